@@ -11,6 +11,8 @@
 #    under the License.
 """Deployment handling for Placmenent API."""
 
+import functools
+
 from microversion_parse import middleware as mp_middleware
 import oslo_middleware
 from oslo_middleware import cors
@@ -22,6 +24,7 @@ from nova.api.openstack.placement import handler
 from nova.api.openstack.placement import microversion
 from nova.api.openstack.placement.objects import resource_provider
 from nova.api.openstack.placement import requestlog
+from nova.api.openstack.placement import sqltiming
 from nova.api.openstack.placement import util
 
 
@@ -56,6 +59,11 @@ def deploy(conf):
     microversion_middleware = mp_middleware.MicroversionMiddleware
     fault_middleware = fault_wrap.FaultWrapper
     request_log = requestlog.RequestLog
+    if conf.placement.sql_timing:
+        sql_timing_middleware = functools.partial(
+            sqltiming.SqlTiming, conf=conf)
+    else:
+        sql_timing_middleware = None
 
     application = handler.PlacementHandler()
     # configure microversion middleware in the old school way
@@ -72,6 +80,7 @@ def deploy(conf):
     # all see the same contextual information including request id and
     # authentication information.
     for middleware in (fault_middleware,
+                       sql_timing_middleware,
                        request_log,
                        context_middleware,
                        auth_middleware,
@@ -98,6 +107,7 @@ def update_database():
     ctx = db_api.DbContext()
     resource_provider.ensure_trait_sync(ctx)
     resource_provider.ensure_rc_cache(ctx)
+    resource_provider.ensure_trait_cache(ctx)
 
 
 # NOTE(cdent): Althought project_name is no longer used because of the
@@ -23,11 +23,12 @@ Routes.Mapper, including automatic handlers to respond with a
 method.
 """
 
+from oslo_config import cfg
+from oslo_log import log as logging
 import routes
 import webob
 
-from oslo_log import log as logging
-
+from nova.api.openstack.placement import db_api
 from nova.api.openstack.placement import exception
 from nova.api.openstack.placement.handlers import aggregate
 from nova.api.openstack.placement.handlers import allocation
@@ -42,8 +43,12 @@ from nova.api.openstack.placement.handlers import usage
 from nova.api.openstack.placement import util
 from nova.i18n import _
 
+CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
+# The request methods whose handlers only read from the database.
+READ_METHODS = ('GET', 'HEAD')
+
 # URLs and Handlers
 # NOTE(cdent): When adding URLs here, do not use regex patterns in
 # the path parameters (e.g. {uuid:[0-9a-zA-Z-]+}) as that will lead
@@ -101,6 +106,7 @@ ROUTE_DECLARATIONS = {
         'GET': allocation.list_for_resource_provider,
     },
     '/allocations': {
+        'GET': allocation.list_allocations,
         'POST': allocation.set_allocations,
     },
     '/allocations/{consumer_uuid}': {
@@ -147,7 +153,17 @@ def dispatch(environ, start_response, mapper):
     # We can't reach this code without action being present.
     handler = result.pop('action')
     environ['wsgiorg.routing_args'] = ((), result)
-    return handler(environ, start_response)
+    context = environ.get('placement.context')
+    if context is None or environ['REQUEST_METHOD'] not in READ_METHODS:
+        return handler(environ, start_response)
+    # Run the read only handlers in a single reader transaction, on the
+    # replica if there is one and [placement]/use_replica_for_reads is True.
+    if CONF.placement.use_replica_for_reads:
+        reader = db_api.placement_context_manager.async_
+    else:
+        reader = db_api.placement_context_manager.reader
+    with reader.using(context):
+        return handler(environ, start_response)
 
 
 def handle_405(environ, start_response):
@@ -54,6 +54,15 @@ def _last_modified_from_allocations(allocations, want_version):
     return last_modified
 
 
+def _consumer_generation(consumer):
+    """Returns the generation of a consumer, or None if the consumer has no
+    record yet (see create_incomplete_consumers online data migration).
+    """
+    if consumer is None or not consumer.obj_attr_is_set('generation'):
+        return None
+    return consumer.generation
+
+
 def _serialize_allocations_for_consumer(allocations, want_version):
     """Turn a list of allocations into a dict by resource provider uuid.
 
@@ -103,7 +112,7 @@ def _serialize_allocations_for_consumer(allocations, want_version):
         result['user_id'] = user_id
         show_consumer_gen = want_version.matches((1, 28))
         if show_consumer_gen:
-            result['consumer_generation'] = consumer.generation
+            result['consumer_generation'] = _consumer_generation(consumer)
 
     return result
 
@@ -144,16 +153,53 @@ def _serialize_allocations_for_resource_provider(allocations,
         allocation_data[key]['resources'][resource_class] = allocation.used
 
         if show_consumer_gen:
-            consumer_gen = None
-            if allocation.consumer is not None:
-                consumer_gen = allocation.consumer.generation
-            allocation_data[key]['consumer_generation'] = consumer_gen
+            allocation_data[key]['consumer_generation'] = (
+                _consumer_generation(allocation.consumer))
 
-    result = {'allocations': allocation_data}
+    # The allocations of each consumer are serialized as the response body is
+    # written, see util.set_json_body.
+    result = {'allocations': util.JSONPairs(allocation_data.items())}
     result['resource_provider_generation'] = resource_provider.generation
     return result
 
 
+def _serialize_allocations_by_consumer(allocations, want_version):
+    """Turn a list of allocations into a dict by consumer id.
+
+    {'allocations':
+       CONSUMER_ID_1: {
+           'allocations': {
+               RP_UUID_1: {
+                   'generation': GENERATION,
+                   'resources': {
+                       'DISK_GB': 4,
+                       'VCPU': 2
+                   }
+               }
+           },
+           'project_id': PROJECT_ID,
+           'user_id': USER_ID,
+           'consumer_generation': 1
+       },
+       CONSUMER_ID_2: {
+           ...
+       }
+    }
+
+    The serialization of each consumer is the one of GET
+    /allocations/{consumer_uuid}.
+    """
+    allocations_by_consumer = collections.OrderedDict()
+    for allocation in allocations:
+        allocations_by_consumer.setdefault(
+            allocation.consumer.uuid, []).append(allocation)
+
+    return {'allocations': util.JSONPairs(
+        (consumer_uuid,
+         _serialize_allocations_for_consumer(allocs, want_version))
+        for consumer_uuid, allocs in allocations_by_consumer.items())}
+
+
 # TODO(cdent): Extracting this is useful, for reuse by reshaper code,
 # but having it in this file seems wrong, however, since it uses
 # _new_allocations it's being left here for now. We need a place for shared
@@ -294,11 +340,10 @@ def list_for_resource_provider(req):
     output = _serialize_allocations_for_resource_provider(
         allocs, rp, want_version)
     last_modified = _last_modified_from_allocations(allocs, want_version)
-    allocations_json = jsonutils.dumps(output)
 
     response = req.response
     response.status = 200
-    response.body = encodeutils.to_utf8(allocations_json)
+    util.set_json_body(response, output)
     response.content_type = 'application/json'
     if want_version.matches((1, 15)):
         response.last_modified = last_modified
@@ -306,6 +351,73 @@ def list_for_resource_provider(req):
     return response
 
 
+def _normalize_rp_uuids_qs_param(value):
+    """Parse a resource_provider_uuid query string parameter value, either a
+    single UUID or the prefix 'in:' followed by comma-separated UUIDs.
+
+    :return: A set of UUIDs
+    :raises `webob.exc.HTTPBadRequest` if the value parameter is not in the
+            expected format.
+    """
+    if "," in value and not value.startswith("in:"):
+        msg = _("Multiple values for 'resource_provider_uuid' must be "
+                "prefixed with the 'in:' keyword. Got: %s") % value
+        raise webob.exc.HTTPBadRequest(msg)
+    if value.startswith('in:'):
+        value = set(value[3:].split(','))
+    else:
+        value = set([value])
+    for rp_uuid in value:
+        if not uuidutils.is_uuid_like(rp_uuid):
+            msg = _("Invalid query string parameters: Expected "
+                    "'resource_provider_uuid' parameter to contain valid "
+                    "UUID(s). Got: %s") % rp_uuid
+            raise webob.exc.HTTPBadRequest(msg)
+    return value
+
+
+@wsgi_wrapper.PlacementWsgify
+@microversion.version_handler('1.31')
+@util.check_accept('application/json')
+def list_allocations(req):
+    """List the allocations of the consumers of a set of resource providers.
+
+    The resource providers are either those in the provider tree of the
+    provider identified by the in_tree query parameter, or those identified by
+    the resource_provider_uuid query parameter. All the allocations of their
+    consumers are returned, including those against other resource providers,
+    keyed by consumer.
+
+    On success return a 200 and an application/json body. Unknown resource
+    providers are ignored.
+    """
+    context = req.environ['placement.context']
+    context.can(policies.ALLOC_LIST)
+    want_version = req.environ[microversion.MICROVERSION_ENVIRON]
+
+    util.validate_query_params(req, schema.GET_ALLOCATIONS_SCHEMA_V1_31)
+
+    if 'in_tree' in req.GET:
+        allocs = rp_obj.AllocationList.get_all_by_consumers_of_providers(
+            context, in_tree=req.GET['in_tree'])
+    else:
+        rp_uuids = _normalize_rp_uuids_qs_param(
+            req.GET['resource_provider_uuid'])
+        allocs = rp_obj.AllocationList.get_all_by_consumers_of_providers(
+            context, rp_uuids=list(rp_uuids))
+
+    output = _serialize_allocations_by_consumer(allocs, want_version)
+    last_modified = _last_modified_from_allocations(allocs, want_version)
+
+    response = req.response
+    response.status = 200
+    util.set_json_body(response, output)
+    response.content_type = 'application/json'
+    response.last_modified = last_modified
+    response.cache_control = 'no-cache'
+    return response
+
+
 def _resource_providers_by_uuid(ctx, rp_uuids):
     """Helper method that returns a dict, keyed by resource provider UUID, of
     ResourceProvider objects.
@@ -14,8 +14,6 @@
 
 import collections
 
-from oslo_serialization import jsonutils
-from oslo_utils import encodeutils
 from oslo_utils import timeutils
 import six
 import webob
@@ -32,7 +30,7 @@ from nova.i18n import _
 
 
 def _transform_allocation_requests_dict(alloc_reqs):
-    """Turn supplied list of AllocationRequest objects into a list of
+    """Turn supplied list of AllocationRequest objects into a generator of
     allocations dicts keyed by resource provider uuid of resources involved
     in the allocation request. The returned results are intended to be used
     as the body of a PUT /allocations/{consumer_uuid} HTTP request at
@@ -58,23 +56,19 @@ def _transform_allocation_requests_dict(alloc_reqs):
         ...
     ]
     """
-    results = []
-
     for ar in alloc_reqs:
         # A default dict of {$rp_uuid: "resources": {})
         rp_resources = collections.defaultdict(lambda: dict(resources={}))
         for rr in ar.resource_requests:
             res_dict = rp_resources[rr.resource_provider.uuid]['resources']
             res_dict[rr.resource_class] = rr.amount
-        results.append(dict(allocations=rp_resources))
-
-    return results
+        yield dict(allocations=rp_resources)
 
 
 def _transform_allocation_requests_list(alloc_reqs):
-    """Turn supplied list of AllocationRequest objects into a list of dicts of
-    resources involved in the allocation request. The returned results is
-    intended to be able to be used as the body of a PUT
+    """Turn supplied list of AllocationRequest objects into a generator of
+    dicts of resources involved in the allocation request. The returned
+    results is intended to be able to be used as the body of a PUT
     /allocations/{consumer_uuid} HTTP request, prior to microversion 1.12,
     so therefore we return a list of JSON objects that looks like the
     following:
@@ -94,7 +88,6 @@ def _transform_allocation_requests_list(alloc_reqs):
         }, ...
     ]
     """
-    results = []
     for ar in alloc_reqs:
         provider_resources = collections.defaultdict(dict)
         for rr in ar.resource_requests:
@@ -109,21 +102,19 @@ def _transform_allocation_requests_list(alloc_reqs):
                 "resources": resources,
             } for rp_uuid, resources in provider_resources.items()
         ]
-        alloc = {
+        yield {
             "allocations": allocs
         }
-        results.append(alloc)
-    return results
 
 
 def _transform_provider_summaries(p_sums, requests, want_version):
-    """Turn supplied list of ProviderSummary objects into a dict, keyed by
-    resource provider UUID, of dicts of provider and inventory information.
-    The traits only show up when `want_version` is 1.17 or newer. All the
-    resource classes are shown when `want_version` is 1.27 or newer while
-    only requested resources are included in the `provider_summaries`
-    for older versions. The parent and root provider uuids only show up
-    when `want_version` is 1.29 or newer.
+    """Turn supplied list of ProviderSummary objects into a util.JSONPairs,
+    keyed by resource provider UUID, of dicts of provider and inventory
+    information. The traits only show up when `want_version` is 1.17 or
+    newer. All the resource classes are shown when `want_version` is 1.27 or
+    newer while only requested resources are included in the
+    `provider_summaries` for older versions. The parent and root provider
+    uuids only show up when `want_version` is 1.29 or newer.
 
     {
        RP_UUID_1: {
@@ -172,15 +163,21 @@ def _transform_provider_summaries(p_sums, requests, want_version):
     include_all_resources = want_version.matches((1, 27))
     enable_nested_providers = want_version.matches((1, 29))
 
-    ret = {}
     requested_resources = set()
 
     for requested_group in requests.values():
         requested_resources |= set(requested_group.resources)
 
-    # if include_all_resources is false, only requested resources are
-    # included in the provider_summaries.
+    # The same provider may be summarized by several request groups. Like
+    # the dict this used to build, keep the place of its first summary and
+    # the content of its last one.
+    ps_by_uuid = collections.OrderedDict()
     for ps in p_sums:
+        ps_by_uuid[ps.resource_provider.uuid] = ps
+
+    def _transform(ps):
+        # if include_all_resources is false, only requested resources are
+        # included in the provider_summaries.
         resources = {
             psr.resource_class: {
                 'capacity': psr.capacity,
@@ -190,19 +187,21 @@ def _transform_provider_summaries(p_sums, requests, want_version):
                 psr.resource_class in requested_resources)
         }
 
-        ret[ps.resource_provider.uuid] = {'resources': resources}
+        summary = {'resources': resources}
 
         if include_traits:
-            ret[ps.resource_provider.uuid]['traits'] = [
-                t.name for t in ps.traits]
+            summary['traits'] = list(ps.traits)
 
         if enable_nested_providers:
-            ret[ps.resource_provider.uuid]['parent_provider_uuid'] = (
+            summary['parent_provider_uuid'] = (
                 ps.resource_provider.parent_provider_uuid)
-            ret[ps.resource_provider.uuid]['root_provider_uuid'] = (
+            summary['root_provider_uuid'] = (
                 ps.resource_provider.root_provider_uuid)
 
-    return ret
+        return summary
+
+    return util.JSONPairs(
+        (rp_uuid, _transform(ps)) for rp_uuid, ps in ps_by_uuid.items())
 
 
 def _exclude_nested_providers(alloc_cands):
@@ -219,22 +218,23 @@ def _exclude_nested_providers(alloc_cands):
     # We use this to get a list of sets of providers in each tree
     tree_sets = list(tree_rps_by_root.values())
 
-    for a_req in alloc_cands.allocation_requests[:]:
+    a_reqs = []
+    all_rp_uuids = set()
+    for a_req in alloc_cands.allocation_requests:
         alloc_rp_uuids = set([
             arr.resource_provider.uuid for arr in a_req.resource_requests])
         # If more than one allocation is provided by the same tree, kill
         # that allocation request.
         if any(len(tree_set & alloc_rp_uuids) > 1 for tree_set in tree_sets):
-            alloc_cands.allocation_requests.remove(a_req)
+            continue
+        a_reqs.append(a_req)
+        all_rp_uuids |= alloc_rp_uuids
+    alloc_cands.allocation_requests = a_reqs
 
     # Exclude eliminated providers from the provider summaries.
-    all_rp_uuids = set()
-    for a_req in alloc_cands.allocation_requests:
-        all_rp_uuids |= set(
-            arr.resource_provider.uuid for arr in a_req.resource_requests)
-    for ps in alloc_cands.provider_summaries[:]:
-        if ps.resource_provider.uuid not in all_rp_uuids:
-            alloc_cands.provider_summaries.remove(ps)
+    alloc_cands.provider_summaries = [
+        ps for ps in alloc_cands.provider_summaries
+        if ps.resource_provider.uuid in all_rp_uuids]
 
     return alloc_cands
 
@@ -323,8 +323,7 @@ def list_allocation_candidates(req):
 
     response = req.response
     trx_cands = _transform_allocation_candidates(cands, requests, want_version)
-    json_data = jsonutils.dumps(trx_cands)
-    response.body = encodeutils.to_utf8(json_data)
+    util.set_json_body(response, trx_cands)
     response.content_type = 'application/json'
     if want_version.matches((1, 15)):
         response.cache_control = 'no-cache'
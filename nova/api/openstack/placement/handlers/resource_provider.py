@@ -61,15 +61,15 @@ def _serialize_provider(environ, resource_provider, want_version):
 
 
 def _serialize_providers(environ, resource_providers, want_version):
-    output = []
     last_modified = None
-    get_last_modified = want_version.matches((1, 15))
-    for provider in resource_providers:
-        if get_last_modified:
+    if want_version.matches((1, 15)):
+        for provider in resource_providers:
             last_modified = util.pick_last_modified(last_modified, provider)
-        provider_data = _serialize_provider(environ, provider, want_version)
-        output.append(provider_data)
     last_modified = last_modified or timeutils.utcnow(with_timezone=True)
+    # The providers are serialized as the response body is written, see
+    # util.set_json_body.
+    output = (_serialize_provider(environ, provider, want_version)
+              for provider in resource_providers)
     return ({"resource_providers": output}, last_modified)
 
 
@@ -250,7 +250,7 @@ def list_resource_providers(req):
     response = req.response
     output, last_modified = _serialize_providers(
         req.environ, resource_providers, want_version)
-    response.body = encodeutils.to_utf8(jsonutils.dumps(output))
+    util.set_json_body(response, output)
     response.content_type = 'application/json'
     if want_version.matches((1, 15)):
         response.last_modified = last_modified
@@ -89,7 +89,7 @@ def delete_consumers_if_no_allocations(ctx, consumer_uuids):
     ctx.session.execute(del_stmt)
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_consumer_by_uuid(ctx, uuid):
     # The SQL for this looks like the following:
     # SELECT
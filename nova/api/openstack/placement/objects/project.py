@@ -40,7 +40,7 @@ def ensure_incomplete_project(ctx):
     return res.inserted_primary_key[0]
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_project_by_external_id(ctx, external_id):
     projects = sa.alias(PROJECT_TBL, name="p")
     cols = [
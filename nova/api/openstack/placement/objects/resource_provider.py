@@ -42,7 +42,9 @@ from nova.api.openstack.placement import exception
 from nova.api.openstack.placement.objects import consumer as consumer_obj
 from nova.api.openstack.placement.objects import project as project_obj
 from nova.api.openstack.placement.objects import user as user_obj
+from nova.api.openstack.placement import provider_graph
 from nova.api.openstack.placement import resource_class_cache as rc_cache
+from nova.api.openstack.placement import trait_cache
 from nova.db.sqlalchemy import api_models as models
 from nova.i18n import _
 from nova import rc_fields
@@ -59,7 +61,9 @@ _RP_TRAIT_TBL = models.ResourceProviderTrait.__table__
 _PROJECT_TBL = models.Project.__table__
 _USER_TBL = models.User.__table__
 _CONSUMER_TBL = models.Consumer.__table__
+_USAGE_TBL = models.ResourceProviderUsage.__table__
 _RC_CACHE = None
+_TRAIT_CACHE = None
 _TRAIT_LOCK = 'trait_sync'
 _TRAITS_SYNCED = False
 
@@ -67,7 +71,14 @@ CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
 
-@db_api.placement_context_manager.reader
+def _provider_graph(ctx):
+    """Returns the ProviderGraph the allocation candidates of the request are
+    computed against, or None if the providers are queried from the database.
+    """
+    return getattr(ctx, 'provider_graph', None)
+
+
+@db_api.placement_context_manager.reader.allow_async
 def ensure_rc_cache(ctx):
     """Ensures that a singleton resource class cache has been created in the
     module's scope.
@@ -81,6 +92,20 @@ def ensure_rc_cache(ctx):
     _RC_CACHE = rc_cache.ResourceClassCache(ctx)
 
 
+@db_api.placement_context_manager.reader.allow_async
+def ensure_trait_cache(ctx):
+    """Ensures that a singleton trait cache has been created in the module's
+    scope.
+
+    :param ctx: `nova.context.RequestContext` that may be used to grab a DB
+                connection.
+    """
+    global _TRAIT_CACHE
+    if _TRAIT_CACHE is not None:
+        return
+    _TRAIT_CACHE = trait_cache.TraitCache(ctx)
+
+
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
 # Bug #1760322: If the caller raises an exception, we don't want the trait
 # sync rolled back; so use an .independent transaction
@@ -121,6 +146,8 @@ def _trait_sync(ctx):
                      need_sync)
         except db_exc.DBDuplicateEntry:
             pass  # some other process sync'd, just ignore
+        if _TRAIT_CACHE is not None:
+            _TRAIT_CACHE.clear()
 
 
 def ensure_trait_sync(ctx):
@@ -147,6 +174,159 @@ def ensure_trait_sync(ctx):
             _TRAITS_SYNCED = True
 
 
+def _usage_table_maintained():
+    """Returns whether the resource_provider_usages table is updated along
+    with the allocations.
+    """
+    return CONF.placement.usage_table in ('maintain', 'use')
+
+
+def _usage_table_used():
+    """Returns whether the usages of the resource providers are read from the
+    resource_provider_usages table instead of being summed from the
+    allocations.
+    """
+    return CONF.placement.usage_table == 'use'
+
+
+def _usage_subquery(rc_ids=None, rp_ids=None):
+    """Returns a selectable of the amounts of the resource classes used on the
+    resource providers, with resource_provider_id, resource_class_id and used
+    columns, to be outer joined with the inventories.
+
+    :param rc_ids: Optional iterable of the resource class IDs the sums of the
+                   allocations are restricted to.
+    :param rp_ids: Optional iterable of the resource provider IDs the sums of
+                   the allocations are restricted to.
+    """
+    if _usage_table_used():
+        # The rows are looked up by the join with the inventories, using the
+        # unique constraint on the provider and resource class.
+        return sa.alias(_USAGE_TBL, name='usage')
+    usage = sa.select([_ALLOC_TBL.c.resource_provider_id,
+                       _ALLOC_TBL.c.resource_class_id,
+                       sql.func.sum(_ALLOC_TBL.c.used).label('used')])
+    if rc_ids is not None:
+        usage = usage.where(_ALLOC_TBL.c.resource_class_id.in_(rc_ids))
+    if rp_ids is not None:
+        usage = usage.where(_ALLOC_TBL.c.resource_provider_id.in_(rp_ids))
+    usage = usage.group_by(_ALLOC_TBL.c.resource_provider_id,
+                           _ALLOC_TBL.c.resource_class_id)
+    return sa.alias(usage, name='usage')
+
+
+def _update_usages(ctx, deltas):
+    """Adds the supplied amounts to the usages in the resource_provider_usages
+    table.
+
+    :param ctx: `nova.context.RequestContext` that contains an oslo_db Session
+    :param deltas: dict, keyed by tuples of (resource provider ID, resource
+                   class ID), of the amounts allocated (when positive) or
+                   freed (when negative).
+    :raises: `exception.ResourceProviderConcurrentUpdateDetected` if another
+             transaction created the usage of a resource class of a provider
+             concurrently.
+    """
+    for (rp_id, rc_id), delta in deltas.items():
+        if not delta:
+            continue
+        upd_stmt = _USAGE_TBL.update().where(sa.and_(
+                _USAGE_TBL.c.resource_provider_id == rp_id,
+                _USAGE_TBL.c.resource_class_id == rc_id)).values(
+                        used=_USAGE_TBL.c.used + delta)
+        if ctx.session.execute(upd_stmt).rowcount:
+            continue
+        if delta < 0:
+            LOG.warning('The usage of the resource class %(rc)s on the '
+                        'resource provider %(rp)s is missing from the '
+                        'resource_provider_usages table. Run nova-manage '
+                        'placement sync_usages to rebuild it.',
+                        {'rc': _RC_CACHE.string_from_id(rc_id), 'rp': rp_id})
+            continue
+        ins_stmt = _USAGE_TBL.insert().values(
+                resource_provider_id=rp_id,
+                resource_class_id=rc_id,
+                used=delta)
+        try:
+            ctx.session.execute(ins_stmt)
+        except db_exc.DBDuplicateEntry:
+            # Another transaction allocated this resource class of the
+            # provider for the first time, it also incremented the generation
+            # of the provider.
+            raise exception.ResourceProviderConcurrentUpdateDetected()
+
+
+def _free_usages(ctx, cond):
+    """Subtracts the allocations matching the supplied condition, which are
+    about to be deleted, from the usages in the resource_provider_usages table.
+    """
+    if not _usage_table_maintained():
+        return
+    sel = sa.select([_ALLOC_TBL.c.resource_provider_id,
+                     _ALLOC_TBL.c.resource_class_id,
+                     sql.func.sum(_ALLOC_TBL.c.used)]).where(cond)
+    sel = sel.group_by(_ALLOC_TBL.c.resource_provider_id,
+                       _ALLOC_TBL.c.resource_class_id)
+    _update_usages(ctx, {(r[0], r[1]): -r[2]
+                         for r in ctx.session.execute(sel)})
+
+
+@db_api.placement_context_manager.writer
+def sync_usages(ctx):
+    """Rebuilds the resource_provider_usages table from the allocations.
+
+    :param ctx: `nova.context.RequestContext` that may be used to grab a DB
+                connection.
+    :returns: The number of usages written.
+    """
+    ctx.session.execute(_USAGE_TBL.delete())
+    sel = sa.select([_ALLOC_TBL.c.resource_provider_id,
+                     _ALLOC_TBL.c.resource_class_id,
+                     sql.func.sum(_ALLOC_TBL.c.used)])
+    sel = sel.group_by(_ALLOC_TBL.c.resource_provider_id,
+                       _ALLOC_TBL.c.resource_class_id)
+    ins_stmt = _USAGE_TBL.insert().from_select(
+        ['resource_provider_id', 'resource_class_id', 'used'], sel)
+    return ctx.session.execute(ins_stmt).rowcount
+
+
+@db_api.placement_context_manager.reader.allow_async
+def verify_usages(ctx):
+    """Compares the resource_provider_usages table with the allocations.
+
+    :param ctx: `nova.context.RequestContext` that may be used to grab a DB
+                connection.
+    :returns: A list of dicts with the resource_provider_uuid, resource_class,
+              allocated and recorded keys, for each resource class of a
+              provider whose recorded usage is not the sum of its
+              allocations.
+    """
+    ensure_rc_cache(ctx)
+    sel = sa.select([_ALLOC_TBL.c.resource_provider_id,
+                     _ALLOC_TBL.c.resource_class_id,
+                     sql.func.sum(_ALLOC_TBL.c.used)])
+    sel = sel.group_by(_ALLOC_TBL.c.resource_provider_id,
+                       _ALLOC_TBL.c.resource_class_id)
+    allocated = {(r[0], r[1]): r[2] for r in ctx.session.execute(sel)}
+    sel = sa.select([_USAGE_TBL.c.resource_provider_id,
+                     _USAGE_TBL.c.resource_class_id,
+                     _USAGE_TBL.c.used])
+    recorded = {(r[0], r[1]): r[2] for r in ctx.session.execute(sel)}
+
+    keys = sorted(key for key in set(allocated) | set(recorded)
+                  if allocated.get(key, 0) != recorded.get(key, 0))
+    if not keys:
+        return []
+    sel = sa.select([_RP_TBL.c.id, _RP_TBL.c.uuid]).where(
+        _RP_TBL.c.id.in_(set(rp_id for rp_id, rc_id in keys)))
+    rp_uuids = dict(ctx.session.execute(sel).fetchall())
+    return [{'resource_provider_uuid': rp_uuids.get(rp_id, rp_id),
+             'resource_class': _RC_CACHE.string_from_id(rc_id),
+             'allocated': allocated.get((rp_id, rc_id), 0),
+             'recorded': recorded.get((rp_id, rc_id), 0)}
+            for rp_id, rc_id in keys]
+
+
 def _get_current_inventory_resources(ctx, rp):
     """Returns a set() containing the resource class IDs for all resources
     currently having an inventory record for the supplied resource provider.
@@ -231,11 +411,18 @@ def _update_inventory_for_provider(ctx, rp, inv_list, to_update):
     for rc_id in to_update:
         rc_str = _RC_CACHE.string_from_id(rc_id)
         inv_record = inv_list.find(rc_str)
-        allocation_query = sa.select(
-            [func.sum(_ALLOC_TBL.c.used).label('usage')]).\
-            where(sa.and_(
-                _ALLOC_TBL.c.resource_provider_id == rp.id,
-                _ALLOC_TBL.c.resource_class_id == rc_id))
+        if _usage_table_used():
+            allocation_query = sa.select(
+                [_USAGE_TBL.c.used.label('usage')]).\
+                where(sa.and_(
+                    _USAGE_TBL.c.resource_provider_id == rp.id,
+                    _USAGE_TBL.c.resource_class_id == rc_id))
+        else:
+            allocation_query = sa.select(
+                [func.sum(_ALLOC_TBL.c.used).label('usage')]).\
+                where(sa.and_(
+                    _ALLOC_TBL.c.resource_provider_id == rp.id,
+                    _ALLOC_TBL.c.resource_class_id == rc_id))
         allocations = ctx.session.execute(allocation_query).first()
         if (allocations
             and allocations['usage'] is not None
@@ -279,6 +466,7 @@ def _increment_provider_generation(ctx, rp):
     res = ctx.session.execute(upd_stmt)
     if res.rowcount != 1:
         raise exception.ResourceProviderConcurrentUpdateDetected()
+    provider_graph.record_changes(ctx, [rp.id])
     return new_generation
 
 
@@ -380,7 +568,7 @@ def _set_inventory(context, rp, inv_list):
     return exceeded
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_provider_by_uuid(context, uuid):
     """Given a UUID, return a dict of information about the resource provider
     from the database.
@@ -414,7 +602,7 @@ def _get_provider_by_uuid(context, uuid):
     return dict(res)
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_aggregates_by_provider_id(context, rp_id):
     """Returns a dict, keyed by internal aggregate ID, of aggregate UUIDs
     associated with the supplied internal resource provider ID.
@@ -428,7 +616,7 @@ def _get_aggregates_by_provider_id(context, rp_id):
     return {r[0]: r[1] for r in context.session.execute(sel).fetchall()}
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _anchors_for_sharing_providers(context, rp_ids, get_id=False):
     """Given a list of internal IDs of sharing providers, returns a set of
     tuples of (sharing provider UUID, anchor provider UUID), where each of
@@ -445,6 +633,10 @@ def _anchors_for_sharing_providers(context, rp_ids, get_id=False):
     If get_id is True, it returns a set of tuples of (sharing provider ID,
     anchor provider ID) instead.
     """
+    graph = _provider_graph(context)
+    if graph is not None:
+        return graph.anchors_for_sharing_providers(rp_ids, get_id=get_id)
+
     # SELECT sps.uuid, COALESCE(rps.uuid, shr_with_sps.uuid)
     # FROM resource_providers AS sps
     # INNER JOIN resource_provider_aggregates AS shr_aggs
@@ -583,9 +775,11 @@ def _set_aggregates(context, resource_provider, provided_aggregates,
     if increment_generation:
         resource_provider.generation = _increment_provider_generation(
             context, resource_provider)
+    else:
+        provider_graph.record_changes(context, [rp_id])
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_traits_by_provider_id(context, rp_id):
     t = sa.alias(_TRAIT_TBL, name='t')
     rpt = sa.alias(_RP_TRAIT_TBL, name='rpt')
@@ -667,7 +861,7 @@ def _set_traits(context, rp, traits):
     rp.generation = _increment_provider_generation(context, rp)
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _has_child_providers(context, rp_id):
     """Returns True if the supplied resource provider has any child providers,
     False otherwise
@@ -681,16 +875,26 @@ def _has_child_providers(context, rp_id):
 
 
 @db_api.placement_context_manager.writer
-def _set_root_provider_id(context, rp_id, root_id):
-    """Simply sets the root_provider_id value for a provider identified by
-    rp_id. Used in online data migration.
-
-    :param rp_id: Internal ID of the provider to update
-    :param root_id: Value to set root provider to
+def set_root_provider_ids(context, batch_size):
+    """Sets the root_provider_id of up to batch_size providers which have none
+    to their own ID, as they were created before the nested providers and so
+    are the roots of their trees. Used in online data migration.
+
+    Returns a tuple containing two identical elements with the number of
+    providers updated, since this is the expected return format for data
+    migration routines.
     """
-    upd = _RP_TBL.update().where(_RP_TBL.c.id == rp_id)
-    upd = upd.values(root_provider_id=root_id)
-    context.session.execute(upd)
+    sel = sa.select([_RP_TBL.c.id])
+    sel = sel.where(_RP_TBL.c.root_provider_id.is_(None))
+    sel = sel.limit(batch_size)
+    rp_ids = [r[0] for r in context.session.execute(sel)]
+    if not rp_ids:
+        return 0, 0
+    upd = _RP_TBL.update().where(_RP_TBL.c.id.in_(rp_ids))
+    upd = upd.values(root_provider_id=_RP_TBL.c.id)
+    res = context.session.execute(upd)
+    provider_graph.record_changes(context, rp_ids)
+    return res.rowcount, res.rowcount
 
 
 ProviderIds = collections.namedtuple(
@@ -705,6 +909,11 @@ def _provider_ids_from_rp_ids(context, rp_ids):
     :returns: dict, keyed by internal provider Id, of ProviderIds namedtuples
     :param rp_ids: iterable of internal provider IDs to look up
     """
+    graph = _provider_graph(context)
+    if graph is not None:
+        return {rp_id: ProviderIds(**ids)
+                for rp_id, ids in graph.provider_ids(rp_ids).items()}
+
     # SELECT
     #   rp.id, rp.uuid,
     #   parent.id AS parent_id, parent.uuid AS parent_uuid,
@@ -813,6 +1022,11 @@ def _provider_ids_matching_aggregates(context, member_of, rp_ids=None):
     :returns: A set of internal resource provider IDs having all required
         aggregate associations
     """
+    graph = _provider_graph(context)
+    if graph is not None:
+        return graph.provider_ids_matching_aggregates(member_of,
+                                                      rp_ids=rp_ids)
+
     # Given a request for the following:
     #
     # member_of = [
@@ -1052,6 +1266,7 @@ class ResourceProvider(base.VersionedObject, base.TimestampedObject):
             context.session.add(db_rp)
             context.session.flush()
             self.root_provider_uuid = self.uuid
+        provider_graph.record_changes(context, [self.id])
 
     @staticmethod
     @db_api.placement_context_manager.writer
@@ -1083,6 +1298,10 @@ class ResourceProvider(base.VersionedObject, base.TimestampedObject):
         RPT_model = models.ResourceProviderTrait
         context.session.query(RPT_model).\
                 filter(RPT_model.resource_provider_id == _id).delete()
+        # delete the (zero) usages of the resource provider
+        RPU_model = models.ResourceProviderUsage
+        context.session.query(RPU_model).\
+                filter(RPU_model.resource_provider_id == _id).delete()
         # set root_provider_id to null to make deletion possible
         context.session.query(models.ResourceProvider).\
             filter(models.ResourceProvider.id == _id,
@@ -1098,6 +1317,7 @@ class ResourceProvider(base.VersionedObject, base.TimestampedObject):
             raise exception.CannotDeleteParentResourceProvider()
         if not result:
             raise exception.NotFound()
+        provider_graph.record_changes(context, [_id])
 
     @db_api.placement_context_manager.writer
     def _update_in_db(self, context, id, updates):
@@ -1186,17 +1406,17 @@ class ResourceProvider(base.VersionedObject, base.TimestampedObject):
             raise exception.ObjectActionError(
                     action='update',
                     reason=_('parent provider UUID does not exist.'))
+        provider_graph.record_changes(
+            context, [id] + [rp.id for rp in same_tree])
 
     @staticmethod
-    @db_api.placement_context_manager.writer  # For online data migration
     def _from_db_object(context, resource_provider, db_resource_provider):
-        # Online data migration to populate root_provider_id
+        # A provider without root_provider_id is the root of its tree, see
+        # set_root_provider_ids.
         # TODO(jaypipes): Remove when all root_provider_id values are NOT NULL
         if db_resource_provider['root_provider_uuid'] is None:
-            rp_id = db_resource_provider['id']
-            uuid = db_resource_provider['uuid']
-            db_resource_provider['root_provider_uuid'] = uuid
-            _set_root_provider_id(context, rp_id, rp_id)
+            db_resource_provider['root_provider_uuid'] = (
+                db_resource_provider['uuid'])
         for field in resource_provider.fields:
             setattr(resource_provider, field, db_resource_provider[field])
         resource_provider._context = context
@@ -1204,7 +1424,7 @@ class ResourceProvider(base.VersionedObject, base.TimestampedObject):
         return resource_provider
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_providers_with_shared_capacity(ctx, rc_id, amount, member_of=None):
     """Returns a list of resource provider IDs (internal IDs, not UUIDs)
     that have capacity for a requested amount of a resource and indicate that
@@ -1249,25 +1469,31 @@ def _get_providers_with_shared_capacity(ctx, rc_id, amount, member_of=None):
                       resource providers that *directly* belong to the
                       aggregates referenced.
     """
+    graph = _provider_graph(ctx)
+    if graph is not None:
+        return graph.providers_with_shared_capacity(rc_id, amount,
+                                                    member_of=member_of)
+
     # The SQL we need to generate here looks like this:
     #
     # SELECT rp.id
     # FROM resource_providers AS rp
     #   INNER JOIN resource_provider_traits AS rpt
     #     ON rp.id = rpt.resource_provider_id
-    #   INNER JOIN traits AS t
-    #     ON rpt.trait_id = t.id
-    #     AND t.name = "MISC_SHARES_VIA_AGGREGATE"
+    #     AND rpt.trait_id = $MISC_SHARES_VIA_AGGREGATE_ID
     #   INNER JOIN inventories AS inv
     #     ON rp.id = inv.resource_provider_id
     #     AND inv.resource_class_id = $rc_id
     #   LEFT JOIN (
-    #     SELECT resource_provider_id, SUM(used) as used
+    #     SELECT resource_provider_id, resource_class_id, SUM(used) as used
     #     FROM allocations
     #     WHERE resource_class_id = $rc_id
-    #     GROUP BY resource_provider_id
+    #     GROUP BY resource_provider_id, resource_class_id
     #   ) AS usage
     #     ON rp.id = usage.resource_provider_id
+    #     AND inv.resource_class_id = usage.resource_class_id
+    #   (or LEFT JOIN resource_provider_usages AS usage, see
+    #   _usage_subquery())
     # WHERE COALESCE(usage.used, 0) + $amount <= (
     #   inv.total - inv.reserved) * inv.allocation_ratio
     # ) AND
@@ -1278,41 +1504,33 @@ def _get_providers_with_shared_capacity(ctx, rc_id, amount, member_of=None):
 
     rp_tbl = sa.alias(_RP_TBL, name='rp')
     inv_tbl = sa.alias(_INV_TBL, name='inv')
-    t_tbl = sa.alias(_TRAIT_TBL, name='t')
     rpt_tbl = sa.alias(_RP_TRAIT_TBL, name='rpt')
 
     rp_to_rpt_join = sa.join(
         rp_tbl, rpt_tbl,
-        rp_tbl.c.id == rpt_tbl.c.resource_provider_id,
-    )
-
-    rpt_to_t_join = sa.join(
-        rp_to_rpt_join, t_tbl,
         sa.and_(
-            rpt_tbl.c.trait_id == t_tbl.c.id,
-            # The traits table wants unicode trait names, but os_traits
-            # presents native str, so we need to cast.
-            t_tbl.c.name == six.text_type(os_traits.MISC_SHARES_VIA_AGGREGATE),
+            rp_tbl.c.id == rpt_tbl.c.resource_provider_id,
+            rpt_tbl.c.trait_id == _TRAIT_CACHE.id_from_string(
+                os_traits.MISC_SHARES_VIA_AGGREGATE),
         ),
     )
 
     rp_to_inv_join = sa.join(
-        rpt_to_t_join, inv_tbl,
+        rp_to_rpt_join, inv_tbl,
         sa.and_(
             rpt_tbl.c.resource_provider_id == inv_tbl.c.resource_provider_id,
             inv_tbl.c.resource_class_id == rc_id,
         ),
     )
 
-    usage = sa.select([_ALLOC_TBL.c.resource_provider_id,
-                       sql.func.sum(_ALLOC_TBL.c.used).label('used')])
-    usage = usage.where(_ALLOC_TBL.c.resource_class_id == rc_id)
-    usage = usage.group_by(_ALLOC_TBL.c.resource_provider_id)
-    usage = sa.alias(usage, name='usage')
+    usage = _usage_subquery(rc_ids=[rc_id])
 
     inv_to_usage_join = sa.outerjoin(
         rp_to_inv_join, usage,
-        inv_tbl.c.resource_provider_id == usage.c.resource_provider_id,
+        sa.and_(
+            inv_tbl.c.resource_provider_id == usage.c.resource_provider_id,
+            inv_tbl.c.resource_class_id == usage.c.resource_class_id,
+        ),
     )
 
     where_conds = sa.and_(
@@ -1348,7 +1566,7 @@ class ResourceProviderList(base.ObjectListBase, base.VersionedObject):
     }
 
     @staticmethod
-    @db_api.placement_context_manager.reader
+    @db_api.placement_context_manager.reader.allow_async
     def _get_all_by_filters_from_db(context, filters):
         # Eg. filters can be:
         #  filters = {
@@ -1488,6 +1706,8 @@ class ResourceProviderList(base.ObjectListBase, base.VersionedObject):
         # ) AS usage
         #     ON inv.resource_provider_id = usage.resource_provider_id
         #     AND inv.resource_class_id = usage.resource_class_id
+        # (or LEFT JOIN resource_provider_usages AS usage, see
+        # _usage_subquery())
         # AND (inv.resource_class_id = $X AND (used + $AMOUNT_X <= (
         #        total - reserved) * inv.allocation_ratio) AND
         #        inv.min_unit <= $AMOUNT_X AND inv.max_unit >= $AMOUNT_X AND
@@ -1512,13 +1732,7 @@ class ResourceProviderList(base.ObjectListBase, base.VersionedObject):
             rp.c.id == _INV_TBL.c.resource_provider_id)
 
         # Now, below is the LEFT JOIN for getting the allocations usage
-        usage = sa.select([_ALLOC_TBL.c.resource_provider_id,
-                           _ALLOC_TBL.c.resource_class_id,
-                           sql.func.sum(_ALLOC_TBL.c.used).label('used')])
-        usage = usage.where(_ALLOC_TBL.c.resource_class_id.in_(resources))
-        usage = usage.group_by(_ALLOC_TBL.c.resource_provider_id,
-                               _ALLOC_TBL.c.resource_class_id)
-        usage = sa.alias(usage, name='usage')
+        usage = _usage_subquery(rc_ids=resources)
         usage_join = sa.outerjoin(inv_join, usage,
             sa.and_(
                 usage.c.resource_provider_id == (
@@ -1595,7 +1809,7 @@ class Inventory(base.VersionedObject, base.TimestampedObject):
         return int((self.total - self.reserved) * self.allocation_ratio)
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_inventory_by_provider_id(ctx, rp_id):
     inv = sa.alias(_INV_TBL, name="i")
     cols = [
@@ -1670,14 +1884,30 @@ class Allocation(base.VersionedObject, base.TimestampedObject):
     }
 
 
+def _record_allocation_changes(ctx, cond):
+    """Records the changes of the providers of the allocations matching the
+    supplied condition, which are about to be deleted.
+    """
+    # Deleting allocations does not increment the generation of their
+    # providers, so this is only recorded by _increment_provider_generation()
+    # for the providers of the allocations which are written.
+    if not CONF.placement.use_provider_graph:
+        return
+    sel = sa.select([_ALLOC_TBL.c.resource_provider_id]).where(cond)
+    provider_graph.record_changes(
+        ctx, [r[0] for r in ctx.session.execute(sel.distinct())])
+
+
 @db_api.placement_context_manager.writer
 def _delete_allocations_for_consumer(ctx, consumer_id):
     """Deletes any existing allocations that correspond to the allocations to
     be written. This is wrapped in a transaction, so if the write subsequently
     fails, the deletion will also be rolled back.
     """
-    del_sql = _ALLOC_TBL.delete().where(
-        _ALLOC_TBL.c.consumer_id == consumer_id)
+    cond = _ALLOC_TBL.c.consumer_id == consumer_id
+    _record_allocation_changes(ctx, cond)
+    _free_usages(ctx, cond)
+    del_sql = _ALLOC_TBL.delete().where(cond)
     ctx.session.execute(del_sql)
 
 
@@ -1686,7 +1916,10 @@ def _delete_allocations_by_ids(ctx, alloc_ids):
     """Deletes allocations having an internal id value in the set of supplied
     IDs
     """
-    del_sql = _ALLOC_TBL.delete().where(_ALLOC_TBL.c.id.in_(alloc_ids))
+    cond = _ALLOC_TBL.c.id.in_(alloc_ids)
+    _record_allocation_changes(ctx, cond)
+    _free_usages(ctx, cond)
+    del_sql = _ALLOC_TBL.delete().where(cond)
     ctx.session.execute(del_sql)
 
 
@@ -1727,6 +1960,8 @@ def _check_capacity_exceeded(ctx, allocs):
     #    AND resource_provider_id IN ($RESOURCE_PROVIDERS)
     #    GROUP BY resource_provider_id, resource_class_id
     # ) AS allocs
+    # (or LEFT JOIN resource_provider_usages AS allocs, see
+    # _usage_subquery())
     # ON inv.resource_provider_id = allocs.resource_provider_id
     # AND inv.resource_class_id = allocs.resource_class_id
     # WHERE rp.id IN ($RESOURCE_PROVIDERS)
@@ -1738,15 +1973,7 @@ def _check_capacity_exceeded(ctx, allocs):
                        for a in allocs])
     provider_uuids = set([a.resource_provider.uuid for a in allocs])
     provider_ids = set([a.resource_provider.id for a in allocs])
-    usage = sa.select([_ALLOC_TBL.c.resource_provider_id,
-                       _ALLOC_TBL.c.resource_class_id,
-                       sql.func.sum(_ALLOC_TBL.c.used).label('used')])
-    usage = usage.where(
-            sa.and_(_ALLOC_TBL.c.resource_class_id.in_(rc_ids),
-                    _ALLOC_TBL.c.resource_provider_id.in_(provider_ids)))
-    usage = usage.group_by(_ALLOC_TBL.c.resource_provider_id,
-                           _ALLOC_TBL.c.resource_class_id)
-    usage = sa.alias(usage, name='usage')
+    usage = _usage_subquery(rc_ids=rc_ids, rp_ids=provider_ids)
 
     inv_join = sql.join(_RP_TBL, _INV_TBL,
             sql.and_(_RP_TBL.c.id == _INV_TBL.c.resource_provider_id,
@@ -1856,7 +2083,7 @@ def _check_capacity_exceeded(ctx, allocs):
     return res_providers
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_allocations_by_provider_id(ctx, rp_id):
     allocs = sa.alias(_ALLOC_TBL, name="a")
     consumers = sa.alias(_CONSUMER_TBL, name="c")
@@ -1878,11 +2105,13 @@ def _get_allocations_by_provider_id(ctx, rp_id):
         users.c.external_id.label("user_external_id"),
     ]
     # TODO(jaypipes): change this join to be on ID not UUID
-    consumers_join = sa.join(
+    # NOTE: The consumer of an allocation may have no record yet, see
+    # _consumer_from_db_record().
+    consumers_join = sa.outerjoin(
         allocs, consumers, allocs.c.consumer_id == consumers.c.uuid)
-    projects_join = sa.join(
+    projects_join = sa.outerjoin(
         consumers_join, projects, consumers.c.project_id == projects.c.id)
-    users_join = sa.join(
+    users_join = sa.outerjoin(
         projects_join, users, consumers.c.user_id == users.c.id)
     sel = sa.select(cols).select_from(users_join)
     sel = sel.where(allocs.c.resource_provider_id == rp_id)
@@ -1890,7 +2119,7 @@ def _get_allocations_by_provider_id(ctx, rp_id):
     return [dict(r) for r in ctx.session.execute(sel)]
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_allocations_by_consumer_uuid(ctx, consumer_uuid):
     allocs = sa.alias(_ALLOC_TBL, name="a")
     rp = sa.alias(_RP_TBL, name="rp")
@@ -1916,12 +2145,14 @@ def _get_allocations_by_consumer_uuid(ctx, consumer_uuid):
     ]
     # Build up the joins of the five tables we need to interact with.
     rp_join = sa.join(allocs, rp, allocs.c.resource_provider_id == rp.c.id)
-    consumer_join = sa.join(rp_join, consumer,
-                            allocs.c.consumer_id == consumer.c.uuid)
-    project_join = sa.join(consumer_join, project,
-                           consumer.c.project_id == project.c.id)
-    user_join = sa.join(project_join, user,
-                        consumer.c.user_id == user.c.id)
+    # NOTE: The consumer of an allocation may have no record yet, see
+    # _consumer_from_db_record().
+    consumer_join = sa.outerjoin(rp_join, consumer,
+                                 allocs.c.consumer_id == consumer.c.uuid)
+    project_join = sa.outerjoin(consumer_join, project,
+                                consumer.c.project_id == project.c.id)
+    user_join = sa.outerjoin(project_join, user,
+                             consumer.c.user_id == user.c.id)
 
     sel = sa.select(cols).select_from(user_join)
     sel = sel.where(allocs.c.consumer_id == consumer_uuid)
@@ -1929,84 +2160,113 @@ def _get_allocations_by_consumer_uuid(ctx, consumer_uuid):
     return [dict(r) for r in ctx.session.execute(sel)]
 
 
-@db_api.placement_context_manager.writer.independent
-def _create_incomplete_consumers_for_provider(ctx, rp_id):
-    # TODO(jaypipes): Remove in Stein after a blocker migration is added.
-    """Creates consumer record if consumer relationship between allocations ->
-    consumers table is missing for any allocation on the supplied provider
-    internal ID, using the "incomplete consumer" project and user CONF options.
+@db_api.placement_context_manager.reader.allow_async
+def _get_allocations_by_consumers_of_providers(ctx, rp_ids):
+    """Returns the allocation records of the consumers having allocations
+    against any of the supplied provider internal IDs. The allocations of
+    these consumers against other providers are returned as well.
     """
-    alloc_to_consumer = sa.outerjoin(
-        _ALLOC_TBL, consumer_obj.CONSUMER_TBL,
-        _ALLOC_TBL.c.consumer_id == consumer_obj.CONSUMER_TBL.c.uuid)
-    sel = sa.select([_ALLOC_TBL.c.consumer_id])
-    sel = sel.select_from(alloc_to_consumer)
-    sel = sel.where(
-        sa.and_(
-            _ALLOC_TBL.c.resource_provider_id == rp_id,
-            consumer_obj.CONSUMER_TBL.c.id.is_(None)))
-    missing = ctx.session.execute(sel).fetchall()
-    if missing:
-        # Do a single INSERT for all missing consumer relationships for the
-        # provider
-        incomplete_proj_id = project_obj.ensure_incomplete_project(ctx)
-        incomplete_user_id = user_obj.ensure_incomplete_user(ctx)
+    allocs = sa.alias(_ALLOC_TBL, name="a")
+    rp = sa.alias(_RP_TBL, name="rp")
+    consumer = sa.alias(_CONSUMER_TBL, name="c")
+    project = sa.alias(_PROJECT_TBL, name="p")
+    user = sa.alias(_USER_TBL, name="u")
+    cols = [
+        allocs.c.id,
+        allocs.c.resource_provider_id,
+        rp.c.name.label("resource_provider_name"),
+        rp.c.uuid.label("resource_provider_uuid"),
+        rp.c.generation.label("resource_provider_generation"),
+        allocs.c.resource_class_id,
+        allocs.c.used,
+        allocs.c.updated_at,
+        allocs.c.created_at,
+        consumer.c.id.label("consumer_id"),
+        consumer.c.generation.label("consumer_generation"),
+        sql.func.coalesce(
+            consumer.c.uuid, allocs.c.consumer_id).label("consumer_uuid"),
+        project.c.id.label("project_id"),
+        project.c.external_id.label("project_external_id"),
+        user.c.id.label("user_id"),
+        user.c.external_id.label("user_external_id"),
+    ]
+    rp_join = sa.join(allocs, rp, allocs.c.resource_provider_id == rp.c.id)
+    # NOTE: The consumer of an allocation may have no record yet, see
+    # _consumer_from_db_record().
+    consumer_join = sa.outerjoin(rp_join, consumer,
+                                 allocs.c.consumer_id == consumer.c.uuid)
+    project_join = sa.outerjoin(consumer_join, project,
+                                consumer.c.project_id == project.c.id)
+    user_join = sa.outerjoin(project_join, user,
+                             consumer.c.user_id == user.c.id)
+
+    # SELECT DISTINCT consumer_id FROM allocations
+    # WHERE resource_provider_id IN ($RP_IDS)
+    consumers_of_rps = sa.select([_ALLOC_TBL.c.consumer_id]).where(
+        _ALLOC_TBL.c.resource_provider_id.in_(rp_ids)).distinct()
+    sel = sa.select(cols).select_from(user_join)
+    sel = sel.where(allocs.c.consumer_id.in_(consumers_of_rps))
 
-        cols = [
-            _ALLOC_TBL.c.consumer_id,
-            incomplete_proj_id,
-            incomplete_user_id,
-        ]
-        sel = sa.select(cols)
-        sel = sel.select_from(alloc_to_consumer)
-        sel = sel.where(
-            sa.and_(
-                _ALLOC_TBL.c.resource_provider_id == rp_id,
-                consumer_obj.CONSUMER_TBL.c.id.is_(None)))
-        # NOTE(mnaser): It is possible to have multiple consumers having many
-        #               allocations to the same resource provider, which would
-        #               make the INSERT FROM SELECT fail due to duplicates.
-        sel = sel.group_by(_ALLOC_TBL.c.consumer_id)
-        target_cols = ['uuid', 'project_id', 'user_id']
-        ins_stmt = consumer_obj.CONSUMER_TBL.insert().from_select(
-            target_cols, sel)
-        res = ctx.session.execute(ins_stmt)
-        if res.rowcount > 0:
-            LOG.info("Online data migration to fix incomplete consumers "
-                     "for resource provider %s has been run. Migrated %d "
-                     "incomplete consumer records on the fly.", rp_id,
-                     res.rowcount)
+    return [dict(r) for r in ctx.session.execute(sel)]
 
 
-@db_api.placement_context_manager.writer.independent
-def _create_incomplete_consumer(ctx, consumer_id):
-    # TODO(jaypipes): Remove in Stein after a blocker migration is added.
-    """Creates consumer record if consumer relationship between allocations ->
-    consumers table is missing for the supplied consumer UUID, using the
-    "incomplete consumer" project and user CONF options.
+@db_api.placement_context_manager.reader.allow_async
+def _provider_ids_from_uuids(ctx, rp_uuids):
+    """Returns the internal IDs of the providers having the supplied UUIDs.
+    Unknown UUIDs are ignored.
     """
-    alloc_to_consumer = sa.outerjoin(
-        _ALLOC_TBL, consumer_obj.CONSUMER_TBL,
-        _ALLOC_TBL.c.consumer_id == consumer_obj.CONSUMER_TBL.c.uuid)
-    sel = sa.select([_ALLOC_TBL.c.consumer_id])
-    sel = sel.select_from(alloc_to_consumer)
-    sel = sel.where(
-        sa.and_(
-            _ALLOC_TBL.c.consumer_id == consumer_id,
-            consumer_obj.CONSUMER_TBL.c.id.is_(None)))
-    missing = ctx.session.execute(sel).fetchall()
-    if missing:
-        incomplete_proj_id = project_obj.ensure_incomplete_project(ctx)
-        incomplete_user_id = user_obj.ensure_incomplete_user(ctx)
-
-        ins_stmt = consumer_obj.CONSUMER_TBL.insert().values(
-            uuid=consumer_id, project_id=incomplete_proj_id,
-            user_id=incomplete_user_id)
-        res = ctx.session.execute(ins_stmt)
-        if res.rowcount > 0:
-            LOG.info("Online data migration to fix incomplete consumers "
-                     "for consumer %s has been run. Migrated %d incomplete "
-                     "consumer records on the fly.", consumer_id, res.rowcount)
+    sel = sa.select([_RP_TBL.c.id]).where(_RP_TBL.c.uuid.in_(rp_uuids))
+    return [r[0] for r in ctx.session.execute(sel)]
+
+
+@db_api.placement_context_manager.reader.allow_async
+def _provider_ids_in_tree(ctx, rp_uuid):
+    """Returns the internal IDs of the providers in the same provider tree as
+    the provider having the supplied UUID, or an empty list if there is no
+    such provider.
+    """
+    tree_ids = _provider_ids_from_uuid(ctx, rp_uuid)
+    if tree_ids is None:
+        return []
+    root_id = tree_ids.root_id
+    # TODO(jaypipes): Remove this OR condition when root_provider_id
+    # is not nullable in the database and all resource provider records
+    # have populated the root provider ID.
+    sel = sa.select([_RP_TBL.c.id]).where(
+        sa.or_(_RP_TBL.c.id == root_id,
+               _RP_TBL.c.root_provider_id == root_id))
+    return [r[0] for r in ctx.session.execute(sel)]
+
+
+def _consumer_from_db_record(context, rec):
+    """Returns the Consumer object of an allocation record joined with its
+    consumer, project and user.
+
+    The consumer of an allocation made before the consumers table existed has
+    no record until the create_incomplete_consumers online data migration is
+    run. Such a consumer is reported as owned by the "incomplete consumer"
+    project and user CONF options, without generation, rather than created
+    while reading its allocations.
+    """
+    if rec['consumer_id'] is None:
+        return consumer_obj.Consumer(
+            context, uuid=rec['consumer_uuid'],
+            project=project_obj.Project(
+                context,
+                external_id=CONF.placement.incomplete_consumer_project_id),
+            user=user_obj.User(
+                context,
+                external_id=CONF.placement.incomplete_consumer_user_id))
+    return consumer_obj.Consumer(
+        context, id=rec['consumer_id'],
+        uuid=rec['consumer_uuid'],
+        generation=rec['consumer_generation'],
+        project=project_obj.Project(
+            context, id=rec['project_id'],
+            external_id=rec['project_external_id']),
+        user=user_obj.User(
+            context, id=rec['user_id'],
+            external_id=rec['user_external_id']))
 
 
 @base.VersionedObjectRegistry.register_if(False)
@@ -2067,6 +2327,9 @@ class AllocationList(base.ObjectListBase, base.VersionedObject):
         # allocation is using a resource class that does not exist.
         visited_consumers = {}
         visited_rps = _check_capacity_exceeded(context, allocs)
+        # A dict, keyed by (resource provider ID, resource class ID), of the
+        # amounts allocated, to add to the resource_provider_usages table.
+        usage_deltas = collections.Counter()
         for alloc in allocs:
             if alloc.consumer.id not in visited_consumers:
                 visited_consumers[alloc.consumer.id] = alloc.consumer
@@ -2088,6 +2351,10 @@ class AllocationList(base.ObjectListBase, base.VersionedObject):
             res = context.session.execute(ins_stmt)
             alloc.id = res.lastrowid
             alloc.obj_reset_changes()
+            usage_deltas[(rp.id, rc_id)] += alloc.used
+
+        if _usage_table_maintained():
+            _update_usages(context, usage_deltas)
 
         # Generation checking happens here. If the inventory for this resource
         # provider changed out from under us, this will raise a
@@ -2110,7 +2377,6 @@ class AllocationList(base.ObjectListBase, base.VersionedObject):
 
     @classmethod
     def get_all_by_resource_provider(cls, context, rp):
-        _create_incomplete_consumers_for_provider(context, rp.id)
         db_allocs = _get_allocations_by_provider_id(context, rp.id)
         # Build up a list of Allocation objects, setting the Allocation object
         # fields to the same-named database record field we got from
@@ -2119,16 +2385,7 @@ class AllocationList(base.ObjectListBase, base.VersionedObject):
         # object constructor as-is
         objs = []
         for rec in db_allocs:
-            consumer = consumer_obj.Consumer(
-                context, id=rec['consumer_id'],
-                uuid=rec['consumer_uuid'],
-                generation=rec['consumer_generation'],
-                project=project_obj.Project(
-                    context, id=rec['project_id'],
-                    external_id=rec['project_external_id']),
-                user=user_obj.User(
-                    context, id=rec['user_id'],
-                    external_id=rec['user_external_id']))
+            consumer = _consumer_from_db_record(context, rec)
             objs.append(
                 Allocation(
                     context, id=rec['id'], resource_provider=rp,
@@ -2139,25 +2396,64 @@ class AllocationList(base.ObjectListBase, base.VersionedObject):
         alloc_list = cls(context, objects=objs)
         return alloc_list
 
+    @classmethod
+    def get_all_by_consumers_of_providers(cls, context, rp_uuids=None,
+                                          in_tree=None):
+        """Returns all the allocations of the consumers having allocations
+        against some providers, including their allocations against providers
+        not in the supplied set, e.g. sharing providers.
+
+        :param rp_uuids: A list of UUIDs of the providers.
+        :param in_tree: The UUID of a provider. The providers are all the
+                        providers in its provider tree.
+        """
+        if in_tree is not None:
+            rp_ids = _provider_ids_in_tree(context, in_tree)
+        else:
+            rp_ids = _provider_ids_from_uuids(context, rp_uuids)
+        if not rp_ids:
+            return cls(context, objects=[])
+        db_allocs = _get_allocations_by_consumers_of_providers(context, rp_ids)
+        # The allocations of a consumer share the same Consumer object and the
+        # allocations against a provider share the same ResourceProvider
+        # object.
+        consumers = {}
+        rps = {}
+        objs = []
+        for rec in db_allocs:
+            consumer = consumers.get(rec['consumer_uuid'])
+            if consumer is None:
+                consumer = _consumer_from_db_record(context, rec)
+                consumers[rec['consumer_uuid']] = consumer
+            rp = rps.get(rec['resource_provider_id'])
+            if rp is None:
+                rp = ResourceProvider(
+                    context,
+                    id=rec['resource_provider_id'],
+                    uuid=rec['resource_provider_uuid'],
+                    name=rec['resource_provider_name'],
+                    generation=rec['resource_provider_generation'])
+                rps[rec['resource_provider_id']] = rp
+            objs.append(
+                Allocation(
+                    context, id=rec['id'], resource_provider=rp,
+                    resource_class=_RC_CACHE.string_from_id(
+                        rec['resource_class_id']),
+                    consumer=consumer,
+                    used=rec['used'],
+                    created_at=rec['created_at'],
+                    updated_at=rec['updated_at']))
+        alloc_list = cls(context, objects=objs)
+        return alloc_list
+
     @classmethod
     def get_all_by_consumer_id(cls, context, consumer_id):
-        _create_incomplete_consumer(context, consumer_id)
         db_allocs = _get_allocations_by_consumer_uuid(context, consumer_id)
 
         if db_allocs:
             # Build up the Consumer object (it's the same for all allocations
             # since we looked up by consumer ID)
-            db_first = db_allocs[0]
-            consumer = consumer_obj.Consumer(
-                context, id=db_first['consumer_id'],
-                uuid=db_first['consumer_uuid'],
-                generation=db_first['consumer_generation'],
-                project=project_obj.Project(
-                    context, id=db_first['project_id'],
-                    external_id=db_first['project_external_id']),
-                user=user_obj.User(
-                    context, id=db_first['user_id'],
-                    external_id=db_first['user_external_id']))
+            consumer = _consumer_from_db_record(context, db_allocs[0])
 
         # Build up a list of Allocation objects, setting the Allocation object
         # fields to the same-named database record field we got from
@@ -2273,8 +2569,24 @@ class UsageList(base.ObjectListBase, base.VersionedObject):
     }
 
     @staticmethod
-    @db_api.placement_context_manager.reader
+    @db_api.placement_context_manager.reader.allow_async
     def _get_all_by_resource_provider_uuid(context, rp_uuid):
+        if _usage_table_used():
+            RPU_model = models.ResourceProviderUsage
+            query = (context.session.query(models.Inventory.resource_class_id,
+                     func.coalesce(RPU_model.used, 0))
+                     .join(models.ResourceProvider,
+                           models.Inventory.resource_provider_id ==
+                           models.ResourceProvider.id)
+                     .outerjoin(RPU_model,
+                                sql.and_(models.Inventory.resource_provider_id
+                                         == RPU_model.resource_provider_id,
+                                         models.Inventory.resource_class_id ==
+                                         RPU_model.resource_class_id))
+                     .filter(models.ResourceProvider.uuid == rp_uuid))
+            return [dict(resource_class_id=item[0], usage=item[1])
+                    for item in query.all()]
+
         query = (context.session.query(models.Inventory.resource_class_id,
                  func.coalesce(func.sum(models.Allocation.used), 0))
                  .join(models.ResourceProvider,
@@ -2292,7 +2604,7 @@ class UsageList(base.ObjectListBase, base.VersionedObject):
         return result
 
     @staticmethod
-    @db_api.placement_context_manager.reader
+    @db_api.placement_context_manager.reader.allow_async
     def _get_all_by_project_user(context, project_id, user_id=None):
         query = (context.session.query(models.Allocation.resource_class_id,
                  func.coalesce(func.sum(models.Allocation.used), 0))
@@ -2369,7 +2681,7 @@ class ResourceClass(base.VersionedObject, base.TimestampedObject):
         return obj
 
     @staticmethod
-    @db_api.placement_context_manager.reader
+    @db_api.placement_context_manager.reader.allow_async
     def _get_next_id(context):
         """Utility method to grab the next resource class identifier to use for
          user-defined resource classes.
@@ -2498,7 +2810,7 @@ class ResourceClassList(base.ObjectListBase, base.VersionedObject):
     }
 
     @staticmethod
-    @db_api.placement_context_manager.reader
+    @db_api.placement_context_manager.reader.allow_async
     def _get_all(context):
         customs = list(context.session.query(models.ResourceClass).all())
         return _RC_CACHE.STANDARDS + customs
@@ -2557,9 +2869,10 @@ class Trait(base.VersionedObject, base.TimestampedObject):
             raise exception.TraitExists(name=self.name)
 
         self._from_db_object(self._context, self, db_trait)
+        _TRAIT_CACHE.clear()
 
     @staticmethod
-    @db_api.placement_context_manager.writer  # trait sync can cause a write
+    @db_api.placement_context_manager.reader.allow_async
     def _get_by_name_from_db(context, name):
         result = context.session.query(models.Trait).filter_by(
             name=name).first()
@@ -2598,6 +2911,7 @@ class Trait(base.VersionedObject, base.TimestampedObject):
                                               reason='ID attribute not found')
 
         self._destroy_in_db(self._context, self.id, self.name)
+        _TRAIT_CACHE.clear()
 
 
 @base.VersionedObjectRegistry.register_if(False)
@@ -2608,7 +2922,7 @@ class TraitList(base.ObjectListBase, base.VersionedObject):
     }
 
     @staticmethod
-    @db_api.placement_context_manager.writer  # trait sync can cause a write
+    @db_api.placement_context_manager.reader.allow_async
     def _get_all_from_db(context, filters):
         if not filters:
             filters = {}
@@ -2647,68 +2961,115 @@ class TraitList(base.ObjectListBase, base.VersionedObject):
         return base.obj_make_list(context, cls(context), Trait, db_traits)
 
 
-@base.VersionedObjectRegistry.register_if(False)
-class AllocationRequestResource(base.VersionedObject):
+# NOTE: The types below are built for every allocation candidate, so they are
+# plain classes with __slots__ rather than versioned objects, to avoid the cost
+# of the field coercion. They are internal to placement and only serialized by
+# the allocation candidates handler.
+class CandidateProvider(object):
+    """The identifiers of a resource provider involved in allocation
+    candidates.
+    """
 
-    fields = {
-        'resource_provider': fields.ObjectField('ResourceProvider'),
-        'resource_class': rc_fields.ResourceClassField(read_only=True),
-        'amount': fields.NonNegativeIntegerField(),
-    }
+    __slots__ = ('id', 'uuid', 'root_provider_uuid', 'parent_provider_uuid')
 
+    def __init__(self, id, uuid, root_provider_uuid,
+                 parent_provider_uuid=None):
+        self.id = id
+        self.uuid = uuid
+        self.root_provider_uuid = root_provider_uuid
+        self.parent_provider_uuid = parent_provider_uuid
 
-@base.VersionedObjectRegistry.register_if(False)
-class AllocationRequest(base.VersionedObject):
+    def __repr__(self):
+        return '%s(uuid=%s)' % (self.__class__.__name__, self.uuid)
 
-    fields = {
+
+class AllocationRequestResource(object):
+
+    __slots__ = ('resource_provider', 'resource_class', 'amount')
+
+    def __init__(self, resource_provider, resource_class, amount):
+        self.resource_provider = resource_provider
+        self.resource_class = resource_class
+        self.amount = amount
+
+    def __repr__(self):
+        return '%s(resource_provider=%r, resource_class=%s, amount=%d)' % (
+            self.__class__.__name__, self.resource_provider,
+            self.resource_class, self.amount)
+
+
+class AllocationRequest(object):
+
+    __slots__ = (
         # UUID of (the root of the tree including) the non-sharing resource
         # provider associated with this AllocationRequest. Internal use only,
         # not included when the object is serialized for output.
-        'anchor_root_provider_uuid': fields.UUIDField(),
+        'anchor_root_provider_uuid',
         # Whether all AllocationRequestResources in this AllocationRequest are
         # required to be satisfied by the same provider (based on the
         # corresponding RequestGroup's use_same_provider attribute). Internal
         # use only, not included when the object is serialized for output.
-        'use_same_provider': fields.BooleanField(),
-        'resource_requests': fields.ListOfObjectsField(
-            'AllocationRequestResource'
-        ),
-    }
+        'use_same_provider',
+        'resource_requests',
+    )
+
+    def __init__(self, resource_requests, anchor_root_provider_uuid,
+                 use_same_provider=None):
+        self.resource_requests = resource_requests
+        self.anchor_root_provider_uuid = anchor_root_provider_uuid
+        self.use_same_provider = use_same_provider
 
     def __repr__(self):
         anchor = (self.anchor_root_provider_uuid[-8:]
-                  if 'anchor_root_provider_uuid' in self else '<?>')
-        usp = self.use_same_provider if 'use_same_provider' in self else '<?>'
+                  if self.anchor_root_provider_uuid else '<?>')
+        usp = ('<?>' if self.use_same_provider is None
+               else self.use_same_provider)
         repr_str = ('%s(anchor=...%s, same_provider=%s, '
                     'resource_requests=[%s])' %
-                    (self.obj_name(), anchor, usp,
+                    (self.__class__.__name__, anchor, usp,
                      ', '.join([str(arr) for arr in self.resource_requests])))
         if six.PY2:
             repr_str = encodeutils.safe_encode(repr_str, incoming='utf-8')
         return repr_str
 
 
-@base.VersionedObjectRegistry.register_if(False)
-class ProviderSummaryResource(base.VersionedObject):
+class ProviderSummaryResource(object):
 
-    fields = {
-        'resource_class': rc_fields.ResourceClassField(read_only=True),
-        'capacity': fields.NonNegativeIntegerField(),
-        'used': fields.NonNegativeIntegerField(),
+    __slots__ = (
+        'resource_class',
+        'capacity',
+        'used',
         # Internal use only; not included when the object is serialized for
         # output.
-        'max_unit': fields.NonNegativeIntegerField(),
-    }
+        'max_unit',
+    )
 
+    def __init__(self, resource_class, capacity, used, max_unit):
+        self.resource_class = resource_class
+        self.capacity = capacity
+        self.used = used
+        self.max_unit = max_unit
 
-@base.VersionedObjectRegistry.register_if(False)
-class ProviderSummary(base.VersionedObject):
+    def __repr__(self):
+        return '%s(resource_class=%s, capacity=%d, used=%d)' % (
+            self.__class__.__name__, self.resource_class, self.capacity,
+            self.used)
 
-    fields = {
-        'resource_provider': fields.ObjectField('ResourceProvider'),
-        'resources': fields.ListOfObjectsField('ProviderSummaryResource'),
-        'traits': fields.ListOfObjectsField('Trait'),
-    }
+
+class ProviderSummary(object):
+
+    # The traits are a list of trait string names.
+    __slots__ = ('resource_provider', 'resources', 'traits')
+
+    def __init__(self, resource_provider, resources=None, traits=None):
+        self.resource_provider = resource_provider
+        self.resources = resources if resources is not None else []
+        self.traits = traits if traits is not None else []
+
+    def __repr__(self):
+        return '%s(resource_provider=%r, resources=%r, traits=%r)' % (
+            self.__class__.__name__, self.resource_provider, self.resources,
+            self.traits)
 
     @property
     def resource_class_names(self):
@@ -2718,11 +3079,15 @@ class ProviderSummary(base.VersionedObject):
         return set(res.resource_class for res in self.resources)
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_usages_by_provider_tree(ctx, root_ids):
     """Returns a row iterator of usage records grouped by provider ID
     for all resource providers in all trees indicated in the ``root_ids``.
     """
+    graph = _provider_graph(ctx)
+    if graph is not None:
+        return graph.usages_by_provider_tree(root_ids)
+
     # We build up a SQL expression that looks like this:
     # SELECT
     #   rp.id as resource_provider_id
@@ -2746,33 +3111,37 @@ def _get_usages_by_provider_tree(ctx, root_ids):
     #   GROUP BY resource_provider_id, resource_class_id
     # )
     # AS usage
+    # (or LEFT JOIN resource_provider_usages AS usage, see _usage_subquery())
     #   ON inv.resource_provider_id = usage.resource_provider_id
     #   AND inv.resource_class_id = usage.resource_class_id
     # WHERE (rp.root_provider_id IN ($root_ids)
     #        OR resource_providers.id IN($root_ids))
     rpt = sa.alias(_RP_TBL, name="rp")
     inv = sa.alias(_INV_TBL, name="inv")
-    # Build our derived table (subquery in the FROM clause) that sums used
-    # amounts for resource provider and resource class
-    derived_alloc_to_rp = sa.join(
-        _ALLOC_TBL, _RP_TBL,
-        sa.and_(_ALLOC_TBL.c.resource_provider_id == _RP_TBL.c.id,
-                # TODO(tetsuro): Remove this OR condition when all
-                # root_provider_id values are NOT NULL
-                sa.or_(_RP_TBL.c.root_provider_id.in_(root_ids),
-                       _RP_TBL.c.id.in_(root_ids))
-                )
-    )
-    usage = sa.alias(
-        sa.select([
-            _ALLOC_TBL.c.resource_provider_id,
-            _ALLOC_TBL.c.resource_class_id,
-            sql.func.sum(_ALLOC_TBL.c.used).label('used'),
-        ]).select_from(derived_alloc_to_rp).group_by(
-            _ALLOC_TBL.c.resource_provider_id,
-            _ALLOC_TBL.c.resource_class_id
-        ),
-        name='usage')
+    if _usage_table_used():
+        usage = _usage_subquery()
+    else:
+        # Build our derived table (subquery in the FROM clause) that sums
+        # used amounts for resource provider and resource class
+        derived_alloc_to_rp = sa.join(
+            _ALLOC_TBL, _RP_TBL,
+            sa.and_(_ALLOC_TBL.c.resource_provider_id == _RP_TBL.c.id,
+                    # TODO(tetsuro): Remove this OR condition when all
+                    # root_provider_id values are NOT NULL
+                    sa.or_(_RP_TBL.c.root_provider_id.in_(root_ids),
+                           _RP_TBL.c.id.in_(root_ids))
+                    )
+        )
+        usage = sa.alias(
+            sa.select([
+                _ALLOC_TBL.c.resource_provider_id,
+                _ALLOC_TBL.c.resource_class_id,
+                sql.func.sum(_ALLOC_TBL.c.used).label('used'),
+            ]).select_from(derived_alloc_to_rp).group_by(
+                _ALLOC_TBL.c.resource_provider_id,
+                _ALLOC_TBL.c.resource_class_id
+            ),
+            name='usage')
     # Build a join between the resource providers and inventories table
     rpt_inv_join = sa.outerjoin(rpt, inv,
                                 rpt.c.id == inv.c.resource_provider_id)
@@ -2805,7 +3174,7 @@ def _get_usages_by_provider_tree(ctx, root_ids):
     return ctx.session.execute(query).fetchall()
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_provider_ids_having_any_trait(ctx, traits):
     """Returns a set of resource provider internal IDs that have ANY of the
     supplied traits.
@@ -2819,6 +3188,10 @@ def _get_provider_ids_having_any_trait(ctx, traits):
     if not traits:
         raise ValueError(_('traits must not be empty'))
 
+    graph = _provider_graph(ctx)
+    if graph is not None:
+        return graph.provider_ids_having_any_trait(traits)
+
     rptt = sa.alias(_RP_TRAIT_TBL, name="rpt")
     sel = sa.select([rptt.c.resource_provider_id])
     sel = sel.where(rptt.c.trait_id.in_(traits.values()))
@@ -2826,7 +3199,7 @@ def _get_provider_ids_having_any_trait(ctx, traits):
     return set(r[0] for r in ctx.session.execute(sel))
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_provider_ids_having_all_traits(ctx, required_traits):
     """Returns a set of resource provider internal IDs that have ALL of the
     required traits.
@@ -2842,6 +3215,10 @@ def _get_provider_ids_having_all_traits(ctx, required_traits):
     if not required_traits:
         raise ValueError(_('required_traits must not be empty'))
 
+    graph = _provider_graph(ctx)
+    if graph is not None:
+        return graph.provider_ids_having_all_traits(required_traits)
+
     rptt = sa.alias(_RP_TRAIT_TBL, name="rpt")
     sel = sa.select([rptt.c.resource_provider_id])
     sel = sel.where(rptt.c.trait_id.in_(required_traits.values()))
@@ -2855,7 +3232,7 @@ def _get_provider_ids_having_all_traits(ctx, required_traits):
     return set(r[0] for r in ctx.session.execute(sel))
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _has_provider_trees(ctx):
     """Simple method that returns whether provider trees (i.e. nested resource
     providers) are in use in the deployment at all. This information is used to
@@ -2865,6 +3242,10 @@ def _has_provider_trees(ctx):
 
     NOTE(jaypipes): The result of this function can be cached extensively.
     """
+    graph = _provider_graph(ctx)
+    if graph is not None:
+        return graph.has_provider_trees()
+
     sel = sa.select([_RP_TBL.c.id])
     sel = sel.where(_RP_TBL.c.parent_provider_id.isnot(None))
     sel = sel.limit(1)
@@ -2872,9 +3253,30 @@ def _has_provider_trees(ctx):
     return len(res) > 0
 
 
-@db_api.placement_context_manager.reader
+def _limit_provider_ids(rp_tuples, limit=None, randomize=False):
+    """Returns at most `limit` of the supplied (provider ID, root provider ID)
+    tuples, picked at random if `randomize` is True, or the first of them
+    otherwise.
+    """
+    if not limit or len(rp_tuples) <= limit:
+        return rp_tuples
+    if randomize:
+        return random.sample(rp_tuples, limit)
+    return rp_tuples[:limit]
+
+
+def _random_func(ctx):
+    """Returns the SQL function generating random numbers in the dialect of
+    the database used by the supplied context.
+    """
+    if ctx.session.bind.dialect.name == 'mysql':
+        return sql.func.rand()
+    return sql.func.random()
+
+
+@db_api.placement_context_manager.reader.allow_async
 def _get_provider_ids_matching(ctx, resources, required_traits,
-        forbidden_traits, member_of=None):
+        forbidden_traits, member_of=None, limit=None, randomize=False):
     """Returns a list of tuples of (internal provider ID, root provider ID)
     that have available inventory to satisfy all the supplied requests for
     resources.
@@ -2895,7 +3297,19 @@ def _get_provider_ids_matching(ctx, resources, required_traits,
                       the allocation_candidates returned will only be for
                       resource providers that are members of one or more of the
                       supplied aggregates of each aggregate UUID list.
+    :param limit: An optional integer, N, representing the maximum number of
+                  providers to return.
+    :param randomize: If True and `limit` is given, return a random sample of
+                      N of the matching providers instead of the first N.
     """
+    # When a single resource class is requested without any trait or
+    # aggregate filter, its query returns exactly the matching providers, so
+    # the limit and the random ordering can be applied by the database.
+    sql_limit = None
+    if len(resources) == 1 and not (
+            required_traits or forbidden_traits or member_of):
+        sql_limit = limit
+
     # The iteratively filtered set of resource provider internal IDs that match
     # all the constraints in the request
     filtered_rps = set()
@@ -2950,7 +3364,8 @@ def _get_provider_ids_matching(ctx, resources, required_traits,
     first = True
     for rc_id, amount in resources.items():
         rc_name = _RC_CACHE.string_from_id(rc_id)
-        provs_with_resource = _get_providers_with_resource(ctx, rc_id, amount)
+        provs_with_resource = _get_providers_with_resource(
+            ctx, rc_id, amount, limit=sql_limit, randomize=randomize)
         LOG.debug("found %d providers with available %d %s",
                   len(provs_with_resource), amount, rc_name)
         if not provs_with_resource:
@@ -2991,10 +3406,12 @@ def _get_provider_ids_matching(ctx, resources, required_traits,
     # provs_with_resource will contain a superset of providers with IDs still
     # in our filtered_rps set. We return the list of tuples of
     # (internal provider ID, root internal provider ID)
-    return [rpids for rpids in provs_with_resource if rpids[0] in filtered_rps]
+    rp_tuples = [rpids for rpids in provs_with_resource
+                 if rpids[0] in filtered_rps]
+    return _limit_provider_ids(rp_tuples, limit=limit, randomize=randomize)
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _provider_aggregates(ctx, rp_ids):
     """Given a list of resource provider internal IDs, returns a dict,
     keyed by those provider IDs, of sets of aggregate ids associated
@@ -3019,15 +3436,26 @@ def _provider_aggregates(ctx, rp_ids):
     return res
 
 
-@db_api.placement_context_manager.reader
-def _get_providers_with_resource(ctx, rc_id, amount):
+@db_api.placement_context_manager.reader.allow_async
+def _get_providers_with_resource(ctx, rc_id, amount, limit=None,
+                                 randomize=False):
     """Returns a set of tuples of (provider ID, root provider ID) of providers
     that satisfy the request for a single resource class.
 
     :param ctx: Session context to use
     :param rc_id: Internal ID of resource class to check inventory for
     :param amount: Amount of resource being requested
+    :param limit: An optional integer, N, representing the maximum number of
+                  providers to return.
+    :param randomize: If True and `limit` is given, return a random sample of
+                      N of the providers instead of the first N.
     """
+    graph = _provider_graph(ctx)
+    if graph is not None:
+        return _limit_provider_ids(
+            graph.providers_with_resource(rc_id, amount), limit=limit,
+            randomize=randomize)
+
     # SELECT rp.id, rp.root_provider_id
     # FROM resource_providers AS rp
     # JOIN inventories AS inv
@@ -3036,26 +3464,25 @@ def _get_providers_with_resource(ctx, rc_id, amount):
     # LEFT JOIN (
     #  SELECT
     #    alloc.resource_provider_id,
+    #    alloc.resource_class_id,
     #    SUM(allocs.used) AS used
     #  FROM allocations AS alloc
     #  WHERE allocs.resource_class_id = $RC_ID
-    #  GROUP BY allocs.resource_provider_id
+    #  GROUP BY allocs.resource_provider_id, allocs.resource_class_id
     # ) AS usage
     #  ON inv.resource_provider_id = usage.resource_provider_id
+    #  AND inv.resource_class_id = usage.resource_class_id
+    # (or LEFT JOIN resource_provider_usages AS usage, see _usage_subquery())
     # WHERE
     #  used + $AMOUNT <= ((total - reserved) * inv.allocation_ratio)
     #  AND inv.min_unit <= $AMOUNT
     #  AND inv.max_unit >= $AMOUNT
     #  AND $AMOUNT % inv.step_size == 0
+    # [ORDER BY RANDOM()]
+    # [LIMIT $LIMIT]
     rpt = sa.alias(_RP_TBL, name="rp")
     inv = sa.alias(_INV_TBL, name="inv")
-    allocs = sa.alias(_ALLOC_TBL, name="alloc")
-    usage = sa.select([
-            allocs.c.resource_provider_id,
-            sql.func.sum(allocs.c.used).label('used')])
-    usage = usage.where(allocs.c.resource_class_id == rc_id)
-    usage = usage.group_by(allocs.c.resource_provider_id)
-    usage = sa.alias(usage, name="usage")
+    usage = _usage_subquery(rc_ids=[rc_id])
     where_conds = [
         sql.func.coalesce(usage.c.used, 0) + amount <= (
             (inv.c.total - inv.c.reserved) * inv.c.allocation_ratio),
@@ -3069,10 +3496,15 @@ def _get_providers_with_resource(ctx, rc_id, amount):
             inv.c.resource_class_id == rc_id))
     inv_to_usage = sa.outerjoin(
         rp_to_inv, usage,
-        inv.c.resource_provider_id == usage.c.resource_provider_id)
+        sa.and_(inv.c.resource_provider_id == usage.c.resource_provider_id,
+                inv.c.resource_class_id == usage.c.resource_class_id))
     sel = sa.select([rpt.c.id, rpt.c.root_provider_id])
     sel = sel.select_from(inv_to_usage)
     sel = sel.where(sa.and_(*where_conds))
+    if limit:
+        if randomize:
+            sel = sel.order_by(_random_func(ctx))
+        sel = sel.limit(limit)
     res = ctx.session.execute(sel).fetchall()
     res = set((r[0], r[1]) for r in res)
     # TODO(tetsuro): Bug#1799892: We could have old providers with no root
@@ -3087,7 +3519,7 @@ def _get_providers_with_resource(ctx, rc_id, amount):
     return ret
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_trees_with_traits(ctx, rp_ids, required_traits, forbidden_traits):
     """Given a list of provider IDs, filter them to return a set of tuples of
     (provider ID, root provider ID) of providers which belong to a tree that
@@ -3102,6 +3534,11 @@ def _get_trees_with_traits(ctx, rp_ids, required_traits, forbidden_traits):
                              internal IDs that a resource provider must
                              not have.
     """
+    graph = _provider_graph(ctx)
+    if graph is not None:
+        return graph.trees_with_traits(rp_ids, required_traits,
+                                       forbidden_traits)
+
     # We now want to restrict the returned providers to only those provider
     # trees that have all our required traits.
     #
@@ -3176,7 +3613,7 @@ def _get_trees_with_traits(ctx, rp_ids, required_traits, forbidden_traits):
     return [(rp_id, root_id) for rp_id, root_id in res]
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_trees_matching_all(ctx, resources, required_traits, forbidden_traits,
                             sharing, member_of):
     """Returns a list of two-tuples (provider internal ID, root provider
@@ -3342,18 +3779,13 @@ def _build_provider_summaries(context, usages, prov_traits):
         if not summary:
             pids = provider_ids[rp_id]
             summary = ProviderSummary(
-                context,
-                resource_provider=ResourceProvider(
-                    context, id=pids.id, uuid=pids.uuid,
-                    root_provider_uuid=pids.root_uuid,
+                CandidateProvider(
+                    pids.id, pids.uuid, pids.root_uuid,
                     parent_provider_uuid=pids.parent_uuid),
-                resources=[],
+                traits=prov_traits[rp_id],
             )
             summaries[rp_id] = summary
 
-        traits = prov_traits[rp_id]
-        summary.traits = [Trait(context, name=tname) for tname in traits]
-
         rc_id = usage['resource_class_id']
         if rc_id is None:
             # NOTE(tetsuro): This provider doesn't have any inventory itself.
@@ -3369,11 +3801,10 @@ def _build_provider_summaries(context, usages, prov_traits):
         cap = int((usage['total'] - usage['reserved']) * allocation_ratio)
         rc_name = _RC_CACHE.string_from_id(rc_id)
         rpsr = ProviderSummaryResource(
-            context,
-            resource_class=rc_name,
-            capacity=cap,
-            used=used,
-            max_unit=usage['max_unit'],
+            rc_name,
+            cap,
+            used,
+            usage['max_unit'],
         )
         summary.resources.append(rpsr)
     return summaries
@@ -3419,12 +3850,10 @@ def _shared_allocation_request_resources(ctx, ns_rp_id, requested_resources,
             if not aggs_in_both:
                 continue
             summary = summaries[rp_id]
-            rp_uuid = summary.resource_provider.uuid
             res_req = AllocationRequestResource(
-                ctx,
-                resource_provider=ResourceProvider(ctx, uuid=rp_uuid),
-                resource_class=_RC_CACHE.string_from_id(rc_id),
-                amount=requested_resources[rc_id],
+                summary.resource_provider,
+                _RC_CACHE.string_from_id(rc_id),
+                requested_resources[rc_id],
             )
             res_requests[rc_id].append(res_req)
     return res_requests
@@ -3437,23 +3866,20 @@ def _allocation_request_for_provider(ctx, requested_resources, provider):
     :param ctx: nova.context.RequestContext object
     :param requested_resources: dict, keyed by resource class ID, of amounts
                                 being requested for that resource class
-    :param provider: ResourceProvider object representing the provider of the
-                     resources.
+    :param provider: CandidateProvider object representing the provider of
+                     the resources.
     """
     resource_requests = [
         AllocationRequestResource(
-            ctx, resource_provider=provider,
-            resource_class=_RC_CACHE.string_from_id(rc_id),
-            amount=amount,
+            provider, _RC_CACHE.string_from_id(rc_id), amount,
         ) for rc_id, amount in requested_resources.items()
     ]
     # NOTE(efried): This method only produces an AllocationRequest with its
     # anchor in its own tree.  If the provider is a sharing provider, the
     # caller needs to identify the other anchors with which it might be
     # associated.
-    return AllocationRequest(
-            ctx, resource_requests=resource_requests,
-            anchor_root_provider_uuid=provider.root_provider_uuid)
+    return AllocationRequest(resource_requests,
+                             provider.root_provider_uuid)
 
 
 def _check_traits_for_alloc_request(res_requests, summaries, prov_traits,
@@ -3562,17 +3988,15 @@ def _alloc_candidates_single_provider(ctx, requested_resources, rp_tuples):
         alloc_requests.append(req_obj)
         # If this is a sharing provider, we have to include an extra
         # AllocationRequest for every possible anchor.
-        traits = [trait.name for trait in rp_summary.traits]
-        if os_traits.MISC_SHARES_VIA_AGGREGATE in traits:
+        if os_traits.MISC_SHARES_VIA_AGGREGATE in rp_summary.traits:
             anchors = set([p[1] for p in _anchors_for_sharing_providers(
                 ctx, [rp_summary.resource_provider.id])])
             for anchor in anchors:
                 # We already added self
                 if anchor == rp_summary.resource_provider.root_provider_uuid:
                     continue
-                req_obj = copy.deepcopy(req_obj)
-                req_obj.anchor_root_provider_uuid = anchor
-                alloc_requests.append(req_obj)
+                alloc_requests.append(AllocationRequest(
+                    list(req_obj.resource_requests), anchor))
     return alloc_requests, list(summaries.values())
 
 
@@ -3630,9 +4054,9 @@ def _alloc_candidates_multiple_providers(ctx, requested_resources,
         rp_summary = summaries[rp_id]
         tree_dict[root_id][rc_id].append(
             AllocationRequestResource(
-                ctx, resource_provider=rp_summary.resource_provider,
-                resource_class=_RC_CACHE.string_from_id(rc_id),
-                amount=requested_resources[rc_id]))
+                rp_summary.resource_provider,
+                _RC_CACHE.string_from_id(rc_id),
+                requested_resources[rc_id]))
 
     # Next, build up a list of allocation requests. These allocation requests
     # are AllocationRequest objects, containing resource provider UUIDs,
@@ -3680,13 +4104,12 @@ def _alloc_candidates_multiple_providers(ctx, requested_resources,
                 continue
             alloc_prov_ids.append(all_prov_ids)
             alloc_requests.append(
-                AllocationRequest(ctx, resource_requests=list(res_requests),
-                                  anchor_root_provider_uuid=root_uuid)
+                AllocationRequest(list(res_requests), root_uuid)
             )
     return alloc_requests, list(summaries.values())
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _get_traits_by_provider_tree(ctx, root_ids):
     """Returns a dict, keyed by provider IDs for all resource providers
     in all trees indicated in the ``root_ids``, of string trait names
@@ -3701,20 +4124,21 @@ def _get_traits_by_provider_tree(ctx, root_ids):
         raise ValueError(_("Expected root_ids to be a list of root resource "
                            "provider internal IDs, but got an empty list."))
 
+    graph = _provider_graph(ctx)
+    if graph is not None:
+        return graph.traits_by_provider_tree(root_ids)
+
     rpt = sa.alias(_RP_TBL, name='rpt')
     rptt = sa.alias(_RP_TRAIT_TBL, name='rptt')
-    tt = sa.alias(_TRAIT_TBL, name='t')
-    rpt_rptt = sa.join(rpt, rptt, rpt.c.id == rptt.c.resource_provider_id)
-    j = sa.join(rpt_rptt, tt, rptt.c.trait_id == tt.c.id)
-    sel = sa.select([rptt.c.resource_provider_id, tt.c.name]).select_from(j)
-    sel = sel.where(rpt.c.root_provider_id.in_(root_ids))
+    j = sa.join(rpt, rptt, rpt.c.id == rptt.c.resource_provider_id)
+    sel = sa.select([rptt.c.resource_provider_id, rptt.c.trait_id])
+    sel = sel.select_from(j).where(rpt.c.root_provider_id.in_(root_ids))
     res = collections.defaultdict(list)
     for r in ctx.session.execute(sel):
-        res[r[0]].append(r[1])
+        res[r[0]].append(_TRAIT_CACHE.string_from_id(r[1]))
     return res
 
 
-@db_api.placement_context_manager.reader
 def _trait_ids_from_names(ctx, names):
     """Given a list of string trait names, returns a dict, keyed by those
     string names, of the corresponding internal integer trait ID.
@@ -3728,11 +4152,7 @@ def _trait_ids_from_names(ctx, names):
         raise ValueError(_("Expected names to be a list of string trait "
                            "names, but got an empty list."))
 
-    # Avoid SAWarnings about unicode types...
-    unames = map(six.text_type, names)
-    tt = sa.alias(_TRAIT_TBL, name='t')
-    sel = sa.select([tt.c.name, tt.c.id]).where(tt.c.name.in_(unames))
-    return {r[0]: r[1] for r in ctx.session.execute(sel)}
+    return _TRAIT_CACHE.ids_from_strings(names)
 
 
 def _rp_rc_key(rp, rc):
@@ -3767,12 +4187,11 @@ def _consolidate_allocation_requests(areqs):
         for arr in areq.resource_requests:
             key = _rp_rc_key(arr.resource_provider, arr.resource_class)
             if key not in arrs_by_rp_rc:
-                arrs_by_rp_rc[key] = copy.deepcopy(arr)
+                arrs_by_rp_rc[key] = AllocationRequestResource(
+                    arr.resource_provider, arr.resource_class, arr.amount)
             else:
                 arrs_by_rp_rc[key].amount += arr.amount
-    return AllocationRequest(
-        resource_requests=list(arrs_by_rp_rc.values()),
-        anchor_root_provider_uuid=anchor_rp_uuid)
+    return AllocationRequest(list(arrs_by_rp_rc.values()), anchor_rp_uuid)
 
 
 def _satisfies_group_policy(areqs, group_policy, num_granular_groups):
@@ -3854,64 +4273,23 @@ def _exceeds_capacity(areq, psum_res_by_rp_rc):
     return False
 
 
-def _merge_candidates(candidates, group_policy=None):
-    """Given a dict, keyed by RequestGroup suffix, of tuples of
-    (allocation_requests, provider_summaries), produce a single tuple of
-    (allocation_requests, provider_summaries) that appropriately incorporates
-    the elements from each.
+def _iter_merged_allocation_requests(areq_lists_by_anchor, all_suffixes,
+                                     group_policy, psum_res_by_rp_rc):
+    """Lazily yields the merged AllocationRequests satisfying all of the
+    RequestGroups.
 
-    Each (alloc_reqs, prov_sums) in `candidates` satisfies one RequestGroup.
-    This method creates a list of alloc_reqs, *each* of which satisfies *all*
-    of the RequestGroups.
+    The combinations are generated, consolidated and checked against the
+    capacity of the providers one at a time, so that a caller only wanting a
+    few of them does not pay for building all of them.
 
-    For that merged list of alloc_reqs, a corresponding provider_summaries is
-    produced.
-
-    :param candidates: A dict, keyed by integer suffix or '', of tuples of
-            (allocation_requests, provider_summaries) to be merged.
+    :param areq_lists_by_anchor: A dict, keyed by anchor root provider UUID,
+            of dicts, keyed by suffix, of lists of AllocationRequest.
+    :param all_suffixes: The set of the suffixes of all the RequestGroups.
     :param group_policy: String indicating how RequestGroups should interact
-            with each other.  If the value is "isolate", we will filter out
-            candidates where AllocationRequests that came from RequestGroups
-            keyed by nonempty suffixes are satisfied by the same provider.
-    :return: A tuple of (allocation_requests, provider_summaries).
+            with each other.  See `_satisfies_group_policy`.
+    :param psum_res_by_rp_rc: A dict, keyed by provider + resource class via
+            _rp_rc_key, of ProviderSummaryResource.
     """
-    # Build a dict, keyed by anchor root provider UUID, of dicts, keyed by
-    # suffix, of nonempty lists of AllocationRequest.  Each inner dict must
-    # possess all of the suffix keys to be viable (i.e. contains at least
-    # one AllocationRequest per RequestGroup).
-    #
-    # areq_lists_by_anchor =
-    #   { anchor_root_provider_uuid: {
-    #         '': [AllocationRequest, ...],   \  This dict must contain
-    #         '1': [AllocationRequest, ...],   \ exactly one nonempty list per
-    #         ...                              / suffix to be viable. That
-    #         '42': [AllocationRequest, ...], /  filtering is done later.
-    #     },
-    #     ...
-    #   }
-    areq_lists_by_anchor = collections.defaultdict(
-            lambda: collections.defaultdict(list))
-    # Save off all the provider summaries lists - we'll use 'em later.
-    all_psums = []
-    # Construct a dict, keyed by resource provider + resource class, of
-    # ProviderSummaryResource.  This will be used to do a final capacity
-    # check/filter on each merged AllocationRequest.
-    psum_res_by_rp_rc = {}
-    for suffix, (areqs, psums) in candidates.items():
-        for areq in areqs:
-            anchor = areq.anchor_root_provider_uuid
-            areq_lists_by_anchor[anchor][suffix].append(areq)
-        for psum in psums:
-            all_psums.append(psum)
-            for psum_res in psum.resources:
-                key = _rp_rc_key(
-                        psum.resource_provider, psum_res.resource_class)
-                psum_res_by_rp_rc[key] = psum_res
-
-    # Create all combinations picking one AllocationRequest from each list
-    # for each anchor.
-    areqs = []
-    all_suffixes = set(candidates)
     num_granular_groups = len(all_suffixes - set(['']))
     for areq_lists_by_suffix in areq_lists_by_anchor.values():
         # Filter out any entries that don't have allocation requests for
@@ -3963,7 +4341,102 @@ def _merge_candidates(candidates, group_policy=None):
             # folded together.  So do a final capacity check/filter.
             if _exceeds_capacity(areq, psum_res_by_rp_rc):
                 continue
-            areqs.append(areq)
+            yield areq
+
+
+def _sample(iterable, limit):
+    """Returns a random sample of at most `limit` elements of an iterable, in
+    a random order, without building the list of all its elements.
+
+    This is a reservoir sampling: each element ends up in the sample with the
+    same probability, as with random.sample() on the list of all of them.
+    """
+    reservoir = []
+    for index, element in enumerate(iterable):
+        if index < limit:
+            reservoir.append(element)
+        else:
+            replaced = random.randint(0, index)
+            if replaced < limit:
+                reservoir[replaced] = element
+    random.shuffle(reservoir)
+    return reservoir
+
+
+def _merge_candidates(candidates, group_policy=None, limit=None,
+                      randomize=False):
+    """Given a dict, keyed by RequestGroup suffix, of tuples of
+    (allocation_requests, provider_summaries), produce a single tuple of
+    (allocation_requests, provider_summaries) that appropriately incorporates
+    the elements from each.
+
+    Each (alloc_reqs, prov_sums) in `candidates` satisfies one RequestGroup.
+    This method creates a list of alloc_reqs, *each* of which satisfies *all*
+    of the RequestGroups.
+
+    For that merged list of alloc_reqs, a corresponding provider_summaries is
+    produced.
+
+    :param candidates: A dict, keyed by integer suffix or '', of tuples of
+            (allocation_requests, provider_summaries) to be merged.
+    :param group_policy: String indicating how RequestGroups should interact
+            with each other.  If the value is "isolate", we will filter out
+            candidates where AllocationRequests that came from RequestGroups
+            keyed by nonempty suffixes are satisfied by the same provider.
+    :param limit: An integer, N, representing the maximum number of merged
+            allocation requests to return.  The combinations stop being
+            generated once N of them are found, unless `randomize` is True.
+    :param randomize: If True, the merged allocation requests are returned in
+            a random order, and if `limit` is given they are a random sample
+            of N of all the merged allocation requests.
+    :return: A tuple of (allocation_requests, provider_summaries).
+    """
+    # Build a dict, keyed by anchor root provider UUID, of dicts, keyed by
+    # suffix, of nonempty lists of AllocationRequest.  Each inner dict must
+    # possess all of the suffix keys to be viable (i.e. contains at least
+    # one AllocationRequest per RequestGroup).
+    #
+    # areq_lists_by_anchor =
+    #   { anchor_root_provider_uuid: {
+    #         '': [AllocationRequest, ...],   \  This dict must contain
+    #         '1': [AllocationRequest, ...],   \ exactly one nonempty list per
+    #         ...                              / suffix to be viable. That
+    #         '42': [AllocationRequest, ...], /  filtering is done later.
+    #     },
+    #     ...
+    #   }
+    areq_lists_by_anchor = collections.defaultdict(
+            lambda: collections.defaultdict(list))
+    # Save off all the provider summaries lists - we'll use 'em later.
+    all_psums = []
+    # Construct a dict, keyed by resource provider + resource class, of
+    # ProviderSummaryResource.  This will be used to do a final capacity
+    # check/filter on each merged AllocationRequest.
+    psum_res_by_rp_rc = {}
+    for suffix, (areqs, psums) in candidates.items():
+        for areq in areqs:
+            anchor = areq.anchor_root_provider_uuid
+            areq_lists_by_anchor[anchor][suffix].append(areq)
+        for psum in psums:
+            all_psums.append(psum)
+            for psum_res in psum.resources:
+                key = _rp_rc_key(
+                        psum.resource_provider, psum_res.resource_class)
+                psum_res_by_rp_rc[key] = psum_res
+
+    # Create the combinations picking one AllocationRequest from each list
+    # for each anchor, only keeping as many of them as we will return.
+    merged = _iter_merged_allocation_requests(
+        areq_lists_by_anchor, set(candidates), group_policy,
+        psum_res_by_rp_rc)
+    if randomize and limit:
+        areqs = _sample(merged, limit)
+    elif limit:
+        areqs = list(itertools.islice(merged, limit))
+    else:
+        areqs = list(merged)
+        if randomize:
+            random.shuffle(areqs)
 
     # It's possible we've filtered out everything.  If so, short out.
     if not areqs:
@@ -3983,23 +4456,26 @@ def _merge_candidates(candidates, group_policy=None):
     return areqs, psums
 
 
-@base.VersionedObjectRegistry.register_if(False)
-class AllocationCandidates(base.VersionedObject):
+class AllocationCandidates(object):
     """The AllocationCandidates object is a collection of possible allocations
     that match some request for resources, along with some summary information
     about the resource providers involved in these allocation candidates.
     """
 
-    fields = {
+    __slots__ = (
         # A collection of allocation possibilities that can be attempted by the
         # caller that would, at the time of calling, meet the requested
         # resource constraints
-        'allocation_requests': fields.ListOfObjectsField('AllocationRequest'),
+        'allocation_requests',
         # Information about usage and inventory that relate to any provider
         # contained in any of the AllocationRequest objects in the
         # allocation_requests field
-        'provider_summaries': fields.ListOfObjectsField('ProviderSummary'),
-    }
+        'provider_summaries',
+    )
+
+    def __init__(self, allocation_requests, provider_summaries):
+        self.allocation_requests = allocation_requests
+        self.provider_summaries = provider_summaries
 
     @classmethod
     def get_by_requests(cls, context, requests, limit=None, group_policy=None):
@@ -4030,16 +4506,18 @@ class AllocationCandidates(base.VersionedObject):
                  and provider_summaries satisfying `requests`, limited
                  according to `limit`.
         """
-        alloc_reqs, provider_summaries = cls._get_by_requests(
-            context, requests, limit=limit, group_policy=group_policy)
-        return cls(
-            context,
-            allocation_requests=alloc_reqs,
-            provider_summaries=provider_summaries,
-        )
+        if CONF.placement.use_provider_graph:
+            context.provider_graph = provider_graph.get_graph(context)
+        try:
+            alloc_reqs, provider_summaries = cls._get_by_requests(
+                context, requests, limit=limit, group_policy=group_policy)
+        finally:
+            context.provider_graph = None
+        return cls(alloc_reqs, provider_summaries)
 
     @staticmethod
-    def _get_by_one_request(context, request, sharing_providers, has_trees):
+    def _get_by_one_request(context, request, sharing_providers, has_trees,
+                            limit=None, randomize=False):
         """Get allocation candidates for one RequestGroup.
 
         Must be called from within an placement_context_manager.reader
@@ -4053,6 +4531,13 @@ class AllocationCandidates(base.VersionedObject):
         :param has_trees: bool indicating there is some level of nesting in the
                           environment (if there isn't, we take faster, simpler
                           code paths)
+        :param limit: An optional integer, N, representing the maximum number
+                      of providers to build allocation requests for when each
+                      of them yields a single allocation request, i.e. when
+                      `request` is the only RequestGroup and no provider is
+                      sharing any of the requested resources.
+        :param randomize: If True and `limit` is given, the providers are a
+                          random sample of N of the matching providers.
         :return: A tuple of (allocation_requests, provider_summaries)
                  satisfying `request`.
         """
@@ -4105,17 +4590,19 @@ class AllocationCandidates(base.VersionedObject):
         # tuples of (internal provider ID, root provider ID) that have ALL
         # the requested resources and more efficiently construct the
         # allocation requests.
+        # Without sharing providers, each provider yields exactly one
+        # allocation request, so only the providers we will return need to be
+        # fetched and summarized.
+        if any_sharing:
+            limit = None
         rp_tuples = _get_provider_ids_matching(context, resources,
                                             required_trait_map,
-                                            forbidden_trait_map, member_of)
+                                            forbidden_trait_map, member_of,
+                                            limit=limit, randomize=randomize)
         return _alloc_candidates_single_provider(context, resources, rp_tuples)
 
     @classmethod
-    # TODO(efried): This is only a writer context because it accesses the
-    # resource_providers table via ResourceProvider.get_by_uuid, which does
-    # data migration to populate the root_provider_uuid.  Change this back to a
-    # reader when that migration is no longer happening.
-    @db_api.placement_context_manager.writer
+    @db_api.placement_context_manager.reader.allow_async
     def _get_by_requests(cls, context, requests, limit=None,
                          group_policy=None):
         # TODO(jaypipes): Make a RequestGroupContext object and put these
@@ -4130,11 +4617,17 @@ class AllocationCandidates(base.VersionedObject):
                     sharing[rc_id] = _get_providers_with_shared_capacity(
                         context, rc_id, amount, member_of)
         has_trees = _has_provider_trees(context)
+        randomize = CONF.placement.randomize_allocation_candidates
+        # The allocation requests of a RequestGroup can only be limited
+        # before they are merged if there are no other groups to merge them
+        # with.
+        group_limit = limit if len(requests) == 1 else None
 
         candidates = {}
         for suffix, request in requests.items():
             alloc_reqs, summaries = cls._get_by_one_request(
-                context, request, sharing, has_trees)
+                context, request, sharing, has_trees, limit=group_limit,
+                randomize=randomize)
             LOG.debug("%s (suffix '%s') returned %d matches",
                       str(request), str(suffix), len(alloc_reqs))
             if not alloc_reqs:
@@ -4153,20 +4646,13 @@ class AllocationCandidates(base.VersionedObject):
         # each allocation request satisfies *all* the incoming `requests`.  The
         # `candidates` dict is guaranteed to contain entries for all suffixes,
         # or we would have short-circuited above.
+        # The number of allocation request objects is limited while they are
+        # merged, so that we can do a random sampling without needing to mess
+        # with the complex sql above or add additional columns to the DB, and
+        # without building all of them when they are not randomized.
         alloc_request_objs, summary_objs = _merge_candidates(
-                candidates, group_policy=group_policy)
-
-        # Limit the number of allocation request objects. We do this after
-        # creating all of them so that we can do a random slice without
-        # needing to mess with the complex sql above or add additional
-        # columns to the DB.
-        if limit and limit <= len(alloc_request_objs):
-            if CONF.placement.randomize_allocation_candidates:
-                alloc_request_objs = random.sample(alloc_request_objs, limit)
-            else:
-                alloc_request_objs = alloc_request_objs[:limit]
-        elif CONF.placement.randomize_allocation_candidates:
-            random.shuffle(alloc_request_objs)
+                candidates, group_policy=group_policy, limit=limit,
+                randomize=randomize)
 
         # Limit summaries to only those mentioned in the allocation requests.
         if limit and limit <= len(alloc_request_objs):
@@ -42,6 +42,10 @@ rules = [
         base.RULE_ADMIN_API,
         "List allocations.",
         [
+            {
+                'method': 'GET',
+                'path': '/allocations'
+            },
             {
                 'method': 'GET',
                 'path': '/allocations/{consumer_uuid}'
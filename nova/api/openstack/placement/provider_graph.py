@@ -0,0 +1,457 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-memory graph of the resource providers, their inventories, usages,
+traits and aggregates, against which the allocation candidates are computed
+when [placement]/use_provider_graph is True.
+
+The writes to the resource providers record the IDs of the providers they
+change in the resource_provider_changes table, which each worker polls to
+reload those providers in its graph.
+"""
+
+import collections
+import datetime
+
+import os_traits
+from oslo_concurrency import lockutils
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+import six
+import sqlalchemy as sa
+from sqlalchemy import sql
+
+from nova.api.openstack.placement import db_api
+from nova.db.sqlalchemy import api_models as models
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+_RP_TBL = models.ResourceProvider.__table__
+_INV_TBL = models.Inventory.__table__
+_ALLOC_TBL = models.Allocation.__table__
+_TRAIT_TBL = models.Trait.__table__
+_RP_TRAIT_TBL = models.ResourceProviderTrait.__table__
+_AGG_TBL = models.PlacementAggregate.__table__
+_RP_AGG_TBL = models.ResourceProviderAggregate.__table__
+_CHANGE_TBL = models.ResourceProviderChange.__table__
+_LOCKNAME = 'provider_graph'
+
+# The changes are polled from a bit before the previous poll, so that the
+# ones committed after it by transactions which started before it, or by
+# hosts whose clock is late, are not missed.
+_CHANGE_GRACE = datetime.timedelta(seconds=60)
+# The changes older than this are deleted, and a worker which did not poll
+# them for that long reloads its whole graph.
+_CHANGE_RETENTION = datetime.timedelta(hours=1)
+_PRUNE_INTERVAL = datetime.timedelta(minutes=10)
+
+Provider = collections.namedtuple(
+    'Provider', ['id', 'uuid', 'parent_id', 'root_id', 'generation'])
+Inventory = collections.namedtuple(
+    'Inventory', ['total', 'reserved', 'min_unit', 'max_unit', 'step_size',
+                  'allocation_ratio'])
+
+
+@db_api.placement_context_manager.writer
+def record_changes(ctx, rp_ids):
+    """Records in the change log that the given resource providers changed,
+    if the placement workers keep a graph of the providers.
+
+    Must be called from within the transaction changing the providers.
+
+    :param ctx: `nova.context.RequestContext` that contains an oslo_db Session
+    :param rp_ids: iterable of internal IDs of the changed providers
+    """
+    if not CONF.placement.use_provider_graph:
+        return
+    rp_ids = set(rp_ids)
+    if rp_ids:
+        ctx.session.execute(
+            _CHANGE_TBL.insert(),
+            [{'resource_provider_id': rp_id} for rp_id in rp_ids])
+
+
+@db_api.placement_context_manager.reader.allow_async
+def _get_rows(ctx, rp_ids=None):
+    """Returns a dict, keyed by table, of the rows describing the given
+    resource providers, or all of them if rp_ids is None.
+    """
+    def _select(cols, from_obj, rp_id_col):
+        sel = sa.select(cols).select_from(from_obj)
+        if rp_ids is not None:
+            sel = sel.where(rp_id_col.in_(rp_ids))
+        return ctx.session.execute(sel).fetchall()
+
+    usage = sa.select([_ALLOC_TBL.c.resource_provider_id,
+                       _ALLOC_TBL.c.resource_class_id,
+                       sql.func.sum(_ALLOC_TBL.c.used).label('used')])
+    if rp_ids is not None:
+        usage = usage.where(_ALLOC_TBL.c.resource_provider_id.in_(rp_ids))
+    usage = usage.group_by(_ALLOC_TBL.c.resource_provider_id,
+                           _ALLOC_TBL.c.resource_class_id)
+    return {
+        'providers': _select(
+            [_RP_TBL.c.id, _RP_TBL.c.uuid, _RP_TBL.c.parent_provider_id,
+             _RP_TBL.c.root_provider_id, _RP_TBL.c.generation],
+            _RP_TBL, _RP_TBL.c.id),
+        'inventories': _select(
+            [_INV_TBL.c.resource_provider_id, _INV_TBL.c.resource_class_id,
+             _INV_TBL.c.total, _INV_TBL.c.reserved, _INV_TBL.c.min_unit,
+             _INV_TBL.c.max_unit, _INV_TBL.c.step_size,
+             _INV_TBL.c.allocation_ratio],
+            _INV_TBL, _INV_TBL.c.resource_provider_id),
+        'usages': ctx.session.execute(usage).fetchall(),
+        'traits': _select(
+            [_RP_TRAIT_TBL.c.resource_provider_id, _TRAIT_TBL.c.id,
+             _TRAIT_TBL.c.name],
+            sa.join(_RP_TRAIT_TBL, _TRAIT_TBL,
+                    _RP_TRAIT_TBL.c.trait_id == _TRAIT_TBL.c.id),
+            _RP_TRAIT_TBL.c.resource_provider_id),
+        'aggregates': _select(
+            [_RP_AGG_TBL.c.resource_provider_id, _AGG_TBL.c.id,
+             _AGG_TBL.c.uuid],
+            sa.join(_RP_AGG_TBL, _AGG_TBL,
+                    _RP_AGG_TBL.c.aggregate_id == _AGG_TBL.c.id),
+            _RP_AGG_TBL.c.resource_provider_id),
+    }
+
+
+@db_api.placement_context_manager.reader.allow_async
+def _get_changes(ctx, since):
+    """Returns the (change ID, provider ID) rows of the change log recorded
+    since the given time.
+    """
+    sel = sa.select([_CHANGE_TBL.c.id, _CHANGE_TBL.c.resource_provider_id])
+    sel = sel.where(_CHANGE_TBL.c.created_at >= since)
+    return ctx.session.execute(sel).fetchall()
+
+
+@db_api.placement_context_manager.writer.independent
+def _delete_changes(ctx, before):
+    """Deletes the rows of the change log recorded before the given time."""
+    ctx.session.execute(
+        _CHANGE_TBL.delete().where(_CHANGE_TBL.c.created_at < before))
+
+
+class ProviderGraph(object):
+    """Snapshot of the resource providers.
+
+    A graph is never changed once built: updated() returns a new graph
+    sharing the data of the providers which did not change, so that the
+    requests computing allocation candidates against a graph are not
+    disturbed by the updates.
+
+    The methods returning providers mirror the functions querying them in
+    nova.api.openstack.placement.objects.resource_provider, and return the
+    same values.
+    """
+
+    def __init__(self):
+        # Dicts, keyed by internal provider ID, of the Provider; of the dicts
+        # of Inventory keyed by resource class ID; of the dicts of used
+        # amounts keyed by resource class ID; of the dicts of trait names
+        # keyed by trait ID; and of the sets of aggregate IDs.
+        self.providers = {}
+        self.inventories = {}
+        self.usages = {}
+        self.traits = {}
+        self.aggregates = {}
+        # Dicts of aggregate IDs keyed by UUID, and of trait IDs keyed by name
+        self.agg_ids = {}
+        self.trait_ids = {}
+        # Whether some providers have a parent, computed on demand
+        self._has_trees = None
+        # Dicts, keyed by index name and then resource class ID, trait ID,
+        # aggregate ID or root provider ID, of sets of provider IDs
+        self._indexes = {'rc': {}, 'trait': {}, 'agg': {}, 'root': {}}
+        # The (index name, key) of the sets of the indexes which this graph
+        # does not share with the graph it was copied from
+        self._owned = set()
+
+    @classmethod
+    def load(cls, ctx):
+        """Returns a graph of all the resource providers."""
+        graph = cls()
+        graph._add(_get_rows(ctx))
+        return graph
+
+    def updated(self, ctx, rp_ids):
+        """Returns a copy of this graph where the given providers are
+        reloaded from the database.
+        """
+        graph = ProviderGraph()
+        for attr in ('providers', 'inventories', 'usages', 'traits',
+                     'aggregates', 'agg_ids', 'trait_ids'):
+            setattr(graph, attr, dict(getattr(self, attr)))
+        graph._indexes = {name: dict(index)
+                          for name, index in self._indexes.items()}
+        for rp_id in rp_ids:
+            graph._remove(rp_id)
+        graph._add(_get_rows(ctx, rp_ids=list(rp_ids)))
+        return graph
+
+    def _index(self, name, key):
+        """Returns the set of an index owned by this graph."""
+        index = self._indexes[name]
+        if (name, key) not in self._owned:
+            index[key] = set(index.get(key, ()))
+            self._owned.add((name, key))
+        return index[key]
+
+    def _remove(self, rp_id):
+        provider = self.providers.pop(rp_id, None)
+        if provider is not None:
+            self._index('root', provider.root_id).discard(rp_id)
+        for rc_id in self.inventories.pop(rp_id, {}):
+            self._index('rc', rc_id).discard(rp_id)
+        for trait_id in self.traits.pop(rp_id, {}):
+            self._index('trait', trait_id).discard(rp_id)
+        for agg_id in self.aggregates.pop(rp_id, ()):
+            self._index('agg', agg_id).discard(rp_id)
+        self.usages.pop(rp_id, None)
+
+    def _add(self, rows):
+        for r in rows['providers']:
+            # TODO(tetsuro): Remove the root provider ID fallback when all
+            # root_provider_id values are NOT NULL
+            root_id = r[3] if r[3] is not None else r[0]
+            self.providers[r[0]] = Provider(r[0], r[1], r[2], root_id, r[4])
+            self._index('root', root_id).add(r[0])
+        for r in rows['inventories']:
+            self.inventories.setdefault(r[0], {})[r[1]] = Inventory(*r[2:])
+            self._index('rc', r[1]).add(r[0])
+        for r in rows['usages']:
+            self.usages.setdefault(r[0], {})[r[1]] = r[2]
+        for r in rows['traits']:
+            self.traits.setdefault(r[0], {})[r[1]] = r[2]
+            self.trait_ids[r[2]] = r[1]
+            self._index('trait', r[1]).add(r[0])
+        for r in rows['aggregates']:
+            self.aggregates.setdefault(r[0], set()).add(r[1])
+            self.agg_ids[r[2]] = r[1]
+            self._index('agg', r[1]).add(r[0])
+
+    def _tree_ids(self, root_ids):
+        rp_ids = set()
+        for root_id in root_ids:
+            rp_ids |= self._indexes['root'].get(root_id, set())
+        return rp_ids
+
+    def has_provider_trees(self):
+        if self._has_trees is None:
+            self._has_trees = any(provider.parent_id is not None
+                                  for provider in self.providers.values())
+        return self._has_trees
+
+    def providers_with_resource(self, rc_id, amount):
+        ret = []
+        for rp_id in self._indexes['rc'].get(rc_id, ()):
+            inv = self.inventories[rp_id][rc_id]
+            used = self.usages.get(rp_id, {}).get(rc_id, 0)
+            if (used + amount <= (
+                    (inv.total - inv.reserved) * inv.allocation_ratio) and
+                    inv.min_unit <= amount <= inv.max_unit and
+                    amount % inv.step_size == 0):
+                ret.append((rp_id, self.providers[rp_id].root_id))
+        return ret
+
+    def providers_with_shared_capacity(self, rc_id, amount, member_of=None):
+        sharing = self._indexes['trait'].get(
+            self.trait_ids.get(
+                six.text_type(os_traits.MISC_SHARES_VIA_AGGREGATE)), set())
+        rp_ids = set(rp_id for rp_id, root_id in
+                     self.providers_with_resource(rc_id, amount)
+                     if rp_id in sharing)
+        if member_of:
+            rps_in_aggs = self.provider_ids_matching_aggregates(member_of)
+            if not rps_in_aggs:
+                return []
+            rp_ids &= rps_in_aggs
+        return list(rp_ids)
+
+    def provider_ids_having_any_trait(self, traits):
+        rp_ids = set()
+        for trait_id in traits.values():
+            rp_ids |= self._indexes['trait'].get(trait_id, set())
+        return rp_ids
+
+    def provider_ids_having_all_traits(self, required_traits):
+        rp_ids = None
+        for trait_id in required_traits.values():
+            trait_rp_ids = self._indexes['trait'].get(trait_id, set())
+            rp_ids = (set(trait_rp_ids) if rp_ids is None
+                      else rp_ids & trait_rp_ids)
+        return rp_ids or set()
+
+    def provider_ids_matching_aggregates(self, member_of, rp_ids=None):
+        rps_in_aggs = None
+        for members in member_of:
+            agg_ids = [self.agg_ids[member] for member in members
+                       if member in self.agg_ids]
+            if not agg_ids:
+                return set()
+            members_rp_ids = set()
+            for agg_id in agg_ids:
+                members_rp_ids |= self._indexes['agg'].get(agg_id, set())
+            rps_in_aggs = (members_rp_ids if rps_in_aggs is None
+                           else rps_in_aggs & members_rp_ids)
+        if rps_in_aggs is None:
+            # Like the query without aggregate joins, an empty member_of
+            # matches all the providers.
+            rps_in_aggs = set(self.providers)
+        if rp_ids:
+            rps_in_aggs &= set(rp_ids)
+        return rps_in_aggs
+
+    def anchors_for_sharing_providers(self, rp_ids, get_id=False):
+        ret = set()
+        for rp_id in rp_ids:
+            if rp_id not in self.providers:
+                continue
+            for agg_id in self.aggregates.get(rp_id, ()):
+                for other_id in self._indexes['agg'][agg_id]:
+                    other = self.providers[other_id]
+                    if get_id:
+                        ret.add((rp_id, other.root_id))
+                    else:
+                        root = self.providers.get(other.root_id, other)
+                        ret.add((self.providers[rp_id].uuid, root.uuid))
+        return ret
+
+    def trees_with_traits(self, rp_ids, required_traits, forbidden_traits):
+        forbidden = set(forbidden_traits.values())
+        required = set(required_traits.values())
+        traits_by_root = collections.defaultdict(set)
+        for rp_id in rp_ids:
+            rp_traits = set(self.traits.get(rp_id, ()))
+            if rp_traits & forbidden:
+                continue
+            traits_by_root[self.providers[rp_id].root_id] |= (
+                rp_traits & required)
+        return [(rp_id, root_id)
+                for root_id, traits in traits_by_root.items()
+                if traits == required
+                for rp_id in self._indexes['root'].get(root_id, ())]
+
+    def usages_by_provider_tree(self, root_ids):
+        rp_ids = self._tree_ids(root_ids) | (set(root_ids) &
+                                             set(self.providers))
+        ret = []
+        for rp_id in rp_ids:
+            provider = self.providers[rp_id]
+            inventories = self.inventories.get(rp_id)
+            if not inventories:
+                ret.append({
+                    'resource_provider_id': rp_id,
+                    'resource_provider_uuid': provider.uuid,
+                    'resource_class_id': None, 'total': None,
+                    'reserved': None, 'allocation_ratio': None,
+                    'max_unit': None, 'used': None})
+                continue
+            for rc_id, inv in inventories.items():
+                ret.append({
+                    'resource_provider_id': rp_id,
+                    'resource_provider_uuid': provider.uuid,
+                    'resource_class_id': rc_id, 'total': inv.total,
+                    'reserved': inv.reserved,
+                    'allocation_ratio': inv.allocation_ratio,
+                    'max_unit': inv.max_unit,
+                    'used': self.usages.get(rp_id, {}).get(rc_id)})
+        return ret
+
+    def traits_by_provider_tree(self, root_ids):
+        ret = collections.defaultdict(list)
+        for rp_id in self._tree_ids(root_ids):
+            ret[rp_id].extend(self.traits.get(rp_id, {}).values())
+        return ret
+
+    def provider_ids(self, rp_ids):
+        """Returns a dict, keyed by internal provider ID, of dicts of the
+        fields of the ProviderIds of the given providers.
+        """
+        ret = {}
+        for rp_id in rp_ids:
+            provider = self.providers.get(rp_id)
+            if provider is None:
+                continue
+            parent = self.providers.get(provider.parent_id)
+            root = self.providers.get(provider.root_id, provider)
+            ret[rp_id] = {
+                'id': rp_id, 'uuid': provider.uuid,
+                'parent_id': parent.id if parent else None,
+                'parent_uuid': parent.uuid if parent else None,
+                'root_id': root.id, 'root_uuid': root.uuid}
+        return ret
+
+
+class ProviderGraphCache(object):
+    """The graph of the resource providers of a placement worker, kept up to
+    date by polling the change log.
+    """
+
+    def __init__(self):
+        self.graph = None
+        self.polled_at = None
+        self.pruned_at = None
+        # IDs of the changes recorded since the previous poll, minus the
+        # grace period, which are already applied to the graph
+        self.applied = set()
+
+    def clear(self):
+        with lockutils.lock(_LOCKNAME):
+            self.graph = None
+
+    def get(self, ctx):
+        """Returns the graph of the resource providers, polling the change
+        log first if the previous poll is older than
+        [placement]/provider_graph_poll_interval.
+        """
+        with lockutils.lock(_LOCKNAME):
+            now = timeutils.utcnow()
+            if (self.graph is None or
+                    now - self.polled_at > _CHANGE_RETENTION):
+                # The changes are read before the graph, so that the ones
+                # committed while it is loaded are applied by the next poll.
+                changes = _get_changes(ctx, now - _CHANGE_GRACE)
+                self.graph = ProviderGraph.load(ctx)
+                self.applied = set(change[0] for change in changes)
+                self.polled_at = now
+                LOG.debug('Loaded %d resource providers in the provider '
+                          'graph', len(self.graph.providers))
+            elif (now - self.polled_at >= datetime.timedelta(
+                    seconds=CONF.placement.provider_graph_poll_interval)):
+                changes = _get_changes(ctx, self.polled_at - _CHANGE_GRACE)
+                rp_ids = set(change[1] for change in changes
+                             if change[0] not in self.applied)
+                if rp_ids:
+                    self.graph = self.graph.updated(ctx, rp_ids)
+                    LOG.debug('Reloaded %d changed resource providers in the '
+                              'provider graph', len(rp_ids))
+                self.applied = set(change[0] for change in changes)
+                self.polled_at = now
+            if (self.pruned_at is None or
+                    now - self.pruned_at > _PRUNE_INTERVAL):
+                _delete_changes(ctx, now - _CHANGE_RETENTION)
+                self.pruned_at = now
+            return self.graph
+
+
+_GRAPH_CACHE = ProviderGraphCache()
+
+
+def get_graph(ctx):
+    """Returns the up to date graph of the resource providers of this
+    worker.
+    """
+    return _GRAPH_CACHE.get(ctx)
@@ -15,6 +15,7 @@
 from oslo_log import log as logging
 
 from nova.api.openstack.placement import microversion
+from nova.api.openstack.placement import sqltiming
 
 LOG = logging.getLogger(__name__)
 
@@ -75,7 +76,8 @@ class RequestLog(object):
         """
         if size is None:
             size = '-'
-        log_format = {
+        log_format = self.format
+        log_values = {
                 'REMOTE_ADDR': environ.get('REMOTE_ADDR', '-'),
                 'REQUEST_METHOD': environ['REQUEST_METHOD'],
                 'REQUEST_URI': req_uri,
@@ -84,4 +86,10 @@ class RequestLog(object):
                 'microversion': environ.get(
                     microversion.MICROVERSION_ENVIRON, '-'),
         }
-        LOG.info(self.format, log_format)
+        # Added by the SqlTiming middleware, if [placement]/sql_timing is
+        # True.
+        sql_timing = environ.get(sqltiming.ENV_SQL_TIMING)
+        if sql_timing is not None:
+            log_format += ' sql: %(sql_timing)s'
+            log_values['sql_timing'] = sql_timing
+        LOG.info(log_format, log_values)
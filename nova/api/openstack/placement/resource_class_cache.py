@@ -22,14 +22,15 @@ _RC_TBL = models.ResourceClass.__table__
 _LOCKNAME = 'rc_cache'
 
 
-@db_api.placement_context_manager.reader
+@db_api.placement_context_manager.reader.allow_async
 def _refresh_from_db(ctx, cache):
     """Grabs all custom resource classes from the DB table and populates the
     supplied cache object's internal integer and string identifier dicts.
 
     :param cache: ResourceClassCache object to refresh.
     """
-    with db_api.placement_context_manager.reader.connection.using(ctx) as conn:
+    with db_api.placement_context_manager.reader.allow_async.connection.using(
+            ctx) as conn:
         sel = sa.select([_RC_TBL.c.id, _RC_TBL.c.name, _RC_TBL.c.updated_at,
                          _RC_TBL.c.created_at])
         res = conn.execute(sel).fetchall()
@@ -167,3 +167,26 @@ POST_ALLOCATIONS_V1_28 = copy.deepcopy(POST_ALLOCATIONS_V1_13)
 POST_ALLOCATIONS_V1_28["patternProperties"] = {
     common.UUID_PATTERN: REQUIRED_GENERATION_ALLOCS_POST
 }
+
+# Represents the allowed query string parameters to GET /allocations, added
+# in microversion 1.31. Exactly one of 'in_tree', the UUID of a provider of the
+# provider tree, and 'resource_provider_uuid', a single UUID or the prefix
+# 'in:' followed by comma-separated UUIDs, must be specified. The validation of
+# the 'resource_provider_uuid' UUIDs is left up to the handler.
+GET_ALLOCATIONS_SCHEMA_V1_31 = {
+    "type": "object",
+    "properties": {
+        "in_tree": {
+            "type": "string",
+            "format": "uuid",
+        },
+        "resource_provider_uuid": {
+            "type": "string",
+        },
+    },
+    "oneOf": [
+        {"required": ["in_tree"]},
+        {"required": ["resource_provider_uuid"]},
+    ],
+    "additionalProperties": False,
+}
@@ -0,0 +1,151 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Middleware recording the SQL statements run for each request."""
+
+import heapq
+import sys
+import threading
+import time
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+
+ENV_SQL_TIMING = 'placement.sql_timing'
+SQL_TIMING_HEADER = 'openstack-placement-sql-timing'
+
+# The number of slowest statements kept for each request.
+SLOWEST_COUNT = 3
+
+# The placement modules whose functions are not used to label the
+# statements, since they only run them on behalf of other functions.
+_SKIPPED_MODULES = (__name__, 'nova.api.openstack.placement.db_api')
+_PLACEMENT_PACKAGE = 'nova.api.openstack.placement.'
+
+_LOCAL = threading.local()
+
+
+def _caller_label():
+    """Return the name of the placement function running a statement, as
+    ``<module>.<function>`` with the module relative to the placement package.
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if (module.startswith(_PLACEMENT_PACKAGE) and
+                module not in _SKIPPED_MODULES):
+            return '%s.%s' % (module.rsplit('.', 1)[-1],
+                              frame.f_code.co_name)
+        frame = frame.f_back
+    return '-'
+
+
+class QueryStats(object):
+    """The number and duration of the SQL statements run for a request."""
+
+    __slots__ = ('count', 'duration', 'slowest')
+
+    def __init__(self):
+        self.count = 0
+        # The total duration of the statements, in seconds.
+        self.duration = 0.0
+        # A heap of the (duration, label) tuples of the slowest statements.
+        self.slowest = []
+
+    def add(self, duration, label):
+        self.count += 1
+        self.duration += duration
+        if len(self.slowest) < SLOWEST_COUNT:
+            heapq.heappush(self.slowest, (duration, label))
+        else:
+            heapq.heappushpop(self.slowest, (duration, label))
+
+    def __str__(self):
+        slowest = ', '.join(
+            '%s %.1fms' % (label, duration * 1000)
+            for duration, label in sorted(self.slowest, reverse=True))
+        return '%d queries %.1fms slowest: %s' % (
+            self.count, self.duration * 1000, slowest or '-')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if getattr(_LOCAL, 'stats', None) is None:
+        return
+    conn.info.setdefault('placement_query_start', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    stats = getattr(_LOCAL, 'stats', None)
+    starts = conn.info.get('placement_query_start')
+    if stats is None or not starts:
+        return
+    stats.add(time.time() - starts.pop(), _caller_label())
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('placement_query_start'):
+        conn.info['placement_query_start'].pop()
+
+
+_LISTENERS = (
+    ('before_cursor_execute', _before_cursor_execute),
+    ('after_cursor_execute', _after_cursor_execute),
+    ('handle_error', _handle_error),
+)
+
+
+def listen():
+    """Listen to the statements run by the engines, to record them for the
+    requests handled by the SqlTiming middleware.
+    """
+    for identifier, listener in _LISTENERS:
+        if not sa.event.contains(Engine, identifier, listener):
+            sa.event.listen(Engine, identifier, listener)
+
+
+class SqlTiming(object):
+    """WSGI Middleware recording the number and duration of the SQL
+    statements run for each request.
+
+    The QueryStats are put in the request environment for the request log.
+    They are also sent in a response header to the callers the admin_api
+    policy rule authorizes, if [placement]/sql_timing_header is True.
+    """
+
+    def __init__(self, application, conf):
+        self.application = application
+        self.header = conf.placement.sql_timing_header
+        listen()
+
+    def __call__(self, environ, start_response):
+        stats = environ[ENV_SQL_TIMING] = QueryStats()
+
+        def replacement_start_response(status, headers, exc_info=None):
+            # The statements of a response are all run by the time it
+            # starts, streamed bodies being serialized from loaded objects.
+            _LOCAL.stats = None
+            if self.header and self._is_admin(environ):
+                headers.append((SQL_TIMING_HEADER, str(stats)))
+            return start_response(status, headers, exc_info)
+
+        _LOCAL.stats = stats
+        try:
+            return self.application(environ, replacement_start_response)
+        finally:
+            _LOCAL.stats = None
+
+    @staticmethod
+    def _is_admin(environ):
+        context = environ.get('placement.context')
+        return context is not None and context.can('admin_api', fatal=False)
@@ -0,0 +1,114 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_concurrency import lockutils
+import six
+import sqlalchemy as sa
+
+from nova.api.openstack.placement import db_api
+from nova.api.openstack.placement import exception
+from nova.db.sqlalchemy import api_models as models
+
+_TRAIT_TBL = models.Trait.__table__
+_LOCKNAME = 'trait_cache'
+
+
+@db_api.placement_context_manager.reader.allow_async
+def _refresh_from_db(ctx, cache):
+    """Grabs all traits from the DB table and populates the supplied cache
+    object's internal integer and string identifier dicts.
+
+    :param cache: TraitCache object to refresh.
+    """
+    with db_api.placement_context_manager.reader.allow_async.connection.using(
+            ctx) as conn:
+        sel = sa.select([_TRAIT_TBL.c.id, _TRAIT_TBL.c.name])
+        res = conn.execute(sel).fetchall()
+        cache.id_cache = {r[1]: r[0] for r in res}
+        cache.str_cache = {r[0]: r[1] for r in res}
+
+
+class TraitCache(object):
+    """A cache of integer and string lookup values for traits."""
+
+    def __init__(self, ctx):
+        """Initialize the cache of trait identifiers.
+
+        :param ctx: `nova.context.RequestContext` from which we can grab a
+                    `SQLAlchemy.Connection` object to use for any DB lookups.
+        """
+        self.ctx = ctx
+        self.id_cache = {}
+        self.str_cache = {}
+
+    def clear(self):
+        with lockutils.lock(_LOCKNAME):
+            self.id_cache = {}
+            self.str_cache = {}
+
+    def id_from_string(self, trait_str):
+        """Given a string representation of a trait -- e.g. "HW_CPU_X86_AVX2"
+        or "CUSTOM_GOLD" -- return the integer code for the trait. The traits
+        are looked up in the traits table, however the results of these DB
+        lookups are cached since the lookups are so frequent.
+
+        :param trait_str: The string representation of the trait to look up a
+                          numeric identifier for.
+        :returns integer identifier for the trait.
+        :raises `exception.TraitNotFound` if trait_str cannot be found in the
+                DB.
+        """
+        trait_ids = self.ids_from_strings([trait_str])
+        if not trait_ids:
+            raise exception.TraitNotFound(names=trait_str)
+        return trait_ids[six.text_type(trait_str)]
+
+    def ids_from_strings(self, trait_strs):
+        """Given an iterable of string representations of traits, return a
+        dict, keyed by those string names, of the integer codes of the traits.
+        The DB is looked up at most once, if some of the traits are not cached
+        yet.
+
+        :param trait_strs: The string representations of the traits to look
+                           up numeric identifiers for.
+        :returns dict, keyed by trait string name, of integer identifiers, not
+                 containing the traits which cannot be found in the DB.
+        """
+        trait_strs = set(six.text_type(trait_str) for trait_str in trait_strs)
+        with lockutils.lock(_LOCKNAME):
+            if not trait_strs.issubset(self.id_cache):
+                # Otherwise, check the database table
+                _refresh_from_db(self.ctx, self)
+            return {trait_str: self.id_cache[trait_str]
+                    for trait_str in trait_strs if trait_str in self.id_cache}
+
+    def string_from_id(self, trait_id):
+        """The reverse of the id_from_string() method. Given a supplied
+        numeric identifier for a trait, we look up the corresponding string
+        representation, via a DB lookup. The results of these DB lookups are
+        cached since the lookups are so frequent.
+
+        :param trait_id: The numeric representation of the trait to look up a
+                         string identifier for.
+        :returns: string identifier for the trait.
+        :raises `exception.TraitNotFound` if trait_id cannot be found in the
+                DB.
+        """
+        with lockutils.lock(_LOCKNAME):
+            if trait_id in self.str_cache:
+                return self.str_cache[trait_id]
+
+            # Otherwise, check the database table
+            _refresh_from_db(self.ctx, self)
+            if trait_id in self.str_cache:
+                return self.str_cache[trait_id]
+            raise exception.TraitNotFound(names=trait_id)
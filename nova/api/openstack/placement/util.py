@@ -13,12 +13,14 @@
 
 import functools
 import re
+import types
 
 import jsonschema
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_middleware import request_id
 from oslo_serialization import jsonutils
+from oslo_utils import encodeutils
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
 import webob
@@ -149,6 +151,102 @@ def json_error_formatter(body, status, title, environ):
     return {'errors': [error_dict]}
 
 
+class JSONPairs(object):
+    """An iterable of key and value pairs serialized as a JSON object.
+
+    Used by the handlers to build the objects of a JSON response body lazily,
+    see `set_json_body`.
+    """
+
+    __slots__ = ('pairs',)
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+
+def _is_lazy(value):
+    return isinstance(value, (JSONPairs, types.GeneratorType))
+
+
+def _materialize(obj):
+    """Return obj with its generators and JSONPairs turned into lists and
+    dicts.
+    """
+    if isinstance(obj, JSONPairs):
+        return {key: _materialize(value) for key, value in obj.pairs}
+    if isinstance(obj, types.GeneratorType):
+        return [_materialize(value) for value in obj]
+    if isinstance(obj, dict):
+        return {key: _materialize(value) for key, value in obj.items()}
+    return obj
+
+
+def _iter_json(obj):
+    """Yield the JSON serialization of obj in pieces.
+
+    The generators and JSONPairs are serialized as they are iterated, as
+    lists and objects respectively. The pieces concatenate to the same
+    string `jsonutils.dumps` returns for the materialized obj.
+    """
+    if isinstance(obj, JSONPairs):
+        items = obj.pairs
+    elif isinstance(obj, dict) and any(_is_lazy(v) for v in obj.values()):
+        items = obj.items()
+    elif isinstance(obj, types.GeneratorType):
+        yield '['
+        for index, value in enumerate(obj):
+            if index:
+                yield ', '
+            for chunk in _iter_json(value):
+                yield chunk
+        yield ']'
+        return
+    else:
+        yield jsonutils.dumps(obj)
+        return
+    yield '{'
+    for index, (key, value) in enumerate(items):
+        if index:
+            yield ', '
+        yield jsonutils.dumps(key)
+        yield ': '
+        for chunk in _iter_json(value):
+            yield chunk
+    yield '}'
+
+
+def _iter_json_chunks(obj, chunk_size=65536):
+    """Yield the UTF-8 encoded JSON serialization of obj in chunks of about
+    chunk_size bytes.
+    """
+    pieces = []
+    size = 0
+    for piece in _iter_json(obj):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield encodeutils.to_utf8(''.join(pieces))
+            pieces = []
+            size = 0
+    if pieces:
+        yield encodeutils.to_utf8(''.join(pieces))
+
+
+def set_json_body(response, obj):
+    """Set the body of response to the JSON serialization of obj.
+
+    The lists and objects of obj may be given as generators and JSONPairs.
+    If [placement]/stream_json_responses is True they are serialized while
+    the response is sent, otherwise they are materialized and the whole body
+    is serialized at once.
+    """
+    if CONF.placement.stream_json_responses:
+        response.app_iter = _iter_json_chunks(obj)
+    else:
+        response.body = encodeutils.to_utf8(
+            jsonutils.dumps(_materialize(obj)))
+
+
 def pick_last_modified(last_modified, obj):
     """Choose max of last_modified and obj.updated_at or obj.created_at.
 
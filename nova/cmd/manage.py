@@ -47,6 +47,7 @@ from sqlalchemy.engine import url as sqla_url
 
 # FIXME(cdent): This is a speedbump in the extraction process
 from nova.api.openstack.placement.objects import consumer as consumer_obj
+from nova.api.openstack.placement.objects import resource_provider as rp_obj
 from nova.cmd import common as cmd_common
 from nova.compute import api as compute_api
 import nova.conf
@@ -416,6 +417,8 @@ class DbCommands(object):
         instance_mapping_obj.populate_queued_for_delete,
         # Added in Stein
         compute_node_obj.migrate_empty_ratio,
+        # Added in Stein
+        rp_obj.set_root_provider_ids,
     )
 
     def __init__(self):
@@ -2308,6 +2311,53 @@ class PlacementCommands(object):
 
         return return_code
 
+    @action_description(
+        _("Rebuilds the resource_provider_usages table of the Placement "
+          "database from the allocations, or verifies it. Requires the "
+          "[api_database] or [placement_database] section of the nova "
+          "configuration file to be populated."))
+    @args('--verify', action='store_true', dest='verify', default=False,
+          help='Report the usages of the table which do not match the '
+               'allocations instead of rebuilding it.')
+    def sync_usages(self, verify=False):
+        """Rebuilds or verifies the usages of the resource providers
+
+        The resource_provider_usages table holds the sums of the allocations
+        of each resource class of each resource provider, when the
+        [placement]/usage_table option is "maintain" or "use". This rebuilds
+        it from the allocations, which is needed before setting the option
+        to "use".
+
+        NOTE: The allocations written while the table is rebuilt or verified
+        may be reported as not matching, run the command again to check them.
+
+        Return codes:
+
+        * 0: Successful run
+        * 1: --verify found usages which do not match the allocations
+        """
+        ctxt = context.get_admin_context()
+        if not verify:
+            count = rp_obj.sync_usages(ctxt)
+            print(_('Wrote %d resource provider usages.') % count)
+            return 0
+
+        mismatches = rp_obj.verify_usages(ctxt)
+        if not mismatches:
+            print(_('The resource provider usages match the allocations.'))
+            return 0
+        t = prettytable.PrettyTable([_('Resource Provider'),
+                                     _('Resource Class'),
+                                     _('Allocated'),
+                                     _('Recorded')])
+        for mismatch in mismatches:
+            t.add_row([mismatch['resource_provider_uuid'],
+                       mismatch['resource_class'],
+                       mismatch['allocated'],
+                       mismatch['recorded']])
+        print(t)
+        return 1
+
 
 CATEGORIES = {
     'api_db': ApiDbCommands,
@@ -49,9 +49,11 @@ PLACEMENT_DOCS_LINK = 'https://docs.openstack.org/nova/latest' \
 
 # NOTE(efried): 1.30 is required by nova-compute to support resource provider
 # reshaping (inventory and allocation data migration).
+# 1.31 is required by nova-compute to retrieve the allocations of a provider
+# tree in a single request.
 # NOTE: If you bump this version, remember to update the history
 # section in the nova-status man page (doc/source/cli/nova-status).
-MIN_PLACEMENT_MICROVERSION = "1.30"
+MIN_PLACEMENT_MICROVERSION = "1.31"
 
 
 class UpgradeCommands(upgradecheck.UpgradeCommands):
@@ -6638,7 +6638,9 @@ class ComputeManager(manager.Manager):
         self.instance_events.clear_events_for_instance(instance)
 
         # NOTE(timello): make sure we update available resources on source
-        # host even before next periodic task.
+        # host even before next periodic task. The instance left the node
+        # without a move claim, so its usage has to be audited from scratch.
+        self._get_resource_tracker().request_full_audit(source_node)
         self.update_available_resource(ctxt)
 
         self._update_scheduler_instance_info(ctxt, instance)
@@ -6750,6 +6752,12 @@ class ComputeManager(manager.Manager):
                 instance.node = node_name
                 instance.progress = 0
                 instance.save(expected_task_state=task_states.MIGRATING)
+                # The instance landed on the node without a resource claim,
+                # so the next update of the available resources has to audit
+                # its usage from scratch.
+                if node_name is not None:
+                    self._get_resource_tracker().request_full_audit(
+                        node_name)
 
         # NOTE(tr3buchet): tear down networks on source host (nova-net)
         # NOTE(mriedem): For neutron, this will delete any inactive source
@@ -0,0 +1,116 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Background synchronization of the compute nodes to the placement service.
+"""
+
+import collections
+import copy
+import threading
+
+from oslo_log import log as logging
+
+from nova import exception
+from nova import utils
+
+LOG = logging.getLogger(__name__)
+
+# The number of times the synchronization of a compute node is attempted when
+# it fails because another process updated its resource providers.
+MAX_ATTEMPTS = 4
+
+# The exceptions after which the synchronization of a compute node is
+# attempted again. The report client invalidates its cache of the resource
+# providers it failed to update, so the next attempt reads them again.
+_RETRIED_EXCEPTIONS = (
+    exception.ResourceProviderUpdateConflict,
+    exception.ResourceProviderSyncFailed,
+)
+
+
+class PlacementSyncWorker(object):
+    """Synchronizes the compute nodes to the placement service in a
+    background greenthread.
+
+    The synchronizations requested for a compute node while a previous one is
+    pending are coalesced into a single one, of the latest state of the
+    compute node. Since the report client only writes what changed since its
+    last synchronization of a provider tree, this results in a single write of
+    all the changes.
+    """
+
+    def __init__(self, sync_func):
+        """:param sync_func: Callable taking a RequestContext and a
+                             ComputeNode, which synchronizes the resource
+                             providers of the compute node to placement.
+        """
+        self.sync_func = sync_func
+        # The (context, compute_node, attempt) tuples of the pending
+        # synchronizations, keyed by the UUID of the compute nodes.
+        self._pending = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._running = False
+
+    def sync(self, context, compute_node):
+        """Requests the synchronization of the compute node to placement.
+
+        A copy of the compute node is synchronized, so that it can keep
+        changing while the synchronization is pending.
+        """
+        compute_node = copy.deepcopy(compute_node)
+        with self._lock:
+            # Move the compute node after the other pending ones, so that a
+            # compute node changing often doesn't delay the others.
+            self._pending.pop(compute_node.uuid, None)
+            self._pending[compute_node.uuid] = (context, compute_node, 1)
+            if self._running:
+                return
+            self._running = True
+        utils.spawn_n(self._run)
+
+    def _pop(self):
+        with self._lock:
+            if not self._pending:
+                self._running = False
+                return None
+            return self._pending.popitem(last=False)[1]
+
+    def _run(self):
+        item = self._pop()
+        while item is not None:
+            self._sync(*item)
+            item = self._pop()
+
+    def _sync(self, context, compute_node, attempt):
+        try:
+            self.sync_func(context, compute_node)
+        except _RETRIED_EXCEPTIONS as e:
+            if attempt >= MAX_ATTEMPTS:
+                LOG.error("Failed to synchronize compute node %(node)s to "
+                          "placement after %(attempts)d attempts: %(error)s",
+                          {'node': compute_node.hypervisor_hostname,
+                           'attempts': attempt, 'error': e})
+                return
+            LOG.debug("Failed to synchronize compute node %(node)s to "
+                      "placement, retrying: %(error)s",
+                      {'node': compute_node.hypervisor_hostname, 'error': e})
+            with self._lock:
+                # A newer state of the compute node supersedes this one.
+                if compute_node.uuid not in self._pending:
+                    self._pending[compute_node.uuid] = (
+                        context, compute_node, attempt + 1)
+        except Exception:
+            # The compute node is synchronized again on the next update of the
+            # available resources.
+            LOG.exception("Failed to synchronize compute node %(node)s to "
+                          "placement.",
+                          {'node': compute_node.hypervisor_hostname})
@@ -20,14 +20,17 @@ model.
 """
 import collections
 import copy
+import functools
 
 from keystoneauth1 import exceptions as ks_exc
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 import retrying
 
 from nova.compute import claims
 from nova.compute import monitors
+from nova.compute import placement_sync
 from nova.compute import stats as compute_stats
 from nova.compute import task_states
 from nova.compute import utils as compute_utils
@@ -51,6 +54,13 @@ CONF = nova.conf.CONF
 
 LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
+# The fields of the compute nodes holding the usage accounted from the
+# instances and migrations rather than reported by the hypervisor.
+_USAGE_FIELDS = ('vcpus_used', 'memory_mb_used', 'local_gb_used',
+                 'current_workload', 'running_vms', 'numa_topology')
+# The usage fields checked for drift by the full audits.
+_AUDITED_USAGE_FIELDS = ('vcpus_used', 'memory_mb_used', 'local_gb_used',
+                         'running_vms')
 
 
 def _instance_in_resize_state(instance):
@@ -148,6 +158,11 @@ class ResourceTracker(object):
         self.old_resources = collections.defaultdict(objects.ComputeNode)
         self.scheduler_client = scheduler_client.SchedulerClient()
         self.reportclient = self.scheduler_client.reportclient
+        self.placement_sync = placement_sync.PlacementSyncWorker(
+            functools.partial(self._update_to_placement, startup=False))
+        # Dict of the times of the last full audits of the resource usage,
+        # keyed by nodename
+        self.last_full_audits = {}
         self.ram_allocation_ratio = CONF.ram_allocation_ratio
         self.cpu_allocation_ratio = CONF.cpu_allocation_ratio
         self.disk_allocation_ratio = CONF.disk_allocation_ratio
@@ -669,6 +684,7 @@ class ResourceTracker(object):
         self.stats.pop(nodename, None)
         self.compute_nodes.pop(nodename, None)
         self.old_resources.pop(nodename, None)
+        self.last_full_audits.pop(nodename, None)
 
     def _get_host_metrics(self, context, nodename):
         """Get the metrics from monitors and
@@ -753,15 +769,50 @@ class ResourceTracker(object):
                               'another host\'s instance!',
                           {'uuid': migration.instance_uuid})
 
+    def _full_audit_needed(self, nodename, startup):
+        """Returns True if the resource usage of the node has to be audited
+        from scratch, False if the usage accounted incrementally since the
+        last full audit is kept.
+        """
+        interval = CONF.compute.resource_audit_interval
+        if startup or not interval or nodename not in self.compute_nodes:
+            return True
+        last_full_audit = self.last_full_audits.get(nodename)
+        return (last_full_audit is None or
+                timeutils.is_older_than(last_full_audit, interval))
+
+    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    def request_full_audit(self, nodename):
+        """Make the next update of the available resources of the node audit
+        its resource usage from scratch.
+
+        This is needed when instances moved to or from the node without a
+        resource claim or drop the incremental accounting would see, like at
+        the end of a live migration.
+        """
+        self.last_full_audits.pop(nodename, None)
+
     @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
     def _update_available_resource(self, context, resources, startup=False):
+        nodename = resources['hypervisor_hostname']
+        if not self._full_audit_needed(nodename, startup):
+            self._update_available_resource_incrementally(context, resources)
+            return
+
+        # Keep the usage accounted incrementally since the last full audit to
+        # report any drift.
+        incremental_usage = None
+        if (CONF.compute.resource_audit_interval and
+                nodename in self.last_full_audits):
+            cn = self.compute_nodes[nodename]
+            incremental_usage = {field: getattr(cn, field)
+                                 for field in _AUDITED_USAGE_FIELDS
+                                 if cn.obj_attr_is_set(field)}
 
         # initialize the compute node object, creating it
         # if it does not already exist.
         is_new_compute_node = self._init_compute_node(context, resources)
 
-        nodename = resources['hypervisor_hostname']
-
         # if we could not init the compute node the tracker will be
         # disabled and we should quit now
         if self.disabled(nodename):
@@ -800,6 +851,10 @@ class ResourceTracker(object):
 
         cn = self.compute_nodes[nodename]
 
+        if incremental_usage is not None:
+            self._report_usage_drift(cn, incremental_usage)
+        self.last_full_audits[nodename] = timeutils.utcnow()
+
         # NOTE(yjiang5): Because pci device tracker status is not cleared in
         # this periodic task, and also because the resource tracker is not
         # notified when instances are deleted, we need remove all usages
@@ -820,6 +875,76 @@ class ResourceTracker(object):
         LOG.debug('Compute_service record updated for %(host)s:%(node)s',
                   {'host': self.host, 'node': nodename})
 
+    def _update_available_resource_incrementally(self, context, resources):
+        """Refresh the resources of a compute node reported by the hypervisor,
+        keeping the usage accounted incrementally from the resource claims and
+        drops and the instance updates since the last full audit.
+
+        Unlike _update_available_resource, this doesn't read the instances
+        and migrations of the node from the database.
+        """
+        nodename = resources['hypervisor_hostname']
+        cn = self.compute_nodes[nodename]
+        self._copy_resources_keeping_usage(cn, resources)
+
+        if self.disabled(nodename):
+            return
+
+        if self.pci_tracker:
+            cn.pci_device_pools = self.pci_tracker.stats.to_device_pools_obj()
+
+        self._report_final_resource_view(nodename)
+
+        metrics = self._get_host_metrics(context, nodename)
+        cn.metrics = jsonutils.dumps(metrics)
+
+        self._update(context, cn)
+        LOG.debug('Compute_service record updated incrementally for '
+                  '%(host)s:%(node)s', {'host': self.host, 'node': nodename})
+
+    def _copy_resources_keeping_usage(self, compute_node, resources):
+        """Copy resource values to supplied compute_node like _copy_resources,
+        keeping the usage accounted from the instances and migrations.
+        """
+        nodename = resources['hypervisor_hostname']
+        stats = self.stats[nodename]
+        # The instance counts and states are maintained by
+        # Stats.update_stats_for_instance, the other stats come from the
+        # hypervisor.
+        instance_stats = {key: value for key, value in stats.items()
+                          if key.startswith('num_') or key == 'io_workload'}
+        instance_states = dict(stats.states)
+        usage = {field: getattr(compute_node, field) for field in _USAGE_FIELDS
+                 if compute_node.obj_attr_is_set(field)}
+
+        self._copy_resources(compute_node, resources)
+
+        stats.update(instance_stats)
+        stats.states.update(instance_states)
+        compute_node.stats = stats
+        for field, value in usage.items():
+            setattr(compute_node, field, value)
+        # free ram and disk may be negative, depending on policy:
+        compute_node.free_ram_mb = (compute_node.memory_mb -
+                                    compute_node.memory_mb_used)
+        compute_node.free_disk_gb = (compute_node.local_gb -
+                                     compute_node.local_gb_used)
+
+    def _report_usage_drift(self, cn, incremental_usage):
+        """Log a warning if the usage of the compute node audited from scratch
+        differs from the usage accounted incrementally.
+        """
+        drift = {field: {'incremental': value,
+                         'audited': getattr(cn, field)}
+                 for field, value in incremental_usage.items()
+                 if value != getattr(cn, field)}
+        if drift:
+            LOG.warning("The resource usage of compute node %(host)s:%(node)s "
+                        "accounted incrementally since the last full audit "
+                        "drifted from the audited usage: %(drift)s",
+                        {'host': self.host, 'node': cn.hypervisor_hostname,
+                         'drift': drift})
+
     def _get_compute_node(self, context, nodename):
         """Returns compute node for the host and nodename."""
         try:
@@ -972,6 +1097,15 @@ class ResourceTracker(object):
                 self.scheduler_client.update_compute_node(context,
                                                           compute_node)
 
+    def _update_scheduler_host_state(self, context, compute_node):
+        """Sends the updated ComputeNode to the schedulers so they can
+        refresh their cached host state without hitting the database.
+        """
+        if not CONF.filter_scheduler.host_state_cache_max_age:
+            return
+        self.scheduler_client.update_compute_node_info(
+            context.elevated(), self.host, compute_node)
+
     @retrying.retry(stop_max_attempt_number=4,
                     retry_on_exception=lambda e: isinstance(
                         e, exception.ResourceProviderUpdateConflict))
@@ -983,8 +1117,14 @@ class ResourceTracker(object):
             # for all resource provider's inv data. We can remove this check.
             # At the moment we still need this check and save compute_node.
             compute_node.save()
+            self._update_scheduler_host_state(context, compute_node)
 
-        self._update_to_placement(context, compute_node, startup)
+        if startup or not CONF.compute.async_placement_sync:
+            self._update_to_placement(context, compute_node, startup)
+        else:
+            # Placement is updated in the background, so that the
+            # COMPUTE_RESOURCE_SEMAPHORE is not held while waiting for it.
+            self.placement_sync.sync(context, compute_node)
 
         if self.pci_tracker:
             self.pci_tracker.save(context)
@@ -1251,20 +1391,33 @@ class ResourceTracker(object):
         # happen according to the normal flow of events where the scheduler
         # always creates allocations for an instance
         try:
-            # pai: report.ProviderAllocInfo namedtuple
-            pai = self.reportclient.get_allocations_for_resource_provider(
-                context, cn.uuid)
+            # The allocations of the consumers of the provider tree of this
+            # compute node, keyed by consumer UUID.
+            allocations = self.reportclient.get_allocations_for_providers(
+                context, in_tree=cn.uuid)
         except (exception.ResourceProviderAllocationRetrievalFailed,
                 ks_exc.ClientException) as e:
             LOG.error("Skipping removal of allocations for deleted instances: "
                       "%s", e)
             return
-        allocations = pai.allocations
         if not allocations:
             # The main loop below would short-circuit anyway, but this saves us
             # the (potentially expensive) context.elevated construction below.
             return
-        read_deleted_context = context.elevated(read_deleted='yes')
+        # Look up the instances we don't know about in a single query rather
+        # than one query per instance.
+        unknown_uuids = [consumer_uuid for consumer_uuid in allocations
+                         if consumer_uuid not in self.tracked_instances and
+                         consumer_uuid not in migration_uuids and
+                         consumer_uuid not in instance_by_uuid]
+        if unknown_uuids:
+            read_deleted_context = context.elevated(read_deleted='yes')
+            instance_by_uuid = dict(instance_by_uuid)
+            instance_by_uuid.update(
+                (instance.uuid, instance)
+                for instance in objects.InstanceList.get_by_filters(
+                    read_deleted_context, {'uuid': unknown_uuids},
+                    expected_attrs=[]))
         for consumer_uuid, alloc in allocations.items():
             if consumer_uuid in self.tracked_instances:
                 LOG.debug("Instance %s actively managed on this compute host "
@@ -1281,23 +1434,18 @@ class ResourceTracker(object):
             instance_uuid = consumer_uuid
             instance = instance_by_uuid.get(instance_uuid)
             if not instance:
-                try:
-                    instance = objects.Instance.get_by_uuid(
-                        read_deleted_context, consumer_uuid,
-                        expected_attrs=[])
-                except exception.InstanceNotFound:
-                    # The instance isn't even in the database. Either the
-                    # scheduler _just_ created an allocation for it and we're
-                    # racing with the creation in the cell database, or the
-                    #  instance was deleted and fully archived before we got a
-                    # chance to run this. The former is far more likely than
-                    # the latter. Avoid deleting allocations for a building
-                    # instance here.
-                    LOG.info("Instance %(uuid)s has allocations against this "
-                             "compute host but is not found in the database.",
-                             {'uuid': instance_uuid},
-                             exc_info=False)
-                    continue
+                # The instance isn't even in the database. Either the
+                # scheduler _just_ created an allocation for it and we're
+                # racing with the creation in the cell database, or the
+                #  instance was deleted and fully archived before we got a
+                # chance to run this. The former is far more likely than
+                # the latter. Avoid deleting allocations for a building
+                # instance here.
+                LOG.info("Instance %(uuid)s has allocations against this "
+                         "compute host but is not found in the database.",
+                         {'uuid': instance_uuid},
+                         exc_info=False)
+                continue
 
             if instance.deleted:
                 # The instance is gone, so we definitely want to remove
@@ -1335,16 +1483,16 @@ class ResourceTracker(object):
                 # migration, evacuation or unshelve in between the time when we
                 # ran InstanceList.get_by_host_and_node(), added those
                 # instances to RT.tracked_instances and the above
-                # Instance.get_by_uuid() call. We SHOULD attempt to remove any
-                # allocations that reference this compute host if the VM is in
-                # a stable terminal state (i.e. it isn't in a state of waiting
-                # for resize to confirm/revert), however if the destination
-                # host is an Ocata compute host, it will delete the allocation
-                # that contains this source compute host information anyway and
-                # recreate an allocation that only refers to itself. So we
-                # don't need to do anything in that case. Just log the
-                # situation here for information but don't attempt to delete or
-                # change the allocation.
+                # InstanceList.get_by_filters() call. We SHOULD attempt to
+                # remove any allocations that reference this compute host if
+                # the VM is in a stable terminal state (i.e. it isn't in a
+                # state of waiting for resize to confirm/revert), however if
+                # the destination host is an Ocata compute host, it will
+                # delete the allocation that contains this source compute host
+                # information anyway and recreate an allocation that only
+                # refers to itself. So we don't need to do anything in that
+                # case. Just log the situation here for information but don't
+                # attempt to delete or change the allocation.
                 LOG.warning("Instance %s has been moved to another host "
                             "%s(%s). There are allocations remaining against "
                             "the source host that might need to be removed: "
@@ -498,6 +498,29 @@ def notify_about_scheduler_action(context, request_spec, action, phase=None,
     notification.emit(context)
 
 
+@rpc.if_notifications_enabled
+def notify_about_scheduler_timing(context, summary, end):
+    """Send versioned notification about the timings of the scheduling
+    requests.
+
+    :param context: the RequestContext object
+    :param summary: the nova.scheduler.timing.TimingSummary of the requests
+    :param end: the time at which the summary was closed
+    """
+    payload = scheduler_notification.SchedulerTimingPayload(
+        host=CONF.host, summary=summary, end=end)
+    notification = scheduler_notification.SchedulerTimingNotification(
+        context=context,
+        priority=fields.NotificationPriority.INFO,
+        publisher=notification_base.NotificationPublisher(
+            host=CONF.host, source=fields.NotificationSource.SCHEDULER),
+        event_type=notification_base.EventType(
+            object='scheduler_timing',
+            action=fields.NotificationAction.UPDATE),
+        payload=payload)
+    notification.emit(context)
+
+
 @rpc.if_notifications_enabled
 def notify_about_volume_attach_detach(context, instance, host, action, phase,
                                       volume_id=None, exception=None, tb=None):
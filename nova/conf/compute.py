@@ -731,6 +731,77 @@ process, causing it to be repopulated the next time the data is accessed.
 Possible values:
 
 * Any positive integer in seconds, or zero to disable refresh.
+"""),
+    cfg.IntOpt('provider_update_concurrency',
+        default=1,
+        min=1,
+        help="""
+Number of resource providers whose inventories, traits and aggregates are
+updated concurrently in the placement service by the compute service.
+
+When the resources of a compute service are modeled with many resource
+providers, like the nodes of an Ironic compute service or the NUMA nodes and
+physical functions of a libvirt host, updating them one after the other can
+take a long time. The providers are still created one after the other, and
+the parent providers are updated after their children and deleted after
+them. The connections kept alive to the placement service are raised to this
+number as well.
+
+Possible values:
+
+* 1: The providers are updated one after the other.
+* Any integer greater than 1: The maximum number of providers updated
+  concurrently.
+"""),
+    cfg.BoolOpt('async_placement_sync',
+        default=False,
+        help="""
+Synchronize the resource providers of the compute nodes to the placement
+service in the background.
+
+By default, the resource tracker updates the inventories, traits and
+aggregates of the resource providers in placement each time it updates the
+resources of a compute node, while holding the lock which resource claims
+like the ones of the instance builds wait for. When this option is enabled,
+only the local resource tracking is done while holding the lock, and the
+synchronization to placement is done by a background worker. The updates of
+a compute node made while its synchronization is pending are synchronized
+together, and a synchronization failing because another process updated the
+resource providers is attempted again.
+
+The resource providers are still synchronized before the compute service
+starts, where an update of their shape may be needed.
+
+Related options:
+
+* ``[compute]/resource_provider_association_refresh``
+"""),
+    cfg.IntOpt('resource_audit_interval',
+        default=0,
+        min=0,
+        help="""
+Interval, in seconds, between the full audits of the resource usage of the
+compute nodes.
+
+By default, each run of the ``update_available_resource`` periodic task
+rebuilds the resource usage of the compute nodes from scratch, reading all the
+instances and in-progress migrations of the node from the database. When this
+option is set, the runs of the periodic task in between the full audits only
+refresh the resources reported by the hypervisor and keep the usage
+maintained incrementally by the resource claims and drops and the instance
+updates of the compute service. The full audits reconcile the usage with the
+database and log a warning when it drifted from the incremental accounting.
+The completion of a live migration, which moves an instance without resource
+claims, triggers a full audit of its source and destination nodes.
+
+Possible values:
+
+* 0: Every run of the periodic task does a full audit.
+* Any positive integer in seconds.
+
+Related options:
+
+* ``update_resources_interval``
 """),
    cfg.StrOpt('cpu_shared_set',
         help="""
@@ -35,6 +35,125 @@ are returned in a deterministic but undefined order. That is, all things
 being equal, two requests for allocation candidates will return the same
 results in the same order; but no guarantees are made as to how that order
 is determined.
+"""),
+    cfg.BoolOpt(
+        'use_provider_graph',
+        default=False,
+        help="""
+If True, each placement worker keeps a graph of the resource providers, their
+inventories, usages, traits and aggregates in memory, and computes the
+allocation candidates against it instead of querying the database for each
+``GET /allocation_candidates`` request.
+
+The writes to the resource providers are recorded in a change log table which
+the workers poll to keep their graph up to date, so this must be enabled on
+all the placement workers sharing a database. Allocation candidates may be
+computed against changes older than ``provider_graph_poll_interval`` seconds;
+the capacity of the providers is still checked when the allocations are
+written.
+
+Related options:
+
+* ``[placement]/provider_graph_poll_interval``
+"""),
+    cfg.IntOpt(
+        'provider_graph_poll_interval',
+        default=1,
+        min=0,
+        help="""
+Number of seconds between the polls of the change log of the resource
+providers by a placement worker keeping a graph of them in memory. The change
+log is polled when handling the ``GET /allocation_candidates`` requests, so a
+worker which did not get one for that long polls it on the next one.
+
+Possible values:
+
+* 0: Poll the change log for each request.
+* Any positive integer: Number of seconds between the polls.
+
+Related options:
+
+* ``[placement]/use_provider_graph``
+"""),
+    cfg.StrOpt(
+        'usage_table',
+        default='none',
+        choices=[
+            ('none', 'The usages of the resource providers are summed from '
+             'their allocations, and the ``resource_provider_usages`` table '
+             'is not updated.'),
+            ('maintain', 'The ``resource_provider_usages`` table is updated '
+             'in the transactions writing the allocations, but the usages '
+             'are still summed from the allocations.'),
+            ('use', 'The ``resource_provider_usages`` table is updated in '
+             'the transactions writing the allocations, and the usages are '
+             'read from it.'),
+        ],
+        help="""
+How the placement service gets the amount of each resource class used on the
+resource providers, when checking their capacity and reporting their usages.
+
+Summing the allocations gets slower as the providers hold more of them, like
+the shared storage providers. The ``resource_provider_usages`` table holds
+these sums instead, updated along with the allocations.
+
+To start using the table, set this option to ``maintain`` on all the
+placement workers sharing a database, run ``nova-manage placement
+sync_usages``, then set this option to ``use`` on all of them. The same command
+with ``--verify`` reports the usages of the table which don't match the
+allocations.
+"""),
+    cfg.BoolOpt(
+        'stream_json_responses',
+        default=False,
+        help="""
+If True, the JSON bodies of the responses listing many objects, like
+``GET /allocation_candidates``, ``GET /resource_providers`` and
+``GET /resource_providers/{uuid}/allocations``, are serialized and sent while
+they are iterated instead of being built whole in memory first. This lowers
+the memory used by the placement workers and the time to the first byte of
+these responses, which are then sent without a ``Content-Length`` header.
+"""),
+    cfg.BoolOpt(
+        'use_replica_for_reads',
+        default=False,
+        help="""
+If True, the placement service runs the ``GET`` requests against the database
+replica configured in ``[placement_database]/slave_connection``, or in
+``[api_database]/slave_connection`` when ``[placement_database]/connection`` is
+not set. This takes the read load of the scheduler, like the
+``GET /allocation_candidates`` requests, off the primary database.
+
+The replica may lag behind the primary, so the clients may not read their
+latest writes. The writes are still checked against the primary database with
+the generations of the resource providers and consumers. Without a replica
+configured the ``GET`` requests run against the primary database either way.
+"""),
+    cfg.BoolOpt(
+        'sql_timing',
+        default=False,
+        help="""
+If True, the placement service records the number and total duration of the
+SQL statements run for each request, along with its slowest statements
+labelled by the placement function which ran them, and adds them to the
+request log line. This costs a little time for each statement, so it is meant
+to find out which statements slow down the requests.
+
+Related options:
+
+* ``[placement]/sql_timing_header``
+"""),
+    cfg.BoolOpt(
+        'sql_timing_header',
+        default=False,
+        help="""
+If True, the SQL statements recorded for each request are also reported in the
+``openstack-placement-sql-timing`` header of the responses to the callers
+authorized by the ``admin_api`` policy rule.
+
+Related options:
+
+* ``[placement]/sql_timing``: This option has no effect unless it is True.
 """),
     # TODO(mriedem): When placement is split out of nova, this should be
     # deprecated since then [oslo_policy]/policy_file can be used.
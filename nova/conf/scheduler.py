@@ -177,6 +177,46 @@ be the same as not finding any suitable hosts.
 
 Note that if you enable this flag, you can disable the (less efficient)
 AvailabilityZoneFilter in the scheduler.
+"""),
+    cfg.IntOpt("timing_summary_interval",
+               default=-1,
+               min=-1,
+               help="""
+Periodic task interval.
+
+This value controls how often (in seconds) the scheduler logs a summary of
+the time spent in each step of the scheduling requests handled since the
+previous summary: each filter, each weigher, the placement query, the loading
+of the host states and the claim of the resources. If negative (the default),
+the scheduling requests are not timed.
+
+The summary gives the number of requests, the total time and an estimate of
+the 50th, 90th and 99th percentiles of the per-request duration of each step,
+which helps finding the filters or weighers dominating the scheduling latency.
+The per-request durations are also logged at debug level.
+
+Possible values:
+
+* A negative integer, to disable the timing of the scheduling requests.
+* 0 to log the summary at the default interval of the periodic tasks.
+* A positive integer, the interval in seconds between two summaries.
+
+Related options:
+
+* ``[scheduler] timing_notifications``
+"""),
+    cfg.BoolOpt("timing_notifications",
+                default=False,
+                help="""
+Emit a versioned ``scheduler_timing.update`` notification with each summary
+of the timings of the scheduling requests.
+
+Related options:
+
+* ``[scheduler] timing_summary_interval``: the summaries and thus the
+  notifications are only made if this option is not negative.
+* ``[notifications] notification_format``: the notification is only emitted
+  if versioned notifications are enabled.
 """),
 ]
 
@@ -274,6 +314,69 @@ NOTE: In a multi-cell (v2) setup where the cell MQ is separated from the
 top-level, computes cannot directly communicate with the scheduler. Thus,
 this option cannot be enabled in that scenario. See also the
 [workarounds]/disable_group_policy_check_upcall option.
+"""),
+    cfg.IntOpt("host_state_cache_max_age",
+        default=0,
+        min=0,
+        help="""
+Maximum age, in seconds, of the scheduler's cached view of a cell's compute
+nodes.
+
+By default the scheduler reads the compute node and service records of every
+enabled cell from the database for each scheduling request. When this option
+is set to a positive value, the scheduler instead keeps its host states
+resident in memory and only re-reads a cell from the database once the cached
+view of that cell is older than this value. In between, compute services push
+their compute node record to the schedulers whenever its resources change,
+so the cached host states are updated incrementally.
+
+This option needs to be set to the same value on the scheduler and on the
+compute services, since the compute services only push their updates when
+it is enabled.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+Possible values:
+
+* 0: Disable caching, read the host states from the database on each request
+* A positive integer, where the integer corresponds to the maximum age of the
+  cached view of a cell, in seconds
+
+Related options:
+
+* track_instance_changes
+"""),
+    cfg.IntOpt("numa_fit_cache_size",
+        default=0,
+        min=0,
+        help="""
+Number of NUMA fitting results kept by the NUMATopologyFilter across the
+scheduling requests.
+
+The NUMATopologyFilter fits the NUMA topology of the requested instance onto
+the NUMA cells of each candidate host. Within a request, the result of fitting
+it onto a host is reused for the other hosts with the same NUMA topology and
+usage, e.g. the idle hosts of a hardware model. When this option is set to a
+positive value, the most recently used results are also kept for the
+following requests asking for the same NUMA topology, up to this number of
+results.
+
+The results are never reused for the requests asking for PCI devices, since
+whether they fit depends on the PCI devices of each host.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+Possible values:
+
+* 0: Only reuse the NUMA fitting results within a request
+* A positive integer, where the integer corresponds to the maximum number of
+  results kept across the requests
+
+Related options:
+
+* enabled_filters
 """),
     cfg.MultiStrOpt("available_filters",
         default=["nova.scheduler.filters.all_filters"],
@@ -336,6 +439,56 @@ Related options:
 * All of the filters in this option *must* be present in the
   'available_filters' option, or a SchedulerHostFilterNotFound
   exception will be raised.
+"""),
+    cfg.BoolOpt("vectorize_filters",
+        default=False,
+        help="""
+Evaluate the resource filters against all candidate hosts at once.
+
+When enabled, the resources of the candidate hosts are gathered into numpy
+arrays and the filters supporting it (RamFilter, CoreFilter, DiskFilter,
+NumInstancesFilter and IoOpsFilter) evaluate all of the hosts in a single
+array operation instead of being called for each host. Other filters keep
+checking each host individually. The results are the same either way, but
+the per-host debug messages of the vectorized filters are not logged.
+
+This requires the numpy library to be installed. If it is not, this option
+is ignored and a warning is logged.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+Related options:
+
+* enabled_filters
+"""),
+    cfg.BoolOpt("vectorize_weighers",
+        default=False,
+        help="""
+Weigh all candidate hosts at once.
+
+When enabled, the weighers supporting it (RAMWeigher, CPUWeigher, DiskWeigher,
+IoOpsWeigher, MetricsWeigher, PCIWeigher and the soft (anti-)affinity
+weighers) return the weights of all of the candidate hosts as a numpy array,
+and the normalization, the weight multipliers and the sum of the weights are
+applied as array operations. Other weighers keep weighing each host
+individually.
+
+The weighed hosts are then only fully sorted up to host_subset_size plus the
+number of alternates and of instances in the request; the remaining hosts
+follow in no particular order.
+
+This requires the numpy library to be installed. If it is not, this option
+is ignored and a warning is logged.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+Related options:
+
+* weight_classes
+* host_subset_size
+* [scheduler]/max_attempts
 """),
     cfg.ListOpt("weight_classes",
         default=["nova.scheduler.weights.all_weighers"],
@@ -536,6 +689,60 @@ In such case enabling this option will reduce contention and chances for
 rescheduling events.
 At the same time it will make the instance packing (even in unweighed case)
 less dense.
+"""),
+    cfg.BoolOpt(
+        "incremental_host_ranking",
+        default=False,
+        help="""
+Reuse the ranking of the hosts across the instances of a multi-create request.
+
+By default, all of the candidate hosts are filtered, weighed and sorted again
+for each instance of a request creating multiple instances. When this option
+is enabled, this is only done for the first instance, and only the best
+host_subset_size + max_attempts hosts are kept sorted. For the next
+instances, only those hosts are filtered and weighed again after resources
+were consumed from them, and the other hosts only replace them when they
+become better than them. The whole list of hosts is only processed again
+if a weigher's normalization range changes or if claiming resources fails on
+every one of the best hosts.
+
+Since only the best hosts are kept, fewer alternate hosts may be returned
+for each instance of a large multi-create request.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+Related options:
+
+* host_subset_size
+* shuffle_best_same_weighed_hosts
+* [scheduler]/max_attempts
+"""),
+    cfg.BoolOpt(
+        "bulk_claim_resources",
+        default=False,
+        help="""
+Claim the resources of all the instances of a multi-create request at once.
+
+By default, the resources of each instance of a request creating multiple
+instances are claimed in the placement service with a separate request once
+its host is selected. When this option is enabled, a host is selected for
+each instance first, then the resources of all of the instances are claimed
+with a single ``POST /allocations`` request. If that request fails, for
+example because another scheduler claimed resources on some of the hosts in
+the meantime, the resources of each instance are claimed separately and only
+the instances whose claim fails on their selected host are scheduled again.
+
+This requires the allocation candidates to be requested with placement API
+microversion 1.28 or later, so that the allocations of existing consumers
+are never overwritten; the resources are claimed separately otherwise.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+Related options:
+
+* incremental_host_ranking
 """),
     cfg.StrOpt(
         "image_properties_default_architecture",
@@ -0,0 +1,41 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Database migrations for the usages of the resource providers"""
+
+from migrate import UniqueConstraint
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    resource_provider_usages = Table('resource_provider_usages', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('id', Integer, primary_key=True, nullable=False,
+               autoincrement=True),
+        Column('resource_provider_id', Integer, nullable=False),
+        Column('resource_class_id', Integer, nullable=False),
+        Column('used', Integer, nullable=False, default=0),
+        UniqueConstraint('resource_provider_id', 'resource_class_id',
+            name='uniq_resource_provider_usages0resource_provider_'
+                 'resource_class'),
+        mysql_engine='InnoDB',
+        mysql_charset='latin1'
+    )
+
+    resource_provider_usages.create(checkfirst=True)
@@ -388,6 +388,40 @@ class ResourceProviderAggregate(API_BASE):
     aggregate_id = Column(Integer, primary_key=True, nullable=False)
 
 
+class ResourceProviderChange(API_BASE):
+    """Records that a resource provider, its inventories, allocations, traits
+    or aggregates changed, for the placement workers keeping a graph of the
+    providers in memory.
+    """
+
+    __tablename__ = 'resource_provider_changes'
+    __table_args__ = (
+        Index('resource_provider_changes_created_at_idx', 'created_at'),
+    )
+
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    # Not a foreign key: the deletions of the providers are recorded as well
+    resource_provider_id = Column(Integer, nullable=False)
+
+
+class ResourceProviderUsage(API_BASE):
+    """The total amount of a resource class allocated from a resource provider,
+    maintained along with the allocations.
+    """
+
+    __tablename__ = 'resource_provider_usages'
+    __table_args__ = (
+        schema.UniqueConstraint('resource_provider_id', 'resource_class_id',
+            name='uniq_resource_provider_usages0resource_provider_'
+                 'resource_class'),
+    )
+
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    resource_provider_id = Column(Integer, nullable=False)
+    resource_class_id = Column(Integer, nullable=False)
+    used = Column(Integer, nullable=False, default=0)
+
+
 class PlacementAggregate(API_BASE):
     """A grouping of resource providers."""
     __tablename__ = 'placement_aggregates'
@@ -48,6 +48,19 @@ class BaseFilter(object):
     # for each request rather than for each instance
     run_filter_once_per_request = False
 
+    # Set to true in a subclass which implements filter_table(), so that it
+    # can be evaluated against a whole table of objects at once when the
+    # filter handler supports it
+    vectorized = False
+
+    def filter_table(self, table, spec_obj):
+        """Return a boolean mask of the rows of the table which pass the
+        filter.
+
+        Override this in a subclass which sets vectorized to True.
+        """
+        raise NotImplementedError()
+
     def run_filter_for_index(self, index):
         """Return True if the filter needs to be run for the "index-th"
         instance in a request.  Only need to override this if a filter
@@ -65,8 +78,27 @@ class BaseFilterHandler(loadables.BaseLoader):
     This class should be subclassed where one needs to use filters.
     """
 
+    # Class of the columnar table built from the objects to run vectorized
+    # filters against. If None, every filter runs against each object.
+    table_class = None
+
+    def _run_filter(self, filter_, list_objs, table, spec_obj):
+        """Run a filter, either object per object or against a whole table.
+
+        Returns a tuple of the filtered objects (or None if the filter says
+        to stop filtering) and the table matching them, if any.
+        """
+        if self.table_class is None or not filter_.vectorized:
+            # The table won't match the filtered objects any longer.
+            return filter_.filter_all(list_objs, spec_obj), None
+        if table is None:
+            table = self.table_class(list_objs)
+        table = table.compress(filter_.filter_table(table, spec_obj))
+        return table.objects, table
+
     def get_filtered_objects(self, filters, objs, spec_obj, index=0):
         list_objs = list(objs)
+        table = None
         LOG.debug("Starting with %d host(s)", len(list_objs))
         # Track the hosts as they are removed. The 'full_filter_results' list
         # contains the host/nodename info for every host that passes each
@@ -82,7 +114,8 @@ class BaseFilterHandler(loadables.BaseLoader):
             if filter_.run_filter_for_index(index):
                 cls_name = filter_.__class__.__name__
                 start_count = len(list_objs)
-                objs = filter_.filter_all(list_objs, spec_obj)
+                objs, table = self._run_filter(filter_, list_objs, table,
+                                               spec_obj)
                 if objs is None:
                     LOG.debug("Filter %s says to stop filtering", cls_name)
                     return
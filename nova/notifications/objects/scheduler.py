@@ -27,3 +27,63 @@ class SelectDestinationsNotification(base.NotificationBase):
     fields = {
         'payload': fields.ObjectField('RequestSpecPayload')
     }
+
+
+@base.notification_sample('scheduler_timing-update.json')
+@nova_base.NovaObjectRegistry.register_notification
+class SchedulerTimingNotification(base.NotificationBase):
+    # Version 1.0: Initial version
+    VERSION = '1.0'
+
+    fields = {
+        'payload': fields.ObjectField('SchedulerTimingPayload')
+    }
+
+
+@nova_base.NovaObjectRegistry.register_notification
+class SchedulerStepTimingPayload(base.NotificationPayloadBase):
+    # Version 1.0: Initial version
+    VERSION = '1.0'
+
+    fields = {
+        'name': fields.StringField(),
+        'count': fields.IntegerField(),
+        'total_ms': fields.FloatField(),
+        'max_ms': fields.FloatField(),
+        'p50_ms': fields.FloatField(),
+        'p90_ms': fields.FloatField(),
+        'p99_ms': fields.FloatField(),
+    }
+
+    def __init__(self, name, histogram):
+        super(SchedulerStepTimingPayload, self).__init__()
+        self.name = name
+        for field, value in histogram.to_dict().items():
+            setattr(self, field, value)
+
+
+@nova_base.NovaObjectRegistry.register_notification
+class SchedulerTimingPayload(base.NotificationPayloadBase):
+    # Version 1.0: Initial version
+    VERSION = '1.0'
+
+    fields = {
+        'host': fields.StringField(),
+        'start': fields.DateTimeField(),
+        'end': fields.DateTimeField(),
+        'requests': fields.IntegerField(),
+        'steps': fields.ListOfObjectsField('SchedulerStepTimingPayload'),
+    }
+
+    def __init__(self, host, summary, end):
+        """Build the payload from a nova.scheduler.timing.TimingSummary
+        covering the requests handled until end.
+        """
+        super(SchedulerTimingPayload, self).__init__()
+        self.host = host
+        self.start = summary.started_at
+        self.end = end
+        self.requests = summary.requests
+        self.steps = [SchedulerStepTimingPayload(name, histogram)
+                      for name, histogram in
+                      sorted(summary.histograms.items())]
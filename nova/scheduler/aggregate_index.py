@@ -0,0 +1,109 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Inverted index of the metadata of the host aggregates.
+"""
+
+import collections
+
+
+class HostSelection(collections.namedtuple('HostSelection',
+                                           ['hosts', 'exclude'])):
+    """Set of host names selected by a filter, or excluded by it if exclude
+    is True.
+    """
+
+    def passes(self, host):
+        return (host in self.hosts) != self.exclude
+
+
+def select(hosts):
+    """Return a HostSelection only letting the given hosts through."""
+    return HostSelection(hosts, False)
+
+
+def exclude(hosts):
+    """Return a HostSelection letting all but the given hosts through."""
+    return HostSelection(hosts, True)
+
+
+class AggregateIndex(object):
+    """Index of the aggregates by metadata key and value.
+
+    The values are split on commas and stripped, the way
+    nova.scheduler.filters.utils.aggregate_metadata_get_by_host() does, so
+    that looking up the hosts having a value in the index is equivalent to
+    looking for that value in the aggregate metadata of each host.
+    """
+
+    def __init__(self):
+        # Dict of the sets of hosts of the aggregates, keyed by aggregate ID
+        self._hosts_by_agg = {}
+        # Dict of the sets of (key, value) metadata items of the aggregates,
+        # keyed by aggregate ID
+        self._items_by_agg = {}
+        # Dict of dict of sets of aggregate IDs, keyed by metadata key and
+        # then value
+        self._agg_ids = collections.defaultdict(
+            lambda: collections.defaultdict(set))
+
+    def __contains__(self, key):
+        return key in self._agg_ids
+
+    def keys(self):
+        """Return the metadata keys of the aggregates."""
+        return list(self._agg_ids)
+
+    def values(self, key):
+        """Return the values of a metadata key of the aggregates."""
+        return list(self._agg_ids.get(key, ()))
+
+    def update(self, aggregate):
+        """Add an aggregate to the index, or update it."""
+        self.remove(aggregate.id)
+        metadata = (aggregate.metadata
+                    if aggregate.obj_attr_is_set('metadata') else {})
+        items = {(key, item.strip())
+                 for key, value in metadata.items()
+                 for item in value.split(',')}
+        self._hosts_by_agg[aggregate.id] = set(aggregate.hosts)
+        self._items_by_agg[aggregate.id] = items
+        for key, value in items:
+            self._agg_ids[key][value].add(aggregate.id)
+
+    def remove(self, aggregate_id):
+        """Remove an aggregate from the index, if it is in it."""
+        self._hosts_by_agg.pop(aggregate_id, None)
+        for key, value in self._items_by_agg.pop(aggregate_id, ()):
+            values = self._agg_ids[key]
+            values[value].discard(aggregate_id)
+            if not values[value]:
+                del values[value]
+            if not values:
+                del self._agg_ids[key]
+
+    def _hosts(self, agg_ids):
+        hosts = set()
+        for agg_id in agg_ids:
+            hosts.update(self._hosts_by_agg[agg_id])
+        return hosts
+
+    def hosts_with_key(self, key):
+        """Return the set of the hosts in an aggregate with a metadata key."""
+        return self._hosts(set().union(*self._agg_ids.get(key, {}).values()))
+
+    def hosts_with_value(self, key, value):
+        """Return the set of the hosts in an aggregate whose metadata key has
+        the given value.
+        """
+        return self._hosts(self._agg_ids.get(key, {}).get(value, ()))
@@ -58,3 +58,7 @@ class SchedulerClient(object):
 
     def sync_instance_info(self, context, host_name, instance_uuids):
         self.queryclient.sync_instance_info(context, host_name, instance_uuids)
+
+    def update_compute_node_info(self, context, host_name, compute_node):
+        self.queryclient.update_compute_node_info(context, host_name,
+                                                  compute_node)
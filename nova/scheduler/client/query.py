@@ -93,3 +93,14 @@ class SchedulerQueryClient(object):
         """
         self.scheduler_rpcapi.sync_instance_info(context, host_name,
                                                  instance_uuids)
+
+    def update_compute_node_info(self, context, host_name, compute_node):
+        """Updates the HostManager with the current resource usage of a
+        compute node.
+
+        :param context: local context
+        :param host_name: name of host sending the update
+        :param compute_node: the updated ComputeNode object
+        """
+        self.scheduler_rpcapi.update_compute_node_info(context, host_name,
+                                                       compute_node)
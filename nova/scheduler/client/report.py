@@ -21,11 +21,13 @@ import random
 import re
 import time
 
+import eventlet
 from keystoneauth1 import exceptions as ks_exc
 import os_traits
 from oslo_log import log as logging
 from oslo_middleware import request_id
 from oslo_utils import versionutils
+from requests import adapters as requests_adapters
 import retrying
 
 from nova.compute import provider_tree
@@ -47,6 +49,7 @@ DISK_GB = fields.ResourceClass.DISK_GB
 _RE_INV_IN_USE = re.compile("Inventory for (.+) on resource provider "
                             "(.+) in use")
 WARN_EVERY = 10
+PROVIDER_TREE_ALLOCATIONS_VERSION = '1.31'
 RESHAPER_VERSION = '1.30'
 CONSUMER_GENERATION_VERSION = '1.28'
 NESTED_AC_VERSION = '1.29'
@@ -253,6 +256,26 @@ def get_placement_request_id(response):
         return response.headers.get(request_id.HTTP_RESP_HEADER_REQUEST_ID)
 
 
+def _provider_levels(uuids, parents):
+    """Groups the UUIDs of resource providers by their depth in their tree.
+
+    :param uuids: Provider UUIDs in top-down order, as returned by
+                  ProviderTree.get_provider_uuids()
+    :param parents: Dict, keyed by provider UUID, of the UUIDs of the parent
+                    providers, or None for the root providers
+    :return: A list of lists of provider UUIDs, in top-down order: the
+             ancestors of a provider among uuids are all in previous lists.
+    """
+    depths = {}
+    levels = []
+    for uuid in uuids:
+        depth = depths[uuid] = depths.get(parents[uuid], -1) + 1
+        if depth == len(levels):
+            levels.append([])
+        levels[depth].append(uuid)
+    return levels
+
+
 # TODO(mriedem): Consider making SchedulerReportClient a global singleton so
 # that things like the compute API do not have to lazy-load it. That would
 # likely require inspecting methods that use a ProviderTree cache to see if
@@ -291,8 +314,25 @@ class SchedulerReportClient(object):
         # Set accept header on every request to ensure we notify placement
         # service of our response body media type preferences.
         client.additional_headers = {'accept': 'application/json'}
+        self._resize_connection_pools(client,
+                                      CONF.compute.provider_update_concurrency)
         return client
 
+    @staticmethod
+    def _resize_connection_pools(client, size):
+        """Keep up to size connections alive to the placement service, so
+        that the providers updated concurrently don't open new ones.
+        """
+        if size <= requests_adapters.DEFAULT_POOLSIZE:
+            return
+        # The adapters of the session are resized rather than replaced, so
+        # that the TLS settings keystoneauth gave them are kept.
+        for adapter in client.session.session.adapters.values():
+            if isinstance(adapter, requests_adapters.HTTPAdapter):
+                adapter._pool_maxsize = size
+                adapter.init_poolmanager(adapter._pool_connections, size,
+                                         block=adapter._pool_block)
+
     def get(self, url, version=None, global_request_id=None):
         headers = ({request_id.INBOUND_HEADER: global_request_id}
                    if global_request_id else {})
@@ -1524,6 +1564,17 @@ class SchedulerReportClient(object):
             LOG.exception('Reshape failed')
             raise exception.ReshapeFailed(error=e)
 
+    @staticmethod
+    def _run_concurrently(func, items):
+        """Calls func with each of the items, in at most
+        [compute]/provider_update_concurrency greenthreads at once, and
+        returns the list of the results.
+        """
+        size = min(CONF.compute.provider_update_concurrency, len(items))
+        if size <= 1:
+            return [func(item) for item in items]
+        return list(eventlet.GreenPool(size=size).imap(func, items))
+
     def update_from_provider_tree(self, context, new_tree, allocations=None):
         """Flush changes from a specified ProviderTree back to placement.
 
@@ -1603,6 +1654,8 @@ class SchedulerReportClient(object):
         new_uuids = new_tree.get_provider_uuids()
         uuids_to_add = set(new_uuids) - set(old_uuids)
         uuids_to_remove = set(old_uuids) - set(new_uuids)
+        old_parents = {uuid: old_tree.data(uuid).parent_uuid
+                       for uuid in uuids_to_remove}
 
         # In case a reshape is happening, we first have to create (or load) any
         # "new" providers.
@@ -1648,14 +1701,19 @@ class SchedulerReportClient(object):
         # allocations off of them via reshape.
         # We have to do deletions in bottom-up order, so we don't error
         # attempting to delete a parent who still has children. (We get the
-        # UUIDs in bottom-up order by reversing old_uuids, which was given to
-        # us in top-down order per ProviderTree.get_provider_uuids().)
-        for uuid in reversed(old_uuids):
-            if uuid not in uuids_to_remove:
-                continue
+        # depths of the providers in top-down order from old_uuids, which was
+        # given to us in top-down order per ProviderTree.get_provider_uuids(),
+        # and reverse them.) The providers at the same depth are deleted
+        # concurrently.
+        def delete_provider(uuid):
             with catch_all(uuid) as status:
                 self._delete_provider(uuid)
-            success = success and status.success
+            return status.success
+
+        to_remove = [uuid for uuid in old_uuids if uuid in uuids_to_remove]
+        for level in reversed(_provider_levels(to_remove, old_parents)):
+            success = (all(self._run_concurrently(delete_provider, level)) and
+                       success)
 
         # At this point the local cache should have all the same providers as
         # new_tree.  Whether we added them or not, walk through and diff/flush
@@ -1666,18 +1724,24 @@ class SchedulerReportClient(object):
         # If we encounter any error and remove a provider from the cache, all
         # its descendants are also removed, and set_*_for_provider methods on
         # it wouldn't be able to get started. Walking the tree in bottom-up
-        # order ensures we at least try to process all of the providers. (We
-        # get the UUIDs in bottom-up order by reversing new_uuids, which was
-        # given to us in top-down order per ProviderTree.get_provider_uuids().)
-        for uuid in reversed(new_uuids):
-            pd = new_tree.data(uuid)
+        # order ensures we at least try to process all of the providers. The
+        # providers at the same depth don't depend on each other, so they are
+        # processed concurrently before moving up to their parents.
+        def update_provider(pd):
             with catch_all(pd.uuid) as status:
                 self._set_inventory_for_provider(
                     context, pd.uuid, pd.inventory)
                 self.set_aggregates_for_provider(
                     context, pd.uuid, pd.aggregates)
                 self.set_traits_for_provider(context, pd.uuid, pd.traits)
-            success = success and status.success
+            return status.success
+
+        new_pds = {uuid: new_tree.data(uuid) for uuid in new_uuids}
+        new_parents = {uuid: pd.parent_uuid for uuid, pd in new_pds.items()}
+        for level in reversed(_provider_levels(new_uuids, new_parents)):
+            success = (all(self._run_concurrently(
+                update_provider, [new_pds[uuid] for uuid in level])) and
+                success)
 
         if not success:
             raise exception.ResourceProviderSyncFailed()
@@ -1892,6 +1956,59 @@ class SchedulerReportClient(object):
                 raise Retry('claim_resources', reason)
         return r.status_code == 204
 
+    @safe_connect
+    @retries
+    def claim_resources_in_bulk(self, context, alloc_requests, project_id,
+                                user_id, allocation_request_version):
+        """Creates allocation records for several new consumers against the
+        supplied resource providers with a single POST /allocations call.
+
+        Either the allocations of all of the consumers are created, or none
+        of them are. Unlike claim_resources(), this does not handle move
+        operations: the consumers must not have allocations yet.
+
+        :param context: The security context
+        :param alloc_requests: Dict, keyed by instance UUID, of the
+                               allocation_request received from placement for
+                               the resources to claim for that instance.
+        :param project_id: The project_id associated with the allocations.
+        :param user_id: The user_id associated with the allocations.
+        :param allocation_request_version: The microversion used to request the
+                                           allocations. It must be at least
+                                           CONSUMER_GENERATION_VERSION.
+        :returns: True if the allocations were created, False otherwise.
+        """
+        payload = {}
+        for consumer_uuid, alloc_request in alloc_requests.items():
+            payload[consumer_uuid] = {
+                'allocations': alloc_request['allocations'],
+                'project_id': project_id,
+                'user_id': user_id,
+                # None makes placement reject the request if the consumer
+                # already exists instead of overwriting its allocations.
+                'consumer_generation': None,
+            }
+
+        r = self.post('/allocations', payload,
+                      version=allocation_request_version,
+                      global_request_id=context.global_id)
+        if r.status_code != 204:
+            err = r.json()['errors'][0]
+            if (err['code'] == 'placement.concurrent_update' and
+                    'consumer generation conflict' not in err['detail']):
+                # A resource provider generation conflict is retried, as in
+                # claim_resources().
+                reason = ('another process changed the resource providers '
+                          'involved in our attempt to post allocations for '
+                          'consumers %s' % ', '.join(alloc_requests))
+                raise Retry('claim_resources_in_bulk', reason)
+            LOG.debug('Unable to post allocations for consumers %(uuids)s '
+                      '(%(code)i %(text)s)',
+                      {'uuids': ', '.join(alloc_requests),
+                       'code': r.status_code,
+                       'text': r.text})
+        return r.status_code == 204
+
     def remove_provider_tree_from_instance_allocation(self, context,
                                                       consumer_uuid,
                                                       root_rp_uuid):
@@ -2172,6 +2289,42 @@ class SchedulerReportClient(object):
         data = resp.json()
         return ProviderAllocInfo(allocations=data['allocations'])
 
+    def get_allocations_for_providers(self, context, rp_uuids=None,
+                                      in_tree=None):
+        """Retrieves, in a single request, all the allocation records of the
+        consumers having allocations against a set of providers.
+
+        The allocations of these consumers against providers not in the set,
+        e.g. sharing providers, are returned as well.
+
+        :param context: The nova.context.RequestContext auth context
+        :param rp_uuids: An iterable of UUIDs of the providers.
+        :param in_tree: The UUID of a provider. If specified, the providers
+                        are those in its provider tree, as known by placement,
+                        and rp_uuids is ignored.
+        :returns: A dict, keyed by consumer UUID, of allocation records with
+                  the shape of the return of get_allocs_for_consumer.
+        :raises: keystoneauth1.exceptions.base.ClientException on failure to
+                 communicate with the placement API
+        :raises: ResourceProviderAllocationRetrievalFailed if the placement API
+                 call fails.
+        """
+        if in_tree is not None:
+            url = '/allocations?in_tree=%s' % in_tree
+            rp_desc = in_tree
+        else:
+            rp_desc = ','.join(sorted(rp_uuids))
+            if not rp_desc:
+                return {}
+            url = '/allocations?resource_provider_uuid=in:%s' % rp_desc
+        resp = self.get(url, version=PROVIDER_TREE_ALLOCATIONS_VERSION,
+                        global_request_id=context.global_id)
+        if not resp:
+            raise exception.ResourceProviderAllocationRetrievalFailed(
+                rp_uuid=rp_desc, error=resp.text)
+
+        return resp.json()['allocations']
+
     def get_allocations_for_provider_tree(self, context, nodename):
         """Retrieve allocation records associated with all providers in the
         provider tree.
@@ -2229,29 +2382,17 @@ class SchedulerReportClient(object):
 
         # We can't get *all* allocations for associated sharing providers
         # because some of those will belong to consumers on other hosts. So we
-        # have to discover all the consumers associated with the providers in
-        # the "local" tree (we use the nodename to figure out which providers
-        # are "local").
-        # All we want to do at this point is accumulate the set of consumers we
-        # care about.
-        consumers = set()
-        # TODO(efried): This could be more efficient if placement offered an
-        # operation like GET /allocations?rp_uuid=in:<list>
-        for u in self._provider_tree.get_provider_uuids(name_or_uuid=nodename):
-            alloc_info = self.get_allocations_for_resource_provider(context, u)
-            # The allocations dict is keyed by consumer UUID
-            consumers.update(alloc_info.allocations)
-
-        # Now get all the allocations for each of these consumers to build the
-        # result. This will include allocations on sharing providers, which is
+        # ask for all the allocations of the consumers associated with the
+        # providers in the "local" tree (we use the nodename to figure out
+        # which providers are "local").
+        # This will include allocations on sharing providers, which is
         # intentional and desirable. But it may also include allocations
         # belonging to other hosts, e.g. if this is happening in the middle of
         # an evacuate. ComputeDriver.update_provider_tree is supposed to ignore
         # such allocations if they appear.
-        # TODO(efried): This could be more efficient if placement offered an
-        # operation like GET /allocations?consumer_uuid=in:<list>
-        return {consumer: self.get_allocs_for_consumer(context, consumer)
-                for consumer in consumers}
+        rp_uuids = self._provider_tree.get_provider_uuids(
+            name_or_uuid=nodename)
+        return self.get_allocations_for_providers(context, rp_uuids=rp_uuids)
 
     def delete_resource_provider(self, context, compute_node, cascade=False):
         """Deletes the ResourceProvider record for the compute_node.
@@ -19,9 +19,11 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import itertools
 import random
 
 from oslo_log import log as logging
+from oslo_utils import versionutils
 from six.moves import range
 
 from nova.compute import utils as compute_utils
@@ -32,7 +34,10 @@ from nova import objects
 from nova.objects import fields as fields_obj
 from nova import rpc
 from nova.scheduler import client
+from nova.scheduler.client import report
 from nova.scheduler import driver
+from nova.scheduler import host_ranking
+from nova.scheduler import timing
 from nova.scheduler import utils
 
 CONF = nova.conf.CONF
@@ -149,8 +154,9 @@ class FilterScheduler(driver.Scheduler):
         # Note: remember, we are using a generator-iterator here. So only
         # traverse this list once. This can bite you if the hosts
         # are being scanned in a filter or weighing function.
-        hosts = self._get_all_host_states(elevated, spec_obj,
-            provider_summaries)
+        hosts = timing.timed_iter(timing.HOST_STATES,
+            self._get_all_host_states(elevated, spec_obj,
+                                      provider_summaries))
 
         # NOTE(sbauza): The RequestSpec.num_instances field contains the number
         # of instances created when the RequestSpec was used to first boot some
@@ -171,6 +177,8 @@ class FilterScheduler(driver.Scheduler):
         num_alts = (CONF.scheduler.max_attempts - 1
                     if return_alternates else 0)
 
+        ranking = self._get_host_ranking(num_instances)
+
         if (instance_uuids is None or
                 not self.USES_ALLOCATION_CANDIDATES or
                 alloc_reqs_by_rp_uuid is None):
@@ -185,8 +193,43 @@ class FilterScheduler(driver.Scheduler):
             # the older dict format representing HostState objects.
             return self._legacy_find_hosts(context, num_instances, spec_obj,
                                            hosts, num_alts,
-                                           instance_uuids=instance_uuids)
+                                           instance_uuids=instance_uuids,
+                                           ranking=ranking)
+
+        if self._use_bulk_claim(spec_obj, instance_uuids,
+                                allocation_request_version):
+            claimed_hosts, claimed_instance_uuids, hosts, num = (
+                self._bulk_claim_hosts(elevated, spec_obj, instance_uuids,
+                    hosts, alloc_reqs_by_rp_uuid, allocation_request_version,
+                    ranking))
+        else:
+            claimed_hosts, claimed_instance_uuids, hosts, num = (
+                self._claim_hosts(elevated, spec_obj, instance_uuids, hosts,
+                    alloc_reqs_by_rp_uuid, allocation_request_version,
+                    ranking))
+
+        # Check if we were able to fulfill the request. If not, this call will
+        # raise a NoValidHost exception.
+        self._ensure_sufficient_hosts(context, claimed_hosts, num_instances,
+                claimed_instance_uuids)
 
+        # We have selected and claimed hosts for each instance. Now we need to
+        # find alternates for each host.
+        selections_to_return = self._get_alternate_hosts(
+            claimed_hosts, spec_obj, hosts, num, num_alts,
+            alloc_reqs_by_rp_uuid, allocation_request_version,
+            ranking=ranking)
+        return selections_to_return
+
+    def _claim_hosts(self, elevated, spec_obj, instance_uuids, hosts,
+                     alloc_reqs_by_rp_uuid, allocation_request_version,
+                     ranking):
+        """Select a host for each instance and claim its resources against
+        it before selecting the host of the next instance.
+
+        Returns a tuple of the claimed hosts, the UUIDs of the instances whose
+        resources were claimed, the last candidate hosts and their index.
+        """
         # A list of the instance UUIDs that were successfully claimed against
         # in the placement API. If we are not able to successfully claim for
         # all involved instances, we use this list to remove those allocations
@@ -196,6 +239,7 @@ class FilterScheduler(driver.Scheduler):
         # The list of hosts that have been selected (and claimed).
         claimed_hosts = []
 
+        num = 0
         for num, instance_uuid in enumerate(instance_uuids):
             # In a multi-create request, the first request spec from the list
             # is passed to the scheduler and that request spec's instance_uuid
@@ -208,7 +252,7 @@ class FilterScheduler(driver.Scheduler):
             # Reset the field so it's not persisted accidentally.
             spec_obj.obj_reset_changes(['instance_uuid'])
 
-            hosts = self._get_sorted_hosts(spec_obj, hosts, num)
+            hosts = self._get_candidate_hosts(spec_obj, hosts, num, ranking)
             if not hosts:
                 # NOTE(jaypipes): If we get here, that means not all instances
                 # in instance_uuids were able to be matched to a selected host.
@@ -216,32 +260,9 @@ class FilterScheduler(driver.Scheduler):
                 # _ensure_sufficient_hosts() call.
                 break
 
-            # Attempt to claim the resources against one or more resource
-            # providers, looping over the sorted list of possible hosts
-            # looking for an allocation_request that contains that host's
-            # resource provider UUID
-            claimed_host = None
-            for host in hosts:
-                cn_uuid = host.uuid
-                if cn_uuid not in alloc_reqs_by_rp_uuid:
-                    msg = ("A host state with uuid = '%s' that did not have a "
-                           "matching allocation_request was encountered while "
-                           "scheduling. This host was skipped.")
-                    LOG.debug(msg, cn_uuid)
-                    continue
-
-                alloc_reqs = alloc_reqs_by_rp_uuid[cn_uuid]
-                # TODO(jaypipes): Loop through all allocation_requests instead
-                # of just trying the first one. For now, since we'll likely
-                # want to order the allocation_requests in the future based on
-                # information in the provider summaries, we'll just try to
-                # claim resources using the first allocation_request
-                alloc_req = alloc_reqs[0]
-                if utils.claim_resources(elevated, self.placement_client,
-                        spec_obj, instance_uuid, alloc_req,
-                        allocation_request_version=allocation_request_version):
-                    claimed_host = host
-                    break
+            claimed_host, hosts = self._claim_candidate_host(elevated,
+                spec_obj, instance_uuid, hosts, num, alloc_reqs_by_rp_uuid,
+                allocation_request_version, ranking)
 
             if claimed_host is None:
                 # We weren't able to claim resources in the placement API
@@ -258,19 +279,217 @@ class FilterScheduler(driver.Scheduler):
             # Now consume the resources so the filter/weights will change for
             # the next instance.
             self._consume_selected_host(claimed_host, spec_obj,
-                                        instance_uuid=instance_uuid)
+                                        instance_uuid=instance_uuid,
+                                        ranking=ranking)
 
-        # Check if we were able to fulfill the request. If not, this call will
-        # raise a NoValidHost exception.
-        self._ensure_sufficient_hosts(context, claimed_hosts, num_instances,
-                claimed_instance_uuids)
+        return claimed_hosts, claimed_instance_uuids, hosts, num
 
-        # We have selected and claimed hosts for each instance. Now we need to
-        # find alternates for each host.
-        selections_to_return = self._get_alternate_hosts(
-            claimed_hosts, spec_obj, hosts, num, num_alts,
-            alloc_reqs_by_rp_uuid, allocation_request_version)
-        return selections_to_return
+    def _claim_candidate_host(self, elevated, spec_obj, instance_uuid, hosts,
+                              index, alloc_reqs_by_rp_uuid,
+                              allocation_request_version, ranking):
+        """Claim the resources of the instance against the first of the
+        candidate hosts for which the claim succeeds, trying the hosts left
+        out of the ranking if there is one.
+
+        Returns a tuple of the claimed host, or None if no claim succeeded,
+        and the hosts which were tried last.
+        """
+        claimed_host = self._claim_first_host(elevated, spec_obj,
+            instance_uuid, hosts, alloc_reqs_by_rp_uuid,
+            allocation_request_version)
+        if claimed_host is None and ranking is not None:
+            # The ranking only holds the best hosts, so try the other
+            # hosts as well before giving up.
+            tried_hosts = set(hosts)
+            other_hosts = [host for host in ranking.get_hosts()
+                           if host not in tried_hosts]
+            ranking.invalidate()
+            if other_hosts:
+                hosts = self._get_sorted_hosts(spec_obj, other_hosts, index)
+                claimed_host = self._claim_first_host(elevated, spec_obj,
+                    instance_uuid, hosts, alloc_reqs_by_rp_uuid,
+                    allocation_request_version)
+        return claimed_host, hosts
+
+    @staticmethod
+    def _use_bulk_claim(spec_obj, instance_uuids, allocation_request_version):
+        """Returns True if the resources of the instances are to be claimed
+        with a single call to the placement API.
+        """
+        if (not CONF.filter_scheduler.bulk_claim_resources or
+                len(instance_uuids) <= 1 or
+                allocation_request_version is None or
+                utils.request_is_rebuild(spec_obj)):
+            return False
+        # The consumer generation is needed to make sure the allocations of
+        # existing consumers are not overwritten, as a move operation would
+        # need them to be doubled up instead.
+        return (versionutils.convert_version_to_tuple(
+                    allocation_request_version) >=
+                versionutils.convert_version_to_tuple(
+                    report.CONSUMER_GENERATION_VERSION))
+
+    def _bulk_claim_hosts(self, elevated, spec_obj, instance_uuids, hosts,
+                          alloc_reqs_by_rp_uuid, allocation_request_version,
+                          ranking):
+        """Select a host for each instance, then claim the resources of all
+        of the instances against their hosts with a single call to the
+        placement API.
+
+        If the call fails, for example because the resources of some of the
+        hosts were claimed by another scheduler in the meantime, the
+        resources of each instance are claimed separately and only the
+        instances whose claim fails against their selected host are
+        scheduled again.
+
+        Returns a tuple of the claimed hosts, the UUIDs of the instances whose
+        resources were claimed, the last candidate hosts and their index.
+        """
+        # The list of hosts that have been selected for the instances, in
+        # the order of instance_uuids.
+        selected_hosts = []
+        # The states of the selected hosts before the resources of the
+        # instances were consumed from them, and the times they were last
+        # consumed, to undo the consumption if the claim fails.
+        saved_states = {}
+        consumed_at = {}
+
+        num = 0
+        for num, instance_uuid in enumerate(instance_uuids):
+            spec_obj.instance_uuid = instance_uuid
+            # Reset the field so it's not persisted accidentally.
+            spec_obj.obj_reset_changes(['instance_uuid'])
+
+            hosts = self._get_candidate_hosts(spec_obj, hosts, num, ranking)
+            selected_host = next((host for host in hosts
+                                  if host.uuid in alloc_reqs_by_rp_uuid),
+                                 None)
+            if selected_host is None:
+                # Nothing has been claimed yet, and the
+                # _ensure_sufficient_hosts() call will raise NoValidHost.
+                LOG.debug("Unable to select a host with an allocation "
+                          "request.", instance_uuid=instance_uuid)
+                return selected_hosts, [], hosts, num
+            selected_hosts.append(selected_host)
+            if selected_host not in saved_states:
+                saved_states[selected_host] = (
+                    selected_host.save_consumption())
+
+            # Now consume the resources so the filter/weights will change for
+            # the next instance.
+            self._consume_selected_host(selected_host, spec_obj,
+                                        instance_uuid=instance_uuid,
+                                        ranking=ranking)
+            consumed_at[selected_host] = selected_host.updated
+
+        # Only the first allocation request of each host is tried, see
+        # _claim_first_host().
+        alloc_reqs_by_instance_uuid = {
+            instance_uuid: alloc_reqs_by_rp_uuid[host.uuid][0]
+            for instance_uuid, host in zip(instance_uuids, selected_hosts)}
+        with timing.step(timing.CLAIM_RESOURCES):
+            claimed = utils.claim_resources_in_bulk(elevated,
+                self.placement_client, spec_obj, alloc_reqs_by_instance_uuid,
+                allocation_request_version)
+        if claimed:
+            return selected_hosts, list(instance_uuids), hosts, num
+
+        LOG.debug("Unable to claim resources for all of the instances at "
+                  "once, claiming them separately.")
+        # Undo the consumption of the selected hosts, and consume them again
+        # for each instance whose claim succeeds, as _claim_hosts() does. The
+        # resources of a host updated by another request or from its compute
+        # node in the meantime are left consumed, since only its other
+        # updates would be undone.
+        restored_hosts = set(
+            host for host, state in saved_states.items()
+            if host.restore_consumption(state, consumed_at[host]))
+        if restored_hosts and ranking is not None:
+            ranking.invalidate()
+        for instance_uuid, selected_host in zip(instance_uuids,
+                                                selected_hosts):
+            self._forget_selected_host(selected_host, spec_obj, instance_uuid)
+
+        claimed_instance_uuids = []
+        claimed_hosts = []
+        for index, (instance_uuid, selected_host) in enumerate(
+                zip(instance_uuids, selected_hosts)):
+            spec_obj.instance_uuid = instance_uuid
+            spec_obj.obj_reset_changes(['instance_uuid'])
+
+            claimed_host = self._claim_first_host(elevated, spec_obj,
+                instance_uuid, [selected_host], alloc_reqs_by_rp_uuid,
+                allocation_request_version)
+            if claimed_host is not None:
+                if selected_host in restored_hosts:
+                    self._consume_selected_host(selected_host, spec_obj,
+                                                instance_uuid=instance_uuid,
+                                                ranking=ranking)
+                else:
+                    self._record_selected_host(selected_host, spec_obj,
+                                               instance_uuid=instance_uuid)
+            else:
+                # Another scheduler won the race for the selected host, so
+                # select a different one for this instance only.
+                LOG.debug("Unable to claim against the selected host "
+                          "%(host)s, selecting another one.",
+                          {'host': selected_host},
+                          instance_uuid=instance_uuid)
+                candidate_hosts = [
+                    host for host in self._get_candidate_hosts(
+                        spec_obj, hosts, index, ranking)
+                    if host is not selected_host]
+                claimed_host, _hosts = self._claim_candidate_host(elevated,
+                    spec_obj, instance_uuid, candidate_hosts, index,
+                    alloc_reqs_by_rp_uuid, allocation_request_version,
+                    ranking)
+                if claimed_host is None:
+                    LOG.debug("Unable to successfully claim against any "
+                              "host.")
+                    break
+                self._consume_selected_host(claimed_host, spec_obj,
+                                            instance_uuid=instance_uuid,
+                                            ranking=ranking)
+
+            claimed_instance_uuids.append(instance_uuid)
+            claimed_hosts.append(claimed_host)
+
+        return claimed_hosts, claimed_instance_uuids, hosts, num
+
+    def _claim_first_host(self, elevated, spec_obj, instance_uuid, hosts,
+                          alloc_reqs_by_rp_uuid, allocation_request_version):
+        """Claim the resources of the instance against the first host of the
+        sorted list of hosts for which the claim succeeds, and return that
+        host, or None if no claim succeeded.
+        """
+        # Attempt to claim the resources against one or more resource
+        # providers, looping over the sorted list of possible hosts
+        # looking for an allocation_request that contains that host's
+        # resource provider UUID
+        for host in hosts:
+            cn_uuid = host.uuid
+            if cn_uuid not in alloc_reqs_by_rp_uuid:
+                msg = ("A host state with uuid = '%s' that did not have a "
+                       "matching allocation_request was encountered while "
+                       "scheduling. This host was skipped.")
+                LOG.debug(msg, cn_uuid)
+                continue
+
+            alloc_reqs = alloc_reqs_by_rp_uuid[cn_uuid]
+            # TODO(jaypipes): Loop through all allocation_requests instead
+            # of just trying the first one. For now, since we'll likely
+            # want to order the allocation_requests in the future based on
+            # information in the provider summaries, we'll just try to
+            # claim resources using the first allocation_request
+            alloc_req = alloc_reqs[0]
+            with timing.step(timing.CLAIM_RESOURCES):
+                claimed = utils.claim_resources(elevated,
+                    self.placement_client, spec_obj, instance_uuid,
+                    alloc_req,
+                    allocation_request_version=allocation_request_version)
+            if claimed:
+                return host
+        return None
 
     def _ensure_sufficient_hosts(self, context, hosts, required_count,
             claimed_uuids=None):
@@ -311,7 +530,7 @@ class FilterScheduler(driver.Scheduler):
             self.placement_client.delete_allocation_for_instance(context, uuid)
 
     def _legacy_find_hosts(self, context, num_instances, spec_obj, hosts,
-                           num_alts, instance_uuids=None):
+                           num_alts, instance_uuids=None, ranking=None):
         """Some schedulers do not do claiming, or we can sometimes not be able
         to if the Placement service is not reachable. Additionally, we may be
         working with older conductors that don't pass in instance_uuids.
@@ -327,7 +546,7 @@ class FilterScheduler(driver.Scheduler):
                 # don't persist the change.
                 spec_obj.instance_uuid = instance_uuid
                 spec_obj.obj_reset_changes(['instance_uuid'])
-            hosts = self._get_sorted_hosts(spec_obj, hosts, num)
+            hosts = self._get_candidate_hosts(spec_obj, hosts, num, ranking)
             if not hosts:
                 # No hosts left, so break here, and the
                 # _ensure_sufficient_hosts() call below will handle this.
@@ -335,7 +554,8 @@ class FilterScheduler(driver.Scheduler):
             selected_host = hosts[0]
             selected_hosts.append(selected_host)
             self._consume_selected_host(selected_host, spec_obj,
-                                        instance_uuid=instance_uuid)
+                                        instance_uuid=instance_uuid,
+                                        ranking=ranking)
 
         # Check if we were able to fulfill the request. If not, this call will
         # raise a NoValidHost exception.
@@ -346,14 +566,22 @@ class FilterScheduler(driver.Scheduler):
         # representing the selected host along with zero or more alternates
         # from the same cell.
         selections_to_return = self._get_alternate_hosts(selected_hosts,
-                spec_obj, hosts, num, num_alts)
+                spec_obj, hosts, num, num_alts, ranking=ranking)
         return selections_to_return
 
     @staticmethod
-    def _consume_selected_host(selected_host, spec_obj, instance_uuid=None):
+    def _consume_selected_host(selected_host, spec_obj, instance_uuid=None,
+                               ranking=None):
         LOG.debug("Selected host: %(host)s", {'host': selected_host},
                   instance_uuid=instance_uuid)
         selected_host.consume_from_request(spec_obj)
+        FilterScheduler._record_selected_host(selected_host, spec_obj,
+                                              instance_uuid=instance_uuid)
+        if ranking is not None:
+            ranking.consume(selected_host)
+
+    @staticmethod
+    def _record_selected_host(selected_host, spec_obj, instance_uuid=None):
         # If we have a server group, add the selected host to it for the
         # (anti-)affinity filters to filter out hosts for subsequent instances
         # in a multi-create request.
@@ -369,16 +597,26 @@ class FilterScheduler(driver.Scheduler):
                 selected_host.instances[instance_uuid] = (
                     objects.Instance(uuid=instance_uuid))
 
+    @staticmethod
+    def _forget_selected_host(selected_host, spec_obj, instance_uuid):
+        """Undo _record_selected_host() for an instance whose resources were
+        not claimed against the selected host.
+        """
+        if spec_obj.instance_group is not None:
+            spec_obj.instance_group.hosts.remove(selected_host.host)
+            spec_obj.instance_group.obj_reset_changes(['hosts'])
+            selected_host.instances.pop(instance_uuid, None)
+
     def _get_alternate_hosts(self, selected_hosts, spec_obj, hosts, index,
                              num_alts, alloc_reqs_by_rp_uuid=None,
-                             allocation_request_version=None):
+                             allocation_request_version=None, ranking=None):
         # We only need to filter/weigh the hosts again if we're dealing with
         # more than one instance and are going to be picking alternates.
         if index > 0 and num_alts > 0:
             # The selected_hosts have all had resources 'claimed' via
             # _consume_selected_host, so we need to filter/weigh and sort the
             # hosts again to get an accurate count for alternates.
-            hosts = self._get_sorted_hosts(spec_obj, hosts, index)
+            hosts = self._get_candidate_hosts(spec_obj, hosts, index, ranking)
         # This is the overall list of values to be returned. There will be one
         # item per instance, and each item will be a list of Selection objects
         # representing the selected host along with alternates from the same
@@ -448,14 +686,48 @@ class FilterScheduler(driver.Scheduler):
 
         weighed_hosts = self.host_manager.get_weighed_hosts(filtered_hosts,
             spec_obj)
+        return self._pick_weighed_host(weighed_hosts)
+
+    def _get_host_ranking(self, num_instances):
+        """Returns the HostRanking reused across the instances of the
+        request, or None if each instance has to filter and weigh all the
+        hosts.
+        """
+        if (not CONF.filter_scheduler.incremental_host_ranking or
+                num_instances <= 1):
+            return None
+        size = (CONF.filter_scheduler.host_subset_size +
+                CONF.scheduler.max_attempts)
+        return host_ranking.HostRanking(self.host_manager, size)
+
+    def _get_candidate_hosts(self, spec_obj, host_states, index, ranking):
+        """Returns the sorted list of HostState objects to pick from for
+        the instance at index in the request.
+        """
+        if ranking is None:
+            return self._get_sorted_hosts(spec_obj, host_states, index)
+
+        # Only the best hosts of the ranking are returned.
+        weighed_hosts = ranking.get_weighed_hosts(spec_obj, host_states,
+                                                  index)
+        if not weighed_hosts:
+            return []
+        return self._pick_weighed_host(weighed_hosts)
+
+    def _pick_weighed_host(self, weighed_hosts):
+        """Returns the HostState objects of a list of WeighedHosts sorted by
+        descending weight, with a randomly chosen one among the best hosts
+        first.
+        """
         if CONF.filter_scheduler.shuffle_best_same_weighed_hosts:
             # NOTE(pas-ha) Randomize best hosts, relying on weighed_hosts
             # being already sorted by weight in descending order.
             # This decreases possible contention and rescheduling attempts
             # when there is a large number of hosts having the same best
             # weight, especially so when host_subset_size is 1 (default)
-            best_hosts = [w for w in weighed_hosts
-                          if w.weight == weighed_hosts[0].weight]
+            best_weight = weighed_hosts[0].weight
+            best_hosts = list(itertools.takewhile(
+                lambda w: w.weight == best_weight, weighed_hosts))
             random.shuffle(best_hosts)
             weighed_hosts = best_hosts + weighed_hosts[len(best_hosts):]
         # Strip off the WeighedHost wrapper class...
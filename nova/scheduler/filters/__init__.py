@@ -16,7 +16,15 @@
 """
 Scheduler host filters
 """
+from oslo_log import log as logging
+
+import nova.conf
 from nova import filters
+from nova.scheduler import host_table
+from nova.scheduler import timing
+
+CONF = nova.conf.CONF
+LOG = logging.getLogger(__name__)
 
 
 class BaseHostFilter(filters.BaseFilter):
@@ -30,6 +38,11 @@ class BaseHostFilter(filters.BaseFilter):
     # existing compute node, etc.
     RUN_ON_REBUILD = False
 
+    # Set to True in a subclass which implements hosts_pass_aggregates(), so
+    # that it is evaluated against the aggregate metadata index of the
+    # HostManager, if any, instead of the aggregates of each host.
+    uses_aggregate_index = False
+
     def _filter_one(self, obj, spec):
         """Return True if the object passes the filter, otherwise False."""
         # Do this here so we don't get scheduler.filters.utils
@@ -49,10 +62,79 @@ class BaseHostFilter(filters.BaseFilter):
         """
         raise NotImplementedError()
 
+    def filter_table(self, table, spec):
+        """Return a boolean mask of the hosts of the HostTable which pass the
+        filter.
+        """
+        # Do this here so we don't get scheduler.filters.utils
+        from nova.scheduler import utils
+        if not self.RUN_ON_REBUILD and utils.request_is_rebuild(spec):
+            # If we don't filter, default to passing the hosts.
+            return table.pass_all()
+        return self.hosts_pass(table, spec)
+
+    def hosts_pass(self, host_table, spec_obj):
+        """Return a boolean mask of the hosts of the HostTable which pass the
+        filter. Override this in a subclass which sets vectorized to True.
+        """
+        raise NotImplementedError()
+
+    def filter_aggregate_index(self, index, spec):
+        """Return the HostSelection of the names of the hosts which pass the
+        filter according to an AggregateIndex, or None if they all pass.
+        """
+        # Do this here so we don't get scheduler.filters.utils
+        from nova.scheduler import utils
+        if not self.RUN_ON_REBUILD and utils.request_is_rebuild(spec):
+            # If we don't filter, default to passing the hosts.
+            return None
+        return self.hosts_pass_aggregates(index, spec)
+
+    def hosts_pass_aggregates(self, index, spec_obj):
+        """Return the HostSelection of the names of the hosts which pass the
+        filter according to an AggregateIndex, or None if they all pass.
+        Override this in a subclass which sets uses_aggregate_index to True.
+        """
+        raise NotImplementedError()
+
 
 class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
+        # AggregateIndex of the aggregates of the hosts to filter, set by the
+        # HostManager
+        self.aggregate_index = None
+        if CONF.filter_scheduler.vectorize_filters:
+            if host_table.is_supported():
+                self.table_class = host_table.HostTable
+            else:
+                LOG.warning('The vectorize_filters option is enabled but the '
+                            'numpy library is not installed. Falling back to '
+                            'filtering each host individually.')
+
+    def _run_filter_with_aggregate_index(self, filter_, list_objs, table,
+                                         spec_obj):
+        selection = filter_.filter_aggregate_index(self.aggregate_index,
+                                                   spec_obj)
+        if selection is None:
+            return list_objs, table
+        mask = [selection.passes(obj.host) for obj in list_objs]
+        if table is not None:
+            table = table.compress(mask)
+        return [obj for obj, passes in zip(list_objs, mask) if passes], table
+
+    def _run_filter(self, filter_, list_objs, table, spec_obj):
+        with timing.step(timing.filter_step(filter_)):
+            if (self.aggregate_index is not None and
+                    filter_.uses_aggregate_index):
+                return self._run_filter_with_aggregate_index(
+                    filter_, list_objs, table, spec_obj)
+            objs, table = super(HostFilterHandler, self)._run_filter(
+                filter_, list_objs, table, spec_obj)
+            # Filters usually return a generator, only run by listing it.
+            if objs is not None:
+                objs = list(objs)
+        return objs, table
 
 
 def all_filters():
@@ -20,6 +20,7 @@ from oslo_log import log as logging
 
 from nova.scheduler import filters
 from nova.scheduler.filters import utils
+from nova.scheduler import instance_index
 
 LOG = logging.getLogger(__name__)
 
@@ -86,16 +87,32 @@ class _GroupAntiAffinityFilter(filters.BaseHostFilter):
 
     RUN_ON_REBUILD = False
 
-    def host_passes(self, host_state, spec_obj):
+    def _applies(self, spec_obj):
         # Only invoke the filter if 'anti-affinity' is configured
         instance_group = spec_obj.instance_group
         policy = instance_group.policy if instance_group else None
-        if self.policy_name != policy:
-            return True
-        # NOTE(hanrong): Move operations like resize can check the same source
-        # compute node where the instance is. That case, AntiAffinityFilter
-        # must not return the source as a non-possible destination.
-        if spec_obj.instance_uuid in host_state.instances.keys():
+        return self.policy_name == policy
+
+    def filter_all(self, filter_obj_list, spec_obj):
+        # Do this here so we don't get scheduler.filters.utils
+        from nova.scheduler import utils as scheduler_utils
+        if (not self._applies(spec_obj) or
+                (not self.RUN_ON_REBUILD and
+                 scheduler_utils.request_is_rebuild(spec_obj))):
+            for host_state in filter_obj_list:
+                yield host_state
+            return
+        # Count the members of the group on all the hosts at once, with the
+        # instance index of the HostManager for the hosts it tracks
+        host_states = list(filter_obj_list)
+        counts = instance_index.count_instances_by_host(
+            host_states, spec_obj.instance_group.members)
+        for host_state, servers_on_host in zip(host_states, counts):
+            if self._host_passes(host_state, spec_obj, servers_on_host):
+                yield host_state
+
+    def host_passes(self, host_state, spec_obj):
+        if not self._applies(spec_obj):
             return True
         # The list of instances UUIDs on the given host
         instances = set(host_state.instances.keys())
@@ -103,7 +120,16 @@ class _GroupAntiAffinityFilter(filters.BaseHostFilter):
         members = set(spec_obj.instance_group.members)
         # The set of instances on the host that are also members of this group
         servers_on_host = instances.intersection(members)
+        return self._host_passes(host_state, spec_obj, len(servers_on_host))
+
+    def _host_passes(self, host_state, spec_obj, servers_on_host):
+        # NOTE(hanrong): Move operations like resize can check the same source
+        # compute node where the instance is. That case, AntiAffinityFilter
+        # must not return the source as a non-possible destination.
+        if spec_obj.instance_uuid in host_state.instances:
+            return True
 
+        instance_group = spec_obj.instance_group
         rules = instance_group.rules
         if rules and 'max_server_per_host' in rules:
             max_server_per_host = rules['max_server_per_host']
@@ -125,7 +151,7 @@ class _GroupAntiAffinityFilter(filters.BaseHostFilter):
         # given host. In the default case(max_server_per_host=1), this filter
         # will accept the given host if there are 0 servers from the group
         # already on this host.
-        return len(servers_on_host) < max_server_per_host
+        return servers_on_host < max_server_per_host
 
 
 class ServerGroupAntiAffinityFilter(_GroupAntiAffinityFilter):
@@ -140,23 +166,42 @@ class _GroupAffinityFilter(filters.BaseHostFilter):
 
     RUN_ON_REBUILD = False
 
-    def host_passes(self, host_state, spec_obj):
+    def _get_group_hosts(self, spec_obj):
         # Only invoke the filter if 'affinity' is configured
         policies = (spec_obj.instance_group.policies
                     if spec_obj.instance_group else [])
         if self.policy_name not in policies:
-            return True
+            return None
 
         group_hosts = (spec_obj.instance_group.hosts
                        if spec_obj.instance_group else [])
+        # No groups configured
+        return set(group_hosts) if group_hosts else None
+
+    def filter_all(self, filter_obj_list, spec_obj):
+        # Do this here so we don't get scheduler.filters.utils
+        from nova.scheduler import utils as scheduler_utils
+        group_hosts = None
+        if self.RUN_ON_REBUILD or not scheduler_utils.request_is_rebuild(
+                spec_obj):
+            # Build the set of the group hosts once for all the hosts
+            group_hosts = self._get_group_hosts(spec_obj)
+        for host_state in filter_obj_list:
+            if group_hosts is None or self._host_passes(host_state,
+                                                        group_hosts):
+                yield host_state
+
+    def host_passes(self, host_state, spec_obj):
+        group_hosts = self._get_group_hosts(spec_obj)
+        if group_hosts is None:
+            return True
+        return self._host_passes(host_state, group_hosts)
+
+    def _host_passes(self, host_state, group_hosts):
         LOG.debug("Group affinity: check if %(host)s in "
                   "%(configured)s", {'host': host_state.host,
                                      'configured': group_hosts})
-        if group_hosts:
-            return host_state.host in group_hosts
-
-        # No groups configured
-        return True
+        return host_state.host in group_hosts
 
 
 class ServerGroupAffinityFilter(_GroupAffinityFilter):
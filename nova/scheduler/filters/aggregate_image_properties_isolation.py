@@ -17,6 +17,7 @@ from oslo_log import log as logging
 
 
 import nova.conf
+from nova.scheduler import aggregate_index
 from nova.scheduler import filters
 from nova.scheduler.filters import utils
 
@@ -33,6 +34,8 @@ class AggregateImagePropertiesIsolation(filters.BaseHostFilter):
 
     RUN_ON_REBUILD = True
 
+    uses_aggregate_index = True
+
     def host_passes(self, host_state, spec_obj):
         """Checks a host in an aggregate that metadata key/value match
         with image properties.
@@ -70,3 +73,35 @@ class AggregateImagePropertiesIsolation(filters.BaseHostFilter):
                            'options': options})
                 return False
         return True
+
+    def hosts_pass_aggregates(self, index, spec_obj):
+        """Exclude the hosts in an aggregate with a metadata key matching an
+        image property unless one of those aggregates has its value.
+        """
+        cfg_namespace = (CONF.filter_scheduler.
+            aggregate_image_properties_isolation_namespace)
+        cfg_separator = (CONF.filter_scheduler.
+            aggregate_image_properties_isolation_separator)
+
+        image_props = spec_obj.image.properties if spec_obj.image else {}
+        excluded = set()
+        for key in index.keys():
+            if (cfg_namespace and
+                    not key.startswith(cfg_namespace + cfg_separator)):
+                continue
+            try:
+                prop = image_props.get(key)
+            except AttributeError:
+                LOG.warning("Aggregates have a metadata key '%(key)s' that "
+                            "is not present in the image metadata.",
+                            {"key": key})
+                continue
+
+            # NOTE(sbauza): Aggregate metadata is only strings, we need to
+            # stringify the property to match with the option
+            if prop:
+                excluded |= (index.hosts_with_key(key) -
+                             index.hosts_with_value(key, str(prop)))
+        if not excluded:
+            return None
+        return aggregate_index.exclude(excluded)
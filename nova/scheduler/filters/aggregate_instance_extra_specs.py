@@ -17,6 +17,7 @@
 from oslo_log import log as logging
 
 
+from nova.scheduler import aggregate_index
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
 from nova.scheduler.filters import utils
@@ -35,6 +36,23 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
 
     RUN_ON_REBUILD = False
 
+    uses_aggregate_index = True
+
+    @staticmethod
+    def _get_scoped_extra_specs(instance_type):
+        """Return the (key, requirement) pairs of the extra specs which
+        have to match the aggregate metadata, without their scope.
+        """
+        for key, req in instance_type.extra_specs.items():
+            # Either not scope format, or aggregate_instance_extra_specs scope
+            scope = key.split(':', 1)
+            if len(scope) > 1:
+                if scope[0] != _SCOPE:
+                    continue
+                else:
+                    del scope[0]
+            yield scope[0], req
+
     def host_passes(self, host_state, spec_obj):
         """Return a list of hosts that can create instance_type
 
@@ -50,15 +68,7 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
 
         metadata = utils.aggregate_metadata_get_by_host(host_state)
 
-        for key, req in instance_type.extra_specs.items():
-            # Either not scope format, or aggregate_instance_extra_specs scope
-            scope = key.split(':', 1)
-            if len(scope) > 1:
-                if scope[0] != _SCOPE:
-                    continue
-                else:
-                    del scope[0]
-            key = scope[0]
+        for key, req in self._get_scoped_extra_specs(instance_type):
             aggregate_vals = metadata.get(key, None)
             if not aggregate_vals:
                 LOG.debug(
@@ -77,3 +87,28 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
                            'aggregate_vals': aggregate_vals})
                 return False
         return True
+
+    def hosts_pass_aggregates(self, index, spec_obj):
+        """Select the hosts in aggregates matching each of the extra specs,
+        matching each distinct metadata value only once.
+        """
+        instance_type = spec_obj.flavor
+        if (not instance_type.obj_attr_is_set('extra_specs')
+                or not instance_type.extra_specs):
+            return None
+
+        hosts = None
+        for key, req in self._get_scoped_extra_specs(instance_type):
+            key_hosts = set()
+            for aggregate_val in index.values(key):
+                if extra_specs_ops.match(aggregate_val, req):
+                    key_hosts |= index.hosts_with_value(key, aggregate_val)
+            hosts = key_hosts if hosts is None else hosts & key_hosts
+            LOG.debug("Extra_spec %(key)s='%(req)s' is matched by the "
+                      "aggregates of %(count)d host(s).",
+                      {'key': key, 'req': req, 'count': len(key_hosts)})
+            if not hosts:
+                break
+        if hosts is None:
+            return None
+        return aggregate_index.select(hosts)
@@ -15,6 +15,7 @@
 
 from oslo_log import log as logging
 
+from nova.scheduler import aggregate_index
 from nova.scheduler import filters
 from nova.scheduler.filters import utils
 
@@ -30,6 +31,8 @@ class AggregateMultiTenancyIsolation(filters.BaseHostFilter):
 
     RUN_ON_REBUILD = False
 
+    uses_aggregate_index = True
+
     def host_passes(self, host_state, spec_obj):
         """If a host is in an aggregate that has the metadata key
         "filter_tenant_id" it can only create instances from that tenant(s).
@@ -53,3 +56,15 @@ class AggregateMultiTenancyIsolation(filters.BaseHostFilter):
             else:
                 LOG.debug("No tenant id's defined on host. Host passes.")
         return True
+
+    def hosts_pass_aggregates(self, index, spec_obj):
+        """Exclude the hosts in an aggregate with the "filter_tenant_id"
+        metadata key unless one of those aggregates lists the tenant.
+        """
+        tenant_id = spec_obj.project_id
+
+        if 'filter_tenant_id' not in index:
+            return None
+        return aggregate_index.exclude(
+            index.hosts_with_key('filter_tenant_id') -
+            index.hosts_with_value('filter_tenant_id', tenant_id))
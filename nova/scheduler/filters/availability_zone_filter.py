@@ -16,6 +16,7 @@
 from oslo_log import log as logging
 
 import nova.conf
+from nova.scheduler import aggregate_index
 from nova.scheduler import filters
 from nova.scheduler.filters import utils
 
@@ -37,6 +38,8 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
 
     RUN_ON_REBUILD = False
 
+    uses_aggregate_index = True
+
     def host_passes(self, host_state, spec_obj):
         availability_zone = spec_obj.availability_zone
 
@@ -61,3 +64,19 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
                        'host_az': host_az})
 
         return hosts_passes
+
+    def hosts_pass_aggregates(self, index, spec_obj):
+        availability_zone = spec_obj.availability_zone
+
+        if not availability_zone:
+            return None
+
+        hosts = index.hosts_with_value('availability_zone', availability_zone)
+        if availability_zone == CONF.default_availability_zone:
+            # The hosts which are not in an availability zone are in the
+            # default one.
+            return aggregate_index.exclude(
+                index.hosts_with_key('availability_zone') - hosts)
+        LOG.debug("Availability Zone '%(az)s' requested, hosts in it: "
+                  "%(hosts)s", {'az': availability_zone, 'hosts': hosts})
+        return aggregate_index.select(hosts)
@@ -78,6 +78,8 @@ class BaseCoreFilter(filters.BaseHostFilter):
 class CoreFilter(BaseCoreFilter):
     """DEPRECATED: CoreFilter filters based on CPU core utilization."""
 
+    vectorized = True
+
     def __init__(self):
         super(CoreFilter, self).__init__()
         LOG.warning('The CoreFilter is deprecated since the 19.0.0 Stein '
@@ -90,6 +92,26 @@ class CoreFilter(BaseCoreFilter):
     def _get_cpu_allocation_ratio(self, host_state, spec_obj):
         return host_state.cpu_allocation_ratio
 
+    def hosts_pass(self, host_table, spec_obj):
+        """Only let through the hosts with sufficient CPU cores."""
+        instance_vcpus = spec_obj.vcpus
+        host_vcpus = host_table.vcpus_total
+        vcpus_total = host_vcpus * host_table.cpu_allocation_ratio
+
+        # Only provide a VCPU limit to compute if the virt driver is reporting
+        # an accurate count of installed VCPUs. (XenServer driver does not)
+        has_limit = vcpus_total > 0
+        host_table.set_limits(has_limit, 'vcpu', vcpus_total)
+
+        # Do not allow an instance to overcommit against itself, only
+        # against other instances.
+        fits = ~has_limit | (host_vcpus >= instance_vcpus)
+        fits &= (vcpus_total - host_table.vcpus_used) >= instance_vcpus
+        # Fail safe: hosts not reporting their VCPUs (zero or unset, which is
+        # NaN in the table) always pass.
+        unknown = ~(host_vcpus > 0) & ~(host_vcpus < 0)
+        return unknown | fits
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
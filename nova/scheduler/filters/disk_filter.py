@@ -26,6 +26,7 @@ class DiskFilter(filters.BaseHostFilter):
 
     RUN_ON_REBUILD = False
     DEPRECATED = True
+    vectorized = True
 
     def __init__(self):
         super(DiskFilter, self).__init__()
@@ -82,6 +83,24 @@ class DiskFilter(filters.BaseHostFilter):
         host_state.limits['disk_gb'] = disk_gb_limit
         return True
 
+    def hosts_pass(self, host_table, spec_obj):
+        """Filter based on disk usage."""
+        requested_disk = (1024 * (spec_obj.root_gb +
+                                  spec_obj.ephemeral_gb) +
+                          spec_obj.swap)
+        total_usable_disk_mb = host_table.total_usable_disk_gb * 1024
+
+        disk_mb_limit = total_usable_disk_mb * host_table.disk_allocation_ratio
+        used_disk_mb = total_usable_disk_mb - host_table.free_disk_mb
+        usable_disk_mb = disk_mb_limit - used_disk_mb
+        # Do not allow an instance to overcommit against itself, only against
+        # other instances.
+        passes = ((total_usable_disk_mb >= requested_disk) &
+                  (usable_disk_mb >= requested_disk))
+
+        host_table.set_limits(passes, 'disk_gb', disk_mb_limit / 1024)
+        return passes
+
 
 class AggregateDiskFilter(DiskFilter):
     """AggregateDiskFilter with per-aggregate disk allocation ratio flag.
@@ -92,6 +111,7 @@ class AggregateDiskFilter(DiskFilter):
 
     RUN_ON_REBUILD = False
     DEPRECATED = False
+    vectorized = False
 
     def _get_disk_allocation_ratio(self, host_state, spec_obj):
         aggregate_vals = utils.aggregate_values_from_key(
@@ -28,6 +28,7 @@ class NumInstancesFilter(filters.BaseHostFilter):
     """Filter out hosts with too many instances."""
 
     RUN_ON_REBUILD = False
+    vectorized = True
 
     def _get_max_instances_per_host(self, host_state, spec_obj):
         return CONF.filter_scheduler.max_instances_per_host
@@ -44,6 +45,10 @@ class NumInstancesFilter(filters.BaseHostFilter):
                        'max_instances': max_instances})
         return passes
 
+    def hosts_pass(self, host_table, spec_obj):
+        max_instances = CONF.filter_scheduler.max_instances_per_host
+        return host_table.num_instances < max_instances
+
 
 class AggregateNumInstancesFilter(NumInstancesFilter):
     """AggregateNumInstancesFilter with per-aggregate the max num instances.
@@ -52,6 +57,8 @@ class AggregateNumInstancesFilter(NumInstancesFilter):
     found.
     """
 
+    vectorized = False
+
     def _get_max_instances_per_host(self, host_state, spec_obj):
         max_instances_per_host = CONF.filter_scheduler.max_instances_per_host
 
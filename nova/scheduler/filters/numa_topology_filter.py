@@ -10,13 +10,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
 from oslo_log import log as logging
 
+import nova.conf
 from nova import objects
 from nova.objects import fields
 from nova.scheduler import filters
 from nova.virt import hardware
 
+CONF = nova.conf.CONF
 LOG = logging.getLogger(__name__)
 
 
@@ -25,12 +29,16 @@ class NUMATopologyFilter(filters.BaseHostFilter):
 
     RUN_ON_REBUILD = True
 
+    def __init__(self):
+        super(NUMATopologyFilter, self).__init__()
+        # Results of numa_fit_instance_to_host() kept across the requests,
+        # keyed by numa_fit_cache_key(), the most recently used last
+        self._fit_cache = collections.OrderedDict()
+
     def _satisfies_cpu_policy(self, host_state, extra_specs, image_props):
         """Check that the host_state provided satisfies any available
         CPU policy requirements.
         """
-        host_topology, _ = hardware.host_topology_and_format_from_host(
-            host_state)
         # NOTE(stephenfin): There can be conflicts between the policy
         # specified by the image and that specified by the instance, but this
         # is not the place to resolve these. We do this during scheduling.
@@ -39,15 +47,17 @@ class NUMATopologyFilter(filters.BaseHostFilter):
         cpu_thread_policy = [extra_specs.get('hw:cpu_thread_policy'),
                              image_props.get('hw_cpu_thread_policy')]
 
-        if not host_topology:
-            return True
-
         if fields.CPUAllocationPolicy.DEDICATED not in cpu_policy:
             return True
 
         if fields.CPUThreadAllocationPolicy.REQUIRE not in cpu_thread_policy:
             return True
 
+        host_topology, _ = hardware.host_topology_and_format_from_host(
+            host_state)
+        if not host_topology:
+            return True
+
         if not host_topology.has_threads:
             LOG.debug("%(host_state)s fails CPU policy requirements. "
                       "Host does not have hyperthreading or "
@@ -57,23 +67,51 @@ class NUMATopologyFilter(filters.BaseHostFilter):
 
         return True
 
+    @staticmethod
+    def _log_no_host_topology(host_state, spec_obj):
+        LOG.debug("%(host)s, %(node)s fails NUMA topology requirements. "
+                  "No host NUMA topology while the instance specified one.",
+                  {'host': host_state.host, 'node': host_state.nodename},
+                  instance_uuid=spec_obj.instance_uuid)
+
+    def _fits(self, key, fit, request_cache):
+        """Return whether the instance fits on the host, calling fit() unless
+        the result for the given key is already known.
+        """
+        if key is None:
+            return fit()
+        if key in request_cache:
+            return request_cache[key]
+        cache_size = CONF.filter_scheduler.numa_fit_cache_size
+        if cache_size and key in self._fit_cache:
+            # Move the result to the most recently used end
+            fits = self._fit_cache[key] = self._fit_cache.pop(key)
+        else:
+            fits = fit()
+            if cache_size:
+                self._fit_cache[key] = fits
+                while len(self._fit_cache) > cache_size:
+                    self._fit_cache.popitem(last=False)
+        request_cache[key] = fits
+        return fits
+
+    def filter_all(self, filter_obj_list, spec_obj):
+        # Reuse the NUMA fitting results for the hosts of the request which
+        # have the same NUMA topology and usage
+        request_cache = {}
+        for host_state in filter_obj_list:
+            if self._host_passes(host_state, spec_obj, request_cache):
+                yield host_state
+
     def host_passes(self, host_state, spec_obj):
-        # TODO(stephenfin): The 'numa_fit_instance_to_host' function has the
-        # unfortunate side effect of modifying 'spec_obj.numa_topology' - an
-        # InstanceNUMATopology object - by populating the 'cpu_pinning' field.
-        # This is rather rude and said function should be reworked to avoid
-        # doing this. That's a large, non-backportable cleanup however, so for
-        # now we just duplicate spec_obj to prevent changes propagating to
-        # future filter calls.
-        spec_obj = spec_obj.obj_clone()
+        return self._host_passes(host_state, spec_obj, {})
 
+    def _host_passes(self, host_state, spec_obj, request_cache):
         ram_ratio = host_state.ram_allocation_ratio
         cpu_ratio = host_state.cpu_allocation_ratio
         extra_specs = spec_obj.flavor.extra_specs
         image_props = spec_obj.image.properties
         requested_topology = spec_obj.numa_topology
-        host_topology, _fmt = hardware.host_topology_and_format_from_host(
-                host_state)
         pci_requests = spec_obj.pci_requests
 
         network_metadata = None
@@ -87,34 +125,54 @@ class NUMATopologyFilter(filters.BaseHostFilter):
                                           image_props):
             return False
 
-        if requested_topology and host_topology:
-            limits = objects.NUMATopologyLimits(
-                cpu_allocation_ratio=cpu_ratio,
-                ram_allocation_ratio=ram_ratio)
-
-            if network_metadata:
-                limits.network_metadata = network_metadata
-
-            instance_topology = (hardware.numa_fit_instance_to_host(
-                        host_topology, requested_topology,
-                        limits=limits,
-                        pci_requests=pci_requests,
-                        pci_stats=host_state.pci_stats))
-            if not instance_topology:
-                LOG.debug("%(host)s, %(node)s fails NUMA topology "
-                          "requirements. The instance does not fit on this "
-                          "host.", {'host': host_state.host,
-                                    'node': host_state.nodename},
-                          instance_uuid=spec_obj.instance_uuid)
-                return False
-            host_state.limits['numa_topology'] = limits
+        if not requested_topology:
             return True
-        elif requested_topology:
-            LOG.debug("%(host)s, %(node)s fails NUMA topology requirements. "
-                      "No host NUMA topology while the instance specified "
-                      "one.",
-                      {'host': host_state.host, 'node': host_state.nodename},
+
+        if not host_state.numa_topology:
+            self._log_no_host_topology(host_state, spec_obj)
+            return False
+
+        limits = objects.NUMATopologyLimits(
+            cpu_allocation_ratio=cpu_ratio,
+            ram_allocation_ratio=ram_ratio)
+
+        if network_metadata:
+            limits.network_metadata = network_metadata
+
+        def fit():
+            host_topology, _fmt = hardware.host_topology_and_format_from_host(
+                host_state)
+            if not host_topology:
+                return None
+            # TODO(stephenfin): The 'numa_fit_instance_to_host' function has
+            # the unfortunate side effect of modifying the
+            # InstanceNUMATopology object by populating the 'cpu_pinning'
+            # field. This is rather rude and said function should be
+            # reworked to avoid doing this. That's a large, non-backportable
+            # cleanup however, so for now we just duplicate it to prevent
+            # changes propagating to future filter calls.
+            instance_topology = hardware.numa_fit_instance_to_host(
+                host_topology, requested_topology.obj_clone(),
+                limits=limits,
+                pci_requests=pci_requests,
+                pci_stats=host_state.pci_stats)
+            return bool(instance_topology)
+
+        # The key is computed from the NUMA topology of the host as it is
+        # stored, so that the JSON ones are only loaded to be fitted onto
+        key = hardware.numa_fit_cache_key(
+            host_state.numa_topology, requested_topology, limits=limits,
+            pci_requests=pci_requests, pci_stats=host_state.pci_stats)
+        fits = self._fits(key, fit, request_cache)
+        if fits is None:
+            self._log_no_host_topology(host_state, spec_obj)
+            return False
+        if not fits:
+            LOG.debug("%(host)s, %(node)s fails NUMA topology "
+                      "requirements. The instance does not fit on this "
+                      "host.", {'host': host_state.host,
+                                'node': host_state.nodename},
                       instance_uuid=spec_obj.instance_uuid)
             return False
-        else:
-            return True
+        host_state.limits['numa_topology'] = limits
+        return True
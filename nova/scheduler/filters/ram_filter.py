@@ -68,6 +68,8 @@ class BaseRamFilter(filters.BaseHostFilter):
 class RamFilter(BaseRamFilter):
     """Ram Filter with over subscription flag."""
 
+    vectorized = True
+
     def __init__(self):
         super(RamFilter, self).__init__()
         LOG.warning('The RamFilter is deprecated since the 19.0.0 Stein '
@@ -80,6 +82,24 @@ class RamFilter(BaseRamFilter):
     def _get_ram_allocation_ratio(self, host_state, spec_obj):
         return host_state.ram_allocation_ratio
 
+    def hosts_pass(self, host_table, spec_obj):
+        """Only let through the hosts with sufficient available RAM."""
+        requested_ram = spec_obj.memory_mb
+        total_usable_ram_mb = host_table.total_usable_ram_mb
+
+        memory_mb_limit = (total_usable_ram_mb *
+                           host_table.ram_allocation_ratio)
+        used_ram_mb = total_usable_ram_mb - host_table.free_ram_mb
+        usable_ram = memory_mb_limit - used_ram_mb
+        # Do not allow an instance to overcommit against itself, only against
+        # other instances.
+        passes = ((total_usable_ram_mb >= requested_ram) &
+                  (usable_ram >= requested_ram))
+
+        # save oversubscription limit for compute node to test against:
+        host_table.set_limits(passes, 'memory_mb', memory_mb_limit)
+        return passes
+
 
 class AggregateRamFilter(BaseRamFilter):
     """AggregateRamFilter with per-aggregate ram subscription flag.
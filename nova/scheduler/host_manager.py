@@ -18,6 +18,7 @@ Manage hosts in the current zone.
 """
 
 import collections
+import copy
 import functools
 import time
 try:
@@ -36,7 +37,9 @@ from nova import context as context_module
 from nova import exception
 from nova import objects
 from nova.pci import stats as pci_stats
+from nova.scheduler import aggregate_index
 from nova.scheduler import filters
+from nova.scheduler import instance_index
 from nova.scheduler import weights
 from nova import utils
 from nova.virt import hardware
@@ -325,6 +328,39 @@ class HostState(object):
         # is always an IO operation because we want to move the instance
         self.num_io_ops += 1
 
+    def save_consumption(self):
+        """Returns a copy of the state updated by consume_from_request(),
+        for restore_consumption() to undo the requests consumed since.
+        """
+        @utils.synchronized(self._lock_name)
+        def _locked(self):
+            state = {attr: getattr(self, attr)
+                     for attr in ('free_ram_mb', 'free_disk_mb', 'vcpus_used',
+                                  'num_instances', 'num_io_ops',
+                                  'numa_topology', 'updated')}
+            # The PCI pools are updated in place.
+            state['pci_stats'] = copy.deepcopy(self.pci_stats)
+            return state
+
+        return _locked(self)
+
+    def restore_consumption(self, state, updated):
+        """Undo the requests consumed since save_consumption() returned
+        state, unless the host state was updated after the given updated
+        time, by another request or from its compute node.
+
+        Returns True if the state was restored.
+        """
+        @utils.synchronized(self._lock_name)
+        def _locked(self):
+            if self.updated != updated:
+                return False
+            for attr, value in state.items():
+                setattr(self, attr, value)
+            return True
+
+        return _locked(self)
+
     def __repr__(self):
         return ("(%(host)s, %(node)s) ram: %(free_ram)sMB "
                 "disk: %(free_disk)sMB io_ops: %(num_io_ops)s "
@@ -359,13 +395,32 @@ class HostManager(object):
         # Dict of set of aggregate IDs keyed by the name of the host belonging
         # to those aggregates
         self.host_aggregates_map = collections.defaultdict(set)
+        # Index of the aggregates by metadata key and value, used by the
+        # filters to select the hosts by aggregate metadata all at once
+        self.aggregate_index = aggregate_index.AggregateIndex()
+        self.filter_handler.aggregate_index = self.aggregate_index
         self._init_aggregates()
         self.track_instance_changes = (
                 CONF.filter_scheduler.track_instance_changes)
         # Dict of instances and status, keyed by host
         self._instance_info = {}
+        # Hosts of the instances of _instance_info, keyed by instance UUID,
+        # used by the filters and weighers to count the instances of a
+        # server group on all the hosts at once
+        self.instance_index = instance_index.InstanceIndex()
         if self.track_instance_changes:
             self._init_instance_info()
+        self.host_state_cache_max_age = (
+                CONF.filter_scheduler.host_state_cache_max_age)
+        # Dict of resident HostState objects keyed by (host, nodename), only
+        # populated when the host state cache is enabled
+        self.host_state_map = {}
+        # Dict of (host, nodename) keys of the cached HostStates keyed by
+        # compute node UUID
+        self._host_state_keys_by_uuid = {}
+        # Dict of the last time the cached HostStates of a cell were refreshed
+        # from the database, keyed by cell UUID
+        self._cell_refresh_times = {}
 
     def _load_filters(self):
         return CONF.filter_scheduler.enabled_filters
@@ -375,6 +430,7 @@ class HostManager(object):
         aggs = objects.AggregateList.get_all(elevated)
         for agg in aggs:
             self.aggs_by_id[agg.id] = agg
+            self.aggregate_index.update(agg)
             for host in agg.hosts:
                 self.host_aggregates_map[host].add(agg.id)
 
@@ -388,6 +444,7 @@ class HostManager(object):
 
     def _update_aggregate(self, aggregate):
         self.aggs_by_id[aggregate.id] = aggregate
+        self.aggregate_index.update(aggregate)
         for host in aggregate.hosts:
             self.host_aggregates_map[host].add(aggregate.id)
         # Refreshing the mapping dict to remove all hosts that are no longer
@@ -402,6 +459,7 @@ class HostManager(object):
         """
         if aggregate.id in self.aggs_by_id:
             del self.aggs_by_id[aggregate.id]
+        self.aggregate_index.remove(aggregate.id)
         for host in self.host_aggregates_map:
             if aggregate.id in self.host_aggregates_map[host]:
                 self.host_aggregates_map[host].remove(aggregate.id)
@@ -422,6 +480,7 @@ class HostManager(object):
             context = context_module.RequestContext()
             LOG.debug("START:_async_init_instance_info")
             self._instance_info = {}
+            self.instance_index = instance_index.InstanceIndex()
 
             count = 0
             if not computes_by_cell:
@@ -457,8 +516,9 @@ class HostManager(object):
                     for instance in instances:
                         host = instance.host
                         if host not in self._instance_info:
-                            self._instance_info[host] = {"instances": {},
-                                                         "updated": False}
+                            self._instance_info[host] = {
+                                "instances": self.instance_index.track(host),
+                                "updated": False}
                         inst_dict = self._instance_info[host]
                         inst_dict["instances"][instance.uuid] = instance
                     # Call sleep() to cooperatively yield
@@ -596,8 +656,15 @@ class HostManager(object):
 
     def get_weighed_hosts(self, hosts, spec_obj):
         """Weigh the hosts."""
+        top = None
+        if self.weight_handler.table_class is not None:
+            # Only the hosts which can be picked, either as a selected host
+            # or as an alternate, need to be ranked.
+            top = (CONF.filter_scheduler.host_subset_size +
+                   CONF.scheduler.max_attempts - 1 +
+                   spec_obj.num_instances - 1)
         return self.weight_handler.get_weighed_objects(self.weighers,
-                hosts, spec_obj)
+                hosts, spec_obj, top=top)
 
     def _get_computes_for_cells(self, context, cells, compute_uuids=None):
         """Get a tuple of compute node and service information.
@@ -611,7 +678,9 @@ class HostManager(object):
             compute_nodes tuple item will be an empty dict.
 
         Returns a tuple (compute_nodes, services) where:
-         - compute_nodes is cell-uuid keyed dict of compute node lists
+         - compute_nodes is cell-uuid keyed dict of compute node lists. The
+           cells which failed or did not respond have no entry, the cells
+           without compute nodes have an empty list.
          - services is a dict of services indexed by hostname
         """
 
@@ -688,6 +757,9 @@ class HostManager(object):
         else:
             cells = self.enabled_cells
 
+        if self.host_state_cache_max_age:
+            return self._get_cached_host_states(context, cells,
+                                                compute_uuids)
         compute_nodes, services = self._get_computes_for_cells(
             context, cells, compute_uuids=compute_uuids)
         return self._get_host_states(context, compute_nodes, services)
@@ -740,6 +812,106 @@ class HostManager(object):
 
         return (host_state_map[host] for host in seen_nodes)
 
+    def _refresh_cached_cells(self, context, cells):
+        """Refreshes the resident HostStates of the cells whose cached view
+        is older than the host_state_cache_max_age option.
+
+        Cells that fail to respond keep their (stale) HostStates and are
+        retried on the next request.
+        """
+        now = timeutils.utcnow()
+        max_age = self.host_state_cache_max_age
+        stale_cells = [cell for cell in cells
+                       if cell.uuid not in self._cell_refresh_times or
+                       timeutils.is_older_than(
+                           self._cell_refresh_times[cell.uuid], max_age)]
+        if not stale_cells:
+            return
+        LOG.debug('Refreshing cached host states for cells: %s',
+                  ', '.join([cell.uuid for cell in stale_cells]))
+        compute_nodes, services = self._get_computes_for_cells(context,
+                                                               stale_cells)
+        for cell in stale_cells:
+            cell_uuid = cell.uuid
+            if cell_uuid not in compute_nodes:
+                # The cell failed or did not respond, keep its HostStates.
+                continue
+            computes = compute_nodes[cell_uuid]
+            seen_nodes = set()
+            for compute in computes:
+                service = services.get(compute.host)
+                if not service:
+                    LOG.warning(
+                        "No compute service record found for host %(host)s",
+                        {'host': compute.host})
+                    continue
+                state_key = (compute.host, compute.hypervisor_hostname)
+                host_state = self.host_state_map.get(state_key)
+                if not host_state:
+                    host_state = self.host_state_cls(
+                        compute.host, compute.hypervisor_hostname, cell_uuid,
+                        compute=compute)
+                    self.host_state_map[state_key] = host_state
+                host_state.update(compute, dict(service))
+                self._host_state_keys_by_uuid[compute.uuid] = state_key
+                seen_nodes.add(state_key)
+            # Drop the nodes of this cell which have been deleted since the
+            # last refresh.
+            for state_key, host_state in list(self.host_state_map.items()):
+                if (host_state.cell_uuid == cell_uuid and
+                        state_key not in seen_nodes):
+                    del self.host_state_map[state_key]
+                    self._host_state_keys_by_uuid.pop(host_state.uuid, None)
+            self._cell_refresh_times[cell_uuid] = now
+
+    def _get_cached_host_states(self, context, cells, compute_uuids):
+        """Returns a generator over the resident HostStates matching the
+        given compute node UUIDs, or all of the HostStates of the given cells
+        if compute_uuids is None.
+
+        Only the per-request information (aggregates and instances) is
+        updated here, so the work done is proportional to the number of
+        candidates rather than to the size of the deployment.
+        """
+        self._refresh_cached_cells(context, cells)
+        cell_uuids = set(cell.uuid for cell in cells)
+        if compute_uuids is None:
+            state_keys = [key for key, state in self.host_state_map.items()
+                          if state.cell_uuid in cell_uuids]
+        else:
+            state_keys = [self._host_state_keys_by_uuid[cn_uuid]
+                          for cn_uuid in compute_uuids
+                          if cn_uuid in self._host_state_keys_by_uuid]
+        host_states = []
+        for state_key in state_keys:
+            host_state = self.host_state_map.get(state_key)
+            if host_state is None or host_state.cell_uuid not in cell_uuids:
+                continue
+            host_state.update(aggregates=self._get_aggregates_info(
+                                  host_state.host),
+                              inst_dict=self._get_instance_info(
+                                  context, host_state))
+            host_states.append(host_state)
+        return iter(host_states)
+
+    def update_compute_node_info(self, context, host_name, compute_node):
+        """Receives an updated ComputeNode object from a compute node.
+
+        This is only used when the host state cache is enabled, so that the
+        resident HostState reflects the usage reported by the compute service
+        without waiting for the next database refresh of its cell. Nodes that
+        are not yet known are picked up by the next refresh.
+        """
+        if not self.host_state_cache_max_age:
+            return
+        state_key = (host_name, compute_node.hypervisor_hostname)
+        host_state = self.host_state_map.get(state_key)
+        if host_state is None:
+            LOG.debug("Received a compute node update from an unknown node "
+                      "%s. Ignoring it until the next refresh.", state_key)
+            return
+        host_state.update(compute=compute_node)
+
     def _get_aggregates_info(self, host):
         return [self.aggs_by_id[agg_id] for agg_id in
                 self.host_aggregates_map[host]]
@@ -785,7 +957,8 @@ class HostManager(object):
         """
         inst_dict = self._get_instances_by_host(context, host_name)
         host_info = self._instance_info[host_name] = {}
-        host_info["instances"] = inst_dict
+        host_info["instances"] = self.instance_index.track(host_name,
+                                                           inst_dict)
         host_info["updated"] = False
 
     @utils.synchronized(HOST_INSTANCE_SEMAPHORE)
@@ -808,8 +981,9 @@ class HostManager(object):
             if len(instances) > 1:
                 # This is a host sending its full instance list, so use it.
                 host_info = self._instance_info[host_name] = {}
-                host_info["instances"] = {instance.uuid: instance
-                                          for instance in instances}
+                host_info["instances"] = self.instance_index.track(
+                    host_name, {instance.uuid: instance
+                                for instance in instances})
                 host_info["updated"] = True
             else:
                 self._recreate_instance_info(context, host_name)
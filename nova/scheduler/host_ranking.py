@@ -0,0 +1,175 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Ranking of the weighed hosts of a request, reused across its instances.
+"""
+
+import heapq
+import itertools
+import random
+
+import nova.conf
+from nova.scheduler import weights
+
+CONF = nova.conf.CONF
+
+
+class HostRanking(object):
+    """Ranking of the candidate hosts of a multi-create request.
+
+    The whole list of candidate hosts is only filtered and weighed for the
+    first instance of the request. Only the best `size` hosts are then kept
+    sorted in a window, while the other hosts are kept in a heap keyed by
+    their weight.
+
+    For the next instances, only the hosts of the window, which include the
+    hosts consumed by the previous instances, are filtered and weighed again.
+    A host whose weight went below the best weight of the heap is swapped
+    with the hosts of the heap, which are filtered again before entering the
+    window. The weights of the other hosts cannot change, since their
+    resources were not consumed, unless the normalization range of a weigher
+    changed, in which case the whole ranking is computed again.
+    """
+
+    def __init__(self, host_manager, size):
+        self.host_manager = host_manager
+        self.size = max(size, 1)
+        # The heap holds (-weight, order, HostState) entries, and the window
+        # the best entries popped from it, by descending weight.
+        self._heap = []
+        self._window = None
+        # The hosts to rank when the whole ranking is computed again.
+        self._hosts_to_rank = None
+        # Hosts ranked again come before the hosts with the same weight which
+        # were left untouched in the heap, as they did in the sorted list.
+        self._order = itertools.count()
+        self._rerank_order = itertools.count(-1, -1)
+
+    def get_hosts(self):
+        """Return the HostStates still taken into account by the ranking."""
+        return [entry[2] for entry in itertools.chain(self._window or [],
+                                                      self._heap)]
+
+    def invalidate(self):
+        """Compute the whole ranking again for the next instance."""
+        if self._window is not None:
+            self._hosts_to_rank = self.get_hosts()
+            self._heap = []
+            self._window = None
+
+    def consume(self, host_state):
+        """Record that resources were consumed from a host of the ranking.
+
+        The hosts of the window are ranked again for each instance anyway,
+        so only a host out of the window invalidates the ranking.
+        """
+        if self._window is not None and not any(
+                entry[2] is host_state for entry in self._window):
+            self.invalidate()
+
+    def get_weighed_hosts(self, spec_obj, host_states, index):
+        """Return the WeighedHosts of the window, sorted by weight.
+
+        host_states is only used for the first instance of the request.
+        """
+        if self._window is not None and not self._update(spec_obj, index):
+            self.invalidate()
+        if self._window is None:
+            if self._hosts_to_rank is not None:
+                host_states = self._hosts_to_rank
+                self._hosts_to_rank = None
+            self._reset(spec_obj, host_states, index)
+        return [weights.WeighedHost(entry[2], -entry[0])
+                for entry in self._window]
+
+    def _filter(self, hosts, spec_obj, index):
+        if not hosts:
+            return []
+        return list(self.host_manager.get_filtered_hosts(hosts, spec_obj,
+                                                         index) or [])
+
+    def _get_scale(self):
+        return [(weigher.minval, weigher.maxval)
+                for weigher in self.host_manager.weighers]
+
+    def _fill_window(self, spec_obj, index, fresh_hosts):
+        """Pop the best entries of the heap into the window.
+
+        The hosts which were not just filtered and weighed are filtered
+        before entering the window, and dropped if they no longer pass.
+        """
+        self._window = []
+        while len(self._window) < self.size and self._heap:
+            count = min(self.size - len(self._window), len(self._heap))
+            entries = [heapq.heappop(self._heap) for _i in range(count)]
+            stale = [entry[2] for entry in entries
+                     if entry[2] not in fresh_hosts]
+            passing = set(self._filter(stale, spec_obj, index))
+            self._window.extend(entry for entry in entries
+                                if entry[2] in fresh_hosts or
+                                entry[2] in passing)
+
+    def _reset(self, spec_obj, host_states, index):
+        self._heap = []
+        self._window = []
+        filtered_hosts = self._filter(host_states, spec_obj, index)
+        if not filtered_hosts:
+            return
+
+        weighed_hosts = self.host_manager.get_weighed_hosts(filtered_hosts,
+                                                            spec_obj)
+        if CONF.filter_scheduler.shuffle_best_same_weighed_hosts:
+            # Shuffle all the best hosts and not only the ones which will be
+            # in the window, so that any of them can be picked.
+            best_weight = weighed_hosts[0].weight
+            best_hosts = list(itertools.takewhile(
+                lambda w: w.weight == best_weight, weighed_hosts))
+            random.shuffle(best_hosts)
+            weighed_hosts = best_hosts + weighed_hosts[len(best_hosts):]
+
+        self._heap = [(-w.weight, next(self._order), w.obj)
+                      for w in weighed_hosts]
+        heapq.heapify(self._heap)
+        self._fill_window(spec_obj, index, set(filtered_hosts))
+
+    def _update(self, spec_obj, index):
+        """Rank the hosts of the window again.
+
+        Returns False if the whole ranking has to be computed again instead.
+        """
+        candidates = [entry[2] for entry in self._window]
+        hosts = self._filter(candidates, spec_obj, index)
+        # A single host is not weighed, so make sure there are at least two
+        # of them to get actual weights.
+        while len(hosts) < 2 and self._heap:
+            candidate = heapq.heappop(self._heap)[2]
+            candidates.append(candidate)
+            hosts += self._filter([candidate], spec_obj, index)
+        if not hosts:
+            self._window = []
+            return True
+
+        scale = self._get_scale()
+        weighed_hosts = self.host_manager.get_weighed_hosts(hosts, spec_obj)
+        if scale != self._get_scale():
+            # The weights of the other hosts changed as well.
+            self._window = [(0, 0, host) for host in candidates]
+            return False
+
+        # Push the hosts in reverse order, so that the first ones get the
+        # lowest order among the hosts with the same weight.
+        for w in reversed(weighed_hosts):
+            heapq.heappush(self._heap,
+                           (-w.weight, next(self._rerank_order), w.obj))
+        self._fill_window(spec_obj, index, set(hosts))
+        return True
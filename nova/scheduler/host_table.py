@@ -0,0 +1,88 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar view of HostStates used by the vectorized scheduler filters.
+"""
+
+from oslo_utils import importutils
+
+numpy = importutils.try_import('numpy')
+
+
+def is_supported():
+    """Return True if the numpy library needed by HostTable is available."""
+    return numpy is not None
+
+
+class HostTable(object):
+    """Array-backed table of the resources of a list of HostStates.
+
+    Each column of COLUMNS is a numpy float array holding the value of the
+    HostState attribute of the same name, so that filters can evaluate a
+    whole candidate list in one array operation instead of calling
+    host_passes() for every single HostState.
+    """
+
+    COLUMNS = (
+        'free_ram_mb',
+        'total_usable_ram_mb',
+        'ram_allocation_ratio',
+        'free_disk_mb',
+        'total_usable_disk_gb',
+        'disk_allocation_ratio',
+        'vcpus_total',
+        'vcpus_used',
+        'cpu_allocation_ratio',
+        'num_io_ops',
+        'num_instances',
+    )
+
+    def __init__(self, objects, columns=None):
+        self.objects = list(objects)
+        if columns is None:
+            # NOTE: None values (e.g. allocation ratios of a host which has
+            # not reported yet) become NaN, which fails every comparison.
+            columns = {name: numpy.array([getattr(obj, name)
+                                          for obj in self.objects],
+                                         dtype=float)
+                       for name in self.COLUMNS}
+        self._columns = columns
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def pass_all(self):
+        """Return a mask which lets every host of the table through."""
+        return numpy.ones(len(self.objects), dtype=bool)
+
+    def compress(self, mask):
+        """Return a new HostTable only holding the hosts selected by mask."""
+        indices = numpy.flatnonzero(mask)
+        objects = [self.objects[i] for i in indices]
+        columns = {name: column[indices]
+                   for name, column in self._columns.items()}
+        return self.__class__(objects, columns=columns)
+
+    def set_limits(self, mask, name, values):
+        """Store the values of an oversubscription limit in the HostState
+        limits of the hosts selected by mask.
+        """
+        indices = numpy.flatnonzero(mask)
+        for i, value in zip(indices, values[indices].tolist()):
+            self.objects[i].limits[name] = value
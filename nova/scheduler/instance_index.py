@@ -0,0 +1,161 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Reverse index of the instances tracked by the HostManager.
+"""
+
+import collections
+import copy
+
+
+class InstanceDict(dict):
+    """Dict of the instances of a host, keyed by instance UUID, keeping the
+    InstanceIndex which created it up to date when it is changed.
+
+    The HostStates of the hosts whose instances are tracked share these
+    dicts, so the instances added by the FilterScheduler while it consumes
+    the selected hosts are indexed as well.
+    """
+
+    def __init__(self, index, host):
+        super(InstanceDict, self).__init__()
+        self.index = index
+        self.host = host
+
+    def is_tracked(self):
+        """Return True if this dict is the one indexed for its host."""
+        return self.index._dicts.get(self.host) is self
+
+    def __setitem__(self, instance_uuid, instance):
+        super(InstanceDict, self).__setitem__(instance_uuid, instance)
+        self.index._add(self, instance_uuid)
+
+    def __delitem__(self, instance_uuid):
+        super(InstanceDict, self).__delitem__(instance_uuid)
+        self.index._remove(self, instance_uuid)
+
+    def pop(self, instance_uuid, *args):
+        value = super(InstanceDict, self).pop(instance_uuid, *args)
+        self.index._remove(self, instance_uuid)
+        return value
+
+    def popitem(self):
+        instance_uuid, instance = super(InstanceDict, self).popitem()
+        self.index._remove(self, instance_uuid)
+        return instance_uuid, instance
+
+    def setdefault(self, instance_uuid, default=None):
+        if instance_uuid not in self:
+            self[instance_uuid] = default
+        return self[instance_uuid]
+
+    def update(self, *args, **kwargs):
+        for instance_uuid, instance in dict(*args, **kwargs).items():
+            self[instance_uuid] = instance
+
+    def clear(self):
+        for instance_uuid in list(self):
+            del self[instance_uuid]
+
+    # Copies are plain dicts, which are not indexed
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class InstanceIndex(object):
+    """Index of the hosts of the instances, keyed by instance UUID.
+
+    Only the instances of the InstanceDicts returned by track() are indexed,
+    so counting the instances of a group on a host with the index is only
+    equivalent to looking them up in host_state.instances when that is the
+    tracked InstanceDict of the host.
+    """
+
+    def __init__(self):
+        # Tracked InstanceDict keyed by host name
+        self._dicts = {}
+        # Dict of the sets of host names keyed by instance UUID
+        self._hosts = collections.defaultdict(set)
+
+    def track(self, host, instances=None):
+        """Return a new InstanceDict of the instances of a host, indexed in
+        place of the previous one of that host, if any.
+        """
+        old = self._dicts.pop(host, None)
+        if old is not None:
+            for instance_uuid in old:
+                self._discard(host, instance_uuid)
+        self._dicts[host] = InstanceDict(self, host)
+        self._dicts[host].update(instances or {})
+        return self._dicts[host]
+
+    def _add(self, instances, instance_uuid):
+        if instances.is_tracked():
+            self._hosts[instance_uuid].add(instances.host)
+
+    def _remove(self, instances, instance_uuid):
+        if instances.is_tracked():
+            self._discard(instances.host, instance_uuid)
+
+    def _discard(self, host, instance_uuid):
+        hosts = self._hosts.get(instance_uuid)
+        if hosts is not None:
+            hosts.discard(host)
+            if not hosts:
+                del self._hosts[instance_uuid]
+
+    def hosts(self, instance_uuid):
+        """Return the set of the hosts of an instance."""
+        return set(self._hosts.get(instance_uuid, ()))
+
+    def count_by_host(self, instance_uuids):
+        """Return a Counter of the given instances keyed by host name."""
+        counts = collections.Counter()
+        for instance_uuid in set(instance_uuids):
+            counts.update(self._hosts.get(instance_uuid, ()))
+        return counts
+
+
+def count_instances_by_host(host_states, instance_uuids):
+    """Return the list of the number of the given instances on each of the
+    host states.
+
+    The instances are counted once per InstanceIndex for the host states
+    whose instances are tracked by one, and looked up in host_state.instances
+    for the others.
+    """
+    instance_uuids = set(instance_uuids)
+    counts_by_index = {}
+    counts = []
+    for host_state in host_states:
+        instances = host_state.instances
+        if (isinstance(instances, InstanceDict) and
+                instances.host == host_state.host and instances.is_tracked()):
+            index = instances.index
+            if id(index) not in counts_by_index:
+                counts_by_index[id(index)] = index.count_by_host(
+                    instance_uuids)
+            counts.append(counts_by_index[id(index)][host_state.host])
+        elif len(instance_uuids) < len(instances):
+            counts.append(sum(1 for instance_uuid in instance_uuids
+                              if instance_uuid in instances))
+        else:
+            counts.append(sum(1 for instance_uuid in instances
+                              if instance_uuid in instance_uuids))
+    return counts
@@ -25,8 +25,10 @@ from oslo_log import log as logging
 import oslo_messaging as messaging
 from oslo_serialization import jsonutils
 from oslo_service import periodic_task
+from oslo_utils import timeutils
 from stevedore import driver
 
+from nova.compute import utils as compute_utils
 import nova.conf
 from nova import exception
 from nova import manager
@@ -35,6 +37,7 @@ from nova.objects import host_mapping as host_mapping_obj
 from nova import quota
 from nova.scheduler import client as scheduler_client
 from nova.scheduler import request_filter
+from nova.scheduler import timing
 from nova.scheduler import utils
 
 
@@ -48,7 +51,7 @@ QUOTAS = quota.QUOTAS
 class SchedulerManager(manager.Manager):
     """Chooses a host to run instances on."""
 
-    target = messaging.Target(version='4.5')
+    target = messaging.Target(version='4.6')
 
     _sentinel = object()
 
@@ -61,6 +64,7 @@ class SchedulerManager(manager.Manager):
                 "nova.scheduler.driver",
                 scheduler_driver,
                 invoke_on_load=True).driver
+        self.timing_summary = timing.TimingSummary()
         super(SchedulerManager, self).__init__(service_name='scheduler',
                                                *args, **kwargs)
 
@@ -81,6 +85,19 @@ class SchedulerManager(manager.Manager):
     def _run_periodic_tasks(self, context):
         self.driver.run_periodic_tasks(context)
 
+    @periodic_task.periodic_task(
+        spacing=CONF.scheduler.timing_summary_interval,
+        run_immediately=True)
+    def _report_timing_summary(self, context):
+        summary, self.timing_summary = (self.timing_summary,
+                                        timing.TimingSummary())
+        if not summary.requests:
+            return
+        summary.log()
+        if CONF.scheduler.timing_notifications:
+            compute_utils.notify_about_scheduler_timing(
+                context, summary, timeutils.utcnow())
+
     def reset(self):
         # NOTE(tssurya): This is a SIGHUP handler which will reset the cells
         # and enabled cells caches in the host manager. So every time an
@@ -89,6 +106,7 @@ class SchedulerManager(manager.Manager):
         self.driver.host_manager.refresh_cells_caches()
 
     @messaging.expected_exceptions(exception.NoValidHost)
+    @timing.timed_request
     def select_destinations(self, ctxt, request_spec=None,
             filter_properties=None, spec_obj=_sentinel, instance_uuids=None,
             return_objects=False, return_alternates=False):
@@ -135,8 +153,9 @@ class SchedulerManager(manager.Manager):
                 raise exception.NoValidHost(reason=e.message)
 
             resources = utils.resources_from_request_spec(spec_obj)
-            res = self.placement_client.get_allocation_candidates(ctxt,
-                                                                  resources)
+            with timing.step(timing.PLACEMENT):
+                res = self.placement_client.get_allocation_candidates(
+                    ctxt, resources)
             if res is None:
                 # We have to handle the case that we failed to connect to the
                 # Placement service and the safe_connect decorator on
@@ -213,3 +232,10 @@ class SchedulerManager(manager.Manager):
         """
         self.driver.host_manager.sync_instance_info(context, host_name,
                                                     instance_uuids)
+
+    def update_compute_node_info(self, context, host_name, compute_node):
+        """Receives the updated ComputeNode record of a host, and passes it
+        on to the driver's HostManager.
+        """
+        self.driver.host_manager.update_compute_node_info(context, host_name,
+                                                          compute_node)
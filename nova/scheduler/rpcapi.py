@@ -105,6 +105,7 @@ class SchedulerAPI(object):
 
         * 4.5 - Modify select_destinations() to optionally return a list of
                 lists of Selection objects, along with zero or more alternates.
+        * 4.6 - Added update_compute_node_info()
     '''
 
     VERSION_ALIASES = {
@@ -183,3 +184,13 @@ class SchedulerAPI(object):
         cctxt = self.client.prepare(version='4.2', fanout=True)
         return cctxt.cast(ctxt, 'sync_instance_info', host_name=host_name,
                           instance_uuids=instance_uuids)
+
+    def update_compute_node_info(self, ctxt, host_name, compute_node):
+        version = '4.6'
+        if not self.client.can_send_version(version):
+            # NOTE: Older schedulers do not cache host states, so there is
+            # nobody to tell about the change.
+            return
+        cctxt = self.client.prepare(version=version, fanout=True)
+        return cctxt.cast(ctxt, 'update_compute_node_info',
+                          host_name=host_name, compute_node=compute_node)
@@ -0,0 +1,217 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Timing of the steps of the scheduling requests.
+
+The steps of a request are timed with step() and timed_iter(), which do
+nothing unless they are run within a request timed by timed_request(). The
+durations of a request are then added to the histograms of a TimingSummary,
+which is periodically logged by the SchedulerManager.
+"""
+
+import bisect
+import collections
+import contextlib
+import functools
+import math
+import threading
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+import nova.conf
+
+CONF = nova.conf.CONF
+LOG = logging.getLogger(__name__)
+
+# Names of the steps of a request which are not a filter or weigher
+SELECT_DESTINATIONS = 'select_destinations'
+PLACEMENT = 'get_allocation_candidates'
+HOST_STATES = 'get_all_host_states'
+CLAIM_RESOURCES = 'claim_resources'
+
+# Upper bounds, in milliseconds, of the buckets of the histograms. An extra
+# bucket holds the longer durations.
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000,
+              2500, 5000, 10000)
+
+# Timings of the request handled by the current (green)thread, if any
+_local = threading.local()
+
+
+def is_enabled():
+    """Return True if the scheduling requests have to be timed."""
+    return CONF.scheduler.timing_summary_interval >= 0
+
+
+def filter_step(filter_):
+    return 'filter.%s' % filter_.__class__.__name__
+
+
+def weigher_step(weigher):
+    return 'weigher.%s' % weigher.__class__.__name__
+
+
+class RequestTimings(object):
+    """Time spent in each step of a single scheduling request.
+
+    The time of a step does not include the time spent in the steps nested
+    in it, e.g. the HostStates loaded while the first filter iterates over
+    them.
+    """
+
+    def __init__(self):
+        # Durations in milliseconds keyed by step name
+        self.durations = collections.defaultdict(float)
+        # Time spent in the nested steps of each running step
+        self._nested = []
+
+    @contextlib.contextmanager
+    def step(self, name):
+        self._nested.append(0.0)
+        watch = timeutils.StopWatch().start()
+        try:
+            yield
+        finally:
+            elapsed = watch.elapsed() * 1000
+            self.durations[name] += elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+
+class Histogram(object):
+    """Distribution of the durations of a step, bucketed by BUCKETS_MS."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, duration_ms):
+        self.buckets[bisect.bisect_left(BUCKETS_MS, duration_ms)] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def percentile(self, percent):
+        """Return an upper bound of a percentile of the durations, which is
+        the upper bound of the bucket holding it.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(int(math.ceil(self.count * percent / 100.0)), 1)
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                break
+        if index == len(BUCKETS_MS):
+            return self.max_ms
+        return min(float(BUCKETS_MS[index]), self.max_ms)
+
+    def to_dict(self):
+        return {'count': self.count,
+                'total_ms': self.total_ms,
+                'max_ms': self.max_ms,
+                'p50_ms': self.percentile(50),
+                'p90_ms': self.percentile(90),
+                'p99_ms': self.percentile(99)}
+
+
+class TimingSummary(object):
+    """Histograms of the per-request durations of each step."""
+
+    def __init__(self):
+        self.started_at = timeutils.utcnow()
+        self.requests = 0
+        # Histograms keyed by step name
+        self.histograms = collections.defaultdict(Histogram)
+
+    def record(self, timings):
+        """Add the durations of a RequestTimings to the histograms."""
+        self.requests += 1
+        for name, duration_ms in timings.durations.items():
+            self.histograms[name].add(duration_ms)
+
+    def log(self):
+        """Log the histograms, by decreasing total time."""
+        LOG.info('Timings of the %(count)d scheduling requests since '
+                 '%(since)s:',
+                 {'count': self.requests,
+                  'since': self.started_at.isoformat()})
+        for name, histogram in sorted(self.histograms.items(),
+                                      key=lambda item: -item[1].total_ms):
+            LOG.info('%(name)s: count=%(count)d total=%(total_ms).1fms '
+                     'p50<=%(p50_ms).1fms p90<=%(p90_ms).1fms '
+                     'p99<=%(p99_ms).1fms max=%(max_ms).1fms',
+                     dict(histogram.to_dict(), name=name))
+
+
+def _get_request_timings():
+    return getattr(_local, 'timings', None)
+
+
+def timed_request(func):
+    """Decorator timing the scheduling requests handled by a method of an
+    object with a timing_summary attribute, to which the durations of each
+    request are added.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not is_enabled():
+            return func(self, *args, **kwargs)
+        timings = RequestTimings()
+        _local.timings = timings
+        try:
+            with timings.step(SELECT_DESTINATIONS):
+                return func(self, *args, **kwargs)
+        finally:
+            _local.timings = None
+            self.timing_summary.record(timings)
+            LOG.debug('Scheduling request timings: %s',
+                      ', '.join('%s=%.2fms' % item for item in
+                                sorted(timings.durations.items())))
+    return wrapper
+
+
+@contextlib.contextmanager
+def step(name):
+    """Add the time spent in this context to a step of the current request.
+    """
+    timings = _get_request_timings()
+    if timings is None:
+        yield
+    else:
+        with timings.step(name):
+            yield
+
+
+def timed_iter(name, iterable):
+    """Return an iterator over iterable, adding the time spent getting each
+    of its items to a step of the current request.
+    """
+    timings = _get_request_timings()
+    if timings is None:
+        return iterable
+    return _timed_iter(timings, name, iter(iterable))
+
+
+def _timed_iter(timings, name, iterator):
+    while True:
+        with timings.step(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
@@ -950,6 +950,20 @@ def request_is_rebuild(spec_obj):
     return check_type == ['rebuild']
 
 
+def _get_claim_user_id(ctx, spec_obj):
+    """Returns the user_id to claim resources in the placement API for."""
+    # We didn't start storing the user_id in the RequestSpec until Rocky so
+    # if it's not set on an old RequestSpec, use the user_id from the context.
+    if 'user_id' in spec_obj and spec_obj.user_id:
+        return spec_obj.user_id
+    # FIXME(mriedem): This would actually break accounting if we relied on
+    # the allocations for something like counting quota usage because in
+    # the case of migrating or evacuating an instance, the user here is
+    # likely the admin, not the owner of the instance, so the allocation
+    # would be tracked against the wrong user.
+    return ctx.user_id
+
+
 def claim_resources(ctx, client, spec_obj, instance_uuid, alloc_req,
         allocation_request_version=None):
     """Given an instance UUID (representing the consumer of resources) and the
@@ -983,18 +997,7 @@ def claim_resources(ctx, client, spec_obj, instance_uuid, alloc_req,
               "instance %s", instance_uuid)
 
     project_id = spec_obj.project_id
-
-    # We didn't start storing the user_id in the RequestSpec until Rocky so
-    # if it's not set on an old RequestSpec, use the user_id from the context.
-    if 'user_id' in spec_obj and spec_obj.user_id:
-        user_id = spec_obj.user_id
-    else:
-        # FIXME(mriedem): This would actually break accounting if we relied on
-        # the allocations for something like counting quota usage because in
-        # the case of migrating or evacuating an instance, the user here is
-        # likely the admin, not the owner of the instance, so the allocation
-        # would be tracked against the wrong user.
-        user_id = ctx.user_id
+    user_id = _get_claim_user_id(ctx, spec_obj)
 
     # NOTE(gibi): this could raise AllocationUpdateFailed which means there is
     # a serious issue with the instance_uuid as a consumer. Every caller of
@@ -1007,3 +1010,30 @@ def claim_resources(ctx, client, spec_obj, instance_uuid, alloc_req,
     return client.claim_resources(ctx, instance_uuid, alloc_req, project_id,
             user_id, allocation_request_version=allocation_request_version,
             consumer_generation=None)
+
+
+def claim_resources_in_bulk(ctx, client, spec_obj, alloc_reqs_by_instance_uuid,
+                            allocation_request_version):
+    """Given a dict of the allocation_request JSON objects returned from
+    Placement keyed by instance UUID, attempt to claim the resources of all of
+    the instances in the placement API with a single call. Returns True if the
+    resources of every instance were claimed, False if none were.
+
+    :param ctx: The RequestContext object
+    :param client: The scheduler client to use for making the claim call
+    :param spec_obj: The RequestSpec object - needed to get the project_id
+    :param alloc_reqs_by_instance_uuid: Dict, keyed by the UUID of the new
+                                        consuming instances, of the
+                                        allocation_request received from
+                                        placement for the resources we want to
+                                        claim against the host chosen for that
+                                        instance.
+    :param allocation_request_version: The microversion used to request the
+                                       allocations.
+    """
+    LOG.debug("Attempting to claim resources in the placement API for "
+              "instances %s", ', '.join(alloc_reqs_by_instance_uuid))
+
+    return client.claim_resources_in_bulk(ctx, alloc_reqs_by_instance_uuid,
+        spec_obj.project_id, _get_claim_user_id(ctx, spec_obj),
+        allocation_request_version=allocation_request_version)
@@ -17,8 +17,16 @@
 Scheduler host weights
 """
 
+from oslo_log import log as logging
+
+import nova.conf
+from nova.scheduler import host_table
+from nova.scheduler import timing
 from nova import weights
 
+CONF = nova.conf.CONF
+LOG = logging.getLogger(__name__)
+
 
 class WeighedHost(weights.WeighedObject):
     def to_dict(self):
@@ -41,6 +49,23 @@ class HostWeightHandler(weights.BaseWeightHandler):
 
     def __init__(self):
         super(HostWeightHandler, self).__init__(BaseHostWeigher)
+        if CONF.filter_scheduler.vectorize_weighers:
+            if host_table.is_supported():
+                self.table_class = host_table.HostTable
+            else:
+                LOG.warning('The vectorize_weighers option is enabled but '
+                            'the numpy library is not installed. Falling '
+                            'back to weighing each host individually.')
+
+    def _weigh_objects(self, weigher, weighed_objs, weighing_properties):
+        with timing.step(timing.weigher_step(weigher)):
+            return super(HostWeightHandler, self)._weigh_objects(
+                weigher, weighed_objs, weighing_properties)
+
+    def _weigh_vector(self, weigher, table, weighed_objs, weighing_properties):
+        with timing.step(timing.weigher_step(weigher)):
+            return super(HostWeightHandler, self)._weigh_vector(
+                weigher, table, weighed_objs, weighing_properties)
 
 
 def all_weighers():
@@ -24,9 +24,13 @@ by preferring the hosts that has less instances from the given group.
 """
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import importutils
 
+from nova.scheduler import instance_index
 from nova.scheduler import weights
 
+numpy = importutils.try_import('numpy')
+
 CONF = cfg.CONF
 
 LOG = logging.getLogger(__name__)
@@ -34,6 +38,7 @@ LOG = logging.getLogger(__name__)
 
 class _SoftAffinityWeigherBase(weights.BaseHostWeigher):
     policy_name = None
+    vectorized = True
 
     def _weigh_object(self, host_state, request_spec):
         """Higher weights win."""
@@ -51,6 +56,38 @@ class _SoftAffinityWeigherBase(weights.BaseHostWeigher):
 
         return len(member_on_host)
 
+    def _applies(self, request_spec):
+        return (request_spec.instance_group and
+                self.policy_name == request_spec.instance_group.policy)
+
+    def weigh_objects(self, weighed_obj_list, request_spec):
+        if not self._applies(request_spec):
+            return super(_SoftAffinityWeigherBase, self).weigh_objects(
+                weighed_obj_list, request_spec)
+        # Count the members of the group on all the hosts at once, with the
+        # instance index of the HostManager for the hosts it tracks
+        weights = self._get_weights(
+            [weighed_obj.obj for weighed_obj in weighed_obj_list],
+            request_spec)
+        if weights:
+            if self.minval is None or min(weights) < self.minval:
+                self.minval = min(weights)
+            if self.maxval is None or max(weights) > self.maxval:
+                self.maxval = max(weights)
+        return weights
+
+    def _get_weights(self, host_states, request_spec):
+        return instance_index.count_instances_by_host(
+            host_states, request_spec.instance_group.members)
+
+    def _weigh_table(self, host_table, request_spec):
+        if not self._applies(request_spec):
+            return numpy.zeros(len(host_table))
+
+        return numpy.array(self._get_weights(host_table.objects,
+                                             request_spec),
+                           dtype=float)
+
 
 class ServerGroupSoftAffinityWeigher(_SoftAffinityWeigherBase):
     policy_name = 'soft-affinity'
@@ -94,3 +131,8 @@ class ServerGroupSoftAntiAffinityWeigher(_SoftAffinityWeigherBase):
         weight = super(ServerGroupSoftAntiAffinityWeigher, self)._weigh_object(
             host_state, request_spec)
         return -1 * weight
+
+    def _get_weights(self, host_states, request_spec):
+        weights = super(ServerGroupSoftAntiAffinityWeigher,
+                        self)._get_weights(host_states, request_spec)
+        return [-1 * weight for weight in weights]
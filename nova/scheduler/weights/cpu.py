@@ -29,6 +29,7 @@ CONF = nova.conf.CONF
 
 class CPUWeigher(weights.BaseHostWeigher):
     minval = 0
+    vectorized = True
 
     def weight_multiplier(self):
         """Override the weight multiplier."""
@@ -39,3 +40,7 @@ class CPUWeigher(weights.BaseHostWeigher):
         vcpus_free = (host_state.vcpus_total * host_state.cpu_allocation_ratio
                       - host_state.vcpus_used)
         return vcpus_free
+
+    def _weigh_table(self, host_table, weight_properties):
+        return (host_table.vcpus_total * host_table.cpu_allocation_ratio
+                - host_table.vcpus_used)
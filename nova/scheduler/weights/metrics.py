@@ -26,16 +26,21 @@ in the configuration file as the followings:
     The final weight would be name1.value * 1.0 + name2.value * -1.0.
 """
 
+from oslo_utils import importutils
+
 import nova.conf
 from nova import exception
 from nova.scheduler import utils
 from nova.scheduler import weights
 
+numpy = importutils.try_import('numpy')
 
 CONF = nova.conf.CONF
 
 
 class MetricsWeigher(weights.BaseHostWeigher):
+    vectorized = True
+
     def __init__(self):
         self._parse_setting()
 
@@ -73,3 +78,33 @@ class MetricsWeigher(weights.BaseHostWeigher):
                         return CONF.metrics.weight_of_unavailable
 
         return value
+
+    def _weigh_table(self, host_table, weight_properties):
+        values = numpy.zeros((len(host_table), len(self.setting)))
+        missing = numpy.zeros(values.shape, dtype=bool)
+        for i, host_state in enumerate(host_table.objects):
+            metrics_dict = {m.name: m for m in host_state.metrics or []}
+            for j, (name, ratio) in enumerate(self.setting):
+                if name in metrics_dict:
+                    values[i, j] = metrics_dict[name].value
+                else:
+                    missing[i, j] = True
+
+        if CONF.metrics.required and missing.any():
+            # Report the first missing metric, as _weigh_object() does.
+            i, j = numpy.argwhere(missing)[0]
+            host_state = host_table.objects[i]
+            raise exception.ComputeHostMetricNotFound(
+                    host=host_state.host,
+                    node=host_state.nodename,
+                    name=self.setting[j][0])
+
+        weights = numpy.zeros(len(host_table))
+        unavailable = numpy.zeros(len(host_table), dtype=bool)
+        for j, (name, ratio) in enumerate(self.setting):
+            weights += values[:, j] * ratio
+            # Do nothing if ratio or weight_multiplier is 0.
+            if ratio * self.weight_multiplier() != 0:
+                unavailable |= missing[:, j]
+        weights[unavailable] = CONF.metrics.weight_of_unavailable
+        return weights
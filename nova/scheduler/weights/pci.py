@@ -21,9 +21,13 @@ versa. Configure the importance of this affinitization using the
 'pci_weight_multiplier' option.
 """
 
+from oslo_utils import importutils
+
 import nova.conf
 from nova.scheduler import weights
 
+numpy = importutils.try_import('numpy')
+
 CONF = nova.conf.CONF
 
 # An arbitrary value used to ensure PCI-requesting instances are stacked rather
@@ -36,6 +40,7 @@ MAX_DEVS = 100
 
 
 class PCIWeigher(weights.BaseHostWeigher):
+    vectorized = True
 
     def weight_multiplier(self):
         """Override the weight multiplier."""
@@ -50,8 +55,7 @@ class PCIWeigher(weights.BaseHostWeigher):
         requested, this will ensure hosts with PCI devices are avoided
         completely, if possible.
         """
-        pools = host_state.pci_stats.pools if host_state.pci_stats else []
-        free = sum(pool['count'] for pool in pools) or 0
+        free = self._get_free_devices(host_state)
 
         # reverse the "has PCI" values. For instances *without* PCI device
         # requests, this ensures we avoid the hosts with the most free PCI
@@ -63,3 +67,14 @@ class PCIWeigher(weights.BaseHostWeigher):
         weight = MAX_DEVS - min(free, MAX_DEVS - 1)
 
         return weight
+
+    def _weigh_table(self, host_table, request_spec):
+        free = numpy.array([self._get_free_devices(host_state)
+                            for host_state in host_table.objects],
+                           dtype=float)
+        return MAX_DEVS - numpy.minimum(free, MAX_DEVS - 1)
+
+    @staticmethod
+    def _get_free_devices(host_state):
+        pools = host_state.pci_stats.pools if host_state.pci_stats else []
+        return sum(pool['count'] for pool in pools) or 0
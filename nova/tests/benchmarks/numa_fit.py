@@ -0,0 +1,138 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Time numa_fit_instance_to_host() fitting instances onto hosts with many NUMA
+cells, half of which are full.
+
+Run it with ``python -m nova.tests.benchmarks.numa_fit --help``.
+"""
+
+from __future__ import print_function
+
+import sys
+import timeit
+
+from oslo_config import cfg
+from oslo_serialization import jsonutils
+
+import nova.conf
+from nova import config
+from nova import objects
+from nova.objects import fields
+from nova.virt import hardware
+
+CONF = nova.conf.CONF
+
+RESULTS_VERSION = 1
+
+CPUS_PER_CELL = 8
+MEMORY_MB_PER_CELL = 16384
+
+cli_opts = [
+    cfg.ListOpt('host-cells',
+                default=['2', '4', '8'],
+                help='Numbers of NUMA cells of the hosts.'),
+    cfg.IntOpt('repeat',
+               default=20,
+               min=1,
+               help='Number of times each instance is fitted onto each host.'),
+    cfg.StrOpt('output',
+               help='Write the JSON results to this file instead of the '
+                    'standard output.'),
+]
+
+
+def make_host_topology(num_cells):
+    """Return a host NUMA topology whose first half of the cells is full."""
+    cells = []
+    for index in range(num_cells):
+        cpuset = set(range(index * CPUS_PER_CELL, (index + 1) * CPUS_PER_CELL))
+        full = index < num_cells // 2
+        cells.append(objects.NUMACell(
+            id=index, cpuset=cpuset, memory=MEMORY_MB_PER_CELL,
+            cpu_usage=CPUS_PER_CELL if full else 0,
+            memory_usage=MEMORY_MB_PER_CELL if full else 0,
+            pinned_cpus=set(cpuset) if full else set(),
+            siblings=[set([cpu]) for cpu in sorted(cpuset)],
+            mempages=[objects.NUMAPagesTopology(
+                size_kb=4, total=MEMORY_MB_PER_CELL * 256,
+                used=MEMORY_MB_PER_CELL * 256 if full else 0)]))
+    return objects.NUMATopology(cells=cells)
+
+
+def make_instance_topology(num_cells, cpu_policy):
+    """Return an instance NUMA topology of 2 CPUs and 1GB per cell."""
+    return objects.InstanceNUMATopology(cells=[
+        objects.InstanceNUMACell(
+            id=index, cpuset=set([index * 2, index * 2 + 1]), memory=1024,
+            cpu_policy=cpu_policy)
+        for index in range(num_cells)])
+
+
+def time_fit(host_topology, instance_topology, repeat):
+    """Return the mean duration of a fit in milliseconds, and whether the
+    instance fits.
+    """
+    limits = objects.NUMATopologyLimits(cpu_allocation_ratio=1.0,
+                                        ram_allocation_ratio=1.0)
+    fitted = []
+
+    def fit():
+        fitted.append(hardware.numa_fit_instance_to_host(
+            host_topology, instance_topology.obj_clone(), limits=limits))
+
+    duration = timeit.timeit(fit, number=repeat)
+    return duration * 1000 / repeat, fitted[-1] is not None
+
+
+def run(host_cells, repeat):
+    results = []
+    for num_host_cells in host_cells:
+        host_topology = make_host_topology(num_host_cells)
+        free_cells = num_host_cells - num_host_cells // 2
+        # The instances fit onto the free cells, except for the last one
+        # asking for one cell more
+        for num_instance_cells in range(1, free_cells + 2):
+            for cpu_policy in (fields.CPUAllocationPolicy.SHARED,
+                               fields.CPUAllocationPolicy.DEDICATED):
+                instance_topology = make_instance_topology(num_instance_cells,
+                                                           cpu_policy)
+                mean_ms, fits = time_fit(host_topology, instance_topology,
+                                         repeat)
+                results.append({'host_cells': num_host_cells,
+                                'instance_cells': num_instance_cells,
+                                'cpu_policy': cpu_policy,
+                                'fits': fits,
+                                'mean_ms': mean_ms})
+    return {'version': RESULTS_VERSION, 'results': results}
+
+
+def main(argv=None):
+    """Parse options, run the benchmark and print its results."""
+    CONF.register_cli_opts(cli_opts)
+    config.parse_args(argv or sys.argv, configure_db=False)
+    objects.register_all()
+
+    results = jsonutils.dumps(
+        run([int(cells) for cells in CONF.host_cells], CONF.repeat),
+        indent=2, sort_keys=True)
+    if CONF.output:
+        with open(CONF.output, 'w') as f:
+            f.write(results + '\n')
+    else:
+        print(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
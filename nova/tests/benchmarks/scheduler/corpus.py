@@ -0,0 +1,187 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Corpus of RequestSpecs replayed by the scheduler benchmark.
+"""
+
+import collections
+import random
+import uuid
+
+from oslo_serialization import jsonutils
+
+from nova import objects
+
+FlavorShape = collections.namedtuple('FlavorShape', [
+    'name', 'vcpus', 'memory_mb', 'root_gb'])
+
+FLAVORS = (
+    FlavorShape('m1.tiny', 1, 512, 1),
+    FlavorShape('m1.small', 1, 2048, 20),
+    FlavorShape('m1.medium', 2, 4096, 40),
+    FlavorShape('m1.large', 4, 8192, 80),
+    FlavorShape('m1.xlarge', 8, 16384, 160),
+)
+
+# Share of the requests using each feature. A request can use several of
+# them, e.g. a NUMA-aware multi-create request in an availability zone.
+AVAILABILITY_ZONE_SHARE = 0.2
+MULTI_CREATE_SHARE = 0.1
+NUMA_SHARE = 0.1
+SRIOV_SHARE = 0.06
+GPU_SHARE = 0.02
+SSD_SHARE = 0.05
+SERVER_GROUP_SHARE = 0.08
+
+SERVER_GROUP_POLICIES = ('affinity', 'anti-affinity', 'soft-affinity',
+                         'soft-anti-affinity')
+
+CORPUS_VERSION = 1
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _make_flavor(rng, index, extra_specs):
+    shape = rng.choice(FLAVORS)
+    return objects.Flavor(id=index + 1, flavorid=str(index + 1),
+                          name=shape.name, vcpus=shape.vcpus,
+                          memory_mb=shape.memory_mb, root_gb=shape.root_gb,
+                          ephemeral_gb=0, swap=0, rxtx_factor=1.0,
+                          vcpu_weight=0, is_public=True, disabled=False,
+                          extra_specs=extra_specs)
+
+
+def _make_image(rng):
+    properties = {}
+    if rng.random() < 0.5:
+        properties['hw_architecture'] = 'x86_64'
+    return objects.ImageMeta.from_dict({
+        'id': _uuid(rng), 'name': 'benchmark', 'status': 'active',
+        'container_format': 'bare', 'disk_format': 'qcow2', 'min_ram': 0,
+        'min_disk': 0, 'properties': properties})
+
+
+def _make_numa_topology(flavor, numa_nodes):
+    cpus = list(range(flavor.vcpus))
+    cells = []
+    for node in range(numa_nodes):
+        cells.append(objects.InstanceNUMACell(
+            id=node, cpuset=set(cpus[node::numa_nodes]),
+            memory=flavor.memory_mb // numa_nodes))
+    return objects.InstanceNUMATopology(cells=cells)
+
+
+def _make_instance_group(rng, fleet, project_id, user_id):
+    """Return a server group whose members are instances of the fleet."""
+    policy = rng.choice(SERVER_GROUP_POLICIES)
+    members, hosts = [], []
+    if policy.endswith('anti-affinity'):
+        for host in rng.sample(fleet.hosts, rng.randint(0, 3)):
+            if fleet.instances[host]:
+                members.append(rng.choice(sorted(fleet.instances[host])))
+                hosts.append(host)
+    else:
+        host = rng.choice(fleet.hosts)
+        members = sorted(fleet.instances[host])[:2]
+        hosts = [host] if members else []
+    return objects.InstanceGroup(uuid=_uuid(rng), name='benchmark',
+                                 policy=policy, policies=[policy], rules={},
+                                 members=members,
+                                 hosts=hosts, project_id=project_id,
+                                 user_id=user_id)
+
+
+def generate(fleet, count, seed=0):
+    """Return a list of count RequestSpecs targeting the given fleet.
+
+    The mix of flavors and features is drawn from a random generator seeded
+    with seed, so that the same corpus is generated on every run.
+    """
+    rng = random.Random(seed)
+    projects = [_uuid(rng) for _i in range(50)]
+    specs = []
+    for index in range(count):
+        extra_specs = {}
+        if rng.random() < SSD_SHARE:
+            extra_specs['aggregate_instance_extra_specs:ssd'] = 'true'
+        numa_nodes = 0
+        if rng.random() < NUMA_SHARE:
+            numa_nodes = rng.choice((1, 2))
+            extra_specs['hw:numa_nodes'] = str(numa_nodes)
+        flavor = _make_flavor(rng, index, extra_specs)
+        numa_nodes = min(numa_nodes, flavor.vcpus)
+
+        pci_requests = []
+        draw = rng.random()
+        if draw < SRIOV_SHARE:
+            pci_requests.append(objects.InstancePCIRequest(
+                count=1, spec=[{'physical_network': 'physnet1'}],
+                request_id=_uuid(rng)))
+        elif draw < SRIOV_SHARE + GPU_SHARE:
+            pci_requests.append(objects.InstancePCIRequest(
+                count=1, spec=[{'vendor_id': '10de', 'product_id': '1db4'}],
+                alias_name='gpu'))
+
+        project_id = rng.choice(projects)
+        user_id = project_id
+        spec = objects.RequestSpec(
+            image=_make_image(rng),
+            flavor=flavor,
+            numa_topology=(_make_numa_topology(flavor, numa_nodes)
+                           if numa_nodes else None),
+            pci_requests=objects.InstancePCIRequests(requests=pci_requests),
+            project_id=project_id,
+            user_id=user_id,
+            availability_zone=None,
+            num_instances=1,
+            ignore_hosts=None,
+            force_hosts=None,
+            force_nodes=None,
+            requested_destination=None,
+            retry=None,
+            limits=objects.SchedulerLimits(),
+            instance_group=None,
+            scheduler_hints={},
+            instance_uuid=_uuid(rng),
+            security_groups=objects.SecurityGroupList(),
+            is_bfv=False)
+        if rng.random() < AVAILABILITY_ZONE_SHARE:
+            spec.availability_zone = rng.choice(fleet.availability_zones)
+        if rng.random() < MULTI_CREATE_SHARE:
+            spec.num_instances = rng.choice((2, 3, 5, 10))
+        if rng.random() < SERVER_GROUP_SHARE:
+            spec.instance_group = _make_instance_group(rng, fleet,
+                                                       project_id, user_id)
+        specs.append(spec)
+    return specs
+
+
+def dump(specs, path):
+    """Save a corpus to a JSON file."""
+    with open(path, 'w') as f:
+        f.write(jsonutils.dumps({
+            'version': CORPUS_VERSION,
+            'requests': [spec.obj_to_primitive() for spec in specs]}))
+
+
+def load(path):
+    """Load a corpus saved by dump()."""
+    with open(path) as f:
+        data = jsonutils.loads(f.read())
+    if data.get('version') != CORPUS_VERSION:
+        raise ValueError('Unsupported corpus version %s in %s' %
+                         (data.get('version'), path))
+    return [objects.RequestSpec.obj_from_primitive(primitive)
+            for primitive in data['requests']]
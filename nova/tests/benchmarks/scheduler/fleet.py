@@ -0,0 +1,244 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Synthetic fleet of compute nodes used by the scheduler benchmark.
+"""
+
+import collections
+import random
+import uuid
+
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+
+from nova import objects
+from nova.objects import fields
+from nova import rc_fields
+from nova.tests.benchmarks.scheduler import corpus
+
+PciPool = collections.namedtuple('PciPool', [
+    'vendor_id', 'product_id', 'dev_type', 'physical_network', 'count'])
+
+HostProfile = collections.namedtuple('HostProfile', [
+    'name', 'share', 'sockets', 'cores', 'threads', 'memory_mb', 'local_gb',
+    'ssd', 'pci_pools'])
+
+# The PCI pools are given per NUMA node.
+PROFILES = (
+    HostProfile('general', 60, 2, 12, 2, 262144, 2048, False, ()),
+    HostProfile('highmem', 15, 2, 16, 2, 786432, 2048, True, ()),
+    HostProfile('sriov', 20, 2, 12, 2, 262144, 1024, True, (
+        PciPool('8086', '154d', fields.PciDeviceType.SRIOV_VF, 'physnet1',
+                32),)),
+    HostProfile('gpu', 5, 2, 8, 2, 393216, 4096, True, (
+        PciPool('10de', '1db4', fields.PciDeviceType.STANDARD, None, 2),)),
+)
+
+CPU_ALLOCATION_RATIO = 16.0
+RAM_ALLOCATION_RATIO = 1.5
+DISK_ALLOCATION_RATIO = 1.0
+
+
+class Fleet(object):
+    """Compute nodes, services, aggregates and instances of a deployment.
+
+    The hosts are spread over the cells and availability zones, and drawn
+    from PROFILES. Each host is filled with instances of the corpus flavors
+    up to a random share of its CPUs, averaging fill.
+    """
+
+    def __init__(self, hosts=1000, cells=1, availability_zones=3, fill=0.5,
+                 seed=0):
+        self._rng = random.Random(seed)
+        now = timeutils.utcnow()
+        self.cells = [objects.CellMapping(uuid=self._uuid(),
+                                          name='cell%d' % (i + 1),
+                                          transport_url='fake:/',
+                                          database_connection='fake:/',
+                                          disabled=False)
+                      for i in range(cells)]
+        self.availability_zones = ['az%d' % (i + 1)
+                                   for i in range(availability_zones)]
+        # Lists of ComputeNodes keyed by cell UUID
+        self.compute_nodes = collections.defaultdict(list)
+        self.compute_nodes_by_uuid = {}
+        # Services and dicts of Instances keyed by host name
+        self.services = {}
+        self.instances = {}
+        self.hosts = []
+
+        az_hosts = collections.defaultdict(list)
+        profile_hosts = collections.defaultdict(list)
+        ssd_hosts = []
+        profiles = [profile for profile in PROFILES
+                    for _i in range(profile.share)]
+        for index in range(hosts):
+            host = 'compute%05d' % index
+            profile = self._rng.choice(profiles)
+            cell = self.cells[index % cells]
+            compute = self._make_compute_node(index, host, profile,
+                                              fill, now)
+            self.compute_nodes[cell.uuid].append(compute)
+            self.compute_nodes_by_uuid[compute.uuid] = compute
+            self.services[host] = objects.Service(
+                id=index + 1, host=host, binary='nova-compute',
+                topic='compute', report_count=1, disabled=False,
+                disabled_reason=None, forced_down=False,
+                created_at=now,
+                updated_at=now, last_seen_up=now)
+            self.hosts.append(host)
+            az_hosts[self.availability_zones[
+                index * availability_zones // hosts]].append(host)
+            profile_hosts[profile.name].append(host)
+            if profile.ssd:
+                ssd_hosts.append(host)
+
+        self.aggregates = []
+        for name, members in sorted(az_hosts.items()):
+            self._add_aggregate(name, members, {'availability_zone': name})
+        for name, members in sorted(profile_hosts.items()):
+            self._add_aggregate(name, members, {'profile': name})
+        self._add_aggregate('ssd', ssd_hosts, {'ssd': 'true'})
+
+    def _uuid(self):
+        return str(uuid.UUID(int=self._rng.getrandbits(128), version=4))
+
+    def _add_aggregate(self, name, hosts, metadata):
+        self.aggregates.append(objects.Aggregate(
+            id=len(self.aggregates) + 1, uuid=self._uuid(), name=name,
+            hosts=hosts, metadata=metadata))
+
+    def _fill(self, host, profile, fill):
+        """Create the instances of a host and return the resources they
+        use, as a (vcpus, memory_mb, disk_gb) tuple.
+        """
+        vcpus = profile.sockets * profile.cores * profile.threads
+        target = min(self._rng.uniform(0, 2 * fill), 0.95) * vcpus
+        used = [0, 0, 0]
+        instances = {}
+        while True:
+            shape = self._rng.choice(corpus.FLAVORS)
+            if (used[0] + shape.vcpus > target or
+                    used[1] + shape.memory_mb > profile.memory_mb or
+                    used[2] + shape.root_gb > profile.local_gb):
+                break
+            used[0] += shape.vcpus
+            used[1] += shape.memory_mb
+            used[2] += shape.root_gb
+            instance_uuid = self._uuid()
+            instances[instance_uuid] = objects.Instance(uuid=instance_uuid)
+        self.instances[host] = instances
+        return tuple(used)
+
+    def _make_numa_topology(self, profile, vcpus_used, memory_mb_used):
+        cpus_per_socket = profile.cores * profile.threads
+        threads_offset = profile.sockets * profile.cores
+        memory_mb = profile.memory_mb // profile.sockets
+        cells = []
+        for socket in range(profile.sockets):
+            cores = range(socket * profile.cores, (socket + 1) * profile.cores)
+            siblings = [set(core + thread * threads_offset
+                            for thread in range(profile.threads))
+                        for core in cores]
+            cells.append(objects.NUMACell(
+                id=socket, cpuset=set().union(*siblings), memory=memory_mb,
+                cpu_usage=min(vcpus_used // profile.sockets,
+                              cpus_per_socket),
+                memory_usage=memory_mb_used // profile.sockets,
+                pinned_cpus=set(), siblings=siblings,
+                mempages=[objects.NUMAPagesTopology(
+                    size_kb=4, total=memory_mb * 256, used=0)],
+                network_metadata=objects.NetworkMetadata(
+                    physnets=set(), tunneled=False)))
+        return objects.NUMATopology(cells=cells)._to_json()
+
+    def _make_compute_node(self, index, host, profile, fill, now):
+        vcpus = profile.sockets * profile.cores * profile.threads
+        vcpus_used, memory_mb_used, local_gb_used = self._fill(host, profile,
+                                                               fill)
+        num_instances = len(self.instances[host])
+        pools = [objects.PciDevicePool(
+                    vendor_id=pool.vendor_id, product_id=pool.product_id,
+                    numa_node=socket, count=pool.count,
+                    tags={'dev_type': pool.dev_type,
+                          'physical_network': pool.physical_network})
+                 for pool in profile.pci_pools
+                 for socket in range(profile.sockets)]
+        return objects.ComputeNode(
+            id=index + 1, uuid=self._uuid(), host=host,
+            hypervisor_hostname=host,
+            host_ip='10.%d.%d.%d' % (index >> 16, (index >> 8) & 255,
+                                     index & 255),
+            hypervisor_type='QEMU', hypervisor_version=2011000,
+            cpu_info=jsonutils.dumps({'arch': 'x86_64', 'vendor': 'Intel',
+                                      'topology': {
+                                          'sockets': profile.sockets,
+                                          'cores': profile.cores,
+                                          'threads': profile.threads}}),
+            vcpus=vcpus, vcpus_used=vcpus_used,
+            memory_mb=profile.memory_mb, memory_mb_used=memory_mb_used,
+            free_ram_mb=profile.memory_mb - memory_mb_used,
+            local_gb=profile.local_gb, local_gb_used=local_gb_used,
+            free_disk_gb=profile.local_gb - local_gb_used,
+            disk_available_least=profile.local_gb - local_gb_used,
+            running_vms=num_instances, current_workload=0,
+            numa_topology=self._make_numa_topology(profile, vcpus_used,
+                                                   memory_mb_used),
+            pci_device_pools=objects.PciDevicePoolList(objects=pools),
+            supported_hv_specs=[objects.HVSpec(
+                arch=fields.Architecture.X86_64,
+                hv_type=fields.HVType.QEMU, vm_mode=fields.VMMode.HVM)],
+            stats={'num_instances': str(num_instances),
+                   'io_workload': str(self._rng.randint(0, 3))},
+            metrics=None,
+            cpu_allocation_ratio=CPU_ALLOCATION_RATIO,
+            ram_allocation_ratio=RAM_ALLOCATION_RATIO,
+            disk_allocation_ratio=DISK_ALLOCATION_RATIO,
+            created_at=now, updated_at=now)
+
+    def heartbeat(self):
+        """Mark all the compute services as up."""
+        now = timeutils.utcnow()
+        for service in self.services.values():
+            service.last_seen_up = now
+            service.updated_at = now
+
+    def _update_usage(self, compute, resources, sign):
+        vcpus = sign * resources.get(rc_fields.ResourceClass.VCPU, 0)
+        memory_mb = sign * resources.get(rc_fields.ResourceClass.MEMORY_MB, 0)
+        disk_gb = sign * resources.get(rc_fields.ResourceClass.DISK_GB, 0)
+        compute.vcpus_used += vcpus
+        compute.memory_mb_used += memory_mb
+        compute.free_ram_mb -= memory_mb
+        compute.local_gb_used += disk_gb
+        compute.free_disk_gb -= disk_gb
+        compute.disk_available_least -= disk_gb
+        compute.running_vms += sign
+        compute.stats = dict(compute.stats,
+                             num_instances=str(compute.running_vms))
+        compute.updated_at = timeutils.utcnow()
+
+    def consume(self, compute_uuid, resources, instance_uuid):
+        """Account for an instance claiming resources from a compute node,
+        the way the resource tracker of the compute service would.
+        """
+        compute = self.compute_nodes_by_uuid[compute_uuid]
+        self._update_usage(compute, resources, 1)
+        self.instances[compute.host][instance_uuid] = objects.Instance(
+            uuid=instance_uuid)
+
+    def release(self, compute_uuid, resources, instance_uuid):
+        """Undo consume()."""
+        compute = self.compute_nodes_by_uuid[compute_uuid]
+        self._update_usage(compute, resources, -1)
+        self.instances[compute.host].pop(instance_uuid, None)
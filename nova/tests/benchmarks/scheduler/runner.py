@@ -0,0 +1,416 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Replay a corpus of RequestSpecs through the FilterScheduler against a
+synthetic fleet, and report how long scheduling took.
+"""
+
+from __future__ import print_function
+
+import collections
+import functools
+import random
+import sys
+import timeit
+import uuid
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+
+import nova.conf
+from nova import config
+from nova import context as context_module
+from nova import exception
+from nova import objects
+from nova import rc_fields as fields
+from nova import rpc
+from nova.scheduler.client import report
+from nova.scheduler import filter_scheduler
+from nova.scheduler import host_manager
+from nova.scheduler import utils
+from nova import servicegroup
+from nova.tests.benchmarks.scheduler import corpus
+from nova.tests.benchmarks.scheduler import fleet as fleet_module
+
+CONF = nova.conf.CONF
+LOG = logging.getLogger(__name__)
+
+RESULTS_VERSION = 1
+
+# The services of the fleet are marked as up at least this often, in seconds,
+# so that they are not reported down by the ComputeFilter during long runs.
+HEARTBEAT_INTERVAL = 10
+
+# The filters enabled by default in the benchmark, which add the NUMA, PCI
+# and aggregate filters to the default filters of the scheduler so that
+# these parts of the fleet are actually exercised.
+BENCHMARK_FILTERS = [
+    'RetryFilter',
+    'AvailabilityZoneFilter',
+    'ComputeFilter',
+    'ComputeCapabilitiesFilter',
+    'ImagePropertiesFilter',
+    'ServerGroupAntiAffinityFilter',
+    'ServerGroupAffinityFilter',
+    'AggregateInstanceExtraSpecsFilter',
+    'NUMATopologyFilter',
+    'PciPassthroughFilter',
+]
+
+cli_opts = [
+    cfg.IntOpt('num-hosts',
+               default=1000,
+               min=1,
+               help='Number of compute nodes of the synthetic fleet.'),
+    cfg.IntOpt('num-cells',
+               default=1,
+               min=1,
+               help='Number of cells the compute nodes are spread over.'),
+    cfg.IntOpt('availability-zones',
+               default=3,
+               min=1,
+               help='Number of availability zones of the fleet.'),
+    cfg.FloatOpt('fill',
+                 default=0.5,
+                 min=0,
+                 max=1,
+                 help='Average share of the CPUs of the compute nodes used '
+                      'by existing instances.'),
+    cfg.IntOpt('num-requests',
+               default=100,
+               min=1,
+               help='Number of RequestSpecs to generate.'),
+    cfg.IntOpt('seed',
+               default=0,
+               help='Seed of the fleet, corpus and scheduler randomness.'),
+    cfg.StrOpt('corpus',
+               help='Replay the RequestSpecs saved in this file instead of '
+                    'generating them.'),
+    cfg.StrOpt('save-corpus',
+               help='Save the replayed RequestSpecs to this file.'),
+    cfg.StrOpt('output',
+               help='Write the JSON results to this file instead of the '
+                    'standard output.'),
+]
+
+
+class FleetHostManager(host_manager.HostManager):
+    """HostManager reading the cells, compute nodes, services, aggregates
+    and instances of a synthetic fleet instead of the databases.
+    """
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+        super(FleetHostManager, self).__init__()
+
+    def refresh_cells_caches(self):
+        self.cells = list(self.fleet.cells)
+        self.enabled_cells = [c for c in self.cells if not c.disabled]
+
+    def _init_aggregates(self):
+        for agg in self.fleet.aggregates:
+            self.aggs_by_id[agg.id] = agg
+            self.aggregate_index.update(agg)
+            for host in agg.hosts:
+                self.host_aggregates_map[host].add(agg.id)
+
+    def _init_instance_info(self, computes_by_cell=None):
+        # The fleet updates the dicts of instances as they are placed, the
+        # way the compute services would send updates to the scheduler.
+        for host, instances in list(self.fleet.instances.items()):
+            instances = self.instance_index.track(host, instances)
+            self.fleet.instances[host] = instances
+            self._instance_info[host] = {'instances': instances,
+                                         'updated': True}
+
+    def _get_instances_by_host(self, context, host_name):
+        return self.fleet.instances.get(host_name, {})
+
+    def _get_computes_for_cells(self, context, cells, compute_uuids=None):
+        compute_nodes = collections.defaultdict(list)
+        for cell in cells:
+            computes = self.fleet.compute_nodes.get(cell.uuid, [])
+            if compute_uuids is not None:
+                wanted = set(compute_uuids)
+                computes = [cn for cn in computes if cn.uuid in wanted]
+            compute_nodes[cell.uuid].extend(computes)
+        return compute_nodes, self.fleet.services
+
+
+class FakePlacement(object):
+    """In-memory placement service and report client of the fleet.
+
+    Allocation candidates are the compute nodes with enough VCPU, MEMORY_MB
+    and DISK_GB inventory left, and claims are applied to the usage of the
+    compute nodes of the fleet.
+    """
+
+    def __init__(self, fleet, seed=0):
+        self.fleet = fleet
+        self.claims = 0
+        self._rng = random.Random(seed)
+        # Dict of (compute node UUID, resources) tuples keyed by consumer
+        self._allocations = {}
+
+    @staticmethod
+    def _get_capacity(compute):
+        rc = fields.ResourceClass
+        return {
+            rc.VCPU: (compute.vcpus * compute.cpu_allocation_ratio,
+                      compute.vcpus_used),
+            rc.MEMORY_MB: (compute.memory_mb * compute.ram_allocation_ratio,
+                           compute.memory_mb_used),
+            rc.DISK_GB: (compute.local_gb * compute.disk_allocation_ratio,
+                         compute.local_gb_used),
+        }
+
+    def _fits(self, compute, resources):
+        capacity = self._get_capacity(compute)
+        return all(rc in capacity and
+                   capacity[rc][1] + amount <= capacity[rc][0]
+                   for rc, amount in resources.items())
+
+    def get_allocation_candidates(self, context, resources):
+        resources = resources.merged_resources()
+        candidates = [compute for compute in
+                      self.fleet.compute_nodes_by_uuid.values()
+                      if self._fits(compute, resources)]
+        limit = CONF.scheduler.max_placement_results
+        if len(candidates) > limit:
+            candidates = self._rng.sample(candidates, limit)
+        alloc_reqs = [{'allocations': {compute.uuid: {
+                          'resources': dict(resources)}}}
+                      for compute in candidates]
+        provider_summaries = {
+            compute.uuid: {
+                'resources': {rc: {'capacity': int(total), 'used': used}
+                              for rc, (total, used) in
+                              self._get_capacity(compute).items()},
+                'traits': []}
+            for compute in candidates}
+        return alloc_reqs, provider_summaries, report.NESTED_AC_VERSION
+
+    def claim_resources(self, context, consumer_uuid, alloc_request,
+                        project_id, user_id, allocation_request_version,
+                        consumer_generation=None):
+        self.claims += 1
+        [(compute_uuid, allocation)] = alloc_request['allocations'].items()
+        compute = self.fleet.compute_nodes_by_uuid[compute_uuid]
+        if not self._fits(compute, allocation['resources']):
+            return False
+        self.fleet.consume(compute_uuid, allocation['resources'],
+                           consumer_uuid)
+        self._allocations[consumer_uuid] = (compute_uuid,
+                                            allocation['resources'])
+        return True
+
+    def delete_allocation_for_instance(self, context, uuid):
+        if uuid in self._allocations:
+            compute_uuid, resources = self._allocations.pop(uuid)
+            self.fleet.release(compute_uuid, resources, uuid)
+        return True
+
+
+class BenchmarkScheduler(filter_scheduler.FilterScheduler):
+    """FilterScheduler using the HostManager and placement of a fleet."""
+
+    def __init__(self, fleet, placement):
+        # NOTE: The parent constructors are not called since they would set
+        # up a HostManager and report client talking to the real services.
+        self.host_manager = FleetHostManager(fleet)
+        self.servicegroup_api = servicegroup.API()
+        self.notifier = rpc.get_notifier('scheduler')
+        self.placement_client = placement
+
+
+class Timer(object):
+    """Accumulate the time spent in the calls to some functions."""
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.seconds = collections.Counter()
+
+    def wrap(self, name, func, materialize=False):
+        """Return a wrapper of func timing its calls under name.
+
+        If materialize is True, the iterator returned by func is turned into
+        a list, so that the time spent iterating over it is accounted for.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = timeit.default_timer()
+            try:
+                result = func(*args, **kwargs)
+                if materialize and result is not None:
+                    result = list(result)
+                return result
+            finally:
+                self.calls[name] += 1
+                self.seconds[name] += timeit.default_timer() - start
+        return wrapper
+
+    def report(self, names):
+        return {name: {'calls': self.calls[name],
+                       'total_ms': self.seconds[name] * 1000,
+                       'mean_ms': (self.seconds[name] * 1000 /
+                                   self.calls[name]
+                                   if self.calls[name] else 0)}
+                for name in names}
+
+
+def _instrument(timer, objs, methods, materialize=False):
+    """Time the given methods of objs, and return the names of objs."""
+    names = []
+    for obj in objs:
+        name = obj.__class__.__name__
+        for method in methods:
+            setattr(obj, method, timer.wrap(name, getattr(obj, method),
+                                            materialize=materialize))
+        names.append(name)
+    return names
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of a list of values."""
+    if not values:
+        return 0
+    values = sorted(values)
+    rank = max(int(-(-len(values) * percent // 100)), 1)
+    return values[rank - 1]
+
+
+def summarize(values, scale=1):
+    """Return the distribution of a list of values, multiplied by scale."""
+    return {
+        'mean': sum(values) * scale / len(values) if values else 0,
+        'p50': percentile(values, 50) * scale,
+        'p90': percentile(values, 90) * scale,
+        'p99': percentile(values, 99) * scale,
+        'max': max(values) * scale if values else 0,
+    }
+
+
+def run(fleet, specs, seed=0):
+    """Replay specs against fleet and return the results as a dict.
+
+    Only the time spent by the FilterScheduler in select_destinations() is
+    measured, and not the one spent getting the allocation candidates from
+    the fake placement service.
+    """
+    # The scheduler uses the random module to pick among the best hosts.
+    random.seed(seed)
+    rng = random.Random(seed)
+    placement = FakePlacement(fleet, seed=seed)
+    scheduler = BenchmarkScheduler(fleet, placement)
+    timer = Timer()
+    # The filters return generators, which are consumed by the filter
+    # handler anyway.
+    filter_names = _instrument(timer, scheduler.host_manager.enabled_filters,
+                               ('filter_all', 'filter_table'),
+                               materialize=True)
+    _instrument(timer, scheduler.host_manager.enabled_filters,
+                ('filter_aggregate_index',))
+    weigher_names = _instrument(timer, scheduler.host_manager.weighers,
+                                ('weigh_objects', 'weigh_table'))
+    context = context_module.get_admin_context()
+
+    latencies, candidates, claims = [], [], []
+    instances = failures = 0
+    last_heartbeat = None
+    start = timeit.default_timer()
+    for spec in specs:
+        now = timeit.default_timer()
+        if last_heartbeat is None or now - last_heartbeat > HEARTBEAT_INTERVAL:
+            fleet.heartbeat()
+            last_heartbeat = now
+        spec = spec.obj_clone()
+        instance_uuids = [str(uuid.UUID(int=rng.getrandbits(128), version=4))
+                          for _i in range(spec.num_instances)]
+        spec.instance_uuid = instance_uuids[0]
+
+        alloc_reqs, provider_summaries, version = (
+            placement.get_allocation_candidates(
+                context, utils.resources_from_request_spec(spec)))
+        alloc_reqs_by_rp_uuid = collections.defaultdict(list)
+        for ar in alloc_reqs:
+            for rp_uuid in ar['allocations']:
+                alloc_reqs_by_rp_uuid[rp_uuid].append(ar)
+        candidates.append(len(alloc_reqs))
+        claims_before = placement.claims
+
+        request_start = timeit.default_timer()
+        try:
+            if not alloc_reqs:
+                raise exception.NoValidHost(reason="")
+            scheduler.select_destinations(
+                context, spec, instance_uuids, alloc_reqs_by_rp_uuid,
+                provider_summaries, version, return_alternates=True)
+            instances += spec.num_instances
+        except exception.NoValidHost:
+            failures += 1
+        latencies.append(timeit.default_timer() - request_start)
+        claims.append(placement.claims - claims_before)
+
+    return {
+        'version': RESULTS_VERSION,
+        'config': {
+            'filter_scheduler': {name: CONF.filter_scheduler[name]
+                                 for name in sorted(CONF.filter_scheduler)},
+            'hosts': len(fleet.hosts),
+            'cells': len(fleet.cells),
+            'requests': len(specs),
+            'seed': seed,
+        },
+        'summary': {
+            'failed_requests': failures,
+            'instances': instances,
+            'wall_time_s': timeit.default_timer() - start,
+        },
+        'latency_ms': summarize(latencies, scale=1000),
+        'allocation_candidates_per_request': summarize(candidates),
+        'claims_per_request': summarize(claims),
+        'filters': timer.report(filter_names),
+        'weighers': timer.report(weigher_names),
+    }
+
+
+def main(argv=None):
+    """Parse options, run the benchmark and print its results."""
+    CONF.register_cli_opts(cli_opts)
+    CONF.set_default('enabled_filters', BENCHMARK_FILTERS,
+                     group='filter_scheduler')
+    config.parse_args(argv or sys.argv, configure_db=False)
+    logging.setup(CONF, 'nova')
+    objects.register_all()
+
+    LOG.info('Generating a fleet of %d compute nodes', CONF.num_hosts)
+    fleet = fleet_module.Fleet(hosts=CONF.num_hosts, cells=CONF.num_cells,
+                               availability_zones=CONF.availability_zones,
+                               fill=CONF.fill, seed=CONF.seed)
+    if CONF.corpus:
+        specs = corpus.load(CONF.corpus)
+    else:
+        specs = corpus.generate(fleet, CONF.num_requests, seed=CONF.seed)
+    if CONF.save_corpus:
+        corpus.dump(specs, CONF.save_corpus)
+
+    LOG.info('Replaying %d requests', len(specs))
+    results = jsonutils.dumps(run(fleet, specs, seed=CONF.seed), indent=2,
+                              sort_keys=True)
+    if CONF.output:
+        with open(CONF.output, 'w') as f:
+            f.write(results + '\n')
+    else:
+        print(results)
+    return 0
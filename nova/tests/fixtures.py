@@ -40,6 +40,7 @@ from requests import adapters
 from wsgi_intercept import interceptor
 
 from nova.api.openstack.compute import tenant_networks
+from nova.api.openstack.placement import db_api as placement_db
 from nova.api.openstack import wsgi_app
 from nova.api import wsgi
 from nova.compute import multi_cell_list
@@ -60,7 +61,7 @@ from nova.tests.functional.api import client
 _TRUE_VALUES = ('True', 'true', '1', 'yes')
 
 CONF = cfg.CONF
-DB_SCHEMA = {'main': "", 'api': ""}
+DB_SCHEMA = {'main': "", 'api': "", 'placement': ""}
 SESSION_CONFIGURED = False
 
 
@@ -629,7 +630,7 @@ class Database(fixtures.Fixture):
     def __init__(self, database='main', connection=None):
         """Create a database fixture.
 
-        :param database: The type of database, 'main', or 'api'
+        :param database: The type of database, 'main', 'api' or 'placement'
         :param connection: The connection string to use
         """
         super(Database, self).__init__()
@@ -638,6 +639,7 @@ class Database(fixtures.Fixture):
         global SESSION_CONFIGURED
         if not SESSION_CONFIGURED:
             session.configure(CONF)
+            placement_db.configure(CONF)
             SESSION_CONFIGURED = True
         self.database = database
         if database == 'main':
@@ -649,6 +651,8 @@ class Database(fixtures.Fixture):
                 self.get_engine = session.get_engine
         elif database == 'api':
             self.get_engine = session.get_api_engine
+        elif database == 'placement':
+            self.get_engine = placement_db.get_placement_engine
 
     def _cache_schema(self):
         global DB_SCHEMA
@@ -726,6 +726,22 @@ class NovaAPIMigrationsWalk(test_migrations.WalkVersionsMixin):
         self.assertColumnExists(engine, 'instance_mappings',
             'queued_for_delete')
 
+    def _check_062(self, engine, data):
+        for column in ['created_at', 'updated_at', 'id',
+                       'resource_provider_id']:
+            self.assertColumnExists(engine, 'resource_provider_changes',
+                                    column)
+        self.assertIndexExists(engine, 'resource_provider_changes',
+                               'resource_provider_changes_created_at_idx')
+
+    def _check_063(self, engine, data):
+        for column in ['created_at', 'updated_at', 'id',
+                       'resource_provider_id', 'resource_class_id', 'used']:
+            self.assertColumnExists(engine, 'resource_provider_usages',
+                                    column)
+        self.assertUniqueConstraintExists(engine, 'resource_provider_usages',
+                ['resource_provider_id', 'resource_class_id'])
+
 
 class TestNovaAPIMigrationsWalkSQLite(NovaAPIMigrationsWalk,
                                       test_fixtures.OpportunisticDBTestMixin,
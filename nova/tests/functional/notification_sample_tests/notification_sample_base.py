@@ -93,7 +93,7 @@ class NotificationSampleTestBase(test.TestCase,
         self.addCleanup(context_patcher.stop)
 
         self.start_service('conductor')
-        self.start_service('scheduler')
+        self.scheduler = self.start_service('scheduler')
         self.start_service('network', manager=CONF.network_manager)
         self.compute = self.start_service('compute')
         # Reset the service create notifications
@@ -0,0 +1,51 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova import context
+from nova.tests import fixtures
+from nova.tests.functional.notification_sample_tests \
+    import notification_sample_base
+from nova.tests.unit import fake_notifier
+
+
+class TestSchedulerTimingNotificationSample(
+        notification_sample_base.NotificationSampleTestBase):
+
+    def setUp(self):
+        self.flags(use_neutron=True)
+        self.flags(timing_summary_interval=0, timing_notifications=True,
+                   group='scheduler')
+        super(TestSchedulerTimingNotificationSample, self).setUp()
+        self.neutron = fixtures.NeutronFixture(self)
+        self.useFixture(self.neutron)
+
+    def test_scheduler_timing_update(self):
+        self._boot_a_server(
+            extra_params={'networks': [{'port': self.neutron.port_1['id']}]})
+        fake_notifier.reset()
+
+        self.scheduler.manager._report_timing_summary(
+            context.get_admin_context())
+
+        self.assertEqual(1, len(fake_notifier.VERSIONED_NOTIFICATIONS))
+        notification = fake_notifier.VERSIONED_NOTIFICATIONS[0]
+        # The durations vary from run to run, so only check the steps
+        # timed.
+        steps = [step['nova_object.data']['name'] for step in
+                 notification['payload']['nova_object.data']['steps']]
+        self.assertIn('select_destinations', steps)
+        self.assertIn('get_allocation_candidates', steps)
+        self.assertIn('filter.ComputeFilter', steps)
+        self._verify_notification(
+            'scheduler_timing-update',
+            replacements={'steps': self.ANY},
+            actual=notification)
@@ -0,0 +1,91 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Base test case for the placement tests using an in-memory sqlite
+database.
+"""
+
+from oslo_utils import uuidutils
+
+from nova.api.openstack.placement import context
+from nova.api.openstack.placement import deploy
+from nova.api.openstack.placement.objects import consumer as consumer_obj
+from nova.api.openstack.placement.objects import project as project_obj
+from nova.api.openstack.placement.objects import resource_provider as rp_obj
+from nova.api.openstack.placement.objects import user as user_obj
+from nova import test
+from nova.tests import fixtures as nova_fixtures
+
+
+class PlacementDbTestCase(test.NoDBTestCase):
+    USES_DB_SELF = True
+
+    def setUp(self):
+        super(PlacementDbTestCase, self).setUp()
+        self.useFixture(nova_fixtures.Database(database='placement'))
+        # The caches of the resource classes and traits hold the identifiers
+        # of the database of the previous test.
+        self._reset_caches()
+        self.addCleanup(self._reset_caches)
+        deploy.update_database()
+        self.ctx = context.RequestContext('fake-user', 'fake-project')
+        self.project = project_obj.Project(self.ctx, external_id='project')
+        self.project.create()
+        self.user = user_obj.User(self.ctx, external_id='user')
+        self.user.create()
+
+    @staticmethod
+    def _reset_caches():
+        rp_obj._TRAITS_SYNCED = False
+        rp_obj._RC_CACHE = None
+        rp_obj._TRAIT_CACHE = None
+
+    def _create_provider(self, name, parent=None, **inventory):
+        """Creates a resource provider with an inventory of the supplied
+        totals, keyed by resource class.
+        """
+        rp = rp_obj.ResourceProvider(
+            self.ctx, name=name, uuid=uuidutils.generate_uuid(),
+            parent_provider_uuid=parent.uuid if parent else None)
+        rp.create()
+        if inventory:
+            inv_list = rp_obj.InventoryList(self.ctx, objects=[])
+            for rc, total in inventory.items():
+                inv = rp_obj.Inventory(self.ctx, resource_provider=rp,
+                                       resource_class=rc, total=total,
+                                       max_unit=total)
+                inv.obj_set_defaults()
+                inv_list.objects.append(inv)
+            rp.set_inventory(inv_list)
+        return rp
+
+    def _create_consumer(self, consumer_uuid=None):
+        consumer = consumer_obj.Consumer(
+            self.ctx, uuid=consumer_uuid or uuidutils.generate_uuid(),
+            project=self.project, user=self.user)
+        consumer.create()
+        return consumer
+
+    def _allocate(self, consumer, allocations):
+        """Replaces the allocations of a consumer.
+
+        :param allocations: A dict, keyed by resource provider, of dicts of
+                            the amounts allocated by resource class. An amount
+                            of 0 removes the allocation.
+        """
+        alloc_list = rp_obj.AllocationList(self.ctx, objects=[
+            rp_obj.Allocation(self.ctx, resource_provider=rp,
+                              resource_class=rc, consumer=consumer, used=used)
+            for rp, resources in allocations.items()
+            for rc, used in resources.items()])
+        alloc_list.replace_all()
+        return alloc_list
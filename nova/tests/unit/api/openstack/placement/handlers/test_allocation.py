@@ -0,0 +1,249 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for the allocation handlers of the placement API."""
+
+import microversion_parse
+import mock
+from oslo_serialization import jsonutils
+from oslo_utils.fixture import uuidsentinel as uuids
+import sqlalchemy as sa
+import webob
+
+from nova.api.openstack.placement import db_api
+from nova.api.openstack.placement.handlers import allocation
+from nova.api.openstack.placement import microversion
+from nova.api.openstack.placement.objects import resource_provider as rp_obj
+import nova.conf
+from nova import test
+from nova.tests.unit.api.openstack.placement import base
+
+CONF = nova.conf.CONF
+
+
+def _get(ctx, handler, path, version, **routing_args):
+    """Calls a GET handler with the supplied path and microversion, as the
+    placement application would.
+    """
+    req = webob.Request.blank(
+        path, headers={'OpenStack-API-Version': 'placement %s' % version})
+    req.environ['placement.context'] = ctx
+    req.environ['wsgiorg.routing_args'] = ((), routing_args)
+    req.environ[microversion.MICROVERSION_ENVIRON] = (
+        microversion_parse.extract_version(
+            req.headers, microversion.SERVICE_TYPE, microversion.VERSIONS))
+    return req.get_response(handler)
+
+
+class TestNormalizeRpUuidsQsParam(test.NoDBTestCase):
+
+    def test_single(self):
+        self.assertEqual(
+            set([uuids.rp1]),
+            allocation._normalize_rp_uuids_qs_param(uuids.rp1))
+
+    def test_in(self):
+        self.assertEqual(
+            set([uuids.rp1, uuids.rp2]),
+            allocation._normalize_rp_uuids_qs_param(
+                'in:%s,%s,%s' % (uuids.rp1, uuids.rp2, uuids.rp1)))
+
+    def test_comma_without_in(self):
+        ex = self.assertRaises(
+            webob.exc.HTTPBadRequest,
+            allocation._normalize_rp_uuids_qs_param,
+            '%s,%s' % (uuids.rp1, uuids.rp2))
+        self.assertIn("must be prefixed with the 'in:' keyword", str(ex))
+
+    def test_bad_uuid(self):
+        for value in ('foo', 'in:%s,foo' % uuids.rp1, 'in:'):
+            ex = self.assertRaises(
+                webob.exc.HTTPBadRequest,
+                allocation._normalize_rp_uuids_qs_param, value)
+            self.assertIn('valid UUID(s)', str(ex))
+
+
+class TestListAllocations(base.PlacementDbTestCase):
+
+    def setUp(self):
+        super(TestListAllocations, self).setUp()
+        patcher = mock.patch.object(self.ctx, 'can')
+        self.mock_can = patcher.start()
+        self.addCleanup(patcher.stop)
+        # A compute node with a child provider, another compute node and a
+        # sharing provider of disk.
+        self.cn1 = self._create_provider('cn1', VCPU=8, MEMORY_MB=1024)
+        self.pf1 = self._create_provider('pf1', parent=self.cn1, VGPU=4)
+        self.cn2 = self._create_provider('cn2', VCPU=8)
+        self.ss = self._create_provider('ss', DISK_GB=100)
+        self.c1 = self._create_consumer()
+        self._allocate(self.c1, {self.cn1: {'VCPU': 1},
+                                 self.ss: {'DISK_GB': 5}})
+        self.c2 = self._create_consumer()
+        self._allocate(self.c2, {self.pf1: {'VGPU': 1}})
+        self.c3 = self._create_consumer()
+        self._allocate(self.c3, {self.cn2: {'VCPU': 2},
+                                 self.ss: {'DISK_GB': 1}})
+
+    def _get(self, query, version='1.31'):
+        return _get(self.ctx, allocation.list_allocations,
+                    '/allocations?%s' % query, version)
+
+    def _allocations(self, query):
+        resp = self._get(query)
+        self.assertEqual(200, resp.status_int, resp.text)
+        return jsonutils.loads(resp.body)['allocations']
+
+    def test_in_tree(self):
+        allocs = self._allocations('in_tree=%s' % self.pf1.uuid)
+        self.assertEqual(set([self.c1.uuid, self.c2.uuid]), set(allocs))
+        # The allocations against the sharing provider outside of the tree
+        # are returned as well.
+        self.assertEqual(
+            {self.cn1.uuid: {'generation': self.cn1.generation,
+                             'resources': {'VCPU': 1}},
+             self.ss.uuid: {'generation': self.ss.generation,
+                            'resources': {'DISK_GB': 5}}},
+            allocs[self.c1.uuid]['allocations'])
+        self.assertEqual('project', allocs[self.c1.uuid]['project_id'])
+        self.assertEqual('user', allocs[self.c1.uuid]['user_id'])
+        self.assertEqual(self.c1.generation,
+                         allocs[self.c1.uuid]['consumer_generation'])
+        self.assertEqual(
+            {self.pf1.uuid: {'generation': self.pf1.generation,
+                             'resources': {'VGPU': 1}}},
+            allocs[self.c2.uuid]['allocations'])
+        self.mock_can.assert_called_once_with('placement:allocations:list')
+
+    def test_resource_provider_uuid(self):
+        allocs = self._allocations('resource_provider_uuid=%s' % self.ss.uuid)
+        self.assertEqual(set([self.c1.uuid, self.c3.uuid]), set(allocs))
+        self.assertEqual(set([self.cn2.uuid, self.ss.uuid]),
+                         set(allocs[self.c3.uuid]['allocations']))
+
+    def test_resource_provider_uuid_in(self):
+        allocs = self._allocations('resource_provider_uuid=in:%s,%s' % (
+            self.pf1.uuid, self.cn2.uuid))
+        self.assertEqual(set([self.c2.uuid, self.c3.uuid]), set(allocs))
+
+    def test_unknown_providers(self):
+        self.assertEqual({}, self._allocations('in_tree=%s' % uuids.unknown))
+        self.assertEqual(
+            {}, self._allocations('resource_provider_uuid=%s' % uuids.unknown))
+        # Unknown providers are ignored.
+        allocs = self._allocations('resource_provider_uuid=in:%s,%s' % (
+            uuids.unknown, self.pf1.uuid))
+        self.assertEqual(set([self.c2.uuid]), set(allocs))
+
+    def test_comma_without_in(self):
+        resp = self._get('resource_provider_uuid=%s,%s' % (self.cn1.uuid,
+                                                           self.cn2.uuid))
+        self.assertEqual(400, resp.status_int)
+        self.assertIn("prefixed with the 'in:' keyword", resp.text)
+
+    def test_bad_uuid(self):
+        for query in ('resource_provider_uuid=foo',
+                      'resource_provider_uuid=in:%s,foo' % self.cn1.uuid,
+                      'in_tree=foo'):
+            resp = self._get(query)
+            self.assertEqual(400, resp.status_int, query)
+
+    def test_neither_or_both_parameters(self):
+        for query in ('', 'in_tree=%s&resource_provider_uuid=%s' % (
+                self.cn1.uuid, self.cn1.uuid)):
+            resp = self._get(query)
+            self.assertEqual(400, resp.status_int, query)
+            self.assertIn('Invalid query string parameters', resp.text)
+
+    def test_unknown_parameter(self):
+        resp = self._get('in_tree=%s&foo=bar' % self.cn1.uuid)
+        self.assertEqual(400, resp.status_int)
+
+    def test_old_microversion(self):
+        resp = self._get('in_tree=%s' % self.cn1.uuid, version='1.30')
+        self.assertEqual(404, resp.status_int)
+
+
+@db_api.placement_context_manager.writer
+def _insert_allocation(ctx, rp_id, consumer_uuid, rc_id, used):
+    """Inserts an allocation without consumer record, as made before the
+    consumers table existed.
+    """
+    ctx.session.execute(rp_obj._ALLOC_TBL.insert().values(
+        resource_provider_id=rp_id, consumer_id=consumer_uuid,
+        resource_class_id=rc_id, used=used))
+
+
+@db_api.placement_context_manager.reader
+def _count_consumers(ctx):
+    return ctx.session.execute(
+        sa.select([sa.func.count()]).select_from(
+            rp_obj._CONSUMER_TBL)).scalar()
+
+
+class TestIncompleteConsumer(base.PlacementDbTestCase):
+    """The GET allocation handlers do not create the records of the
+    consumers of allocations made before the consumers table existed.
+    """
+
+    def setUp(self):
+        super(TestIncompleteConsumer, self).setUp()
+        patcher = mock.patch.object(self.ctx, 'can')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rp = self._create_provider('cn1', VCPU=8)
+        self._allocate(self._create_consumer(), {self.rp: {'VCPU': 1}})
+        _insert_allocation(self.ctx, self.rp.id, uuids.incomplete,
+                           rp_obj._RC_CACHE.id_from_string('VCPU'), 2)
+        self.assertEqual(1, _count_consumers(self.ctx))
+
+    def _get(self, handler, path, **routing_args):
+        resp = _get(self.ctx, handler, path, '1.31', **routing_args)
+        self.assertEqual(200, resp.status_int, resp.text)
+        # The consumer record is not created.
+        self.assertEqual(1, _count_consumers(self.ctx))
+        return jsonutils.loads(resp.body)
+
+    def _assert_incomplete(self, allocs):
+        self.assertEqual(CONF.placement.incomplete_consumer_project_id,
+                         allocs['project_id'])
+        self.assertEqual(CONF.placement.incomplete_consumer_user_id,
+                         allocs['user_id'])
+        self.assertIsNone(allocs['consumer_generation'])
+
+    def test_list_for_consumer(self):
+        allocs = self._get(allocation.list_for_consumer,
+                           '/allocations/%s' % uuids.incomplete,
+                           consumer_uuid=uuids.incomplete)
+        self.assertEqual({self.rp.uuid: {'generation': self.rp.generation,
+                                         'resources': {'VCPU': 2}}},
+                         allocs['allocations'])
+        self._assert_incomplete(allocs)
+
+    def test_list_for_resource_provider(self):
+        allocs = self._get(allocation.list_for_resource_provider,
+                           '/resource_providers/%s/allocations' % self.rp.uuid,
+                           uuid=self.rp.uuid)['allocations']
+        self.assertEqual(2, len(allocs))
+        self.assertEqual({'resources': {'VCPU': 2},
+                          'consumer_generation': None},
+                         allocs[uuids.incomplete])
+
+    def test_list_allocations(self):
+        allocs = self._get(allocation.list_allocations,
+                           '/allocations?in_tree=%s' % self.rp.uuid)
+        self.assertEqual(2, len(allocs['allocations']))
+        allocs = allocs['allocations'][uuids.incomplete]
+        self.assertEqual({self.rp.uuid: {'generation': self.rp.generation,
+                                         'resources': {'VCPU': 2}}},
+                         allocs['allocations'])
+        self._assert_incomplete(allocs)
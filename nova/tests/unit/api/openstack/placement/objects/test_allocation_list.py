@@ -0,0 +1,106 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for reading the allocation lists from a sqlite database."""
+
+from oslo_utils.fixture import uuidsentinel as uuids
+
+from nova.api.openstack.placement.objects import resource_provider as rp_obj
+from nova.tests.unit.api.openstack.placement import base
+
+
+class TestGetAllByConsumersOfProviders(base.PlacementDbTestCase):
+
+    def setUp(self):
+        super(TestGetAllByConsumersOfProviders, self).setUp()
+        # A compute node with a child provider, another compute node and a
+        # sharing provider of disk.
+        self.cn1 = self._create_provider('cn1', VCPU=8, MEMORY_MB=1024)
+        self.pf1 = self._create_provider('pf1', parent=self.cn1, VGPU=4)
+        self.cn2 = self._create_provider('cn2', VCPU=8)
+        self.ss = self._create_provider('ss', DISK_GB=100)
+        self.c1 = self._create_consumer()
+        self._allocate(self.c1, {self.cn1: {'VCPU': 1, 'MEMORY_MB': 256},
+                                 self.ss: {'DISK_GB': 5}})
+        self.c2 = self._create_consumer()
+        self._allocate(self.c2, {self.pf1: {'VGPU': 1}})
+        self.c3 = self._create_consumer()
+        self._allocate(self.c3, {self.cn2: {'VCPU': 2},
+                                 self.ss: {'DISK_GB': 1}})
+
+    def _get(self, **kwargs):
+        allocs = rp_obj.AllocationList.get_all_by_consumers_of_providers(
+            self.ctx, **kwargs)
+        return set((a.consumer.uuid, a.resource_provider.uuid,
+                    a.resource_class, a.used) for a in allocs)
+
+    def test_in_tree(self):
+        expected = set([
+            (self.c1.uuid, self.cn1.uuid, 'VCPU', 1),
+            (self.c1.uuid, self.cn1.uuid, 'MEMORY_MB', 256),
+            (self.c1.uuid, self.ss.uuid, 'DISK_GB', 5),
+            (self.c2.uuid, self.pf1.uuid, 'VGPU', 1),
+        ])
+        # Any provider of the tree identifies it.
+        self.assertEqual(expected, self._get(in_tree=self.cn1.uuid))
+        self.assertEqual(expected, self._get(in_tree=self.pf1.uuid))
+
+    def test_rp_uuids(self):
+        # The allocations of the consumers of the sharing provider against
+        # the compute nodes are returned as well.
+        self.assertEqual(
+            set([(self.c1.uuid, self.cn1.uuid, 'VCPU', 1),
+                 (self.c1.uuid, self.cn1.uuid, 'MEMORY_MB', 256),
+                 (self.c1.uuid, self.ss.uuid, 'DISK_GB', 5),
+                 (self.c3.uuid, self.cn2.uuid, 'VCPU', 2),
+                 (self.c3.uuid, self.ss.uuid, 'DISK_GB', 1)]),
+            self._get(rp_uuids=[self.ss.uuid]))
+        self.assertEqual(
+            set([(self.c2.uuid, self.pf1.uuid, 'VGPU', 1),
+                 (self.c3.uuid, self.cn2.uuid, 'VCPU', 2),
+                 (self.c3.uuid, self.ss.uuid, 'DISK_GB', 1)]),
+            self._get(rp_uuids=[self.pf1.uuid, self.cn2.uuid]))
+
+    def test_unknown_providers(self):
+        self.assertEqual(set(), self._get(in_tree=uuids.unknown))
+        self.assertEqual(set(), self._get(rp_uuids=[uuids.unknown]))
+        self.assertEqual(set(), self._get(rp_uuids=[]))
+        self.assertEqual(
+            set([(self.c2.uuid, self.pf1.uuid, 'VGPU', 1)]),
+            self._get(rp_uuids=[uuids.unknown, self.pf1.uuid]))
+
+    def test_no_allocations(self):
+        cn3 = self._create_provider('cn3', VCPU=8)
+        self.assertEqual(set(), self._get(in_tree=cn3.uuid))
+
+    def test_shared_objects(self):
+        allocs = rp_obj.AllocationList.get_all_by_consumers_of_providers(
+            self.ctx, rp_uuids=[self.ss.uuid])
+        consumers = {}
+        rps = {}
+        for alloc in allocs:
+            consumers.setdefault(alloc.consumer.uuid, set()).add(
+                id(alloc.consumer))
+            rps.setdefault(alloc.resource_provider.uuid, set()).add(
+                id(alloc.resource_provider))
+        # The allocations of a consumer, or against a provider, share the
+        # same object.
+        self.assertEqual([1, 1], [len(ids) for ids in consumers.values()])
+        self.assertEqual([1, 1, 1], [len(ids) for ids in rps.values()])
+        alloc = [a for a in allocs if a.consumer.uuid == self.c1.uuid and
+                 a.resource_provider.uuid == self.ss.uuid][0]
+        self.assertEqual(self.c1.generation, alloc.consumer.generation)
+        self.assertEqual('project', alloc.consumer.project.external_id)
+        self.assertEqual('user', alloc.consumer.user.external_id)
+        self.assertEqual(self.ss.generation,
+                         alloc.resource_provider.generation)
+        self.assertIsNotNone(alloc.created_at)
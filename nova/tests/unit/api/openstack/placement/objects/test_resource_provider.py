@@ -0,0 +1,71 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for the resource provider objects which need no database."""
+
+import collections
+import random
+
+import fixtures
+import mock
+
+from nova.api.openstack.placement.objects import resource_provider
+from nova import test
+
+
+class TestSample(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestSample, self).setUp()
+        # Make the samples reproducible.
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.api.openstack.placement.objects.resource_provider.random',
+            random.Random(42)))
+
+    def test_fewer_elements_than_limit(self):
+        sample = resource_provider._sample(iter(range(5)), 10)
+        self.assertEqual(list(range(5)), sorted(sample))
+
+    def test_limit(self):
+        sample = resource_provider._sample(iter(range(100)), 10)
+        self.assertEqual(10, len(sample))
+        self.assertEqual(10, len(set(sample)))
+        self.assertTrue(set(sample).issubset(range(100)))
+
+    def test_zero_limit(self):
+        self.assertEqual([], resource_provider._sample(iter(range(5)), 0))
+
+    def test_empty(self):
+        self.assertEqual([], resource_provider._sample(iter(()), 5))
+
+    def test_iterates_once(self):
+        iterable = mock.MagicMock()
+        iterable.__iter__.return_value = iter(range(20))
+        sample = resource_provider._sample(iterable, 5)
+        self.assertEqual(5, len(sample))
+        iterable.__iter__.assert_called_once_with()
+
+    def test_uniform(self):
+        # Each of the 10 elements ends up in about 3 out of 10 samples of 3
+        # elements, wherever it is in the iterable.
+        counts = collections.Counter()
+        for _ in range(3000):
+            counts.update(resource_provider._sample(iter(range(10)), 3))
+        self.assertEqual(set(range(10)), set(counts))
+        for element, count in counts.items():
+            self.assertTrue(800 < count < 1000, (element, count))
+
+    def test_random_order(self):
+        # The elements kept from the start of the iterable are shuffled.
+        firsts = set(resource_provider._sample(iter(range(5)), 5)[0]
+                     for _ in range(50))
+        self.assertGreater(len(firsts), 1)
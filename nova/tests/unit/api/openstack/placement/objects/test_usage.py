@@ -0,0 +1,186 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for the resource_provider_usages table, on a sqlite
+database.
+"""
+
+import sqlalchemy as sa
+
+from nova.api.openstack.placement import db_api
+from nova.api.openstack.placement.objects import resource_provider as rp_obj
+from nova.tests.unit.api.openstack.placement import base
+
+
+@db_api.placement_context_manager.reader
+def _recorded_usages(ctx):
+    """Returns a dict, keyed by (resource provider UUID, resource class), of
+    the non-zero usages in the resource_provider_usages table.
+    """
+    usage = rp_obj._USAGE_TBL
+    rp = rp_obj._RP_TBL
+    sel = sa.select([rp.c.uuid, usage.c.resource_class_id, usage.c.used])
+    sel = sel.select_from(sa.join(
+        usage, rp, usage.c.resource_provider_id == rp.c.id))
+    return {(r[0], rp_obj._RC_CACHE.string_from_id(r[1])): r[2]
+            for r in ctx.session.execute(sel) if r[2]}
+
+
+@db_api.placement_context_manager.writer
+def _execute(ctx, stmt):
+    ctx.session.execute(stmt)
+
+
+class TestUsageTable(base.PlacementDbTestCase):
+
+    def setUp(self):
+        super(TestUsageTable, self).setUp()
+        self.flags(usage_table='maintain', group='placement')
+        self.cn1 = self._create_provider('cn1', VCPU=8, MEMORY_MB=1024)
+        self.cn2 = self._create_provider('cn2', VCPU=8, MEMORY_MB=1024)
+        self.ss = self._create_provider('ss', DISK_GB=100)
+
+    def _rc_id(self, rc):
+        return rp_obj._RC_CACHE.id_from_string(rc)
+
+    def _assert_usages(self, expected):
+        self.assertEqual(expected, _recorded_usages(self.ctx))
+        self.assertEqual([], rp_obj.verify_usages(self.ctx))
+
+    def test_allocate(self):
+        self._allocate(self._create_consumer(),
+                       {self.cn1: {'VCPU': 2, 'MEMORY_MB': 256},
+                        self.ss: {'DISK_GB': 10}})
+        self._allocate(self._create_consumer(), {self.cn1: {'VCPU': 1}})
+        self._assert_usages({(self.cn1.uuid, 'VCPU'): 3,
+                             (self.cn1.uuid, 'MEMORY_MB'): 256,
+                             (self.ss.uuid, 'DISK_GB'): 10})
+
+    def test_replace(self):
+        consumer = self._create_consumer()
+        self._allocate(consumer, {self.cn1: {'VCPU': 2, 'MEMORY_MB': 256},
+                                  self.ss: {'DISK_GB': 10}})
+        self._allocate(consumer, {self.cn1: {'VCPU': 4},
+                                  self.ss: {'DISK_GB': 20}})
+        self._assert_usages({(self.cn1.uuid, 'VCPU'): 4,
+                             (self.ss.uuid, 'DISK_GB'): 20})
+        # An amount of 0 removes the allocation.
+        self._allocate(consumer, {self.cn1: {'VCPU': 4},
+                                  self.ss: {'DISK_GB': 0}})
+        self._assert_usages({(self.cn1.uuid, 'VCPU'): 4})
+
+    def test_delete(self):
+        consumer = self._create_consumer()
+        self._allocate(consumer, {self.cn1: {'VCPU': 2, 'MEMORY_MB': 256}})
+        other = self._create_consumer()
+        self._allocate(other, {self.cn1: {'VCPU': 1}})
+        allocs = rp_obj.AllocationList.get_all_by_consumer_id(
+            self.ctx, consumer.uuid)
+        allocs.delete_all()
+        self._assert_usages({(self.cn1.uuid, 'VCPU'): 1})
+
+    def test_move(self):
+        instance = self._create_consumer()
+        self._allocate(instance, {self.cn1: {'VCPU': 2, 'MEMORY_MB': 256},
+                                  self.ss: {'DISK_GB': 10}})
+        # The allocations of the instance on the source node are moved to the
+        # migration, and the instance allocates on the destination node, in
+        # a single transaction.
+        migration = self._create_consumer()
+        rp_obj.AllocationList(self.ctx, objects=[
+            rp_obj.Allocation(self.ctx, resource_provider=rp,
+                              resource_class=rc, consumer=consumer, used=used)
+            for consumer, rp, rc, used in (
+                (migration, self.cn1, 'VCPU', 2),
+                (migration, self.cn1, 'MEMORY_MB', 256),
+                (instance, self.cn2, 'VCPU', 2),
+                (instance, self.cn2, 'MEMORY_MB', 256),
+                (instance, self.ss, 'DISK_GB', 10))]).replace_all()
+        self._assert_usages({(self.cn1.uuid, 'VCPU'): 2,
+                             (self.cn1.uuid, 'MEMORY_MB'): 256,
+                             (self.cn2.uuid, 'VCPU'): 2,
+                             (self.cn2.uuid, 'MEMORY_MB'): 256,
+                             (self.ss.uuid, 'DISK_GB'): 10})
+        # Confirming the migration deletes the allocations of the migration.
+        rp_obj.AllocationList.get_all_by_consumer_id(
+            self.ctx, migration.uuid).delete_all()
+        self._assert_usages({(self.cn2.uuid, 'VCPU'): 2,
+                             (self.cn2.uuid, 'MEMORY_MB'): 256,
+                             (self.ss.uuid, 'DISK_GB'): 10})
+
+    def test_sync_usages_repairs_drift(self):
+        self._allocate(self._create_consumer(),
+                       {self.cn1: {'VCPU': 2, 'MEMORY_MB': 256},
+                        self.ss: {'DISK_GB': 10}})
+        usage = rp_obj._USAGE_TBL
+        # A wrong usage, a missing usage and a usage without allocations.
+        _execute(self.ctx, usage.update().where(sa.and_(
+            usage.c.resource_provider_id == self.cn1.id,
+            usage.c.resource_class_id == self._rc_id('VCPU'))).values(used=5))
+        _execute(self.ctx, usage.delete().where(
+            usage.c.resource_provider_id == self.ss.id))
+        _execute(self.ctx, usage.insert().values(
+            resource_provider_id=self.cn2.id,
+            resource_class_id=self._rc_id('VCPU'), used=1))
+
+        drift = rp_obj.verify_usages(self.ctx)
+        self.assertEqual(
+            sorted([{'resource_provider_uuid': self.cn1.uuid,
+                     'resource_class': 'VCPU',
+                     'allocated': 2, 'recorded': 5},
+                    {'resource_provider_uuid': self.cn2.uuid,
+                     'resource_class': 'VCPU',
+                     'allocated': 0, 'recorded': 1},
+                    {'resource_provider_uuid': self.ss.uuid,
+                     'resource_class': 'DISK_GB',
+                     'allocated': 10, 'recorded': 0}],
+                   key=lambda d: (d['resource_provider_uuid'],
+                                  d['resource_class'])),
+            sorted(drift, key=lambda d: (d['resource_provider_uuid'],
+                                         d['resource_class'])))
+
+        self.assertEqual(3, rp_obj.sync_usages(self.ctx))
+        self._assert_usages({(self.cn1.uuid, 'VCPU'): 2,
+                             (self.cn1.uuid, 'MEMORY_MB'): 256,
+                             (self.ss.uuid, 'DISK_GB'): 10})
+
+    def test_free_missing_usage(self):
+        consumer = self._create_consumer()
+        self._allocate(consumer, {self.cn1: {'VCPU': 2}})
+        _execute(self.ctx, rp_obj._USAGE_TBL.delete())
+        rp_obj.AllocationList.get_all_by_consumer_id(
+            self.ctx, consumer.uuid).delete_all()
+        # No negative usage is recorded.
+        self._assert_usages({})
+        self.assertIn('is missing from the resource_provider_usages table',
+                      self.stdlog.logger.output)
+
+    def test_not_maintained(self):
+        self.flags(usage_table='none', group='placement')
+        self._allocate(self._create_consumer(), {self.cn1: {'VCPU': 2}})
+        self.assertEqual({}, _recorded_usages(self.ctx))
+        self.assertEqual(
+            [{'resource_provider_uuid': self.cn1.uuid,
+              'resource_class': 'VCPU', 'allocated': 2, 'recorded': 0}],
+            rp_obj.verify_usages(self.ctx))
+        # The table is rebuilt before it is maintained again.
+        self.assertEqual(1, rp_obj.sync_usages(self.ctx))
+        self._assert_usages({(self.cn1.uuid, 'VCPU'): 2})
+
+    def test_used(self):
+        self.flags(usage_table='use', group='placement')
+        self._allocate(self._create_consumer(), {self.cn1: {'VCPU': 2}})
+        usages = rp_obj.UsageList.get_all_by_resource_provider_uuid(
+            self.ctx, self.cn1.uuid)
+        self.assertEqual({'VCPU': 2, 'MEMORY_MB': 0},
+                         {u.resource_class: u.usage for u in usages})
+        self._assert_usages({(self.cn1.uuid, 'VCPU'): 2})
@@ -0,0 +1,89 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for the dispatch of the placement API requests."""
+
+import contextlib
+
+import mock
+
+from nova.api.openstack.placement import handler
+from nova import test
+
+
+class TestDispatch(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestDispatch, self).setUp()
+        patcher = mock.patch.object(handler.db_api,
+                                    'placement_context_manager')
+        self.mock_cm = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_cm.reader.using.side_effect = self._using('reader')
+        self.mock_cm.async_.using.side_effect = self._using('async_')
+        self.mapper = mock.Mock()
+        self.mapper.match.side_effect = lambda environ: {
+            'action': self._handler, 'uuid': mock.sentinel.uuid}
+        self.transaction = None
+        # The transactions the handler ran in.
+        self.in_transaction = []
+
+    def _using(self, name):
+        @contextlib.contextmanager
+        def using(context):
+            self.transaction = name
+            yield
+            self.transaction = None
+        return using
+
+    def _handler(self, environ, start_response):
+        self.in_transaction.append(self.transaction)
+        return mock.sentinel.response
+
+    def _dispatch(self, method, context=mock.sentinel.context):
+        environ = {'REQUEST_METHOD': method}
+        if context is not None:
+            environ['placement.context'] = context
+        self.assertEqual(
+            mock.sentinel.response,
+            handler.dispatch(environ, mock.sentinel.start_response,
+                             self.mapper))
+        self.assertEqual(((), {'uuid': mock.sentinel.uuid}),
+                         environ['wsgiorg.routing_args'])
+
+    def test_read(self):
+        for method in ('GET', 'HEAD'):
+            self._dispatch(method)
+        self.assertEqual(['reader', 'reader'], self.in_transaction)
+        self.mock_cm.reader.using.assert_called_with(mock.sentinel.context)
+        self.mock_cm.async_.using.assert_not_called()
+
+    def test_read_replica(self):
+        self.flags(use_replica_for_reads=True, group='placement')
+        for method in ('GET', 'HEAD'):
+            self._dispatch(method)
+        self.assertEqual(['async_', 'async_'], self.in_transaction)
+        self.mock_cm.async_.using.assert_called_with(mock.sentinel.context)
+        self.mock_cm.reader.using.assert_not_called()
+
+    def test_write(self):
+        self.flags(use_replica_for_reads=True, group='placement')
+        for method in ('PUT', 'POST', 'DELETE'):
+            self._dispatch(method)
+        self.assertEqual([None, None, None], self.in_transaction)
+        self.mock_cm.reader.using.assert_not_called()
+        self.mock_cm.async_.using.assert_not_called()
+
+    def test_no_context(self):
+        self._dispatch('GET', context=None)
+        self.assertEqual([None], self.in_transaction)
+        self.mock_cm.reader.using.assert_not_called()
@@ -0,0 +1,282 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for the in-memory graph of the resource providers."""
+
+import mock
+import os_traits
+from oslo_utils import fixture as utils_fixture
+import six
+
+from nova.api.openstack.placement import provider_graph
+from nova import test
+
+VCPU = 0
+DISK_GB = 2
+SHARES = six.text_type(os_traits.MISC_SHARES_VIA_AGGREGATE)
+AVX2 = six.text_type(os_traits.HW_CPU_X86_AVX2)
+
+
+def _inv(total, reserved=0, min_unit=1, max_unit=None, step_size=1,
+         allocation_ratio=1.0):
+    return (total, reserved, min_unit, max_unit or total, step_size,
+            allocation_ratio)
+
+
+def _rows(providers=(), inventories=(), usages=(), traits=(),
+          aggregates=()):
+    return {'providers': list(providers), 'inventories': list(inventories),
+            'usages': list(usages), 'traits': list(traits),
+            'aggregates': list(aggregates)}
+
+
+# Two compute node trees and a sharing storage provider:
+#
+#   cn1 (1)  <- numa1 (2)       cn2 (3)       ss (4)
+#
+# cn1 and ss are in the aggregate agg1, cn2 and ss in agg2.
+_ROWS = _rows(
+    providers=[
+        (1, 'cn1', None, 1, 0),
+        (2, 'numa1', 1, 1, 0),
+        (3, 'cn2', None, 3, 0),
+        (4, 'ss', None, 4, 0),
+    ],
+    inventories=[
+        (2,) + (VCPU,) + _inv(8, reserved=2),
+        (3,) + (VCPU,) + _inv(4, max_unit=2),
+        (4,) + (DISK_GB,) + _inv(100, step_size=10),
+    ],
+    usages=[(2, VCPU, 4)],
+    traits=[(2, 10, AVX2), (4, 11, SHARES)],
+    aggregates=[(1, 20, 'agg1'), (4, 20, 'agg1'), (3, 21, 'agg2'),
+                (4, 21, 'agg2')],
+)
+
+
+class ProviderGraphTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ProviderGraphTestCase, self).setUp()
+        self.graph = self._load(_ROWS)
+
+    @staticmethod
+    def _load(rows):
+        with mock.patch.object(provider_graph, '_get_rows',
+                               return_value=rows):
+            return provider_graph.ProviderGraph.load(mock.sentinel.ctx)
+
+    def test_load(self):
+        self.assertEqual(set([1, 2, 3, 4]), set(self.graph.providers))
+        self.assertEqual(1, self.graph.providers[2].root_id)
+        self.assertEqual(4, self.graph.usages[2][VCPU])
+        self.assertEqual({10: AVX2}, self.graph.traits[2])
+        self.assertEqual(set([20, 21]), self.graph.aggregates[4])
+        self.assertTrue(self.graph.has_provider_trees())
+
+    def test_load_root_provider_id_fallback(self):
+        graph = self._load(_rows(providers=[(1, 'cn1', None, None, 0)]))
+        self.assertEqual(1, graph.providers[1].root_id)
+        self.assertFalse(graph.has_provider_trees())
+
+    def test_providers_with_resource(self):
+        # numa1 has 8 - 2 reserved - 4 used VCPUs left, cn2 a max_unit of 2.
+        self.assertEqual(set([(2, 1), (3, 3)]),
+                         set(self.graph.providers_with_resource(VCPU, 2)))
+        self.assertEqual([], self.graph.providers_with_resource(VCPU, 3))
+        # The amount must be a multiple of the step size.
+        self.assertEqual([], self.graph.providers_with_resource(DISK_GB, 15))
+        self.assertEqual([(4, 4)],
+                         self.graph.providers_with_resource(DISK_GB, 20))
+
+    def test_providers_with_shared_capacity(self):
+        self.assertEqual(
+            [4], self.graph.providers_with_shared_capacity(DISK_GB, 20))
+        self.assertEqual(
+            [4], self.graph.providers_with_shared_capacity(
+                DISK_GB, 20, member_of=[['agg2']]))
+        self.assertEqual(
+            [], self.graph.providers_with_shared_capacity(
+                DISK_GB, 20, member_of=[['unknown']]))
+        # cn2 has VCPU inventory but does not share it.
+        self.assertEqual(
+            [], self.graph.providers_with_shared_capacity(VCPU, 1))
+
+    def test_provider_ids_having_traits(self):
+        traits = {AVX2: 10, SHARES: 11}
+        self.assertEqual(set([2, 4]),
+                         self.graph.provider_ids_having_any_trait(traits))
+        self.assertEqual(set(),
+                         self.graph.provider_ids_having_all_traits(traits))
+        self.assertEqual(set([2]), self.graph.provider_ids_having_all_traits(
+            {AVX2: 10}))
+        self.assertEqual(set(),
+                         self.graph.provider_ids_having_all_traits({}))
+
+    def test_provider_ids_matching_aggregates(self):
+        self.assertEqual(
+            set([1, 4]),
+            self.graph.provider_ids_matching_aggregates([['agg1']]))
+        # The aggregates of an item are OR'd, the items are AND'd.
+        self.assertEqual(
+            set([1, 3, 4]),
+            self.graph.provider_ids_matching_aggregates([['agg1', 'agg2']]))
+        self.assertEqual(
+            set([4]),
+            self.graph.provider_ids_matching_aggregates([['agg1'],
+                                                         ['agg2']]))
+        self.assertEqual(
+            set([4]),
+            self.graph.provider_ids_matching_aggregates([['agg1']],
+                                                        rp_ids=[2, 3, 4]))
+
+    def test_provider_ids_matching_aggregates_unknown(self):
+        for rp_ids in (None, [1, 4]):
+            self.assertEqual(
+                set(),
+                self.graph.provider_ids_matching_aggregates(
+                    [['agg1'], ['unknown']], rp_ids=rp_ids))
+
+    def test_provider_ids_matching_aggregates_empty_member_of(self):
+        self.assertEqual(set([1, 2, 3, 4]),
+                         self.graph.provider_ids_matching_aggregates([]))
+        self.assertEqual(
+            set([1, 3]),
+            self.graph.provider_ids_matching_aggregates([], rp_ids=[1, 3]))
+
+    def test_anchors_for_sharing_providers(self):
+        self.assertEqual(
+            set([('ss', 'cn1'), ('ss', 'cn2'), ('ss', 'ss')]),
+            self.graph.anchors_for_sharing_providers([4, 5]))
+        self.assertEqual(
+            set([(4, 1), (4, 3), (4, 4)]),
+            self.graph.anchors_for_sharing_providers([4], get_id=True))
+
+    def test_trees_with_traits(self):
+        # The trait of numa1 satisfies its whole tree.
+        self.assertEqual(
+            set([(1, 1), (2, 1)]),
+            set(self.graph.trees_with_traits([1, 2, 3], {AVX2: 10}, {})))
+        # A provider with a forbidden trait is not a candidate.
+        self.assertEqual(
+            [], self.graph.trees_with_traits([2], {}, {AVX2: 10}))
+
+    def test_usages_by_provider_tree(self):
+        usages = self.graph.usages_by_provider_tree([1])
+        self.assertEqual(2, len(usages))
+        by_rp = {u['resource_provider_id']: u for u in usages}
+        self.assertIsNone(by_rp[1]['resource_class_id'])
+        self.assertEqual({'resource_provider_id': 2,
+                          'resource_provider_uuid': 'numa1',
+                          'resource_class_id': VCPU, 'total': 8,
+                          'reserved': 2, 'allocation_ratio': 1.0,
+                          'max_unit': 8, 'used': 4}, by_rp[2])
+
+    def test_traits_by_provider_tree(self):
+        self.assertEqual({1: [], 2: [AVX2]},
+                         dict(self.graph.traits_by_provider_tree([1])))
+
+    def test_provider_ids(self):
+        self.assertEqual(
+            {2: {'id': 2, 'uuid': 'numa1', 'parent_id': 1,
+                 'parent_uuid': 'cn1', 'root_id': 1, 'root_uuid': 'cn1'}},
+            self.graph.provider_ids([2, 5]))
+
+    def test_updated(self):
+        rows = _rows(
+            providers=[(3, 'cn2', None, 3, 1)],
+            inventories=[(3,) + (VCPU,) + _inv(16)],
+            aggregates=[(3, 20, 'agg1')])
+        with mock.patch.object(provider_graph, '_get_rows',
+                               return_value=rows) as mock_rows:
+            graph = self.graph.updated(mock.sentinel.ctx, [3])
+        mock_rows.assert_called_once_with(mock.sentinel.ctx, rp_ids=[3])
+
+        self.assertEqual(1, graph.providers[3].generation)
+        self.assertEqual(set([1, 3, 4]),
+                         graph.provider_ids_matching_aggregates([['agg1']]))
+        self.assertEqual(set([4]),
+                         graph.provider_ids_matching_aggregates([['agg2']]))
+        self.assertIn((3, 3), graph.providers_with_resource(VCPU, 16))
+        # The original graph is left untouched.
+        self.assertEqual(0, self.graph.providers[3].generation)
+        self.assertEqual(
+            set([1, 4]),
+            self.graph.provider_ids_matching_aggregates([['agg1']]))
+        self.assertEqual([], self.graph.providers_with_resource(VCPU, 16))
+
+    def test_updated_deleted_provider(self):
+        with mock.patch.object(provider_graph, '_get_rows',
+                               return_value=_rows()):
+            graph = self.graph.updated(mock.sentinel.ctx, [2])
+        self.assertNotIn(2, graph.providers)
+        self.assertEqual([], graph.usages_by_provider_tree([2]))
+        self.assertEqual(set(), graph.provider_ids_having_any_trait(
+            {AVX2: 10}))
+        self.assertIn(2, self.graph.providers)
+
+
+@mock.patch.object(provider_graph, '_delete_changes')
+@mock.patch.object(provider_graph, '_get_changes')
+@mock.patch.object(provider_graph, '_get_rows')
+class ProviderGraphCacheTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ProviderGraphCacheTestCase, self).setUp()
+        self.flags(provider_graph_poll_interval=10, group='placement')
+        self.time_fixture = self.useFixture(utils_fixture.TimeFixture())
+        self.cache = provider_graph.ProviderGraphCache()
+
+    def test_get_loads_once(self, mock_rows, mock_changes, mock_delete):
+        mock_rows.return_value = _ROWS
+        mock_changes.return_value = [(1, 1)]
+
+        graph = self.cache.get(mock.sentinel.ctx)
+        self.assertEqual(set([1, 2, 3, 4]), set(graph.providers))
+        mock_rows.assert_called_once_with(mock.sentinel.ctx)
+        mock_delete.assert_called_once_with(mock.sentinel.ctx, mock.ANY)
+
+        # Within the poll interval, the graph is returned as is.
+        self.time_fixture.advance_time_seconds(5)
+        self.assertIs(graph, self.cache.get(mock.sentinel.ctx))
+        mock_rows.assert_called_once_with(mock.sentinel.ctx)
+        mock_changes.assert_called_once_with(mock.sentinel.ctx, mock.ANY)
+
+    def test_get_applies_changes(self, mock_rows, mock_changes, mock_delete):
+        mock_rows.return_value = _ROWS
+        # The change 1 was committed before the graph was loaded.
+        mock_changes.return_value = [(1, 1)]
+        graph = self.cache.get(mock.sentinel.ctx)
+
+        self.time_fixture.advance_time_seconds(10)
+        mock_rows.return_value = _rows(providers=[(3, 'cn2', None, 3, 1)])
+        mock_changes.return_value = [(1, 1), (2, 3)]
+        new_graph = self.cache.get(mock.sentinel.ctx)
+
+        # Only the provider of the change not applied yet is reloaded.
+        self.assertIsNot(graph, new_graph)
+        mock_rows.assert_called_with(mock.sentinel.ctx, rp_ids=[3])
+        self.assertEqual(1, new_graph.providers[3].generation)
+        self.assertEqual(0, graph.providers[3].generation)
+
+        # The changes already applied are not reloaded again.
+        self.time_fixture.advance_time_seconds(10)
+        self.assertIs(new_graph, self.cache.get(mock.sentinel.ctx))
+        self.assertEqual(2, mock_rows.call_count)
+
+    def test_clear(self, mock_rows, mock_changes, mock_delete):
+        mock_rows.return_value = _ROWS
+        mock_changes.return_value = []
+        self.cache.get(mock.sentinel.ctx)
+        self.cache.clear()
+        self.cache.get(mock.sentinel.ctx)
+        self.assertEqual(2, mock_rows.call_count)
@@ -0,0 +1,145 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for the SQL timing middleware."""
+
+import mock
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+
+from nova.api.openstack.placement import sqltiming
+import nova.conf
+from nova import test
+
+CONF = nova.conf.CONF
+
+
+def _listener():
+    """Stands for the SQLAlchemy event listener calling _caller_label()."""
+    return sqltiming._caller_label()
+
+
+def _sqlalchemy():
+    """Stands for the SQLAlchemy frames running the statement."""
+    return _listener()
+
+
+def _define(module, name, callee):
+    """Returns a function named name of the given module, calling callee."""
+    namespace = {'__name__': module, 'callee': callee}
+    exec('def %s():\n    return callee()\n' % name, namespace)
+    return namespace[name]
+
+
+class TestCallerLabel(test.NoDBTestCase):
+
+    def test_placement_function(self):
+        func = _define(
+            'nova.api.openstack.placement.objects.resource_provider',
+            '_get_provider_ids', _sqlalchemy)
+        self.assertEqual('resource_provider._get_provider_ids', func())
+
+    def test_innermost_placement_function(self):
+        inner = _define('nova.api.openstack.placement.objects.consumer',
+                        '_get_consumer_by_uuid', _sqlalchemy)
+        outer = _define('nova.api.openstack.placement.handlers.allocation',
+                        'list_for_consumer', inner)
+        self.assertEqual('consumer._get_consumer_by_uuid', outer())
+
+    def test_skipped_modules(self):
+        db_api = _define('nova.api.openstack.placement.db_api', 'wrapper',
+                         _sqlalchemy)
+        timing = _define('nova.api.openstack.placement.sqltiming',
+                         '_after_cursor_execute', db_api)
+        func = _define('nova.api.openstack.placement.objects.user',
+                       '_get_user_by_external_id', timing)
+        self.assertEqual('user._get_user_by_external_id', func())
+
+    def test_not_placement(self):
+        func = _define('nova.db.sqlalchemy.api', 'instance_get', _sqlalchemy)
+        self.assertEqual('-', func())
+
+
+class TestQueryStats(test.NoDBTestCase):
+
+    def test_empty(self):
+        stats = sqltiming.QueryStats()
+        self.assertEqual(0, stats.count)
+        self.assertEqual('0 queries 0.0ms slowest: -', str(stats))
+
+    def test_add(self):
+        stats = sqltiming.QueryStats()
+        for duration, label in ((0.002, 'a'), (0.010, 'b'), (0.001, 'c'),
+                                (0.005, 'd'), (0.003, 'e')):
+            stats.add(duration, label)
+        self.assertEqual(5, stats.count)
+        self.assertAlmostEqual(0.021, stats.duration)
+        # Only the slowest statements are kept, slowest first.
+        self.assertEqual(
+            '5 queries 21.0ms slowest: b 10.0ms, d 5.0ms, e 3.0ms',
+            str(stats))
+
+
+class TestSqlTiming(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestSqlTiming, self).setUp()
+        self.engine = sa.create_engine('sqlite://')
+        self.addCleanup(self._remove_listeners)
+
+    @staticmethod
+    def _remove_listeners():
+        for identifier, listener in sqltiming._LISTENERS:
+            if sa.event.contains(Engine, identifier, listener):
+                sa.event.remove(Engine, identifier, listener)
+
+    def _call(self, header, is_admin=True):
+        self.flags(sql_timing_header=header, group='placement')
+        context = mock.Mock()
+        context.can.return_value = is_admin
+        environ = {'placement.context': context}
+        start_response = mock.Mock()
+
+        def app(environ, start_response):
+            self.engine.execute('select 1')
+            self.engine.execute('select 2')
+            start_response('200 OK', [])
+            # The statements run once the response started are not counted.
+            self.engine.execute('select 3')
+            return [b'']
+
+        middleware = sqltiming.SqlTiming(app, CONF)
+        middleware(environ, start_response)
+        return environ, start_response.call_args[0][1]
+
+    def test_records_statements(self):
+        environ, headers = self._call(header=False)
+        stats = environ[sqltiming.ENV_SQL_TIMING]
+        self.assertEqual(2, stats.count)
+        self.assertEqual(2, len(stats.slowest))
+        self.assertEqual([], headers)
+        # Outside of a request, nothing is recorded.
+        self.engine.execute('select 4')
+        self.assertEqual(2, stats.count)
+        self.assertIsNone(sqltiming._LOCAL.stats)
+
+    def test_header(self):
+        environ, headers = self._call(header=True)
+        stats = environ[sqltiming.ENV_SQL_TIMING]
+        self.assertEqual([(sqltiming.SQL_TIMING_HEADER, str(stats))],
+                         headers)
+        environ['placement.context'].can.assert_called_once_with(
+            'admin_api', fatal=False)
+
+    def test_header_not_admin(self):
+        environ, headers = self._call(header=True, is_admin=False)
+        self.assertEqual([], headers)
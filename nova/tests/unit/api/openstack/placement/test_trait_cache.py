@@ -0,0 +1,89 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for the cache of the trait identifiers."""
+
+import mock
+
+from nova.api.openstack.placement import exception
+from nova.api.openstack.placement import trait_cache
+from nova import test
+
+
+class TestTraitCache(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestTraitCache, self).setUp()
+        self.traits = {u'HW_CPU_X86_AVX2': 1, u'CUSTOM_GOLD': 2}
+        patcher = mock.patch.object(trait_cache, '_refresh_from_db',
+                                    side_effect=self._refresh_from_db)
+        self.mock_refresh = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = trait_cache.TraitCache(mock.sentinel.ctx)
+
+    def _refresh_from_db(self, ctx, cache):
+        cache.id_cache = dict(self.traits)
+        cache.str_cache = {v: k for k, v in self.traits.items()}
+
+    def test_id_from_string(self):
+        self.assertEqual(1, self.cache.id_from_string('HW_CPU_X86_AVX2'))
+        self.assertEqual(2, self.cache.id_from_string(u'CUSTOM_GOLD'))
+        # The second lookup is served from the cache.
+        self.mock_refresh.assert_called_once_with(mock.sentinel.ctx,
+                                                  self.cache)
+
+    def test_id_from_string_not_found(self):
+        self.assertRaises(exception.TraitNotFound,
+                          self.cache.id_from_string, 'CUSTOM_SILVER')
+        # A trait not found is looked up again, it may have been created since.
+        self.traits[u'CUSTOM_SILVER'] = 3
+        self.assertEqual(3, self.cache.id_from_string('CUSTOM_SILVER'))
+        self.assertEqual(2, self.mock_refresh.call_count)
+
+    def test_ids_from_strings(self):
+        self.assertEqual(
+            {u'HW_CPU_X86_AVX2': 1, u'CUSTOM_GOLD': 2},
+            self.cache.ids_from_strings(['HW_CPU_X86_AVX2', 'CUSTOM_GOLD']))
+        self.assertEqual({u'CUSTOM_GOLD': 2},
+                         self.cache.ids_from_strings(['CUSTOM_GOLD']))
+        self.assertEqual({}, self.cache.ids_from_strings([]))
+        self.assertEqual(1, self.mock_refresh.call_count)
+
+    def test_ids_from_strings_partially_cached(self):
+        self.cache.ids_from_strings(['CUSTOM_GOLD'])
+        self.traits[u'CUSTOM_SILVER'] = 3
+        # The traits not cached yet are looked up with a single refresh, and
+        # the unknown ones are left out.
+        self.assertEqual(
+            {u'CUSTOM_GOLD': 2, u'CUSTOM_SILVER': 3},
+            self.cache.ids_from_strings(['CUSTOM_GOLD', 'CUSTOM_SILVER',
+                                         'CUSTOM_BRONZE']))
+        self.assertEqual(2, self.mock_refresh.call_count)
+
+    def test_string_from_id(self):
+        self.assertEqual(u'CUSTOM_GOLD', self.cache.string_from_id(2))
+        self.assertEqual(u'HW_CPU_X86_AVX2', self.cache.string_from_id(1))
+        self.mock_refresh.assert_called_once_with(mock.sentinel.ctx,
+                                                  self.cache)
+
+    def test_string_from_id_not_found(self):
+        self.assertRaises(exception.TraitNotFound,
+                          self.cache.string_from_id, 3)
+        self.assertEqual(1, self.mock_refresh.call_count)
+
+    def test_clear(self):
+        self.cache.id_from_string('CUSTOM_GOLD')
+        self.cache.clear()
+        self.assertEqual({}, self.cache.id_cache)
+        self.assertEqual({}, self.cache.str_cache)
+        self.cache.id_from_string('CUSTOM_GOLD')
+        self.assertEqual(2, self.mock_refresh.call_count)
@@ -0,0 +1,114 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for the utility functions used by the placement API."""
+
+import datetime
+
+from oslo_serialization import jsonutils
+from oslo_utils import encodeutils
+import six
+import webob
+
+from nova.api.openstack.placement import util
+from nova import test
+
+
+def _allocations():
+    """Returns the lazy and the materialized version of a response body."""
+    consumers = [
+        (u'c1', {u'VCPU': 1, u'MEMORY_MB': 512}),
+        (u'cé', {u'DISK_GB': 10}),
+        (u'c3', {}),
+    ]
+
+    def _lazy():
+        return {
+            'allocations': util.JSONPairs(
+                (uuid, {'resources': resources,
+                        'providers': (rp for rp in ('rp1', 'rp2'))})
+                for uuid, resources in consumers),
+            'empty_list': (x for x in ()),
+            'empty_object': util.JSONPairs(iter(())),
+            'generation': 3,
+            'name': u'café',
+            'updated_at': datetime.datetime(2018, 8, 1, 12, 0, 0),
+        }
+
+    materialized = {
+        'allocations': {
+            uuid: {'resources': resources, 'providers': ['rp1', 'rp2']}
+            for uuid, resources in consumers},
+        'empty_list': [],
+        'empty_object': {},
+        'generation': 3,
+        'name': u'café',
+        'updated_at': datetime.datetime(2018, 8, 1, 12, 0, 0),
+    }
+    return _lazy, materialized
+
+
+class TestJSONBody(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestJSONBody, self).setUp()
+        self.lazy, self.materialized = _allocations()
+
+    def _dumps(self, obj):
+        return encodeutils.to_utf8(jsonutils.dumps(obj))
+
+    def test_materialize(self):
+        self.assertEqual(self.materialized, util._materialize(self.lazy()))
+
+    def test_iter_json(self):
+        self.assertEqual(jsonutils.dumps(self.materialized),
+                         ''.join(util._iter_json(self.lazy())))
+
+    def test_iter_json_not_lazy(self):
+        # An object without generators and JSONPairs is serialized at once.
+        self.assertEqual([jsonutils.dumps(self.materialized)],
+                         list(util._iter_json(self.materialized)))
+
+    def test_iter_json_top_level(self):
+        for lazy, materialized in (
+                ((x for x in (1, {'a': (y for y in ())})), [1, {'a': []}]),
+                (util.JSONPairs([('a', 1)]), {'a': 1}),
+                (u'é', u'é'),
+                (None, None)):
+            self.assertEqual(jsonutils.dumps(materialized),
+                             ''.join(util._iter_json(lazy)))
+
+    def test_iter_json_chunks(self):
+        chunks = list(util._iter_json_chunks(self.lazy()))
+        self.assertEqual(1, len(chunks))
+        self.assertIsInstance(chunks[0], six.binary_type)
+        self.assertEqual(self._dumps(self.materialized), chunks[0])
+
+    def test_iter_json_chunks_small_chunks(self):
+        chunks = list(util._iter_json_chunks(self.lazy(), chunk_size=16))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), 16)
+        self.assertEqual(self._dumps(self.materialized), b''.join(chunks))
+
+    def test_set_json_body_streamed(self):
+        self.flags(stream_json_responses=True, group='placement')
+        response = webob.Response()
+        util.set_json_body(response, self.lazy())
+        self.assertEqual(self._dumps(self.materialized),
+                         b''.join(response.app_iter))
+
+    def test_set_json_body_not_streamed(self):
+        self.flags(stream_json_responses=False, group='placement')
+        response = webob.Response()
+        util.set_json_body(response, self.lazy())
+        self.assertEqual(self._dumps(self.materialized), response.body)
@@ -7704,6 +7704,7 @@ class ComputeManagerMigrationTestCase(test.NoDBTestCase):
 
     def test_post_live_migration_at_destination_success(self):
 
+        @mock.patch.object(self.compute, '_get_resource_tracker')
         @mock.patch.object(self.instance, 'save')
         @mock.patch.object(self.compute.network_api, 'get_instance_nw_info',
                            return_value='test_network')
@@ -7720,7 +7721,8 @@ class ComputeManagerMigrationTestCase(test.NoDBTestCase):
                      _get_compute_info, _get_power_state,
                      _get_instance_block_device_info,
                      _notify_about_instance_usage, migrate_instance_finish,
-                     setup_networks_on_host, get_instance_nw_info, save):
+                     setup_networks_on_host, get_instance_nw_info, save,
+                     get_rt):
 
             cn = mock.Mock(spec_set=['hypervisor_hostname'])
             cn.hypervisor_hostname = 'test_host'
@@ -7775,11 +7777,14 @@ class ComputeManagerMigrationTestCase(test.NoDBTestCase):
             self.assertIsNone(self.instance.task_state)
             save.assert_called_once_with(
                 expected_task_state=task_states.MIGRATING)
+            get_rt.return_value.request_full_audit.assert_called_once_with(
+                'test_host')
 
         _do_test()
 
     def test_post_live_migration_at_destination_compute_not_found(self):
 
+        @mock.patch.object(self.compute, '_get_resource_tracker')
         @mock.patch.object(self.instance, 'save')
         @mock.patch.object(self.compute, 'network_api')
         @mock.patch.object(self.compute, '_notify_about_instance_usage')
@@ -7794,7 +7799,8 @@ class ComputeManagerMigrationTestCase(test.NoDBTestCase):
         def _do_test(mock_notify, post_live_migration_at_destination,
                      _get_compute_info, _get_power_state,
                      _get_instance_block_device_info,
-                     _notify_about_instance_usage, network_api, save):
+                     _notify_about_instance_usage, network_api, save,
+                     get_rt):
             cn = mock.Mock(spec_set=['hypervisor_hostname'])
             cn.hypervisor_hostname = 'test_host'
             _get_compute_info.return_value = cn
@@ -7807,6 +7813,7 @@ class ComputeManagerMigrationTestCase(test.NoDBTestCase):
                 mock.call(self.context, self.instance, self.instance.host,
                           action='live_migration_post_dest', phase='end')])
             self.assertIsNone(self.instance.node)
+            get_rt.return_value.request_full_audit.assert_not_called()
 
         _do_test()
 
@@ -7875,16 +7882,22 @@ class ComputeManagerMigrationTestCase(test.NoDBTestCase):
     @mock.patch('nova.objects.ConsoleAuthToken.'
                 'clean_console_auths_for_instance')
     def _call_post_live_migration(self, mock_clean, *args, **kwargs):
+        @mock.patch.object(self.compute, '_get_resource_tracker')
         @mock.patch.object(self.compute, 'update_available_resource')
         @mock.patch.object(self.compute, 'compute_rpcapi')
         @mock.patch.object(self.compute, '_notify_about_instance_usage')
         @mock.patch.object(self.compute, 'network_api')
         @mock.patch('nova.objects.BlockDeviceMappingList.get_by_instance_uuid')
-        def _do_call(bdm, nwapi, notify, rpc, update):
-            return self.compute._post_live_migration(self.context,
-                                                     self.instance,
-                                                     'foo',
-                                                     *args, **kwargs)
+        def _do_call(bdm, nwapi, notify, rpc, update, get_rt):
+            source_node = self.instance.node
+            result = self.compute._post_live_migration(self.context,
+                                                       self.instance,
+                                                       'foo',
+                                                       *args, **kwargs)
+            get_rt.return_value.request_full_audit.assert_called_once_with(
+                source_node)
+            update.assert_called_once_with(self.context)
+            return result
         result = _do_call()
         mock_clean.assert_called_once_with(self.context, self.instance.uuid)
         return result
@@ -42,6 +42,7 @@ from nova.objects import base
 from nova.objects import block_device as block_device_obj
 from nova.objects import fields
 from nova import rpc
+from nova.scheduler import timing
 from nova import test
 from nova.tests.unit import fake_block_device
 from nova.tests.unit import fake_crypto
@@ -1290,6 +1291,60 @@ class ServerGroupTestCase(test.TestCase):
         self.assertEqual(notification, expected)
 
 
+class SchedulerTimingTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(SchedulerTimingTestCase, self).setUp()
+        fake_notifier.stub_notifier(self)
+        self.addCleanup(fake_notifier.reset)
+        self.context = context.RequestContext('fake', 'fake')
+
+    def test_notify_about_scheduler_timing(self):
+        start = datetime.datetime(2012, 10, 29, 13, 42, 11)
+        end = datetime.datetime(2012, 10, 29, 13, 43, 11)
+        summary = timing.TimingSummary()
+        summary.started_at = start
+        timings = timing.RequestTimings()
+        timings.durations['filter.RamFilter'] = 0.4
+        summary.record(timings)
+
+        compute_utils.notify_about_scheduler_timing(self.context, summary,
+                                                    end)
+
+        self.assertEqual(len(fake_notifier.VERSIONED_NOTIFICATIONS), 1)
+        notification = fake_notifier.VERSIONED_NOTIFICATIONS[0]
+        expected = {'priority': 'INFO',
+                    'event_type': u'scheduler_timing.update',
+                    'publisher_id': u'nova-scheduler:fake-mini',
+                    'payload': {
+                        'nova_object.data': {
+                            'host': u'fake-mini',
+                            'start': u'2012-10-29T13:42:11Z',
+                            'end': u'2012-10-29T13:43:11Z',
+                            'requests': 1,
+                            'steps': [{
+                                'nova_object.data': {
+                                    'name': u'filter.RamFilter',
+                                    'count': 1,
+                                    'total_ms': 0.4,
+                                    'max_ms': 0.4,
+                                    'p50_ms': 0.4,
+                                    'p90_ms': 0.4,
+                                    'p99_ms': 0.4,
+                                },
+                                'nova_object.name':
+                                    'SchedulerStepTimingPayload',
+                                'nova_object.namespace': 'nova',
+                                'nova_object.version': '1.0'
+                            }]
+                        },
+                        'nova_object.name': 'SchedulerTimingPayload',
+                        'nova_object.namespace': 'nova',
+                        'nova_object.version': '1.0'
+                   }
+            }
+        self.assertEqual(expected, notification)
+
+
 class ComputeUtilsQuotaTestCase(test.TestCase):
     def setUp(self):
         super(ComputeUtilsQuotaTestCase, self).setUp()
@@ -0,0 +1,102 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the background synchronization of the compute nodes to
+placement.
+"""
+
+import mock
+from oslo_utils.fixture import uuidsentinel as uuids
+
+from nova.compute import placement_sync
+from nova import exception
+from nova import objects
+from nova import test
+
+
+class PlacementSyncWorkerTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(PlacementSyncWorkerTestCase, self).setUp()
+        self.sync_func = mock.Mock()
+        self.worker = placement_sync.PlacementSyncWorker(self.sync_func)
+        patcher = mock.patch('nova.utils.spawn_n')
+        self.mock_spawn = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cn1 = objects.ComputeNode(uuid=uuids.cn1,
+                                       hypervisor_hostname='node1',
+                                       local_gb=10)
+        self.cn2 = objects.ComputeNode(uuid=uuids.cn2,
+                                       hypervisor_hostname='node2',
+                                       local_gb=20)
+
+    def _run(self):
+        self.mock_spawn.assert_called_once_with(self.worker._run)
+        self.worker._run()
+
+    def test_sync_coalesced(self):
+        self.worker.sync(mock.sentinel.ctx1, self.cn1)
+        self.worker.sync(mock.sentinel.ctx1, self.cn2)
+        self.cn1.local_gb = 30
+        self.worker.sync(mock.sentinel.ctx2, self.cn1)
+
+        # A single worker runs the pending synchronizations.
+        self._run()
+
+        self.assertEqual(2, self.sync_func.call_count)
+        calls = self.sync_func.call_args_list
+        # The compute node synchronized again moved after the other one.
+        self.assertEqual((mock.sentinel.ctx1, uuids.cn2),
+                         (calls[0][0][0], calls[0][0][1].uuid))
+        self.assertEqual((mock.sentinel.ctx2, uuids.cn1, 30),
+                         (calls[1][0][0], calls[1][0][1].uuid,
+                          calls[1][0][1].local_gb))
+        # A copy of the compute node is synchronized.
+        self.assertIsNot(self.cn1, calls[1][0][1])
+
+        # A new worker is spawned for the next synchronization.
+        self.mock_spawn.reset_mock()
+        self.worker.sync(mock.sentinel.ctx, self.cn1)
+        self.mock_spawn.assert_called_once_with(self.worker._run)
+
+    def test_sync_conflict_retried(self):
+        self.sync_func.side_effect = [
+            exception.ResourceProviderUpdateConflict(
+                uuid=uuids.cn1, generation=42, error='error'),
+            None]
+        self.worker.sync(mock.sentinel.ctx, self.cn1)
+
+        self._run()
+
+        self.assertEqual(2, self.sync_func.call_count)
+
+    @mock.patch.object(placement_sync.LOG, 'error')
+    def test_sync_conflict_out_of_attempts(self, mock_log):
+        self.sync_func.side_effect = exception.ResourceProviderSyncFailed()
+        self.worker.sync(mock.sentinel.ctx, self.cn1)
+
+        self._run()
+
+        self.assertEqual(placement_sync.MAX_ATTEMPTS,
+                         self.sync_func.call_count)
+        mock_log.assert_called_once()
+
+    @mock.patch.object(placement_sync.LOG, 'exception')
+    def test_sync_failure(self, mock_log):
+        self.sync_func.side_effect = [exception.ReshapeNeeded(), None]
+        self.worker.sync(mock.sentinel.ctx, self.cn1)
+        self.worker.sync(mock.sentinel.ctx, self.cn2)
+
+        self._run()
+
+        # The failure is not retried and doesn't stop the worker.
+        self.assertEqual(2, self.sync_func.call_count)
+        mock_log.assert_called_once()
@@ -35,7 +35,6 @@ from nova.objects import fields as obj_fields
 from nova.objects import pci_device
 from nova.pci import manager as pci_manager
 from nova import rc_fields
-from nova.scheduler.client import report
 from nova import test
 from nova.tests.unit import fake_notifier
 from nova.tests.unit.objects import test_pci_device as fake_pci_device
@@ -1053,6 +1052,157 @@ class TestUpdateAvailableResources(BaseTestCase):
                                                  actual_resources))
         update_mock.assert_called_once()
 
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.PciDeviceList.get_by_compute_node',
+                return_value=objects.PciDeviceList())
+    @mock.patch('nova.objects.ComputeNode.get_by_host_and_nodename')
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
+    @mock.patch('nova.objects.InstanceList.get_by_host_and_node')
+    def test_incremental_update(self, get_mock, migr_mock, get_cn_mock,
+                                pci_mock, instance_pci_mock):
+        self.flags(resource_audit_interval=600, group='compute')
+        self._setup_rt()
+
+        get_mock.return_value = []
+        migr_mock.return_value = []
+        get_cn_mock.return_value = _COMPUTE_NODE_FIXTURES[0].obj_clone()
+
+        # The first update is a full audit.
+        self._update_available_resources()
+        get_mock.assert_called_once()
+        migr_mock.assert_called_once()
+        self.assertIn(_NODENAME, self.rt.last_full_audits)
+
+        # Simulate a claim accounted since the full audit and a change of the
+        # hypervisor view.
+        cn = self.rt.compute_nodes[_NODENAME]
+        cn.memory_mb_used = 128
+        cn.running_vms = 1
+        self.rt.stats[_NODENAME]['num_instances'] = 1
+        self.rt.tracked_instances.add(uuids.claimed)
+        virt_resources = copy.deepcopy(_VIRT_DRIVER_AVAIL_RESOURCES)
+        virt_resources.update(memory_mb=1024, memory_mb_used=1000,
+                              hypervisor_version=2)
+        self.driver_mock.get_available_resource.return_value = virt_resources
+
+        # The next update keeps the usage accounted incrementally without
+        # reading the instances and migrations.
+        update_mock = self._update_available_resources()
+        get_mock.assert_called_once()
+        migr_mock.assert_called_once()
+        update_mock.assert_called_once_with(mock.ANY, cn)
+        self.assertEqual(1024, cn.memory_mb)
+        self.assertEqual(2, cn.hypervisor_version)
+        self.assertEqual(128, cn.memory_mb_used)
+        self.assertEqual(1024 - 128, cn.free_ram_mb)
+        self.assertEqual(1, cn.running_vms)
+        self.assertEqual('1', cn.stats['num_instances'])
+        self.assertEqual(set([uuids.claimed]), self.rt.tracked_instances)
+
+        # The startup update is always a full audit.
+        self._update_available_resources(startup=True)
+        self.assertEqual(2, get_mock.call_count)
+        self.assertEqual(0, cn.memory_mb_used)
+
+    @mock.patch.object(resource_tracker.LOG, 'warning')
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.PciDeviceList.get_by_compute_node',
+                return_value=objects.PciDeviceList())
+    @mock.patch('nova.objects.ComputeNode.get_by_host_and_nodename')
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
+    @mock.patch('nova.objects.InstanceList.get_by_host_and_node')
+    def test_full_audit_reports_drift(self, get_mock, migr_mock, get_cn_mock,
+                                      pci_mock, instance_pci_mock, mock_warn):
+        self.flags(resource_audit_interval=600, group='compute')
+        self._setup_rt()
+
+        get_mock.return_value = []
+        migr_mock.return_value = []
+        get_cn_mock.return_value = _COMPUTE_NODE_FIXTURES[0].obj_clone()
+
+        self._update_available_resources()
+        mock_warn.assert_not_called()
+
+        # The usage accounted incrementally leaked.
+        cn = self.rt.compute_nodes[_NODENAME]
+        cn.memory_mb_used = 128
+
+        # The next full audit is due.
+        self.rt.last_full_audits[_NODENAME] = (
+            timeutils.utcnow() - datetime.timedelta(seconds=601))
+        self._update_available_resources()
+
+        self.assertEqual(2, get_mock.call_count)
+        self.assertEqual(0, cn.memory_mb_used)
+        mock_warn.assert_called_once()
+        self.assertEqual(
+            {'memory_mb_used': {'incremental': 128, 'audited': 0}},
+            mock_warn.call_args[0][1]['drift'])
+
+    @mock.patch.object(resource_tracker.LOG, 'warning')
+    @mock.patch('nova.compute.utils.is_volume_backed_instance',
+                return_value=False)
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.PciDeviceList.get_by_compute_node',
+                return_value=objects.PciDeviceList())
+    @mock.patch('nova.objects.ComputeNode.get_by_host_and_nodename')
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
+    @mock.patch('nova.objects.InstanceList.get_by_host_and_node')
+    def test_request_full_audit(self, get_mock, migr_mock, get_cn_mock,
+                                pci_mock, instance_pci_mock, bfv_check_mock,
+                                mock_warn):
+        self.flags(resource_audit_interval=600, group='compute')
+        self._setup_rt()
+
+        get_mock.return_value = []
+        migr_mock.return_value = []
+        get_cn_mock.return_value = _COMPUTE_NODE_FIXTURES[0].obj_clone()
+
+        self._update_available_resources()
+        self.assertEqual(1, get_mock.call_count)
+
+        # An instance moved to the node without a claim, e.g. at the end of
+        # a live migration.
+        instance = _INSTANCE_FIXTURES[0].obj_clone()
+        get_mock.return_value = [instance]
+        self.rt.request_full_audit(_NODENAME)
+        self.assertNotIn(_NODENAME, self.rt.last_full_audits)
+
+        self._update_available_resources()
+
+        # The next update audited the usage from scratch without reporting
+        # the expected difference as a drift.
+        self.assertEqual(2, get_mock.call_count)
+        self.assertIn(_NODENAME, self.rt.last_full_audits)
+        cn = self.rt.compute_nodes[_NODENAME]
+        self.assertEqual(instance.flavor.memory_mb, cn.memory_mb_used)
+        self.assertEqual(1, cn.running_vms)
+        mock_warn.assert_not_called()
+
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.PciDeviceList.get_by_compute_node',
+                return_value=objects.PciDeviceList())
+    @mock.patch('nova.objects.ComputeNode.get_by_host_and_nodename')
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
+    @mock.patch('nova.objects.InstanceList.get_by_host_and_node')
+    def test_full_audit_by_default(self, get_mock, migr_mock, get_cn_mock,
+                                   pci_mock, instance_pci_mock):
+        self._setup_rt()
+
+        get_mock.return_value = []
+        migr_mock.return_value = []
+        get_cn_mock.return_value = _COMPUTE_NODE_FIXTURES[0].obj_clone()
+
+        self._update_available_resources()
+        self._update_available_resources()
+
+        self.assertEqual(2, get_mock.call_count)
+        self.assertEqual(2, migr_mock.call_count)
+
 
 class TestInitComputeNode(BaseTestCase):
 
@@ -1366,6 +1516,32 @@ class TestUpdateComputeNode(BaseTestCase):
         self.assertFalse(norm_mock.called)
         ucn_mock = self.sched_client_mock.update_compute_node
         ucn_mock.assert_called_once_with(mock.sentinel.ctx, new_compute)
+        # The schedulers do not cache their host states by default.
+        self.sched_client_mock.update_compute_node_info.assert_not_called()
+
+    @mock.patch('nova.objects.ComputeNode.save')
+    def test_existing_compute_node_updated_host_state_cache(self, save_mock):
+        self.flags(host_state_cache_max_age=60, group='filter_scheduler')
+        self._setup_rt()
+        ctx = mock.Mock()
+
+        orig_compute = _COMPUTE_NODE_FIXTURES[0].obj_clone()
+        self.rt.compute_nodes[_NODENAME] = orig_compute
+        self.rt.old_resources[_NODENAME] = orig_compute
+
+        new_compute = orig_compute.obj_clone()
+        new_compute.memory_mb_used = 128
+
+        self.rt._update(ctx, new_compute)
+        save_mock.assert_called_once_with()
+        ucni_mock = self.sched_client_mock.update_compute_node_info
+        ucni_mock.assert_called_once_with(ctx.elevated.return_value,
+                                          _HOSTNAME, new_compute)
+
+        # Nothing is pushed to the schedulers if the resources didn't change.
+        ucni_mock.reset_mock()
+        self.rt._update(ctx, new_compute.obj_clone())
+        ucni_mock.assert_not_called()
 
     @mock.patch('nova.compute.resource_tracker.'
                 '_normalize_inventory_from_cn_obj')
@@ -1536,6 +1712,28 @@ class TestUpdateComputeNode(BaseTestCase):
 
         self.assertEqual(4, ufpt_mock.call_count)
 
+    @mock.patch('nova.objects.ComputeNode.save', new=mock.Mock())
+    def test_update_async_placement_sync(self):
+        self.flags(async_placement_sync=True, group='compute')
+        self._setup_rt()
+        orig_compute = _COMPUTE_NODE_FIXTURES[0].obj_clone()
+        self.rt.compute_nodes[_NODENAME] = orig_compute
+        self.rt.old_resources[_NODENAME] = orig_compute
+        new_compute = orig_compute.obj_clone()
+
+        with mock.patch.object(self.rt, 'placement_sync') as mock_sync:
+            self.rt._update(mock.sentinel.ctx, new_compute)
+            # Placement is updated in the background.
+            mock_sync.sync.assert_called_once_with(mock.sentinel.ctx,
+                                                   new_compute)
+            self.driver_mock.get_inventory.assert_not_called()
+
+            # It is still updated synchronously on startup.
+            self.rt._update(mock.sentinel.ctx, new_compute, startup=True)
+            mock_sync.sync.assert_called_once_with(mock.sentinel.ctx,
+                                                   new_compute)
+            self.driver_mock.get_inventory.assert_called_once_with(_NODENAME)
+
     def test_copy_resources_no_update_allocation_ratios(self):
         """Tests that a ComputeNode object's allocation ratio fields are
         not set if the configured allocation ratio values are default None.
@@ -2934,17 +3132,16 @@ class TestUpdateUsageFromInstance(BaseTestCase):
             self.rt._get_usage_dict(self.instance, self.instance),
             _NODENAME, sign=-1)
 
-    @mock.patch('nova.objects.Instance.get_by_uuid')
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
     def test_remove_deleted_instances_allocations_deleted_instance(self,
             mock_inst_get):
         rc = self.rt.reportclient
-        allocs = report.ProviderAllocInfo(
-            allocations={uuids.deleted: "fake_deleted_instance"})
-        rc.get_allocations_for_resource_provider = mock.MagicMock(
+        allocs = {uuids.deleted: "fake_deleted_instance"}
+        rc.get_allocations_for_providers = mock.MagicMock(
             return_value=allocs)
         rc.delete_allocation_for_instance = mock.MagicMock()
-        mock_inst_get.return_value = objects.Instance(
-            uuid=uuids.deleted, deleted=True)
+        mock_inst_get.return_value = [objects.Instance(
+            uuid=uuids.deleted, deleted=True)]
         cn = self.rt.compute_nodes[_NODENAME]
         ctx = mock.MagicMock()
         # Call the method.
@@ -2955,21 +3152,19 @@ class TestUpdateUsageFromInstance(BaseTestCase):
             ctx, uuids.deleted)
         mock_inst_get.assert_called_once_with(
             ctx.elevated.return_value,
-            uuids.deleted,
+            {'uuid': [uuids.deleted]},
             expected_attrs=[])
         ctx.elevated.assert_called_once_with(read_deleted='yes')
 
-    @mock.patch('nova.objects.Instance.get_by_uuid')
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
     def test_remove_deleted_instances_allocations_building_instance(self,
             mock_inst_get):
         rc = self.rt.reportclient
-        allocs = report.ProviderAllocInfo(
-            allocations={uuids.deleted: "fake_deleted_instance"})
-        rc.get_allocations_for_resource_provider = mock.MagicMock(
+        allocs = {uuids.deleted: "fake_deleted_instance"}
+        rc.get_allocations_for_providers = mock.MagicMock(
             return_value=allocs)
         rc.delete_allocation_for_instance = mock.MagicMock()
-        mock_inst_get.side_effect = exc.InstanceNotFound(
-            instance_id=uuids.deleted)
+        mock_inst_get.return_value = []
         cn = self.rt.compute_nodes[_NODENAME]
         ctx = mock.MagicMock()
         # Call the method.
@@ -2978,19 +3173,18 @@ class TestUpdateUsageFromInstance(BaseTestCase):
         # should not have been deleted
         self.assertFalse(rc.delete_allocation_for_instance.called)
 
-    @mock.patch('nova.objects.Instance.get_by_uuid')
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
     def test_remove_deleted_instances_allocations_ignores_migrations(self,
             mock_inst_get):
         rc = self.rt.reportclient
-        allocs = report.ProviderAllocInfo(
-            allocations={uuids.deleted: "fake_deleted_instance",
-                         uuids.migration: "fake_migration"})
+        allocs = {uuids.deleted: "fake_deleted_instance",
+                  uuids.migration: "fake_migration"}
         mig = objects.Migration(uuid=uuids.migration)
-        rc.get_allocations_for_resource_provider = mock.MagicMock(
+        rc.get_allocations_for_providers = mock.MagicMock(
             return_value=allocs)
         rc.delete_allocation_for_instance = mock.MagicMock()
-        mock_inst_get.return_value = objects.Instance(
-            uuid=uuids.deleted, deleted=True)
+        mock_inst_get.return_value = [objects.Instance(
+            uuid=uuids.deleted, deleted=True)]
         cn = self.rt.compute_nodes[_NODENAME]
         ctx = mock.MagicMock()
         # Call the method.
@@ -3002,13 +3196,12 @@ class TestUpdateUsageFromInstance(BaseTestCase):
         rc.delete_allocation_for_instance.assert_called_once_with(
             ctx, uuids.deleted)
 
-    @mock.patch('nova.objects.Instance.get_by_uuid')
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
     def test_remove_deleted_instances_allocations_scheduled_instance(self,
             mock_inst_get):
         rc = self.rt.reportclient
-        allocs = report.ProviderAllocInfo(
-            allocations={uuids.scheduled: "fake_scheduled_instance"})
-        rc.get_allocations_for_resource_provider = mock.MagicMock(
+        allocs = {uuids.scheduled: "fake_scheduled_instance"}
+        rc.get_allocations_for_providers = mock.MagicMock(
             return_value=allocs)
         rc.delete_allocation_for_instance = mock.MagicMock()
         instance_by_uuid = {uuids.scheduled:
@@ -3023,10 +3216,10 @@ class TestUpdateUsageFromInstance(BaseTestCase):
         rc.delete_allocation_for_instance.assert_not_called()
 
     @mock.patch('nova.scheduler.client.report.SchedulerReportClient.'
-                'get_allocations_for_resource_provider')
+                'get_allocations_for_providers')
     @mock.patch('nova.scheduler.client.report.SchedulerReportClient.'
                 'delete_allocation_for_instance')
-    @mock.patch('nova.objects.Instance.get_by_uuid')
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
     def test_remove_deleted_instances_allocations_move_ops(self, mock_get,
             mock_delete_allocs, mock_get_allocs):
         """Test that we do NOT delete allocations for instances that are
@@ -3039,33 +3232,73 @@ class TestUpdateUsageFromInstance(BaseTestCase):
         # Instances in resizing/move will be ACTIVE or STOPPED
         instance.vm_state = vm_states.ACTIVE
         # Mock out the allocation call
-        allocs = {uuids.inst0: mock.sentinel.moving_instance}
+        allocs = {uuids.moving_instance: mock.sentinel.moving_instance}
         mock_get_allocs.return_value = allocs
-        mock_get.return_value = instance
+        mock_get.return_value = [instance]
 
         cn = self.rt.compute_nodes[_NODENAME]
         ctx = mock.MagicMock()
         self.rt._remove_deleted_instances_allocations(ctx, cn, [], mock.ANY)
         mock_delete_allocs.assert_not_called()
 
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
+    def test_remove_deleted_instances_allocations_unknown_instances_query(
+            self, mock_inst_get):
+        """Tests that the unknown instances having allocations against the
+        provider tree of the node are looked up in a single query.
+        """
+        rc = self.rt.reportclient
+        self.rt.tracked_instances = set([uuids.known])
+        allocs = {uuids.known: "fake_known_instance",
+                  uuids.deleted1: "fake_deleted_instance",
+                  uuids.deleted2: "fake_deleted_instance",
+                  uuids.scheduled: "fake_scheduled_instance"}
+        rc.get_allocations_for_providers = mock.MagicMock(
+            return_value=allocs)
+        rc.delete_allocation_for_instance = mock.MagicMock()
+        mock_inst_get.return_value = [
+            objects.Instance(uuid=uuids.deleted1, deleted=True),
+            objects.Instance(uuid=uuids.deleted2, deleted=True)]
+        instance_by_uuid = {uuids.scheduled:
+                            objects.Instance(uuid=uuids.scheduled,
+                                             deleted=False, host=None)}
+        cn = self.rt.compute_nodes[_NODENAME]
+        ctx = mock.MagicMock()
+        # Call the method.
+        self.rt._remove_deleted_instances_allocations(ctx, cn, [],
+                                                      instance_by_uuid)
+        rc.get_allocations_for_providers.assert_called_once_with(
+            ctx, in_tree=cn.uuid)
+        mock_inst_get.assert_called_once_with(
+            ctx.elevated.return_value, mock.ANY, expected_attrs=[])
+        self.assertEqual(
+            set([uuids.deleted1, uuids.deleted2]),
+            set(mock_inst_get.call_args[0][1]['uuid']))
+        rc.delete_allocation_for_instance.assert_has_calls(
+            [mock.call(ctx, uuids.deleted1), mock.call(ctx, uuids.deleted2)],
+            any_order=True)
+        self.assertEqual(2, rc.delete_allocation_for_instance.call_count)
+
     def test_remove_deleted_instances_allocations_known_instance(self):
         """Tests the case that actively tracked instances for the
         given node do not have their allocations removed.
         """
         rc = self.rt.reportclient
         self.rt.tracked_instances = set([uuids.known])
-        allocs = report.ProviderAllocInfo(
-            allocations={
-                uuids.known: {
-                    'resources': {
-                        'VCPU': 1,
-                        'MEMORY_MB': 2048,
-                        'DISK_GB': 20
+        allocs = {
+            uuids.known: {
+                'allocations': {
+                    uuids.cn: {
+                        'resources': {
+                            'VCPU': 1,
+                            'MEMORY_MB': 2048,
+                            'DISK_GB': 20
+                        }
                     }
                 }
             }
-        )
-        rc.get_allocations_for_resource_provider = mock.MagicMock(
+        }
+        rc.get_allocations_for_providers = mock.MagicMock(
             return_value=allocs)
         rc.delete_allocation_for_instance = mock.MagicMock()
         cn = self.rt.compute_nodes[_NODENAME]
@@ -3078,7 +3311,7 @@ class TestUpdateUsageFromInstance(BaseTestCase):
         # instance and has allocations for it.
         rc.delete_allocation_for_instance.assert_not_called()
 
-    @mock.patch('nova.objects.Instance.get_by_uuid')
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
     def test_remove_deleted_instances_allocations_unknown_instance(
             self, mock_inst_get):
         """Tests the case that an instance is found with allocations for
@@ -3087,22 +3320,24 @@ class TestUpdateUsageFromInstance(BaseTestCase):
         how this happened or what to do.
         """
         instance = _INSTANCE_FIXTURES[0]
-        mock_inst_get.return_value = instance
+        mock_inst_get.return_value = [instance]
         rc = self.rt.reportclient
         # No tracked instances on this node.
         # But there is an allocation for an instance on this node.
-        allocs = report.ProviderAllocInfo(
-            allocations={
-                instance.uuid: {
-                    'resources': {
-                        'VCPU': 1,
-                        'MEMORY_MB': 2048,
-                        'DISK_GB': 20
+        allocs = {
+            instance.uuid: {
+                'allocations': {
+                    uuids.cn: {
+                        'resources': {
+                            'VCPU': 1,
+                            'MEMORY_MB': 2048,
+                            'DISK_GB': 20
+                        }
                     }
                 }
             }
-        )
-        rc.get_allocations_for_resource_provider = mock.MagicMock(
+        }
+        rc.get_allocations_for_providers = mock.MagicMock(
             return_value=allocs)
         rc.delete_allocation_for_instance = mock.MagicMock()
         cn = self.rt.compute_nodes[_NODENAME]
@@ -3122,8 +3357,8 @@ class TestUpdateUsageFromInstance(BaseTestCase):
         """
         cn = self.rt.compute_nodes[_NODENAME]
         rc = self.rt.reportclient
-        # We'll test three different ways get_allocations_for_resource_provider
-        # can cause us to no-op.
+        # We'll test three different ways get_allocations_for_providers can
+        # cause us to no-op.
         side_effects = (
             # Actual placement error
             exc.ResourceProviderAllocationRetrievalFailed(
@@ -3131,17 +3366,17 @@ class TestUpdateUsageFromInstance(BaseTestCase):
             # API communication failure
             ks_exc.ClientException,
             # Legitimately no allocations
-            report.ProviderAllocInfo(allocations={}),
+            {},
         )
-        rc.get_allocations_for_resource_provider = mock.Mock(
+        rc.get_allocations_for_providers = mock.Mock(
             side_effect=side_effects)
         for _ in side_effects:
             # If we didn't no op, this would blow up at 'ctx'.elevated()
             self.rt._remove_deleted_instances_allocations(
                 'ctx', cn, [], {})
-            rc.get_allocations_for_resource_provider.assert_called_once_with(
-                'ctx', cn.uuid)
-            rc.get_allocations_for_resource_provider.reset_mock()
+            rc.get_allocations_for_providers.assert_called_once_with(
+                'ctx', in_tree=cn.uuid)
+            rc.get_allocations_for_providers.reset_mock()
 
     def test_delete_allocation_for_shelve_offloaded_instance(self):
         instance = _INSTANCE_FIXTURES[0].obj_clone()
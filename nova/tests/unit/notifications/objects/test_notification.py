@@ -422,6 +422,9 @@ notification_object_data = {
     'NotificationPublisher': '2.2-b6ad48126247e10b46b6b0240e52e614',
     'RequestSpecPayload': '1.1-64d30723a2e381d0cd6a16a877002c64',
     'SchedulerRetriesPayload': '1.0-03a07d09575ef52cced5b1b24301d0b4',
+    'SchedulerStepTimingPayload': '1.0-52dcffae1a37ecad830d7cc2678166f9',
+    'SchedulerTimingNotification': '1.0-a73147b93b520ff0061865849d3dfa56',
+    'SchedulerTimingPayload': '1.0-b2688888f4e8f5771d39fa5c02353134',
     'SelectDestinationsNotification': '1.0-a73147b93b520ff0061865849d3dfa56',
     'ServerGroupNotification': '1.0-a73147b93b520ff0061865849d3dfa56',
     'ServerGroupPayload': '1.1-4ded2997ea1b07038f7af33ef5c45f7f',
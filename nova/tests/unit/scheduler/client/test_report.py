@@ -12,13 +12,16 @@
 
 import time
 
+import eventlet
 import fixtures
 from keystoneauth1 import exceptions as ks_exc
 import mock
 from oslo_serialization import jsonutils
 from oslo_utils.fixture import uuidsentinel as uuids
+import requests
 from six.moves.urllib import parse
 
+from nova.compute import provider_tree
 import nova.conf
 from nova import context
 from nova import exception
@@ -175,6 +178,48 @@ class TestConstructor(test.NoDBTestCase):
         self.assertEqual({'accept': 'application/json'},
                          client._client.additional_headers)
 
+    @mock.patch('keystoneauth1.loading.load_session_from_conf_options')
+    @mock.patch('keystoneauth1.loading.load_auth_from_conf_options')
+    def test_constructor_connection_pools(self, load_auth_mock,
+                                          load_sess_mock):
+        session = requests.Session()
+        load_sess_mock.return_value.session = session
+        report.SchedulerReportClient()
+        # The default pool size is kept up to that of requests.
+        for adapter in session.adapters.values():
+            self.assertEqual(10, adapter._pool_maxsize)
+
+        self.flags(provider_update_concurrency=32, group='compute')
+        report.SchedulerReportClient()
+        for adapter in session.adapters.values():
+            self.assertEqual(32, adapter._pool_maxsize)
+            self.assertEqual(32, adapter.poolmanager.connection_pool_kw[
+                'maxsize'])
+
+
+class TestProviderLevels(test.NoDBTestCase):
+    def test_provider_levels(self):
+        # root1 -> (child1 -> grandchild1, child2), root2
+        parents = {
+            uuids.root1: None,
+            uuids.child1: uuids.root1,
+            uuids.grandchild1: uuids.child1,
+            uuids.child2: uuids.root1,
+            uuids.root2: None,
+        }
+        self.assertEqual(
+            [[uuids.root1, uuids.root2], [uuids.child1, uuids.child2],
+             [uuids.grandchild1]],
+            report._provider_levels(
+                [uuids.root1, uuids.child1, uuids.grandchild1, uuids.child2,
+                 uuids.root2], parents))
+        # The ancestors of the providers may not be in the list.
+        self.assertEqual(
+            [[uuids.grandchild1, uuids.child2]],
+            report._provider_levels([uuids.grandchild1, uuids.child2],
+                                    parents))
+        self.assertEqual([], report._provider_levels([], parents))
+
 
 class SchedulerReportClientTestCase(test.NoDBTestCase):
 
@@ -1135,6 +1180,73 @@ class TestPutAllocations(SchedulerReportClientTestCase):
             expected_url, microversion='1.28', json=expected_payload,
             headers={'X-Openstack-Request-Id': self.context.global_id})
 
+    def _test_claim_resources_in_bulk(self, resp_mocks):
+        self.ks_adap_mock.post.side_effect = resp_mocks
+        alloc_req = {
+            'allocations': {
+                uuids.cn1: {
+                    'resources': {
+                        'VCPU': 1,
+                        'MEMORY_MB': 1024,
+                    }
+                },
+            },
+        }
+        alloc_requests = {uuids.instance1: alloc_req,
+                          uuids.instance2: alloc_req}
+
+        res = self.client.claim_resources_in_bulk(self.context,
+            alloc_requests, uuids.project_id, uuids.user_id,
+            allocation_request_version='1.29')
+
+        expected_payload = {
+            consumer_uuid: {
+                'allocations': alloc_req['allocations'],
+                'project_id': uuids.project_id,
+                'user_id': uuids.user_id,
+                'consumer_generation': None}
+            for consumer_uuid in (uuids.instance1, uuids.instance2)}
+        expected_call = mock.call(
+            '/allocations', microversion='1.29', json=expected_payload,
+            headers={'X-Openstack-Request-Id': self.context.global_id})
+        self.ks_adap_mock.post.assert_has_calls(
+            [expected_call] * len(resp_mocks))
+        # The allocations are never read first, unlike with claim_resources.
+        self.ks_adap_mock.get.assert_not_called()
+        return res
+
+    def test_claim_resources_in_bulk(self):
+        self.assertTrue(self._test_claim_resources_in_bulk(
+            [fake_requests.FakeResponse(204)]))
+
+    def test_claim_resources_in_bulk_rp_generation_retry_success(self):
+        self.assertTrue(self._test_claim_resources_in_bulk([
+            fake_requests.FakeResponse(
+                409,
+                jsonutils.dumps(
+                    {'errors': [
+                        {'code': 'placement.concurrent_update',
+                         'detail': ''}]})),
+            fake_requests.FakeResponse(204)]))
+
+    def test_claim_resources_in_bulk_consumer_generation_failure(self):
+        self.assertFalse(self._test_claim_resources_in_bulk([
+            fake_requests.FakeResponse(
+                409,
+                jsonutils.dumps(
+                    {'errors': [
+                        {'code': 'placement.concurrent_update',
+                         'detail': 'consumer generation conflict'}]}))]))
+
+    def test_claim_resources_in_bulk_failure(self):
+        self.assertFalse(self._test_claim_resources_in_bulk([
+            fake_requests.FakeResponse(
+                409,
+                jsonutils.dumps(
+                    {'errors': [
+                        {'code': 'something else',
+                         'detail': 'not cool'}]}))]))
+
     def test_remove_provider_from_inst_alloc_no_shared(self):
         """Tests that the method which manipulates an existing doubled-up
         allocation for a move operation to remove the source host results in
@@ -1694,6 +1806,53 @@ class TestMoveAllocations(SchedulerReportClientTestCase):
 
 
 class TestProviderOperations(SchedulerReportClientTestCase):
+    def test_update_from_provider_tree_concurrently(self):
+        """Tests that the providers at the same depth are updated and deleted
+        concurrently, and after their descendants.
+        """
+        self.flags(provider_update_concurrency=4, group='compute')
+        # root -> (child1 -> grandchild1, child2, child3)
+        cache = self.client._provider_tree
+        cache.new_root('root', uuids.root, generation=1)
+        for name in ('child1', 'child2', 'child3'):
+            cache.new_child(name, uuids.root, uuid=getattr(uuids, name),
+                            generation=1)
+        cache.new_child('grandchild1', uuids.child1, uuid=uuids.grandchild1,
+                        generation=1)
+        new_tree = provider_tree.ProviderTree()
+        new_tree.new_root('root', uuids.root, generation=1)
+        new_tree.new_child('child2', uuids.root, uuid=uuids.child2,
+                           generation=1)
+        new_tree.new_child('child3', uuids.root, uuid=uuids.child3,
+                           generation=1)
+
+        calls = []
+
+        def delete_provider(rp_uuid):
+            calls.append(('delete', rp_uuid))
+            cache.remove(rp_uuid)
+
+        def set_traits(context, rp_uuid, traits):
+            calls.append(('update', rp_uuid))
+
+        pool = mock.Mock(wraps=eventlet.GreenPool)
+        with test.nested(
+                mock.patch.object(self.client, '_delete_provider',
+                                  side_effect=delete_provider),
+                mock.patch.object(self.client, '_set_inventory_for_provider'),
+                mock.patch.object(self.client, 'set_aggregates_for_provider'),
+                mock.patch.object(self.client, 'set_traits_for_provider',
+                                  side_effect=set_traits),
+                mock.patch('eventlet.GreenPool', new=pool)):
+            self.client.update_from_provider_tree(self.context, new_tree)
+
+        self.assertEqual(
+            [('delete', uuids.grandchild1), ('delete', uuids.child1),
+             ('update', uuids.child2), ('update', uuids.child3),
+             ('update', uuids.root)], calls)
+        # Only the two children are processed in a pool.
+        pool.assert_called_once_with(size=2)
+
     @mock.patch('nova.scheduler.client.report.SchedulerReportClient.'
                 '_create_resource_provider')
     @mock.patch('nova.scheduler.client.report.SchedulerReportClient.'
@@ -3901,6 +4060,56 @@ class TestAllocations(SchedulerReportClientTestCase):
             '/resource_providers/rpuuid/allocations',
             global_request_id=self.context.global_id)
 
+    @mock.patch("nova.scheduler.client.report.SchedulerReportClient.get")
+    def test_get_allocations_for_providers(self, mock_get):
+        mock_get.return_value = fake_requests.FakeResponse(
+            200, content=jsonutils.dumps({'allocations': {'foo': 'bar'}}))
+        ret = self.client.get_allocations_for_providers(
+            self.context, rp_uuids=['rp2', 'rp1'])
+        self.assertEqual({'foo': 'bar'}, ret)
+        mock_get.assert_called_once_with(
+            '/allocations?resource_provider_uuid=in:rp1,rp2', version='1.31',
+            global_request_id=self.context.global_id)
+
+        mock_get.reset_mock()
+        ret = self.client.get_allocations_for_providers(
+            self.context, in_tree='rp1')
+        self.assertEqual({'foo': 'bar'}, ret)
+        mock_get.assert_called_once_with(
+            '/allocations?in_tree=rp1', version='1.31',
+            global_request_id=self.context.global_id)
+
+    @mock.patch("nova.scheduler.client.report.SchedulerReportClient.get")
+    def test_get_allocations_for_providers_none(self, mock_get):
+        self.assertEqual({}, self.client.get_allocations_for_providers(
+            self.context, rp_uuids=[]))
+        mock_get.assert_not_called()
+
+    @mock.patch("nova.scheduler.client.report.SchedulerReportClient.get")
+    def test_get_allocations_for_providers_fail(self, mock_get):
+        mock_get.return_value = fake_requests.FakeResponse(400, content="ouch")
+        self.assertRaises(exception.ResourceProviderAllocationRetrievalFailed,
+                          self.client.get_allocations_for_providers,
+                          self.context, in_tree='rp1')
+
+    @mock.patch("nova.scheduler.client.report.SchedulerReportClient."
+                "get_allocations_for_providers")
+    def test_get_allocations_for_provider_tree(self, mock_get):
+        self.client._provider_tree.new_root('node1', uuids.root)
+        self.client._provider_tree.new_child('child', uuids.root,
+                                             uuid=uuids.child)
+        ret = self.client.get_allocations_for_provider_tree(
+            self.context, 'node1')
+        self.assertEqual(mock_get.return_value, ret)
+        mock_get.assert_called_once_with(self.context, rp_uuids=mock.ANY)
+        self.assertEqual(set([uuids.root, uuids.child]),
+                         set(mock_get.call_args[1]['rp_uuids']))
+
+    def test_get_allocations_for_provider_tree_unknown_node(self):
+        self.assertRaises(ValueError,
+                          self.client.get_allocations_for_provider_tree,
+                          self.context, 'unknown')
+
     @mock.patch("nova.scheduler.client.report.SchedulerReportClient.get")
     def test_get_allocs_for_consumer(self, mock_get):
         mock_get.return_value = fake_requests.FakeResponse(
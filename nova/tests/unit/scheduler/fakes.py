@@ -21,6 +21,7 @@ import datetime
 from oslo_utils.fixture import uuidsentinel
 
 from nova import objects
+from nova.scheduler import aggregate_index
 from nova.scheduler import driver
 from nova.scheduler import host_manager
 
@@ -181,6 +182,20 @@ class FakeHostState(host_manager.HostState):
             setattr(self, key, val)
 
 
+def make_aggregate_index(aggregates, hosts):
+    """Return an AggregateIndex of the aggregates and FakeHostStates of the
+    hosts, whose aggregates are set accordingly.
+    """
+    index = aggregate_index.AggregateIndex()
+    for aggregate in aggregates:
+        index.update(aggregate)
+    host_states = [FakeHostState(host, 'node', {
+                       'aggregates': [aggregate for aggregate in aggregates
+                                      if host in aggregate.hosts]})
+                   for host in hosts]
+    return index, host_states
+
+
 class FakeScheduler(driver.Scheduler):
 
     def select_destinations(self, context, spec_obj, instance_uuids):
@@ -15,6 +15,7 @@ from oslo_utils.fixture import uuidsentinel as uuids
 
 from nova import objects
 from nova.scheduler.filters import affinity_filter
+from nova.scheduler import instance_index
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -249,3 +250,50 @@ class TestGroupAffinityFilter(test.NoDBTestCase):
     def test_group_affinity_filter_fails(self):
         self._test_group_affinity_filter_fails(
                 affinity_filter.ServerGroupAffinityFilter(), 'affinity')
+
+    def _get_group_hosts(self):
+        index = instance_index.InstanceIndex()
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i, {})
+                 for i in range(1, 5)]
+        hosts[0].instances = index.track('host1', {uuids.inst1: None})
+        hosts[1].instances = index.track('host2', {uuids.inst2: None,
+                                                   uuids.inst3: None})
+        hosts[2].instances = index.track('host3', {uuids.inst4: None})
+        # The instances of this host are not tracked by the index
+        hosts[3].instances = {uuids.inst5: None}
+        return hosts
+
+    def test_group_anti_affinity_filter_all(self):
+        filt_cls = affinity_filter.ServerGroupAntiAffinityFilter()
+        hosts = self._get_group_hosts()
+        spec_obj = objects.RequestSpec(
+            instance_group=objects.InstanceGroup(
+                policy='anti-affinity',
+                members=[uuids.inst1, uuids.inst2, uuids.inst3, uuids.inst5],
+                rules={'max_server_per_host': 2}),
+            instance_uuid=uuids.fake)
+
+        passing = list(filt_cls.filter_all(hosts, spec_obj))
+
+        self.assertEqual(['host1', 'host3', 'host4'],
+                         [host.host for host in passing])
+        self.assertEqual([host for host in hosts
+                          if filt_cls.host_passes(host, spec_obj)], passing)
+
+    def test_group_anti_affinity_filter_all_other_policy(self):
+        filt_cls = affinity_filter.ServerGroupAntiAffinityFilter()
+        hosts = self._get_group_hosts()
+        spec_obj = objects.RequestSpec(instance_group=objects.InstanceGroup(
+            policy='affinity', members=[uuids.inst1]))
+        self.assertEqual(hosts, list(filt_cls.filter_all(hosts, spec_obj)))
+
+    def test_group_affinity_filter_all(self):
+        filt_cls = affinity_filter.ServerGroupAffinityFilter()
+        hosts = self._get_group_hosts()
+        spec_obj = objects.RequestSpec(instance_group=objects.InstanceGroup(
+            policies=['affinity'], hosts=['host2', 'host4']))
+        self.assertEqual(['host2', 'host4'],
+                         [host.host for host in
+                          filt_cls.filter_all(hosts, spec_obj)])
+        spec_obj.instance_group.hosts = []
+        self.assertEqual(hosts, list(filt_cls.filter_all(hosts, spec_obj)))
@@ -148,3 +148,59 @@ class TestAggImagePropsIsolationFilter(test.NoDBTestCase):
                 os_type='linux')))
         host = fakes.FakeHostState('host1', 'compute', {})
         self.assertFalse(self.filt_cls.host_passes(host, spec_obj))
+
+
+class TestAggImagePropsIsolationAggregateIndex(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestAggImagePropsIsolationAggregateIndex, self).setUp()
+        self.filt_cls = aipi.AggregateImagePropertiesIsolation()
+        self.aggregates = [
+            objects.Aggregate(id=1, hosts=['host1', 'host2'],
+                              metadata={'hw_vm_mode': 'hvm',
+                                        'foo': 'bar'}),
+            objects.Aggregate(id=2, hosts=['host2', 'host3'],
+                              metadata={'hw_vm_mode': 'xen, exe',
+                                        'os_distro': 'fedora'})]
+
+    @staticmethod
+    def _make_spec(**properties):
+        return objects.RequestSpec(image=objects.ImageMeta(
+            properties=objects.ImageMetaProps(**properties)))
+
+    def _assert_same_hosts(self, aggregates, spec_obj, expected):
+        index, host_states = fakes.make_aggregate_index(
+            aggregates, ['host1', 'host2', 'host3', 'host4'])
+        selection = self.filt_cls.filter_aggregate_index(index, spec_obj)
+        passing = [host_state.host for host_state in host_states
+                   if selection is None or selection.passes(host_state.host)]
+        self.assertEqual(expected, passing)
+        # The same hosts pass the filter one by one.
+        self.assertEqual(passing, [host_state.host for host_state in
+                                   host_states
+                                   if self.filt_cls.host_passes(host_state,
+                                                                spec_obj)])
+
+    def test_no_image_properties(self):
+        self._assert_same_hosts(self.aggregates, self._make_spec(),
+                                ['host1', 'host2', 'host3', 'host4'])
+
+    def test_image_properties(self):
+        self._assert_same_hosts(self.aggregates,
+                                self._make_spec(hw_vm_mode='xen'),
+                                ['host2', 'host3', 'host4'])
+
+    def test_several_image_properties(self):
+        self._assert_same_hosts(
+            self.aggregates,
+            self._make_spec(hw_vm_mode='hvm', os_distro='ubuntu'),
+            ['host1', 'host4'])
+
+    def test_namespace(self):
+        self.flags(aggregate_image_properties_isolation_namespace='os',
+                   aggregate_image_properties_isolation_separator='_',
+                   group='filter_scheduler')
+        self._assert_same_hosts(
+            self.aggregates,
+            self._make_spec(hw_vm_mode='hvm', os_distro='ubuntu'),
+            ['host1', 'host4'])
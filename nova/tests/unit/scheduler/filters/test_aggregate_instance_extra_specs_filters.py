@@ -90,3 +90,61 @@ class TestAggregateInstanceExtraSpecsFilter(test.NoDBTestCase):
             'opt2': '222'
         }
         self._do_test_aggregate_filter_extra_specs(especs, passes=False)
+
+
+class TestAggregateInstanceExtraSpecsAggregateIndex(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestAggregateInstanceExtraSpecsAggregateIndex, self).setUp()
+        self.filt_cls = agg_specs.AggregateInstanceExtraSpecsFilter()
+        self.aggregates = [
+            objects.Aggregate(id=1, hosts=['host1', 'host2'],
+                              metadata={'ssd': 'true', 'gpus': '2'}),
+            objects.Aggregate(id=2, hosts=['host2', 'host3'],
+                              metadata={'gpus': '4'})]
+
+    @staticmethod
+    def _make_spec(extra_specs):
+        return objects.RequestSpec(
+            flavor=objects.Flavor(memory_mb=1024, extra_specs=extra_specs))
+
+    def _assert_same_hosts(self, aggregates, spec_obj, expected):
+        index, host_states = fakes.make_aggregate_index(
+            aggregates, ['host1', 'host2', 'host3', 'host4'])
+        selection = self.filt_cls.filter_aggregate_index(index, spec_obj)
+        passing = [host_state.host for host_state in host_states
+                   if selection is None or selection.passes(host_state.host)]
+        self.assertEqual(expected, passing)
+        # The same hosts pass the filter one by one.
+        self.assertEqual(passing, [host_state.host for host_state in
+                                   host_states
+                                   if self.filt_cls.host_passes(host_state,
+                                                                spec_obj)])
+
+    def test_no_extra_specs(self):
+        self._assert_same_hosts(self.aggregates, self._make_spec({}),
+                                ['host1', 'host2', 'host3', 'host4'])
+
+    def test_unscoped_and_other_scopes(self):
+        self._assert_same_hosts(
+            self.aggregates,
+            self._make_spec({'ssd': 'true', 'hw:numa_nodes': '1'}),
+            ['host1', 'host2'])
+
+    def test_scoped_operators(self):
+        self._assert_same_hosts(
+            self.aggregates,
+            self._make_spec({'aggregate_instance_extra_specs:gpus': '>= 3'}),
+            ['host2', 'host3'])
+
+    def test_several_extra_specs(self):
+        self._assert_same_hosts(
+            self.aggregates,
+            self._make_spec({'aggregate_instance_extra_specs:gpus': '4',
+                             'ssd': 'true'}),
+            ['host2'])
+
+    def test_no_match(self):
+        self._assert_same_hosts(
+            self.aggregates, self._make_spec({'foo': 'bar', 'ssd': 'true'}),
+            [])
@@ -63,3 +63,44 @@ class TestAggregateMultitenancyIsolationFilter(test.NoDBTestCase):
             context=mock.sentinel.ctx, project_id='my_tenantid')
         host = fakes.FakeHostState('host1', 'compute', {})
         self.assertTrue(self.filt_cls.host_passes(host, spec_obj))
+
+
+class TestAggregateMultitenancyIsolationAggregateIndex(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestAggregateMultitenancyIsolationAggregateIndex,
+              self).setUp()
+        self.filt_cls = ami.AggregateMultiTenancyIsolation()
+        self.aggregates = [
+            objects.Aggregate(id=1, hosts=['host1', 'host2'],
+                              metadata={'filter_tenant_id': 'tenant1'}),
+            objects.Aggregate(id=2, hosts=['host2', 'host3'],
+                              metadata={'filter_tenant_id':
+                                        'tenant2,tenant3'})]
+
+    def _assert_same_hosts(self, aggregates, spec_obj, expected):
+        index, host_states = fakes.make_aggregate_index(
+            aggregates, ['host1', 'host2', 'host3', 'host4'])
+        selection = self.filt_cls.filter_aggregate_index(index, spec_obj)
+        passing = [host_state.host for host_state in host_states
+                   if selection is None or selection.passes(host_state.host)]
+        self.assertEqual(expected, passing)
+        # The same hosts pass the filter one by one.
+        self.assertEqual(passing, [host_state.host for host_state in
+                                   host_states
+                                   if self.filt_cls.host_passes(host_state,
+                                                                spec_obj)])
+
+    def test_tenant_isolated(self):
+        self._assert_same_hosts(self.aggregates,
+                                objects.RequestSpec(project_id='tenant3'),
+                                ['host2', 'host3', 'host4'])
+
+    def test_tenant_not_isolated(self):
+        self._assert_same_hosts(self.aggregates,
+                                objects.RequestSpec(project_id='tenant4'),
+                                ['host4'])
+
+    def test_no_isolation(self):
+        self._assert_same_hosts([], objects.RequestSpec(project_id='tenant4'),
+                                ['host1', 'host2', 'host3', 'host4'])
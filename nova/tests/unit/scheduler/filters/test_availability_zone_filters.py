@@ -48,3 +48,50 @@ class TestAvailabilityZoneFilter(test.NoDBTestCase):
         request = self._make_zone_request('bad')
         host = fakes.FakeHostState('host1', 'node1', {})
         self.assertFalse(self.filt_cls.host_passes(host, request))
+
+
+class TestAvailabilityZoneFilterAggregateIndex(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestAvailabilityZoneFilterAggregateIndex, self).setUp()
+        self.filt_cls = availability_zone_filter.AvailabilityZoneFilter()
+        self.aggregates = [
+            objects.Aggregate(id=1, hosts=['host1', 'host2'],
+                              metadata={'availability_zone': 'az1'}),
+            objects.Aggregate(id=2, hosts=['host2', 'host3'],
+                              metadata={'availability_zone': 'nova'})]
+
+    def _assert_same_hosts(self, aggregates, spec_obj, expected):
+        index, host_states = fakes.make_aggregate_index(
+            aggregates, ['host1', 'host2', 'host3', 'host4'])
+        selection = self.filt_cls.filter_aggregate_index(index, spec_obj)
+        passing = [host_state.host for host_state in host_states
+                   if selection is None or selection.passes(host_state.host)]
+        self.assertEqual(expected, passing)
+        # The same hosts pass the filter one by one.
+        self.assertEqual(passing, [host_state.host for host_state in
+                                   host_states
+                                   if self.filt_cls.host_passes(host_state,
+                                                                spec_obj)])
+
+    def test_no_availability_zone(self):
+        self._assert_same_hosts(self.aggregates,
+                                objects.RequestSpec(availability_zone=None),
+                                ['host1', 'host2', 'host3', 'host4'])
+
+    def test_availability_zone(self):
+        self._assert_same_hosts(self.aggregates,
+                                objects.RequestSpec(availability_zone='az1'),
+                                ['host1', 'host2'])
+
+    def test_default_availability_zone(self):
+        self._assert_same_hosts(self.aggregates,
+                                objects.RequestSpec(availability_zone='nova'),
+                                ['host2', 'host3', 'host4'])
+
+    def test_rebuild(self):
+        spec_obj = objects.RequestSpec(availability_zone='az1',
+                                       scheduler_hints={
+                                           '_nova_check_type': ['rebuild']})
+        self.assertIsNone(self.filt_cls.filter_aggregate_index(
+            mock.sentinel.index, spec_obj))
@@ -14,6 +14,7 @@ import mock
 
 from nova import objects
 from nova.scheduler.filters import core_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -50,6 +51,27 @@ class TestCoreFilter(test.NoDBTestCase):
                  'cpu_allocation_ratio': 2})
         self.assertFalse(self.filt_cls.host_passes(host, spec_obj))
 
+    def test_core_filter_hosts_pass(self):
+        self.filt_cls = core_filter.CoreFilter()
+        spec_obj = objects.RequestSpec(flavor=objects.Flavor(vcpus=2))
+        hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                {'vcpus_total': 4, 'vcpus_used': 6,
+                 'cpu_allocation_ratio': 2}),
+            fakes.FakeHostState('host2', 'node2', {}),
+            fakes.FakeHostState('host3', 'node3',
+                {'vcpus_total': 4, 'vcpus_used': 7,
+                 'cpu_allocation_ratio': 2}),
+            fakes.FakeHostState('host4', 'node4',
+                {'vcpus_total': 1, 'vcpus_used': 0,
+                 'cpu_allocation_ratio': 2}),
+        ]
+        table = host_table.HostTable(hosts)
+        passes = self.filt_cls.hosts_pass(table, spec_obj)
+        self.assertEqual([True, True, False, False], passes.tolist())
+        self.assertEqual([{'vcpu': 8.0}, {}, {'vcpu': 8.0}, {'vcpu': 2.0}],
+                         [host.limits for host in hosts])
+
     @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
     def test_aggregate_core_filter_value_error(self, agg_mock):
         self.filt_cls = core_filter.AggregateCoreFilter()
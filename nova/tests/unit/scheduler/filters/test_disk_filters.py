@@ -14,6 +14,7 @@ import mock
 
 from nova import objects
 from nova.scheduler.filters import disk_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -52,6 +53,28 @@ class TestDiskFilter(test.NoDBTestCase):
         self.assertTrue(filt_cls.host_passes(host, spec_obj))
         self.assertEqual(12 * 10.0, host.limits['disk_gb'])
 
+    def test_disk_filter_hosts_pass(self):
+        filt_cls = disk_filter.DiskFilter()
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(
+                root_gb=3, ephemeral_gb=3, swap=1024))
+        hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                {'free_disk_mb': 1 * 1024, 'total_usable_disk_gb': 12,
+                 'disk_allocation_ratio': 10.0}),
+            fakes.FakeHostState('host2', 'node2',
+                {'free_disk_mb': 6 * 1024, 'total_usable_disk_gb': 13,
+                 'disk_allocation_ratio': 1.0}),
+            fakes.FakeHostState('host3', 'node3',
+                {'free_disk_mb': 6 * 1024, 'total_usable_disk_gb': 6,
+                 'disk_allocation_ratio': 10.0}),
+        ]
+        table = host_table.HostTable(hosts)
+        passes = filt_cls.hosts_pass(table, spec_obj)
+        self.assertEqual([True, False, False], passes.tolist())
+        self.assertEqual([{'disk_gb': 12 * 10.0}, {}, {}],
+                         [host.limits for host in hosts])
+
     def test_disk_filter_oversubscribe_single_instance_fails(self):
         filt_cls = disk_filter.DiskFilter()
         spec_obj = objects.RequestSpec(
@@ -293,3 +293,71 @@ class TestNUMATopologyFilter(test.NoDBTestCase):
                                       network_metadata=network_metadata)
 
         self.assertFalse(self.filt_cls.host_passes(host, spec_obj))
+
+    def _get_fit_hosts(self):
+        other_topology = fakes.NUMA_TOPOLOGY.obj_clone()
+        other_topology.cells[0].cpu_usage = 2
+        return [fakes.FakeHostState('host%s' % i, 'node%s' % i,
+                                    {'numa_topology': numa_topology,
+                                     'pci_stats': None,
+                                     'cpu_allocation_ratio': 16.0,
+                                     'ram_allocation_ratio': 1.5})
+                for i, numa_topology in enumerate(
+                    [fakes.NUMA_TOPOLOGY, other_topology,
+                     fakes.NUMA_TOPOLOGY.obj_clone()])]
+
+    @mock.patch('nova.virt.hardware.numa_fit_instance_to_host')
+    def test_numa_topology_filter_all_reuses_fit(self, mock_fit):
+        instance_topology = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=0, cpuset=set([1]), memory=512)
+               ])
+        spec_obj = self._get_spec_obj(numa_topology=instance_topology)
+        hosts = self._get_fit_hosts()
+        mock_fit.side_effect = [instance_topology, None] * 2
+
+        passing = list(self.filt_cls.filter_all(hosts, spec_obj))
+
+        self.assertEqual([hosts[0], hosts[2]], passing)
+        # The first and last hosts have the same NUMA topology and usage
+        self.assertEqual(2, mock_fit.call_count)
+        self.assertIn('numa_topology', hosts[2].limits)
+        # The results are not kept across the requests by default
+        list(self.filt_cls.filter_all(hosts, spec_obj))
+        self.assertEqual(4, mock_fit.call_count)
+
+    @mock.patch('nova.virt.hardware.numa_fit_instance_to_host')
+    def test_numa_topology_filter_all_fit_cache(self, mock_fit):
+        self.flags(numa_fit_cache_size=1, group='filter_scheduler')
+        instance_topology = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=0, cpuset=set([1]), memory=512)
+               ])
+        spec_obj = self._get_spec_obj(numa_topology=instance_topology)
+        hosts = self._get_fit_hosts()
+        mock_fit.return_value = instance_topology
+
+        self.assertEqual(hosts, list(self.filt_cls.filter_all(hosts,
+                                                             spec_obj)))
+        self.assertEqual(2, mock_fit.call_count)
+        # Only the result of the second host was kept
+        self.assertEqual(hosts[1:2],
+                         list(self.filt_cls.filter_all(hosts[1:2],
+                                                       spec_obj)))
+        self.assertEqual(2, mock_fit.call_count)
+        self.assertEqual(hosts[:1],
+                         list(self.filt_cls.filter_all(hosts[:1], spec_obj)))
+        self.assertEqual(3, mock_fit.call_count)
+
+    @mock.patch('nova.virt.hardware.numa_fit_instance_to_host')
+    def test_numa_topology_filter_all_pci_requests(self, mock_fit):
+        instance_topology = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=0, cpuset=set([1]), memory=512)
+               ])
+        spec_obj = self._get_spec_obj(numa_topology=instance_topology)
+        spec_obj.pci_requests = objects.InstancePCIRequests(requests=[
+            objects.InstancePCIRequest(count=1, spec=[])])
+        hosts = self._get_fit_hosts()
+        mock_fit.return_value = instance_topology
+
+        self.assertEqual(hosts, list(self.filt_cls.filter_all(hosts,
+                                                             spec_obj)))
+        self.assertEqual(3, mock_fit.call_count)
@@ -14,6 +14,7 @@ import mock
 
 from nova import objects
 from nova.scheduler.filters import ram_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -57,6 +58,30 @@ class TestRamFilter(test.NoDBTestCase):
                  'ram_allocation_ratio': 2.0})
         self.assertFalse(self.filt_cls.host_passes(host, spec_obj))
 
+    def test_ram_filter_hosts_pass(self):
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(memory_mb=1024))
+        hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                {'free_ram_mb': 1023, 'total_usable_ram_mb': 1024,
+                 'ram_allocation_ratio': 1.0}),
+            fakes.FakeHostState('host2', 'node2',
+                {'free_ram_mb': 1024, 'total_usable_ram_mb': 1024,
+                 'ram_allocation_ratio': 1.0}),
+            fakes.FakeHostState('host3', 'node3',
+                {'free_ram_mb': -1024, 'total_usable_ram_mb': 2048,
+                 'ram_allocation_ratio': 2.0}),
+            fakes.FakeHostState('host4', 'node4',
+                {'free_ram_mb': 512, 'total_usable_ram_mb': 512,
+                 'ram_allocation_ratio': 2.0}),
+        ]
+        table = host_table.HostTable(hosts)
+        passes = self.filt_cls.hosts_pass(table, spec_obj)
+        self.assertEqual([False, True, True, False], passes.tolist())
+        self.assertEqual([{}, {'memory_mb': 1024.0},
+                          {'memory_mb': 2048 * 2.0}, {}],
+                         [host.limits for host in hosts])
+
 
 @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
 class TestAggregateRamFilter(test.NoDBTestCase):
@@ -0,0 +1,75 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For AggregateIndex.
+"""
+
+from nova import objects
+from nova.scheduler import aggregate_index
+from nova import test
+
+
+class AggregateIndexTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(AggregateIndexTestCase, self).setUp()
+        self.index = aggregate_index.AggregateIndex()
+        self.agg1 = objects.Aggregate(
+            id=1, hosts=['host1', 'host2'],
+            metadata={'availability_zone': 'az1', 'ssd': 'true'})
+        self.agg2 = objects.Aggregate(
+            id=2, hosts=['host2', 'host3'],
+            metadata={'filter_tenant_id': 'tenant1, tenant2', 'ssd': 'true'})
+        self.index.update(self.agg1)
+        self.index.update(self.agg2)
+
+    def test_lookups(self):
+        self.assertEqual({'availability_zone', 'ssd', 'filter_tenant_id'},
+                         set(self.index.keys()))
+        self.assertIn('ssd', self.index)
+        self.assertNotIn('foo', self.index)
+        self.assertEqual(['true'], self.index.values('ssd'))
+        self.assertEqual([], self.index.values('foo'))
+        self.assertEqual({'host1', 'host2', 'host3'},
+                         self.index.hosts_with_key('ssd'))
+        self.assertEqual(set(), self.index.hosts_with_key('foo'))
+        self.assertEqual({'host2', 'host3'},
+                         self.index.hosts_with_value('filter_tenant_id',
+                                                     'tenant2'))
+        self.assertEqual(set(), self.index.hosts_with_value('ssd', 'false'))
+
+    def test_update(self):
+        self.agg1.hosts = ['host4']
+        self.agg1.metadata = {'availability_zone': 'az2'}
+        self.index.update(self.agg1)
+
+        self.assertEqual({'host4'},
+                         self.index.hosts_with_value('availability_zone',
+                                                     'az2'))
+        self.assertEqual(set(),
+                         self.index.hosts_with_value('availability_zone',
+                                                     'az1'))
+        self.assertEqual({'host2', 'host3'}, self.index.hosts_with_key('ssd'))
+
+    def test_remove(self):
+        self.index.remove(2)
+        self.index.remove(3)
+
+        self.assertEqual({'availability_zone', 'ssd'}, set(self.index.keys()))
+        self.assertEqual({'host1', 'host2'}, self.index.hosts_with_key('ssd'))
+
+    def test_host_selection(self):
+        selection = aggregate_index.select({'host1'})
+        self.assertTrue(selection.passes('host1'))
+        self.assertFalse(selection.passes('host2'))
+        selection = aggregate_index.exclude({'host1'})
+        self.assertFalse(selection.passes('host1'))
+        self.assertTrue(selection.passes('host2'))
@@ -0,0 +1,101 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the scheduler benchmark.
+"""
+
+import os
+
+import fixtures
+from oslo_utils.fixture import uuidsentinel as uuids
+
+from nova import test
+from nova.tests.benchmarks.scheduler import corpus
+from nova.tests.benchmarks.scheduler import fleet as fleet_module
+from nova.tests.benchmarks.scheduler import runner
+
+
+class SchedulerBenchmarkTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(SchedulerBenchmarkTestCase, self).setUp()
+        self.flags(enabled_filters=runner.BENCHMARK_FILTERS,
+                   group='filter_scheduler')
+        self.fleet = fleet_module.Fleet(hosts=12, cells=2, seed=1)
+
+    def test_fleet(self):
+        self.assertEqual(12, len(self.fleet.hosts))
+        self.assertEqual(2, len(self.fleet.compute_nodes))
+        self.assertEqual(['az1', 'az2', 'az3'],
+                         [agg.availability_zone
+                          for agg in self.fleet.aggregates[:3]])
+        for compute in self.fleet.compute_nodes_by_uuid.values():
+            self.assertEqual(len(self.fleet.instances[compute.host]),
+                             compute.running_vms)
+            self.assertLessEqual(compute.vcpus_used, compute.vcpus)
+
+    def test_fleet_is_reproducible(self):
+        fleet = fleet_module.Fleet(hosts=12, cells=2, seed=1)
+        self.assertEqual(sorted(self.fleet.compute_nodes_by_uuid),
+                         sorted(fleet.compute_nodes_by_uuid))
+
+    def test_consume_and_release(self):
+        compute = self.fleet.compute_nodes[self.fleet.cells[0].uuid][0]
+        vcpus_used = compute.vcpus_used
+        resources = {'VCPU': 2, 'MEMORY_MB': 512, 'DISK_GB': 1}
+        self.fleet.consume(compute.uuid, resources, uuids.instance)
+        self.assertEqual(vcpus_used + 2, compute.vcpus_used)
+        self.assertIn(uuids.instance, self.fleet.instances[compute.host])
+        self.fleet.release(compute.uuid, resources, uuids.instance)
+        self.assertEqual(vcpus_used, compute.vcpus_used)
+        self.assertNotIn(uuids.instance, self.fleet.instances[compute.host])
+
+    def test_corpus_dump_and_load(self):
+        specs = corpus.generate(self.fleet, 5, seed=2)
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'corpus.json')
+        corpus.dump(specs, path)
+        loaded = corpus.load(path)
+        self.assertEqual([spec.obj_to_primitive() for spec in specs],
+                         [spec.obj_to_primitive() for spec in loaded])
+
+    def test_fake_placement_claim_exceeding_capacity(self):
+        placement = runner.FakePlacement(self.fleet)
+        compute = self.fleet.compute_nodes[self.fleet.cells[0].uuid][0]
+        alloc_req = {'allocations': {compute.uuid: {
+            'resources': {'DISK_GB': compute.local_gb + 1}}}}
+        self.assertFalse(placement.claim_resources(
+            None, uuids.instance, alloc_req, 'fake-project', 'fake-user',
+            '1.29'))
+        self.assertEqual(1, placement.claims)
+
+    def test_run(self):
+        specs = corpus.generate(self.fleet, 10, seed=2)
+        instances = sum(len(i) for i in self.fleet.instances.values())
+
+        results = runner.run(self.fleet, specs, seed=2)
+
+        self.assertEqual(10, results['config']['requests'])
+        self.assertEqual(instances + results['summary']['instances'],
+                         sum(len(i) for i in self.fleet.instances.values()))
+        self.assertLessEqual(results['latency_ms']['p50'],
+                             results['latency_ms']['p99'])
+        self.assertGreaterEqual(results['claims_per_request']['mean'], 1)
+        self.assertEqual(set(runner.BENCHMARK_FILTERS),
+                         set(results['filters']))
+        self.assertIn('RAMWeigher', results['weighers'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, runner.percentile(values, 50))
+        self.assertEqual(99, runner.percentile(values, 99))
+        self.assertEqual(1, runner.percentile([1], 99))
+        self.assertEqual(0, runner.percentile([], 50))
@@ -26,6 +26,8 @@ from nova.scheduler import client
 from nova.scheduler.client import report
 from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
+from nova.scheduler import host_ranking
+from nova.scheduler import timing
 from nova.scheduler import utils as scheduler_utils
 from nova.scheduler import weights
 from nova import test  # noqa
@@ -252,6 +254,13 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
     def test_schedule_successful_claim(self):
         self._test_schedule_successful_claim()
 
+    def test_schedule_successful_claim_timed(self):
+        timings = timing.RequestTimings()
+        with mock.patch.object(timing, '_get_request_timings',
+                               return_value=timings):
+            self._test_schedule_successful_claim()
+        self.assertEqual([timing.CLAIM_RESOURCES], list(timings.durations))
+
     def test_schedule_old_reqspec_and_move_operation(self):
         """This test is for verifying that in case of a move operation with an
         original RequestSpec created for 3 concurrent instances, we only verify
@@ -731,6 +740,294 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         # (as the host_subset_size is 1) and the tail should stay the same.
         self.assertEqual([hs2, hs1, hs3, hs4], results)
 
+    def test_get_host_ranking(self):
+        self.assertIsNone(self.driver._get_host_ranking(3))
+
+        self.flags(incremental_host_ranking=True, host_subset_size=2,
+                   group='filter_scheduler')
+        self.flags(max_attempts=4, group='scheduler')
+        self.assertIsNone(self.driver._get_host_ranking(1))
+        ranking = self.driver._get_host_ranking(3)
+        self.assertIsInstance(ranking, host_ranking.HostRanking)
+        self.assertEqual(6, ranking.size)
+        self.assertEqual(self.driver.host_manager, ranking.host_manager)
+
+    @mock.patch('random.choice', side_effect=lambda x: x[1])
+    @mock.patch('nova.scheduler.host_manager.HostManager.get_filtered_hosts')
+    def test_get_candidate_hosts_ranking(self, mock_filt, mock_rand):
+        self.flags(host_subset_size=2, group='filter_scheduler')
+        hs1 = mock.Mock(spec=host_manager.HostState, host='host1')
+        hs2 = mock.Mock(spec=host_manager.HostState, host='host2')
+        hs3 = mock.Mock(spec=host_manager.HostState, host='host3')
+        ranking = mock.Mock(spec=host_ranking.HostRanking)
+        ranking.get_weighed_hosts.return_value = [
+            weights.WeighedHost(hs1, 1.0),
+            weights.WeighedHost(hs2, 0.5),
+            weights.WeighedHost(hs3, 0.0),
+        ]
+
+        results = self.driver._get_candidate_hosts(mock.sentinel.spec,
+            mock.sentinel.host_states, mock.sentinel.index, ranking)
+
+        ranking.get_weighed_hosts.assert_called_once_with(mock.sentinel.spec,
+            mock.sentinel.host_states, mock.sentinel.index)
+        # The hosts are only filtered and weighed by the ranking.
+        mock_filt.assert_not_called()
+        self.assertEqual([hs2, hs1, hs3], results)
+
+    def test_get_candidate_hosts_ranking_no_hosts(self):
+        ranking = mock.Mock(spec=host_ranking.HostRanking)
+        ranking.get_weighed_hosts.return_value = []
+
+        self.assertEqual([], self.driver._get_candidate_hosts(
+            mock.sentinel.spec, [], 1, ranking))
+
+    @mock.patch('nova.scheduler.host_ranking.HostRanking')
+    @mock.patch('nova.scheduler.utils.claim_resources')
+    @mock.patch('nova.scheduler.filter_scheduler.FilterScheduler.'
+                '_get_all_host_states')
+    @mock.patch('nova.scheduler.filter_scheduler.FilterScheduler.'
+                '_get_sorted_hosts')
+    def test_schedule_incremental_ranking(self, mock_get_hosts,
+            mock_get_all_states, mock_claim, mock_ranking_cls):
+        """Tests that the ranking is reused across the instances of the
+        request, and that the other hosts are tried when claiming fails for
+        all of the ranked hosts.
+        """
+        self.flags(incremental_host_ranking=True, group='filter_scheduler')
+        spec_obj = objects.RequestSpec(num_instances=2, instance_group=None,
+                                       instance_uuid=uuids.instance0)
+        hs1 = mock.Mock(spec=host_manager.HostState, host='host1',
+                nodename="node1", limits={}, uuid=uuids.cn1,
+                cell_uuid=uuids.cell1, instances={})
+        hs2 = mock.Mock(spec=host_manager.HostState, host='host2',
+                nodename="node2", limits={}, uuid=uuids.cn2,
+                cell_uuid=uuids.cell1, instances={})
+        mock_get_all_states.return_value = mock.sentinel.all_host_states
+        ranking = mock_ranking_cls.return_value
+        ranking.get_weighed_hosts.return_value = [
+            weights.WeighedHost(hs1, 1.0)]
+        ranking.get_hosts.return_value = [hs1, hs2]
+        mock_get_hosts.return_value = [hs2]
+        # Claiming fails against hs1 for the first instance only.
+        mock_claim.side_effect = [False, True, True]
+        alloc_reqs_by_rp_uuid = {
+            uuids.cn1: [{"allocations": "fake_cn1_alloc"}],
+            uuids.cn2: [{"allocations": "fake_cn2_alloc"}],
+        }
+        instance_uuids = [uuids.instance0, uuids.instance1]
+
+        selected_hosts = self.driver._schedule(self.context, spec_obj,
+            instance_uuids, alloc_reqs_by_rp_uuid,
+            mock.sentinel.provider_summaries)
+
+        self.assertEqual([hs2.host, hs1.host],
+                         [sel[0].service_host for sel in selected_hosts])
+        ranking.get_weighed_hosts.assert_has_calls([
+            mock.call(spec_obj, mock.sentinel.all_host_states, 0),
+            mock.call(spec_obj, [hs2], 1)])
+        ranking.invalidate.assert_called_once_with()
+        mock_get_hosts.assert_called_once_with(spec_obj, [hs2], 0)
+        ranking.consume.assert_has_calls([mock.call(hs2), mock.call(hs1)])
+
+    def test_use_bulk_claim(self):
+        spec_obj = objects.RequestSpec()
+        instance_uuids = [uuids.instance0, uuids.instance1]
+        self.assertFalse(self.driver._use_bulk_claim(spec_obj,
+            instance_uuids, '1.29'))
+
+        self.flags(bulk_claim_resources=True, group='filter_scheduler')
+        self.assertTrue(self.driver._use_bulk_claim(spec_obj,
+            instance_uuids, '1.29'))
+        self.assertTrue(self.driver._use_bulk_claim(spec_obj,
+            instance_uuids, '1.28'))
+        # The consumer generation is needed not to overwrite allocations.
+        self.assertFalse(self.driver._use_bulk_claim(spec_obj,
+            instance_uuids, '1.27'))
+        self.assertFalse(self.driver._use_bulk_claim(spec_obj,
+            instance_uuids, None))
+        self.assertFalse(self.driver._use_bulk_claim(spec_obj,
+            [uuids.instance0], '1.29'))
+
+    def _get_bulk_claim_hosts(self):
+        self.flags(bulk_claim_resources=True, group='filter_scheduler')
+        spec_obj = objects.RequestSpec(num_instances=2, instance_group=None,
+                                       project_id=uuids.project_id,
+                                       instance_uuid=uuids.instance0)
+        hs1 = mock.Mock(spec=host_manager.HostState, host='host1',
+                nodename="node1", limits={}, uuid=uuids.cn1,
+                cell_uuid=uuids.cell1, instances={}, updated=None)
+        hs2 = mock.Mock(spec=host_manager.HostState, host='host2',
+                nodename="node2", limits={}, uuid=uuids.cn2,
+                cell_uuid=uuids.cell1, instances={}, updated=None)
+        hs3 = mock.Mock(spec=host_manager.HostState, host='host3',
+                nodename="node3", limits={}, uuid=uuids.cn3,
+                cell_uuid=uuids.cell1, instances={}, updated=None)
+        alloc_reqs_by_rp_uuid = {
+            uuids.cn1: [{"allocations": "fake_cn1_alloc"}],
+            uuids.cn2: [{"allocations": "fake_cn2_alloc"}],
+            uuids.cn3: [{"allocations": "fake_cn3_alloc"}],
+        }
+        return spec_obj, hs1, hs2, hs3, alloc_reqs_by_rp_uuid
+
+    @mock.patch('nova.scheduler.utils.claim_resources')
+    @mock.patch('nova.scheduler.utils.claim_resources_in_bulk',
+                return_value=True)
+    @mock.patch('nova.scheduler.filter_scheduler.FilterScheduler.'
+                '_get_all_host_states')
+    @mock.patch('nova.scheduler.filter_scheduler.FilterScheduler.'
+                '_get_sorted_hosts')
+    def test_schedule_bulk_claim(self, mock_get_hosts, mock_get_all_states,
+            mock_bulk_claim, mock_claim):
+        """Tests that the resources of all of the instances are claimed with
+        a single call once their hosts are selected.
+        """
+        spec_obj, hs1, hs2, hs3, alloc_reqs_by_rp_uuid = (
+            self._get_bulk_claim_hosts())
+        mock_get_all_states.return_value = mock.sentinel.all_host_states
+        mock_get_hosts.side_effect = [[hs1, hs2], [hs2, hs1]]
+        instance_uuids = [uuids.instance0, uuids.instance1]
+
+        ctx = mock.Mock()
+        selected_hosts = self.driver._schedule(ctx, spec_obj,
+            instance_uuids, alloc_reqs_by_rp_uuid,
+            mock.sentinel.provider_summaries,
+            allocation_request_version='1.29')
+
+        self.assertEqual([hs1.host, hs2.host],
+                         [sel[0].service_host for sel in selected_hosts])
+        mock_bulk_claim.assert_called_once_with(
+            ctx.elevated.return_value, self.placement_client,
+            spec_obj, {uuids.instance0: {"allocations": "fake_cn1_alloc"},
+                       uuids.instance1: {"allocations": "fake_cn2_alloc"}},
+            '1.29')
+        mock_claim.assert_not_called()
+        hs1.consume_from_request.assert_called_once_with(spec_obj)
+        hs2.consume_from_request.assert_called_once_with(spec_obj)
+
+    @mock.patch('nova.scheduler.utils.claim_resources')
+    @mock.patch('nova.scheduler.utils.claim_resources_in_bulk',
+                return_value=False)
+    @mock.patch('nova.scheduler.filter_scheduler.FilterScheduler.'
+                '_get_all_host_states')
+    @mock.patch('nova.scheduler.filter_scheduler.FilterScheduler.'
+                '_get_sorted_hosts')
+    def test_schedule_bulk_claim_fails(self, mock_get_hosts,
+            mock_get_all_states, mock_bulk_claim, mock_claim):
+        """Tests that when the bulk claim fails, the resources of each
+        instance are claimed separately and only the instances whose claim
+        fails against their selected host are scheduled again.
+        """
+        spec_obj, hs1, hs2, hs3, alloc_reqs_by_rp_uuid = (
+            self._get_bulk_claim_hosts())
+        mock_get_all_states.return_value = mock.sentinel.all_host_states
+        mock_get_hosts.side_effect = [[hs1, hs2], [hs2, hs1], [hs2, hs3]]
+        # Claiming fails against hs2 for the second instance.
+        mock_claim.side_effect = [True, False, True]
+        instance_uuids = [uuids.instance0, uuids.instance1]
+
+        ctx = mock.Mock()
+        selected_hosts = self.driver._schedule(ctx, spec_obj,
+            instance_uuids, alloc_reqs_by_rp_uuid,
+            mock.sentinel.provider_summaries,
+            allocation_request_version='1.29')
+
+        self.assertEqual([hs1.host, hs3.host],
+                         [sel[0].service_host for sel in selected_hosts])
+        mock_bulk_claim.assert_called_once()
+        elevated = ctx.elevated.return_value
+        mock_claim.assert_has_calls([
+            mock.call(elevated, self.placement_client, spec_obj,
+                      uuids.instance0, {"allocations": "fake_cn1_alloc"},
+                      allocation_request_version='1.29'),
+            mock.call(elevated, self.placement_client, spec_obj,
+                      uuids.instance1, {"allocations": "fake_cn2_alloc"},
+                      allocation_request_version='1.29'),
+            mock.call(elevated, self.placement_client, spec_obj,
+                      uuids.instance1, {"allocations": "fake_cn3_alloc"},
+                      allocation_request_version='1.29')])
+        # Only the second instance is scheduled again.
+        mock_get_hosts.assert_called_with(spec_obj, [hs2, hs1], 1)
+        self.assertEqual(3, mock_get_hosts.call_count)
+        hs3.consume_from_request.assert_called_once_with(spec_obj)
+
+    @mock.patch('nova.scheduler.utils.claim_resources',
+                side_effect=[True, False])
+    @mock.patch('nova.scheduler.utils.claim_resources_in_bulk',
+                return_value=False)
+    @mock.patch('nova.scheduler.filter_scheduler.FilterScheduler.'
+                '_get_sorted_hosts')
+    def _test_bulk_claim_hosts_fails(self, mock_get_hosts, mock_bulk_claim,
+            mock_claim, restored=True):
+        spec_obj, hs1, hs2, hs3, alloc_reqs_by_rp_uuid = (
+            self._get_bulk_claim_hosts())
+        spec_obj.instance_group = objects.InstanceGroup(hosts=[])
+        for hs in (hs1, hs2):
+            hs.restore_consumption.return_value = restored
+        # The second instance can only be placed on hs2, where its claim
+        # fails.
+        mock_get_hosts.side_effect = [[hs1, hs2], [hs2, hs1], [hs2]]
+        instance_uuids = [uuids.instance0, uuids.instance1]
+
+        claimed_hosts, claimed_instance_uuids, _hosts, _num = (
+            self.driver._bulk_claim_hosts(self.context, spec_obj,
+                instance_uuids, mock.sentinel.hosts, alloc_reqs_by_rp_uuid,
+                '1.29', None))
+
+        self.assertEqual([hs1], claimed_hosts)
+        self.assertEqual([uuids.instance0], claimed_instance_uuids)
+        for hs in (hs1, hs2):
+            hs.save_consumption.assert_called_once_with()
+            hs.restore_consumption.assert_called_once_with(
+                hs.save_consumption.return_value, None)
+        # The host and the stub instance of the unclaimed instance are
+        # forgotten.
+        self.assertEqual(['host1'], spec_obj.instance_group.hosts)
+        self.assertEqual([uuids.instance0], list(hs1.instances))
+        self.assertEqual({}, hs2.instances)
+        return hs1, hs2
+
+    def test_bulk_claim_hosts_fails_restored(self):
+        """Tests that the consumption of the selected hosts is undone when
+        the bulk claim fails, and only redone for the claimed instances.
+        """
+        hs1, hs2 = self._test_bulk_claim_hosts_fails()
+        self.assertEqual(2, hs1.consume_from_request.call_count)
+        self.assertEqual(1, hs2.consume_from_request.call_count)
+
+    def test_bulk_claim_hosts_fails_updated(self):
+        """Tests that the consumption of the selected hosts is kept when
+        they were updated in the meantime.
+        """
+        hs1, hs2 = self._test_bulk_claim_hosts_fails(restored=False)
+        self.assertEqual(1, hs1.consume_from_request.call_count)
+        self.assertEqual(1, hs2.consume_from_request.call_count)
+
+    @mock.patch('nova.scheduler.filter_scheduler.FilterScheduler.'
+                '_cleanup_allocations')
+    @mock.patch('nova.scheduler.utils.claim_resources_in_bulk')
+    @mock.patch('nova.scheduler.filter_scheduler.FilterScheduler.'
+                '_get_all_host_states')
+    @mock.patch('nova.scheduler.filter_scheduler.FilterScheduler.'
+                '_get_sorted_hosts')
+    def test_schedule_bulk_claim_no_hosts(self, mock_get_hosts,
+            mock_get_all_states, mock_bulk_claim, mock_cleanup):
+        """Tests that nothing is claimed if there is no host for one of the
+        instances.
+        """
+        spec_obj, hs1, hs2, hs3, alloc_reqs_by_rp_uuid = (
+            self._get_bulk_claim_hosts())
+        mock_get_all_states.return_value = mock.sentinel.all_host_states
+        mock_get_hosts.side_effect = [[hs1], []]
+
+        self.assertRaises(exception.NoValidHost, self.driver._schedule,
+            self.context, spec_obj, [uuids.instance0, uuids.instance1],
+            alloc_reqs_by_rp_uuid, mock.sentinel.provider_summaries,
+            allocation_request_version='1.29')
+
+        mock_bulk_claim.assert_not_called()
+        mock_cleanup.assert_not_called()
+
     def test_cleanup_allocations(self):
         instance_uuids = []
         # Check we don't do anything if there's no instance UUIDs to cleanup
@@ -24,7 +24,11 @@ from six.moves import range
 from nova import filters
 from nova import loadables
 from nova import objects
+from nova.scheduler import aggregate_index
+from nova.scheduler import filters as host_filters
+from nova.scheduler import host_table
 from nova import test
+from nova.tests.unit.scheduler import fakes
 
 
 class Filter1(filters.BaseFilter):
@@ -37,6 +41,17 @@ class Filter2(filters.BaseFilter):
     pass
 
 
+class NumInstancesBelowFilter(filters.BaseFilter):
+    """Test Filter class evaluating a whole table at once."""
+    vectorized = True
+
+    def __init__(self, max_instances):
+        self.max_instances = max_instances
+
+    def filter_table(self, table, spec_obj):
+        return table.num_instances < self.max_instances
+
+
 class FiltersTestCase(test.NoDBTestCase):
 
     def setUp(self):
@@ -265,3 +280,92 @@ class FiltersTestCase(test.NoDBTestCase):
             cargs = mock_log.call_args[0][0]
             self.assertIn("with instance ID '%s'" % fake_uuid, cargs)
             self.assertIn(exp_output, cargs)
+
+    def test_get_filtered_objects_vectorized(self):
+        hosts = [fakes.FakeHostState('host%s' % i, 'node',
+                                     {'num_instances': i})
+                 for i in range(5)]
+        spec_obj = objects.RequestSpec()
+        filt1 = NumInstancesBelowFilter(4)
+        filt2 = NumInstancesBelowFilter(3)
+        filt3 = mock.Mock(Filter1)
+        filt3.vectorized = False
+        filt3.filter_all.side_effect = lambda objs, spec: objs[1:]
+        filt4 = NumInstancesBelowFilter(2)
+
+        with mock.patch.object(host_table, 'HostTable',
+                               wraps=host_table.HostTable) as mock_table:
+            self.filter_handler.table_class = mock_table
+            result = self.filter_handler.get_filtered_objects(
+                [filt1, filt2, filt3, filt4], hosts, spec_obj)
+
+        self.assertEqual([hosts[1]], result)
+        filt3.filter_all.assert_called_once_with(hosts[:3], spec_obj)
+        # The table is built once for the first two filters, then once again
+        # after the per-object filter.
+        mock_table.assert_has_calls([mock.call(hosts), mock.call(hosts[1:3])])
+        self.assertEqual(2, mock_table.call_count)
+
+
+class HostFilterHandlerTestCase(test.NoDBTestCase):
+
+    def test_table_class_disabled(self):
+        handler = host_filters.HostFilterHandler()
+        self.assertIsNone(handler.table_class)
+
+    def test_table_class(self):
+        self.flags(vectorize_filters=True, group='filter_scheduler')
+        handler = host_filters.HostFilterHandler()
+        self.assertIs(host_table.HostTable, handler.table_class)
+
+    @mock.patch('nova.scheduler.filters.LOG')
+    @mock.patch.object(host_table, 'numpy', None)
+    def test_table_class_no_numpy(self, mock_log):
+        self.flags(vectorize_filters=True, group='filter_scheduler')
+        handler = host_filters.HostFilterHandler()
+        self.assertIsNone(handler.table_class)
+        self.assertTrue(mock_log.warning.called)
+
+    def _test_run_filter_with_aggregate_index(self, table_class=None):
+        hosts = [fakes.FakeHostState('host%s' % i, 'node', {})
+                 for i in range(3)]
+        spec_obj = objects.RequestSpec()
+        filt = mock.Mock(uses_aggregate_index=True, vectorized=False)
+        filt.filter_aggregate_index.return_value = aggregate_index.exclude(
+            {'host1'})
+        handler = host_filters.HostFilterHandler()
+        handler.aggregate_index = mock.sentinel.index
+        handler.table_class = table_class
+
+        result = handler.get_filtered_objects([filt], hosts, spec_obj)
+
+        self.assertEqual([hosts[0], hosts[2]], result)
+        filt.filter_aggregate_index.assert_called_once_with(
+            mock.sentinel.index, spec_obj)
+        self.assertFalse(filt.filter_all.called)
+
+    def test_run_filter_with_aggregate_index(self):
+        self._test_run_filter_with_aggregate_index()
+
+    def test_run_filter_with_aggregate_index_vectorized(self):
+        self._test_run_filter_with_aggregate_index(host_table.HostTable)
+
+    def test_run_filter_with_aggregate_index_all_pass(self):
+        hosts = [fakes.FakeHostState('host1', 'node', {})]
+        filt = mock.Mock(uses_aggregate_index=True)
+        filt.filter_aggregate_index.return_value = None
+        handler = host_filters.HostFilterHandler()
+        handler.aggregate_index = mock.sentinel.index
+
+        self.assertEqual(hosts, handler.get_filtered_objects(
+            [filt], hosts, objects.RequestSpec()))
+
+    def test_run_filter_without_aggregate_index(self):
+        hosts = [fakes.FakeHostState('host1', 'node', {})]
+        filt = mock.Mock(uses_aggregate_index=True, vectorized=False)
+        filt.filter_all.return_value = iter(hosts)
+        handler = host_filters.HostFilterHandler()
+
+        self.assertEqual(hosts, handler.get_filtered_objects(
+            [filt], hosts, objects.RequestSpec()))
+        self.assertFalse(filt.filter_aggregate_index.called)
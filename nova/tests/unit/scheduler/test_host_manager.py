@@ -22,7 +22,9 @@ import datetime
 
 import mock
 from oslo_serialization import jsonutils
+from oslo_utils import fixture as utils_fixture
 from oslo_utils.fixture import uuidsentinel as uuids
+from oslo_utils import timeutils
 from oslo_utils import versionutils
 import six
 
@@ -161,6 +163,8 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertIn(uuids.instance_1, fake_info['instances'])
         self.assertIn(uuids.instance_2, fake_info['instances'])
         self.assertNotIn(uuids.instance_3, fake_info['instances'])
+        self.assertEqual({'host2'},
+                         hm.instance_index.hosts(uuids.instance_3))
         exp_filters = {'deleted': False, 'host': [u'host1', u'host2']}
         mock_get_by_filters.assert_called_once_with(mock.ANY, exp_filters)
 
@@ -254,6 +258,19 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual({'fake-host': set([])},
                          self.host_manager.host_aggregates_map)
 
+    def test_aggregate_index(self):
+        self.assertIs(self.host_manager.aggregate_index,
+                      self.host_manager.filter_handler.aggregate_index)
+        fake_agg = objects.Aggregate(id=1, hosts=['fake-host'],
+                                     metadata={'ssd': 'true'})
+        self.host_manager.update_aggregates([fake_agg])
+        self.assertEqual({'fake-host'},
+                         self.host_manager.aggregate_index.hosts_with_value(
+                             'ssd', 'true'))
+        self.host_manager.delete_aggregate(fake_agg)
+        self.assertEqual(
+            set(), self.host_manager.aggregate_index.hosts_with_key('ssd'))
+
     def test_choose_host_filters_not_found(self):
         self.assertRaises(exception.SchedulerHostFilterNotFound,
                           self.host_manager._choose_host_filters,
@@ -285,6 +302,29 @@ class HostManagerTestCase(test.NoDBTestCase):
             self.assertEqual(set(info['expected_objs']), set(info['got_objs']))
         self.assertEqual(set(info['expected_objs']), set(result))
 
+    @mock.patch('nova.scheduler.weights.HostWeightHandler.'
+                'get_weighed_objects')
+    def test_get_weighed_hosts(self, mock_weigh):
+        spec_obj = objects.RequestSpec(num_instances=1)
+        result = self.host_manager.get_weighed_hosts(self.fake_hosts,
+                                                     spec_obj)
+        self.assertEqual(mock_weigh.return_value, result)
+        mock_weigh.assert_called_once_with(self.host_manager.weighers,
+                                           self.fake_hosts, spec_obj,
+                                           top=None)
+
+    @mock.patch('nova.scheduler.weights.HostWeightHandler.'
+                'get_weighed_objects')
+    def test_get_weighed_hosts_vectorized(self, mock_weigh):
+        self.flags(host_subset_size=2, group='filter_scheduler')
+        self.flags(max_attempts=3, group='scheduler')
+        self.host_manager.weight_handler.table_class = mock.sentinel.table
+        spec_obj = objects.RequestSpec(num_instances=4)
+        self.host_manager.get_weighed_hosts(self.fake_hosts, spec_obj)
+        # host_subset_size, plus 2 alternates, plus 3 other instances.
+        mock_weigh.assert_called_once_with(self.host_manager.weighers,
+                                           self.fake_hosts, spec_obj, top=7)
+
     def test_get_filtered_hosts(self):
         fake_properties = objects.RequestSpec(ignore_hosts=[],
                                               instance_uuid=uuids.instance,
@@ -770,6 +810,10 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual(len(new_info['instances']),
                          len(mock_get_by_host.return_value))
         self.assertFalse(new_info['updated'])
+        self.assertEqual(
+            {host_name: 2},
+            self.host_manager.instance_index.count_by_host(
+                [uuids.instance_1, uuids.instance_2, uuids.instance_3]))
 
     def test_update_instance_info(self):
         host_name = 'fake_host'
@@ -798,6 +842,33 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual(len(new_info['instances']), 4)
         self.assertTrue(new_info['updated'])
 
+    def test_update_instance_info_instance_index(self):
+        host_name = 'fake_host'
+        inst1 = fake_instance.fake_instance_obj('fake_context',
+                                                uuid=uuids.instance_1,
+                                                host=host_name)
+        inst2 = fake_instance.fake_instance_obj('fake_context',
+                                                uuid=uuids.instance_2,
+                                                host=host_name)
+        inst3 = fake_instance.fake_instance_obj('fake_context',
+                                                uuid=uuids.instance_3,
+                                                host=host_name)
+        index = self.host_manager.instance_index
+        # A host sending its full instance list
+        self.host_manager.update_instance_info(
+            'fake_context', host_name,
+            objects.InstanceList(objects=[inst1, inst2]))
+        self.assertEqual({host_name}, index.hosts(uuids.instance_1))
+        self.host_manager.update_instance_info(
+            'fake_context', host_name, objects.InstanceList(objects=[inst3]))
+        self.host_manager.delete_instance_info('fake_context', host_name,
+                                               uuids.instance_1)
+        self.assertEqual(set(), index.hosts(uuids.instance_1))
+        self.assertEqual(
+            {host_name: 2},
+            index.count_by_host([uuids.instance_1, uuids.instance_2,
+                                 uuids.instance_3]))
+
     def test_update_instance_info_unknown_host(self):
         self.host_manager._recreate_instance_info = mock.MagicMock()
         host_name = 'fake_host'
@@ -1157,6 +1228,151 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(0, num_hosts2)
 
 
+class HostManagerCachedHostStatesTestCase(test.NoDBTestCase):
+    """Test case for the HostManager host state cache."""
+
+    @mock.patch.object(host_manager.HostManager, '_init_instance_info')
+    @mock.patch.object(host_manager.HostManager, '_init_aggregates')
+    def setUp(self, mock_init_agg, mock_init_inst):
+        super(HostManagerCachedHostStatesTestCase, self).setUp()
+        self.flags(host_state_cache_max_age=60, group='filter_scheduler')
+        self.host_manager = host_manager.HostManager()
+        self.cn_uuids = [cn.uuid for cn in fakes.COMPUTE_NODES]
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    @mock.patch('nova.objects.InstanceList.get_uuids_by_host')
+    def test_get_host_states_by_uuids_cached(self, mock_get_by_host,
+                                             mock_get_all,
+                                             mock_get_by_binary):
+        mock_get_by_host.return_value = []
+        mock_get_all.return_value = fakes.COMPUTE_NODES
+        mock_get_by_binary.return_value = fakes.SERVICES
+
+        hosts1 = list(self.host_manager.get_host_states_by_uuids(
+            mock.sentinel.ctxt, self.cn_uuids, objects.RequestSpec()))
+        self.assertEqual(4, len(hosts1))
+        # Only a subset of the candidates is returned, and the resident
+        # HostStates are reused without reading the cell again.
+        hosts2 = list(self.host_manager.get_host_states_by_uuids(
+            mock.sentinel.ctxt, [uuids.cn1, uuids.cn3],
+            objects.RequestSpec()))
+        self.assertEqual(set([('host1', 'node1'), ('host3', 'node3')]),
+                         set((h.host, h.nodename) for h in hosts2))
+        for host_state in hosts2:
+            self.assertIn(host_state, hosts1)
+        mock_get_all.assert_called_once_with(mock.ANY)
+        mock_get_by_binary.assert_called_once_with(
+            mock.ANY, 'nova-compute', include_disabled=True)
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    @mock.patch('nova.objects.InstanceList.get_uuids_by_host')
+    def test_get_host_states_by_uuids_stale_cell(self, mock_get_by_host,
+                                                 mock_get_all,
+                                                 mock_get_by_binary):
+        running_nodes = [n for n in fakes.COMPUTE_NODES
+                         if n.hypervisor_hostname != 'node4']
+        mock_get_by_host.return_value = []
+        mock_get_all.side_effect = [fakes.COMPUTE_NODES, running_nodes]
+        mock_get_by_binary.return_value = fakes.SERVICES
+        time_fixture = self.useFixture(utils_fixture.TimeFixture())
+
+        hosts = list(self.host_manager.get_host_states_by_uuids(
+            mock.sentinel.ctxt, self.cn_uuids, objects.RequestSpec()))
+        self.assertEqual(4, len(hosts))
+        # Still fresh, node4 is returned from the cache.
+        time_fixture.advance_time_seconds(30)
+        hosts = list(self.host_manager.get_host_states_by_uuids(
+            mock.sentinel.ctxt, self.cn_uuids, objects.RequestSpec()))
+        self.assertEqual(4, len(hosts))
+        self.assertEqual(1, mock_get_all.call_count)
+        # The cell is now stale, so it is read again and node4 is gone.
+        time_fixture.advance_time_seconds(31)
+        hosts = list(self.host_manager.get_host_states_by_uuids(
+            mock.sentinel.ctxt, self.cn_uuids, objects.RequestSpec()))
+        self.assertEqual(3, len(hosts))
+        self.assertEqual(2, mock_get_all.call_count)
+        self.assertNotIn(('host4', 'node4'), self.host_manager.host_state_map)
+        self.assertNotIn(uuids.cn4,
+                         self.host_manager._host_state_keys_by_uuid)
+
+    @mock.patch('nova.context.scatter_gather_cells')
+    def test_refresh_cached_cells_empty_and_failed_cells(self, mock_sg):
+        cell1 = objects.CellMapping(uuid=uuids.cell1)
+        cell2 = objects.CellMapping(uuid=uuids.cell2)
+        mock_sg.return_value = {
+            uuids.cell1: (fakes.SERVICES[:2], fakes.COMPUTE_NODES[:2]),
+            uuids.cell2: (fakes.SERVICES[2:], fakes.COMPUTE_NODES[2:]),
+        }
+        time_fixture = self.useFixture(utils_fixture.TimeFixture())
+        self.host_manager._refresh_cached_cells(mock.sentinel.ctxt,
+                                                [cell1, cell2])
+        self.assertEqual(4, len(self.host_manager.host_state_map))
+
+        # The compute nodes of cell1 are all gone and cell2 fails to respond.
+        time_fixture.advance_time_seconds(61)
+        refresh_time = timeutils.utcnow()
+        mock_sg.return_value = {
+            uuids.cell1: (fakes.SERVICES[:2], []),
+            uuids.cell2: nova_context.did_not_respond_sentinel,
+        }
+        self.host_manager._refresh_cached_cells(mock.sentinel.ctxt,
+                                                [cell1, cell2])
+
+        # The HostStates of cell1 are evicted and the cell is fresh, while
+        # cell2 keeps its stale HostStates and is retried on the next request.
+        self.assertEqual(set([('host3', 'node3'), ('host4', 'node4')]),
+                         set(self.host_manager.host_state_map))
+        self.assertEqual(refresh_time,
+                         self.host_manager._cell_refresh_times[uuids.cell1])
+        self.assertNotEqual(refresh_time,
+                            self.host_manager._cell_refresh_times[uuids.cell2])
+        self.host_manager._refresh_cached_cells(mock.sentinel.ctxt,
+                                                [cell1, cell2])
+        mock_sg.assert_called_with(mock.sentinel.ctxt, [cell2], mock.ANY,
+                                   mock.ANY)
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    @mock.patch('nova.objects.InstanceList.get_uuids_by_host')
+    def test_update_compute_node_info(self, mock_get_by_host, mock_get_all,
+                                      mock_get_by_binary):
+        mock_get_by_host.return_value = []
+        mock_get_all.return_value = fakes.COMPUTE_NODES
+        mock_get_by_binary.return_value = fakes.SERVICES
+        list(self.host_manager.get_host_states_by_uuids(
+            mock.sentinel.ctxt, self.cn_uuids, objects.RequestSpec()))
+
+        compute = fakes.COMPUTE_NODES[0].obj_clone()
+        compute.free_ram_mb = 128
+        compute.updated_at = datetime.datetime(2015, 11, 11, 12, 0, 0)
+        self.host_manager.update_compute_node_info(mock.sentinel.ctxt,
+                                                   'host1', compute)
+
+        host_state = self.host_manager.host_state_map[('host1', 'node1')]
+        self.assertEqual(128, host_state.free_ram_mb)
+        self.assertEqual(1, mock_get_all.call_count)
+
+    @mock.patch.object(host_manager.HostState, 'update')
+    def test_update_compute_node_info_unknown_node(self, mock_update):
+        compute = objects.ComputeNode(host='host1', hypervisor_hostname='n')
+        self.host_manager.update_compute_node_info(mock.sentinel.ctxt,
+                                                   'host1', compute)
+        mock_update.assert_not_called()
+        self.assertEqual({}, self.host_manager.host_state_map)
+
+    def test_update_compute_node_info_cache_disabled(self):
+        self.host_manager.host_state_cache_max_age = 0
+        host_state = mock.Mock(spec=host_manager.HostState)
+        self.host_manager.host_state_map[('host1', 'node1')] = host_state
+        compute = objects.ComputeNode(host='host1',
+                                      hypervisor_hostname='node1')
+        self.host_manager.update_compute_node_info(mock.sentinel.ctxt,
+                                                   'host1', compute)
+        host_state.update.assert_not_called()
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
@@ -1405,6 +1621,46 @@ class HostStateTestCase(test.NoDBTestCase):
             host.consume_from_request(req_spec)
         self.assertEqual(fake_updated, host.updated)
 
+    def _save_and_consume(self):
+        host = host_manager.HostState("fakehost", "fakenode", uuids.cell)
+        host.free_ram_mb = 1024
+        host.vcpus_used = 1
+        host.num_instances = 1
+        host.pci_stats = pci_stats.PciDeviceStats(
+            [objects.PciDevicePool(vendor_id='8086', product_id='15ed',
+                                   numa_node=1, count=2)])
+        state = host.save_consumption()
+        # Consume as consume_from_request() does, the PCI pools in place.
+        host.free_ram_mb = 512
+        host.vcpus_used = 2
+        host.num_instances = 2
+        host.pci_stats.pools[0]['count'] = 1
+        host.updated = mock.sentinel.consumed
+        return host, state
+
+    def test_restore_consumption(self):
+        host, state = self._save_and_consume()
+        self.assertTrue(host.restore_consumption(state,
+                                                 mock.sentinel.consumed))
+        self.assertEqual(1024, host.free_ram_mb)
+        self.assertEqual(1, host.vcpus_used)
+        self.assertEqual(1, host.num_instances)
+        self.assertEqual(2, host.pci_stats.pools[0]['count'])
+        self.assertIsNone(host.updated)
+
+    def test_restore_consumption_updated(self):
+        """Tests that the consumption is not undone if the host state was
+        updated after it.
+        """
+        host, state = self._save_and_consume()
+        self.assertFalse(host.restore_consumption(state,
+                                                  mock.sentinel.other))
+        self.assertEqual(512, host.free_ram_mb)
+        self.assertEqual(2, host.vcpus_used)
+        self.assertEqual(2, host.num_instances)
+        self.assertEqual(1, host.pci_stats.pools[0]['count'])
+        self.assertEqual(mock.sentinel.consumed, host.updated)
+
     def test_resources_consumption_from_compute_node(self):
         _ts_now = datetime.datetime(2015, 11, 11, 11, 0, 0)
         metrics = [
@@ -0,0 +1,131 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For HostRanking.
+"""
+
+import mock
+
+from nova.scheduler import host_ranking
+from nova.scheduler import weights
+from nova.scheduler.weights import ram
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class HostRankingTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(HostRankingTestCase, self).setUp()
+        self.weight_handler = weights.HostWeightHandler()
+        self.host_manager = mock.Mock(weighers=[ram.RAMWeigher()])
+        self.host_manager.get_filtered_hosts.side_effect = self._filter
+        self.host_manager.get_weighed_hosts.side_effect = self._weigh
+        self.hosts = [fakes.FakeHostState('host%s' % i, 'node%s' % i,
+                                          {'free_ram_mb': ram_mb})
+                      for i, ram_mb in enumerate([1024, 4096, 2048, 512,
+                                                  3072, 256])]
+        self.ranking = host_ranking.HostRanking(self.host_manager, 3)
+
+    @staticmethod
+    def _filter(hosts, spec_obj, index=0):
+        return [host for host in hosts if host.free_ram_mb >= 512]
+
+    def _weigh(self, hosts, spec_obj):
+        return self.weight_handler.get_weighed_objects(
+            self.host_manager.weighers, hosts, spec_obj)
+
+    def _get_ranked_hosts(self, index=0):
+        return [w.obj.host for w in self.ranking.get_weighed_hosts(
+            mock.sentinel.spec, iter(self.hosts), index)]
+
+    def _get_sorted_hosts(self):
+        """Rank all the hosts from scratch."""
+        return [w.obj.host for w in self._weigh(
+            self._filter(self.hosts, mock.sentinel.spec),
+            mock.sentinel.spec)][:3]
+
+    def test_first_instance(self):
+        self.assertEqual(['host1', 'host4', 'host2'], self._get_ranked_hosts())
+        self.assertEqual(1, self.host_manager.get_filtered_hosts.call_count)
+        self.assertEqual(set(self._filter(self.hosts, None)),
+                         set(self.ranking.get_hosts()))
+
+    def test_consumed_host_swapped_with_heap(self):
+        self._get_ranked_hosts()
+        self.host_manager.get_filtered_hosts.reset_mock()
+        self.hosts[1].free_ram_mb = 768
+        self.ranking.consume(self.hosts[1])
+
+        ranked_hosts = self._get_ranked_hosts(1)
+        self.assertEqual(['host4', 'host2', 'host0'], ranked_hosts)
+        self.assertEqual(self._get_sorted_hosts(), ranked_hosts)
+        # Only the hosts of the window and the host replacing host1 are
+        # filtered again.
+        self.host_manager.get_filtered_hosts.assert_has_calls([
+            mock.call([self.hosts[1], self.hosts[4], self.hosts[2]],
+                      mock.sentinel.spec, 1),
+            mock.call([self.hosts[0]], mock.sentinel.spec, 1)])
+
+    def test_filtered_host_dropped(self):
+        self._get_ranked_hosts()
+        self.hosts[4].free_ram_mb = 128
+        self.ranking.consume(self.hosts[4])
+
+        self.assertEqual(['host1', 'host2', 'host0'],
+                         self._get_ranked_hosts(1))
+        self.assertNotIn(self.hosts[4], self.ranking.get_hosts())
+
+    def test_scale_change_ranks_all_hosts(self):
+        self._get_ranked_hosts()
+        self.host_manager.get_filtered_hosts.reset_mock()
+        # The RAMWeigher maxval is now higher, which changes the weights of
+        # all the hosts.
+        self.hosts[2].free_ram_mb = 8192
+        self.ranking.consume(self.hosts[2])
+
+        self.assertEqual(['host2', 'host1', 'host4'],
+                         self._get_ranked_hosts(1))
+        self.host_manager.get_filtered_hosts.assert_called_with(
+            mock.ANY, mock.sentinel.spec, 1)
+        self.assertEqual(set(self._filter(self.hosts, None)),
+                         set(self.host_manager.get_filtered_hosts.
+                             call_args[0][0]))
+
+    def test_consume_host_out_of_window(self):
+        self._get_ranked_hosts()
+        self.ranking.consume(self.hosts[0])
+        self.host_manager.get_filtered_hosts.reset_mock()
+
+        self._get_ranked_hosts(1)
+        self.host_manager.get_filtered_hosts.assert_called_once_with(
+            mock.ANY, mock.sentinel.spec, 1)
+        self.assertEqual(5, len(
+            self.host_manager.get_filtered_hosts.call_args[0][0]))
+
+    def test_no_host_left(self):
+        self._get_ranked_hosts()
+        for host in self.hosts:
+            host.free_ram_mb = 0
+
+        self.assertEqual([], self._get_ranked_hosts(1))
+        self.assertEqual([], self.ranking.get_hosts())
+
+    @mock.patch('random.shuffle', side_effect=lambda x: x.reverse())
+    def test_shuffle_best_hosts(self, mock_shuffle):
+        self.flags(shuffle_best_same_weighed_hosts=True,
+                   group='filter_scheduler')
+        for host in self.hosts:
+            host.free_ram_mb = 1024
+
+        # All the best hosts are shuffled before filling the window.
+        self.assertEqual(['host5', 'host4', 'host3'],
+                         self._get_ranked_hosts())
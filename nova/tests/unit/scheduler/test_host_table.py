@@ -0,0 +1,64 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For HostTable.
+"""
+
+import math
+
+from nova.scheduler import host_table
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class HostTableTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(HostTableTestCase, self).setUp()
+        self.hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                {'free_ram_mb': 512, 'vcpus_total': 4, 'num_instances': 1,
+                 'ram_allocation_ratio': 1.5}),
+            fakes.FakeHostState('host2', 'node2',
+                {'free_ram_mb': 1024, 'vcpus_total': 8, 'num_instances': 2}),
+            fakes.FakeHostState('host3', 'node3',
+                {'free_ram_mb': 2048, 'vcpus_total': 16, 'num_instances': 3,
+                 'ram_allocation_ratio': 1.0}),
+        ]
+        self.table = host_table.HostTable(self.hosts)
+
+    def test_columns(self):
+        self.assertEqual(3, len(self.table))
+        self.assertEqual([512, 1024, 2048], self.table.free_ram_mb.tolist())
+        self.assertEqual([4, 8, 16], self.table.vcpus_total.tolist())
+        self.assertEqual([1, 2, 3], self.table.num_instances.tolist())
+        # Unset values are NaN
+        ratios = self.table.ram_allocation_ratio.tolist()
+        self.assertEqual(1.5, ratios[0])
+        self.assertTrue(math.isnan(ratios[1]))
+        self.assertRaises(AttributeError, getattr, self.table, 'foo')
+
+    def test_pass_all(self):
+        self.assertEqual([True, True, True], self.table.pass_all().tolist())
+
+    def test_compress(self):
+        table = self.table.compress(self.table.num_instances != 2)
+        self.assertEqual([self.hosts[0], self.hosts[2]], table.objects)
+        self.assertEqual([512, 2048], table.free_ram_mb.tolist())
+        self.assertEqual([1.5, 1.0], table.ram_allocation_ratio.tolist())
+
+    def test_set_limits(self):
+        self.table.set_limits(self.table.num_instances > 1, 'vcpu',
+                              self.table.vcpus_total * 2)
+        self.assertEqual([{}, {'vcpu': 16.0}, {'vcpu': 32.0}],
+                         [host.limits for host in self.hosts])
+        self.assertIsInstance(self.hosts[1].limits['vcpu'], float)
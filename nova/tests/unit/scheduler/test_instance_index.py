@@ -0,0 +1,86 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For InstanceIndex.
+"""
+
+import copy
+
+from nova.scheduler import instance_index
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class InstanceIndexTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(InstanceIndexTestCase, self).setUp()
+        self.index = instance_index.InstanceIndex()
+        self.host1 = self.index.track('host1', {'inst1': None,
+                                                'inst2': None})
+        self.host2 = self.index.track('host2', {'inst3': None})
+
+    def test_track(self):
+        self.assertIsInstance(self.host1, instance_index.InstanceDict)
+        self.assertEqual({'inst1': None, 'inst2': None}, self.host1)
+        self.assertTrue(self.host1.is_tracked())
+        self.assertEqual({'host1'}, self.index.hosts('inst1'))
+        self.assertEqual({'host1': 2, 'host2': 1},
+                         self.index.count_by_host(['inst1', 'inst2', 'inst3',
+                                                   'inst4']))
+
+    def test_track_again(self):
+        host1 = self.index.track('host1', {'inst2': None})
+
+        self.assertFalse(self.host1.is_tracked())
+        self.assertEqual(set(), self.index.hosts('inst1'))
+        # The dict which is not tracked anymore is not indexed
+        self.host1['inst4'] = None
+        self.assertEqual(set(), self.index.hosts('inst4'))
+        host1['inst5'] = None
+        self.assertEqual({'host1'}, self.index.hosts('inst5'))
+
+    def test_changes(self):
+        self.host2['inst1'] = None
+        self.assertEqual({'host1', 'host2'}, self.index.hosts('inst1'))
+        del self.host1['inst1']
+        self.host2.pop('inst3')
+        self.host2.pop('inst6', None)
+        self.host2.setdefault('inst4')
+        self.host2.update(inst5=None)
+        self.assertEqual({'host2'}, self.index.hosts('inst1'))
+        self.assertEqual({'host2': 3},
+                         self.index.count_by_host(['inst1', 'inst3', 'inst4',
+                                                   'inst5']))
+        self.host2.clear()
+        self.assertEqual({}, self.index.count_by_host(['inst1', 'inst4']))
+
+    def test_copy(self):
+        for copied in (copy.copy(self.host1), copy.deepcopy(self.host1)):
+            self.assertNotIsInstance(copied, instance_index.InstanceDict)
+            self.assertEqual(self.host1, copied)
+
+    def test_count_instances_by_host(self):
+        self.host2['inst4'] = None
+        host_states = [
+            fakes.FakeHostState('host1', 'node1', {}),
+            fakes.FakeHostState('host2', 'node2', {}),
+            fakes.FakeHostState('host3', 'node3', {}),
+        ]
+        host_states[0].instances = self.host1
+        host_states[1].instances = self.host2
+        # The instances of this host are not tracked by the index
+        host_states[2].instances = {'inst1': None, 'inst5': None}
+
+        self.assertEqual(
+            [1, 2, 1],
+            instance_index.count_instances_by_host(
+                host_states, ['inst1', 'inst3', 'inst4']))
@@ -165,3 +165,23 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
                 instance_uuids=['fake1', 'fake2'],
                 fanout=True,
                 version='4.2')
+
+    def test_update_compute_node_info(self):
+        self._test_scheduler_api('update_compute_node_info',
+                rpc_method='cast',
+                host_name='fake_host',
+                compute_node='fake_compute_node',
+                fanout=True,
+                version='4.6')
+
+    def test_update_compute_node_info_old_version(self):
+        rpcapi = scheduler_rpcapi.SchedulerAPI()
+        with test.nested(
+            mock.patch.object(rpcapi.client, 'can_send_version',
+                              return_value=False),
+            mock.patch.object(rpcapi.client, 'prepare')
+        ) as (mock_csv, mock_prepare):
+            rpcapi.update_compute_node_info(mock.sentinel.ctxt, 'fake_host',
+                                            mock.sentinel.compute_node)
+            mock_csv.assert_called_once_with('4.6')
+            mock_prepare.assert_not_called()
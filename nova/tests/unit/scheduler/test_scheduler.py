@@ -319,6 +319,16 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
                                               mock.sentinel.host_name,
                                               mock.sentinel.instance_uuids)
 
+    def test_update_compute_node_info(self):
+        with mock.patch.object(self.manager.driver.host_manager,
+                               'update_compute_node_info') as mock_update:
+            self.manager.update_compute_node_info(mock.sentinel.context,
+                                                  mock.sentinel.host_name,
+                                                  mock.sentinel.compute_node)
+            mock_update.assert_called_once_with(mock.sentinel.context,
+                                                mock.sentinel.host_name,
+                                                mock.sentinel.compute_node)
+
     def test_reset(self):
         with mock.patch.object(self.manager.driver.host_manager,
                                'refresh_cells_caches') as mock_refresh:
@@ -335,6 +345,65 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
                                                           cell_mapping=cm2)]
         self.manager._discover_hosts_in_cells(mock.sentinel.context)
 
+    @mock.patch('nova.scheduler.utils.resources_from_request_spec')
+    @mock.patch('nova.scheduler.client.report.SchedulerReportClient.'
+                'get_allocation_candidates')
+    def test_select_destination_timed(self, mock_get_ac, mock_rfrs):
+        self.flags(timing_summary_interval=0, group='scheduler')
+        fake_spec = objects.RequestSpec(instance_uuid=uuids.instance)
+        mock_get_ac.return_value = (fakes.ALLOC_REQS, mock.sentinel.p_sums,
+                                    "9.42")
+        with mock.patch.object(self.manager.driver, 'select_destinations'):
+            self.manager.select_destinations(self.context, spec_obj=fake_spec,
+                    instance_uuids=[fake_spec.instance_uuid])
+
+        summary = self.manager.timing_summary
+        self.assertEqual(1, summary.requests)
+        self.assertEqual({'select_destinations', 'get_allocation_candidates'},
+                         set(summary.histograms))
+
+    @mock.patch('nova.scheduler.utils.resources_from_request_spec')
+    @mock.patch('nova.scheduler.client.report.SchedulerReportClient.'
+                'get_allocation_candidates')
+    def test_select_destination_not_timed(self, mock_get_ac, mock_rfrs):
+        mock_get_ac.return_value = (fakes.ALLOC_REQS, mock.sentinel.p_sums,
+                                    "9.42")
+        fake_spec = objects.RequestSpec(instance_uuid=uuids.instance)
+        with mock.patch.object(self.manager.driver, 'select_destinations'):
+            self.manager.select_destinations(self.context, spec_obj=fake_spec,
+                    instance_uuids=[fake_spec.instance_uuid])
+
+        self.assertEqual(0, self.manager.timing_summary.requests)
+
+    @mock.patch('nova.compute.utils.notify_about_scheduler_timing')
+    def test_report_timing_summary(self, mock_notify):
+        self.flags(timing_notifications=True, group='scheduler')
+        summary = self.manager.timing_summary
+        summary.requests = 1
+        with mock.patch.object(summary, 'log') as mock_log:
+            self.manager._report_timing_summary(self.context)
+        mock_log.assert_called_once_with()
+        mock_notify.assert_called_once_with(self.context, summary, mock.ANY)
+        self.assertIsNot(summary, self.manager.timing_summary)
+        self.assertEqual(0, self.manager.timing_summary.requests)
+
+    @mock.patch('nova.compute.utils.notify_about_scheduler_timing')
+    def test_report_timing_summary_without_notification(self, mock_notify):
+        summary = self.manager.timing_summary
+        summary.requests = 1
+        with mock.patch.object(summary, 'log') as mock_log:
+            self.manager._report_timing_summary(self.context)
+        mock_log.assert_called_once_with()
+        mock_notify.assert_not_called()
+
+    @mock.patch('nova.compute.utils.notify_about_scheduler_timing')
+    def test_report_timing_summary_no_requests(self, mock_notify):
+        summary = self.manager.timing_summary
+        with mock.patch.object(summary, 'log') as mock_log:
+            self.manager._report_timing_summary(self.context)
+        mock_log.assert_not_called()
+        mock_notify.assert_not_called()
+
 
 class SchedulerTestCase(test.NoDBTestCase):
     """Test case for base scheduler driver class."""
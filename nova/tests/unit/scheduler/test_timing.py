@@ -0,0 +1,188 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the timing of the scheduling requests.
+"""
+
+import fixtures
+import mock
+from oslo_utils import timeutils
+
+from nova import objects
+from nova.scheduler import filters
+from nova.scheduler.filters import all_hosts_filter
+from nova.scheduler.filters import ram_filter
+from nova.scheduler import timing
+from nova.scheduler import weights
+from nova.scheduler.weights import ram
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class FakeManager(object):
+    def __init__(self):
+        self.timing_summary = timing.TimingSummary()
+
+    @timing.timed_request
+    def select_destinations(self, func):
+        return func()
+
+
+class TimingTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(TimingTestCase, self).setUp()
+        self.flags(timing_summary_interval=0, group='scheduler')
+        self.manager = FakeManager()
+
+    def _mock_elapsed(self, *seconds):
+        """Make the StopWatches return the given elapsed times, in the order
+        in which the timed steps end.
+        """
+        watch = mock.Mock()
+        watch.start.return_value = watch
+        watch.elapsed.side_effect = seconds
+        self.useFixture(fixtures.MockPatchObject(timeutils, 'StopWatch',
+                                                 return_value=watch))
+
+    def test_nested_steps(self):
+        self._mock_elapsed(0.004, 0.001, 0.010, 0.020)
+
+        def func():
+            with timing.step('outer'):
+                with timing.step('inner'):
+                    pass
+                with timing.step('inner'):
+                    pass
+            return mock.sentinel.result
+
+        self.assertEqual(mock.sentinel.result,
+                         self.manager.select_destinations(func))
+        summary = self.manager.timing_summary
+        self.assertEqual(1, summary.requests)
+        self.assertEqual(5.0, summary.histograms['inner'].total_ms)
+        self.assertEqual(5.0, summary.histograms['outer'].total_ms)
+        self.assertEqual(10.0,
+                         summary.histograms['select_destinations'].total_ms)
+        self.assertEqual(1, summary.histograms['inner'].count)
+
+    def test_request_failing(self):
+        self._mock_elapsed(0.002, 0.003)
+
+        def func():
+            with timing.step('outer'):
+                raise test.TestingException()
+
+        self.assertRaises(test.TestingException,
+                          self.manager.select_destinations, func)
+        summary = self.manager.timing_summary
+        self.assertEqual(1, summary.requests)
+        self.assertEqual(2.0, summary.histograms['outer'].total_ms)
+        self.assertIsNone(timing._get_request_timings())
+
+    def test_disabled(self):
+        self.flags(timing_summary_interval=-1, group='scheduler')
+
+        def func():
+            self.assertIsNone(timing._get_request_timings())
+            with timing.step('outer'):
+                pass
+
+        self.manager.select_destinations(func)
+        self.assertEqual(0, self.manager.timing_summary.requests)
+
+    def test_timed_iter(self):
+        self._mock_elapsed(0.001, 0.002, 0.003, 0.004, 0.020)
+        iterable = [1, 2, 3]
+
+        def func():
+            self.assertEqual(iterable,
+                             list(timing.timed_iter('items', iterable)))
+
+        self.manager.select_destinations(func)
+        # Including the call raising StopIteration
+        self.assertEqual(10.0, self.manager.timing_summary.histograms[
+            'items'].total_ms)
+
+    def test_timed_iter_not_timed(self):
+        iterable = iter([1, 2])
+        self.assertIs(iterable, timing.timed_iter('items', iterable))
+
+    def test_filter_and_weigher_steps(self):
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(memory_mb=1024))
+        hosts = [fakes.FakeHostState('host%s' % i, 'node%s' % i,
+                                     {'free_ram_mb': ram_mb,
+                                      'total_usable_ram_mb': ram_mb,
+                                      'ram_allocation_ratio': 1.0})
+                 for i, ram_mb in enumerate([512, 2048, 4096])]
+        filter_handler = filters.HostFilterHandler()
+        weight_handler = weights.HostWeightHandler()
+
+        def func():
+            filtered = filter_handler.get_filtered_objects(
+                [all_hosts_filter.AllHostsFilter(), ram_filter.RamFilter()],
+                hosts, spec_obj)
+            return weight_handler.get_weighed_objects([ram.RAMWeigher()],
+                                                      filtered, spec_obj)
+
+        weighed = self.manager.select_destinations(func)
+
+        self.assertEqual(['host2', 'host1'], [w.obj.host for w in weighed])
+        self.assertEqual({'select_destinations', 'filter.AllHostsFilter',
+                          'filter.RamFilter', 'weigher.RAMWeigher'},
+                         set(self.manager.timing_summary.histograms))
+
+
+class HistogramTestCase(test.NoDBTestCase):
+    def test_empty(self):
+        histogram = timing.Histogram()
+        self.assertEqual({'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                          'p50_ms': 0.0, 'p90_ms': 0.0, 'p99_ms': 0.0},
+                         histogram.to_dict())
+
+    def test_percentiles(self):
+        histogram = timing.Histogram()
+        for duration_ms in [0.3] * 50 + [3.0] * 40 + [30.0] * 9 + [20000.0]:
+            histogram.add(duration_ms)
+        self.assertEqual(100, histogram.count)
+        self.assertEqual(20000.0, histogram.max_ms)
+        # The upper bounds of the buckets holding the percentiles
+        self.assertEqual(0.5, histogram.percentile(50))
+        self.assertEqual(5.0, histogram.percentile(90))
+        self.assertEqual(50.0, histogram.percentile(99))
+        self.assertEqual(20000.0, histogram.percentile(100))
+
+    def test_percentile_capped_by_max(self):
+        histogram = timing.Histogram()
+        histogram.add(3.0)
+        self.assertEqual(3.0, histogram.percentile(50))
+
+
+class TimingSummaryTestCase(test.NoDBTestCase):
+    @mock.patch.object(timing, 'LOG')
+    def test_log(self, mock_log):
+        summary = timing.TimingSummary()
+        for durations in ({'filter.RamFilter': 1.0, 'weigher.RAMWeigher': 2},
+                          {'filter.RamFilter': 3.0}):
+            timings = timing.RequestTimings()
+            timings.durations.update(durations)
+            summary.record(timings)
+
+        summary.log()
+
+        self.assertEqual(3, mock_log.info.call_count)
+        # The steps are logged by decreasing total time
+        self.assertEqual(
+            ['filter.RamFilter', 'weigher.RAMWeigher'],
+            [call[0][1]['name'] for call in
+             mock_log.info.call_args_list[1:]])
+        self.assertEqual(2, mock_log.info.call_args_list[1][0][1]['count'])
@@ -888,3 +888,20 @@ class TestUtils(test.NoDBTestCase):
         self.assertTrue(res)
         mock_is_rebuild.assert_called_once_with(mock.sentinel.spec_obj)
         self.assertFalse(mock_client.claim_resources.called)
+
+    @mock.patch('nova.scheduler.client.report.SchedulerReportClient')
+    def test_claim_resources_in_bulk(self, mock_client):
+        ctx = nova_context.RequestContext(user_id=uuids.user_id)
+        spec_obj = objects.RequestSpec(project_id=uuids.project_id,
+                                       user_id=uuids.spec_user_id)
+        alloc_reqs = {uuids.instance1: mock.sentinel.alloc_req1,
+                      uuids.instance2: mock.sentinel.alloc_req2}
+        mock_client.claim_resources_in_bulk.return_value = True
+
+        res = utils.claim_resources_in_bulk(ctx, mock_client, spec_obj,
+                                            alloc_reqs, '1.29')
+
+        self.assertTrue(res)
+        mock_client.claim_resources_in_bulk.assert_called_once_with(
+            ctx, alloc_reqs, uuids.project_id, uuids.spec_user_id,
+            allocation_request_version='1.29')
@@ -16,6 +16,7 @@
 import mock
 
 from nova import objects
+from nova.scheduler import instance_index
 from nova.scheduler import weights
 from nova.scheduler.weights import affinity
 from nova import test
@@ -68,9 +69,19 @@ class SoftWeigherTestBase(test.NoDBTestCase):
         return [fakes.FakeHostState(host, node, values)
                 for host, node, values in host_values]
 
+    def _get_indexed_hosts(self):
+        index = instance_index.InstanceIndex()
+        hosts = self._get_all_hosts()
+        # Only the instances of the first hosts are tracked by the index
+        for host_state in hosts[:3]:
+            host_state.instances = index.track(host_state.host,
+                                               host_state.instances)
+        return hosts
+
     def _do_test(self, policy, expected_weight,
-                 expected_host):
-        hostinfo_list = self._get_all_hosts()
+                 expected_host, indexed=False):
+        hostinfo_list = (self._get_indexed_hosts() if indexed
+                         else self._get_all_hosts())
         weighed_host = self._get_weighed_host(hostinfo_list,
                                               policy)
         self.assertEqual(expected_weight, weighed_host.weight)
@@ -117,6 +128,35 @@ class SoftAffinityWeigherTestCase(SoftWeigherTestBase):
                       expected_host='host3')
         self.assertEqual(1, mock_log.warning.call_count)
 
+    def test_vectorized(self):
+        self.flags(vectorize_weighers=True, group='filter_scheduler')
+        self.weight_handler = weights.HostWeightHandler()
+        self._do_test(policy='soft-affinity',
+                      expected_weight=1.0,
+                      expected_host='host2')
+
+    def test_instance_index(self):
+        self._do_test(policy='soft-affinity',
+                      expected_weight=1.0,
+                      expected_host='host2',
+                      indexed=True)
+
+    def test_vectorized_instance_index(self):
+        self.flags(vectorize_weighers=True, group='filter_scheduler')
+        self.weight_handler = weights.HostWeightHandler()
+        self._do_test(policy='soft-affinity',
+                      expected_weight=1.0,
+                      expected_host='host2',
+                      indexed=True)
+
+    def test_vectorized_other_policy(self):
+        # We do not know the host, all have same weight.
+        self.flags(vectorize_weighers=True, group='filter_scheduler')
+        self.weight_handler = weights.HostWeightHandler()
+        self._do_test(policy='soft-anti-affinity',
+                      expected_weight=0.0,
+                      expected_host=None)
+
 
 class SoftAntiAffinityWeigherTestCase(SoftWeigherTestBase):
 
@@ -157,3 +197,24 @@ class SoftAntiAffinityWeigherTestCase(SoftWeigherTestBase):
                       expected_weight=0.0,
                       expected_host='host2')
         self.assertEqual(1, mock_log.warning.call_count)
+
+    def test_vectorized(self):
+        self.flags(vectorize_weighers=True, group='filter_scheduler')
+        self.weight_handler = weights.HostWeightHandler()
+        self._do_test(policy='soft-anti-affinity',
+                      expected_weight=1.0,
+                      expected_host='host3')
+
+    def test_instance_index(self):
+        self._do_test(policy='soft-anti-affinity',
+                      expected_weight=1.0,
+                      expected_host='host3',
+                      indexed=True)
+
+    def test_vectorized_instance_index(self):
+        self.flags(vectorize_weighers=True, group='filter_scheduler')
+        self.weight_handler = weights.HostWeightHandler()
+        self._do_test(policy='soft-anti-affinity',
+                      expected_weight=1.0,
+                      expected_host='host3',
+                      indexed=True)
@@ -127,3 +127,15 @@ class CPUWeigherTestCase(test.NoDBTestCase):
         weighed_host = weights[-1]
         self.assertEqual(0, weighed_host.weight)
         self.assertEqual('negative', weighed_host.obj.host)
+
+    def test_vectorized(self):
+        self.flags(vectorize_weighers=True, group='filter_scheduler')
+        self.weight_handler = weights.HostWeightHandler()
+        hostinfo_list = self._get_all_hosts()
+
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+            self.weighers, hostinfo_list, {})
+        self.assertEqual(['host4', 'host3', 'host2', 'host1'],
+                         [w.obj.host for w in weighed_hosts])
+        self.assertEqual([1.0, 0.375, 0.125, 0.0],
+                         [w.weight for w in weighed_hosts])
@@ -67,3 +67,15 @@ class IoOpsWeigherTestCase(test.NoDBTestCase):
         self._do_test(io_ops_weight_multiplier=2.0,
                       expected_weight=2.0,
                       expected_host='host4')
+
+    def test_vectorized(self):
+        self.flags(vectorize_weighers=True, group='filter_scheduler')
+        self.weight_handler = weights.HostWeightHandler()
+        hostinfo_list = self._get_all_hosts()
+
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+            self.weighers, hostinfo_list, {})
+        self.assertEqual(['host3', 'host1', 'host2', 'host4'],
+                         [w.obj.host for w in weighed_hosts])
+        self.assertEqual([0.0, -0.25, -0.5, -1.0],
+                         [w.weight for w in weighed_hosts])
@@ -181,3 +181,29 @@ class MetricsWeigherTestCase(test.NoDBTestCase):
         self.flags(required=False, group='metrics')
         setting = [idle + '=0.0001', user + '=-1']
         self._do_test(setting, 1.0, 'host5')
+
+    def test_vectorized(self):
+        self.flags(required=False, group='metrics')
+        setting = [idle + '=0.0001', kernel + '=1', user + '=-1']
+        self.flags(weight_setting=setting, group='metrics')
+        self.weighers[0]._parse_setting()
+        expected = self.weight_handler.get_weighed_objects(
+            self.weighers, self._get_all_hosts(), {})
+
+        self.flags(vectorize_weighers=True, group='filter_scheduler')
+        self.weighers = [metrics.MetricsWeigher()]
+        self.weight_handler = weights.HostWeightHandler()
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+            self.weighers, self._get_all_hosts(), {})
+        self.assertEqual([(w.obj.host, w.weight) for w in expected],
+                         [(w.obj.host, w.weight) for w in weighed_hosts])
+
+    def test_vectorized_metric_not_found_required(self):
+        self.flags(vectorize_weighers=True, group='filter_scheduler')
+        self.weight_handler = weights.HostWeightHandler()
+        setting = [idle + '=1', user + '=2']
+        self.assertRaises(exception.ComputeHostMetricNotFound,
+                          self._do_test,
+                          setting,
+                          8192,
+                          'host4')
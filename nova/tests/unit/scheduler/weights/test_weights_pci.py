@@ -169,3 +169,23 @@ class PCIWeigherTestCase(test.NoDBTestCase):
         for weighed_host in weighed_hosts:
             # the weigher normalizes all weights to 0 if they're all equal
             self.assertEqual(0.0, weighed_host.weight)
+
+    def test_vectorized(self):
+        self.flags(vectorize_weighers=True, group='filter_scheduler')
+        self.weight_handler = weights.HostWeightHandler()
+
+        hosts = [
+            ('host1', 'node1', [4, 1]),  # 5 devs
+            ('host2', 'node2', None),  # no PCI stats
+            ('host3', 'node3', [1, 1, 1, 1]),  # 4 devs
+        ]
+        hostinfo_list = self._get_all_hosts(hosts)
+
+        # we don't request PCI devices
+        spec_obj = objects.RequestSpec(pci_requests=None)
+
+        weighed_hosts = self._get_weighed_hosts(hostinfo_list, spec_obj)
+        self.assertEqual(['host2', 'host3', 'host1'],
+                         [w.obj.host for w in weighed_hosts])
+        self.assertEqual([1.0, 0.2, 0.0],
+                         [w.weight for w in weighed_hosts])
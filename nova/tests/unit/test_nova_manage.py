@@ -2943,6 +2943,44 @@ class TestNovaManagePlacement(test.NoDBTestCase):
                       (uuidsentinel.rp_uuid, uuidsentinel.aggregate),
                       self.output.getvalue())
 
+    @mock.patch('nova.api.openstack.placement.objects.resource_provider.'
+                'sync_usages', return_value=3)
+    def test_sync_usages(self, mock_sync):
+        self.assertEqual(0, self.cli.sync_usages())
+        mock_sync.assert_called_once_with(
+            test.MatchType(context.RequestContext))
+        self.assertIn('Wrote 3 resource provider usages',
+                      self.output.getvalue())
+
+    @mock.patch('nova.api.openstack.placement.objects.resource_provider.'
+                'sync_usages')
+    @mock.patch('nova.api.openstack.placement.objects.resource_provider.'
+                'verify_usages', return_value=[])
+    def test_sync_usages_verify(self, mock_verify, mock_sync):
+        self.assertEqual(0, self.cli.sync_usages(verify=True))
+        mock_verify.assert_called_once_with(
+            test.MatchType(context.RequestContext))
+        mock_sync.assert_not_called()
+        self.assertIn('The resource provider usages match the allocations',
+                      self.output.getvalue())
+
+    @mock.patch('nova.api.openstack.placement.objects.resource_provider.'
+                'sync_usages')
+    @mock.patch('nova.api.openstack.placement.objects.resource_provider.'
+                'verify_usages')
+    def test_sync_usages_verify_mismatch(self, mock_verify, mock_sync):
+        mock_verify.return_value = [{
+            'resource_provider_uuid': uuidsentinel.rp_uuid,
+            'resource_class': 'VCPU',
+            'allocated': 2,
+            'recorded': 1,
+        }]
+        self.assertEqual(1, self.cli.sync_usages(verify=True))
+        mock_sync.assert_not_called()
+        output = self.output.getvalue()
+        self.assertIn(uuidsentinel.rp_uuid, output)
+        self.assertIn('VCPU', output)
+
 
 class TestNovaManageMain(test.NoDBTestCase):
     """Tests the nova-manage:main() setup code."""
@@ -17,8 +17,11 @@ Tests For weights.
 """
 
 import mock
+import numpy
 
+from nova.scheduler import host_table
 from nova.scheduler import weights as scheduler_weights
+from nova.scheduler.weights import compute
 from nova.scheduler.weights import ram
 from nova import test
 from nova.tests.unit.scheduler import fakes
@@ -57,6 +60,40 @@ class TestWeigher(test.NoDBTestCase):
             ret = weights.normalize(seq, minval=minval, maxval=maxval)
             self.assertEqual(tuple(ret), result)
 
+    def test_normalization_vector(self):
+        # weight_list, expected_result, minval, maxval
+        map_ = (
+            ((), (), None, None),
+            ((0.0, 0.0), (0.0, 0.0), None, None),
+            ((1.0, 1.0), (0.0, 0.0), None, None),
+
+            ((20.0, 50.0), (0.0, 1.0), None, None),
+            ((20.0, 50.0), (0.0, 0.375), None, 100.0),
+            ((20.0, 50.0), (0.4, 1.0), 0.0, None),
+            ((20.0, 50.0), (0.2, 0.5), 0.0, 100.0),
+        )
+        for seq, result, minval, maxval in map_:
+            ret = weights.normalize_vector(numpy.array(seq, dtype=float),
+                                           minval=minval, maxval=maxval)
+            self.assertEqual(tuple(ret.tolist()), result)
+
+    def test_rank(self):
+        ranked = weights.rank(numpy.array([1.0, 3.0, 2.0, 3.0]))
+        self.assertEqual([1, 3, 2, 0], ranked.tolist())
+
+    def test_rank_top(self):
+        values = numpy.array([1.0, 5.0, 2.0, 4.0, 3.0, 0.0])
+        ranked = weights.rank(values, top=2)
+        self.assertEqual([1, 3], ranked[:2].tolist())
+        self.assertEqual([0, 2, 4, 5], sorted(ranked[2:].tolist()))
+
+    def test_rank_top_keeps_ties_sorted(self):
+        values = numpy.array([1.0, 3.0, 2.0, 3.0, 3.0, float('nan')])
+        ranked = weights.rank(values, top=1)
+        # All the hosts with the top weight are sorted, in their order.
+        self.assertEqual([1, 3, 4], ranked[:3].tolist())
+        self.assertEqual([0, 2, 5], sorted(ranked[3:].tolist()))
+
     @mock.patch('nova.weights.BaseWeigher.weigh_objects')
     def test_only_one_host(self, mock_weigh):
         host_values = [
@@ -72,3 +109,33 @@ class TestWeigher(test.NoDBTestCase):
         self.assertEqual(1, len(weighed_host))
         self.assertEqual('host1', weighed_host[0].obj.host)
         self.assertFalse(mock_weigh.called)
+
+    def test_vectorized(self):
+        host_values = [
+            ('host1', 'node1', {'free_ram_mb': 512, 'failed_builds': 0}),
+            ('host2', 'node2', {'free_ram_mb': 1024, 'failed_builds': 1}),
+            ('host3', 'node3', {'free_ram_mb': 3072, 'failed_builds': 3}),
+            ('host4', 'node4', {'free_ram_mb': 8192, 'failed_builds': 0}),
+        ]
+        hostinfo = [fakes.FakeHostState(host, node, values)
+                    for host, node, values in host_values]
+        weight_handler = scheduler_weights.HostWeightHandler()
+        weighers = [ram.RAMWeigher(), compute.BuildFailureWeigher()]
+        expected = weight_handler.get_weighed_objects(weighers, hostinfo, {})
+
+        weight_handler.table_class = host_table.HostTable
+        weighers = [ram.RAMWeigher(), compute.BuildFailureWeigher()]
+        with mock.patch.object(ram.RAMWeigher, '_weigh_object') as mock_weigh:
+            weighed_hosts = weight_handler.get_weighed_objects(
+                weighers, hostinfo, {})
+            # The RAMWeigher weighs all the hosts at once.
+            self.assertFalse(mock_weigh.called)
+        self.assertEqual([(w.obj.host, w.weight) for w in expected],
+                         [(w.obj.host, w.weight) for w in weighed_hosts])
+        self.assertIsInstance(weighed_hosts[0].weight, float)
+
+    def test_vectorized_unsupported(self):
+        self.flags(vectorize_weighers=True, group='filter_scheduler')
+        with mock.patch.object(host_table, 'numpy', None):
+            weight_handler = scheduler_weights.HostWeightHandler()
+        self.assertIsNone(weight_handler.table_class)
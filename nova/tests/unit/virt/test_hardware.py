@@ -14,6 +14,7 @@
 
 import collections
 import copy
+import itertools
 
 import mock
 from oslo_serialization import jsonutils
@@ -27,6 +28,7 @@ from nova.objects import base as base_obj
 from nova.objects import fields
 from nova.pci import stats
 from nova import test
+from nova.tests.benchmarks import numa_fit
 from nova.tests.unit import fake_pci_device_pools as fake_pci
 from nova.virt import hardware as hw
 
@@ -1968,6 +1970,108 @@ class VirtNUMAHostTopologyTestCase(test.NoDBTestCase):
         self.assertIsInstance(instance_topology, objects.InstanceNUMATopology)
         self.assertEqual(1, instance_topology.cells[0].id)
 
+    def test_numa_fit_cache_key(self):
+        key = hw.numa_fit_cache_key(self.host, self.instance1, self.limits)
+        self.assertEqual(hash(key), hash(hw.numa_fit_cache_key(
+            self.host.obj_clone(), self.instance1.obj_clone(),
+            self.limits.obj_clone())))
+        # The instance UUID does not change whether the instance fits
+        self.instance1.instance_uuid = uuids.instance
+        self.assertEqual(key, hw.numa_fit_cache_key(
+            self.host, self.instance1, self.limits))
+
+        self.assertNotEqual(key, hw.numa_fit_cache_key(
+            self.host, self.instance3, self.limits))
+        self.assertNotEqual(key, hw.numa_fit_cache_key(
+            self.host, self.instance1))
+        self.host.cells[1].pinned_cpus = set([3])
+        self.assertNotEqual(key, hw.numa_fit_cache_key(
+            self.host, self.instance1, self.limits))
+        self.host.cells[1].pinned_cpus = set()
+        self.host.cells[0].mempages[0].used = 1024
+        self.assertNotEqual(key, hw.numa_fit_cache_key(
+            self.host, self.instance1, self.limits))
+
+    def test_numa_fit_cache_key_pci(self):
+        test_dict = copy.copy(fake_pci.fake_pool_dict)
+        test_dict['numa_node'] = 1
+        pci_stats = stats.PciDeviceStats(
+            [objects.PciDevicePool.from_dict(test_dict)])
+        pci_reqs = [objects.InstancePCIRequest(count=1, spec=[])]
+
+        self.assertNotEqual(
+            hw.numa_fit_cache_key(self.host, self.instance1),
+            hw.numa_fit_cache_key(self.host, self.instance1,
+                                  pci_stats=pci_stats))
+        # Whether the PCI requests fit depends on the devices of the host
+        self.assertIsNone(hw.numa_fit_cache_key(
+            self.host, self.instance1, pci_requests=pci_reqs,
+            pci_stats=pci_stats))
+
+
+class NUMACellPermutationsTestCase(test.NoDBTestCase):
+    def _check_permutations(self, num_host_cells, feasible):
+        num_instance_cells = len(feasible)
+        calls = []
+
+        def fits(host_index, instance_index):
+            calls.append((host_index, instance_index))
+            return host_index in feasible[instance_index]
+
+        permutations = list(hw._numa_cell_permutations(
+            num_host_cells, num_instance_cells, fits))
+
+        self.assertEqual(
+            [permutation for permutation in itertools.permutations(
+                range(num_host_cells), num_instance_cells)
+             if all(host_index in feasible[instance_index]
+                    for instance_index, host_index in enumerate(
+                        permutation))],
+            permutations)
+        # Each pair of cells is only checked once
+        self.assertEqual(len(calls), len(set(calls)))
+
+    def test_permutations(self):
+        self._check_permutations(4, [{0, 1, 2, 3}, {0, 1, 2, 3}])
+        self._check_permutations(4, [{3}, {2, 3}, {0, 2, 3}])
+        self._check_permutations(3, [{0}, {0}])
+        self._check_permutations(2, [set(), {0, 1}])
+
+    def test_permutations_pruned(self):
+        # Only the first host cell fits the last instance cell, so that the
+        # permutations using it for the first ones are never enumerated
+        feasible = [set(range(8))] * 7 + [{0}]
+        calls = []
+
+        def fits(host_index, instance_index):
+            calls.append((host_index, instance_index))
+            return host_index in feasible[instance_index]
+
+        permutation = next(hw._numa_cell_permutations(8, 8, fits))
+
+        self.assertEqual((1, 2, 3, 4, 5, 6, 7, 0), permutation)
+        self.assertLessEqual(len(calls), 64)
+        self.assertEqual(
+            [], list(hw._numa_cell_permutations(8, 2, lambda h, i: h == 0)))
+
+
+class NUMAFitBenchmarkTestCase(test.NoDBTestCase):
+    def test_run(self):
+        results = numa_fit.run([2, 4], 1)['results']
+
+        self.assertEqual(
+            [(2, 1, True), (2, 2, False), (4, 1, True), (4, 2, True),
+             (4, 3, False)],
+            [(result['host_cells'], result['instance_cells'], result['fits'])
+             for result in results
+             if result['cpu_policy'] == fields.CPUAllocationPolicy.SHARED])
+        self.assertEqual(
+            [result['fits'] for result in results
+             if result['cpu_policy'] == fields.CPUAllocationPolicy.SHARED],
+            [result['fits'] for result in results
+             if result['cpu_policy'] ==
+             fields.CPUAllocationPolicy.DEDICATED])
+
 
 class NumberOfSerialPortsTest(test.NoDBTestCase):
     def test_flavor(self):
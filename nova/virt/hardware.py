@@ -27,6 +27,7 @@ from nova import context
 from nova import exception
 from nova.i18n import _
 from nova import objects
+from nova.objects import base as obj_base
 from nova.objects import fields
 from nova.objects import instance as obj_instance
 
@@ -1648,7 +1649,9 @@ def numa_fit_instance_to_host(
     fit instance cells onto all permutations of host cells by calling
     the _fit_instance_cell method, and return a new InstanceNUMATopology
     with its cell ids set to host cell ids of the first successful
-    permutation, or None.
+    permutation, or None. The permutations which cannot succeed since one
+    of their instance cells does not fit onto its host cell are pruned
+    from the search, see _numa_cell_permutations().
 
     :param host_topology: objects.NUMATopology object to fit an
                           instance on
@@ -1689,37 +1692,54 @@ def numa_fit_instance_to_host(
         host_cells = sorted(host_cells, key=lambda cell: cell.id in [
             pool['numa_node'] for pool in pci_stats.pools])
 
+    # The host cell index and the result of the last fit of each instance
+    # cell, keyed by instance cell index
+    last_fits = {}
+
+    def fit_cell(host_index, instance_index):
+        cpuset_reserved = 0
+        if (instance_topology.emulator_threads_isolated
+                and instance_index == 0):
+            # For the case of isolate emulator threads, to
+            # make predictable where that CPU overhead is
+            # located we always configure it to be on host
+            # NUMA node associated to the guest NUMA node
+            # 0.
+            cpuset_reserved = 1
+        try:
+            got_cell = _numa_fit_instance_cell(
+                host_cells[host_index],
+                instance_topology.cells[instance_index],
+                limits, cpuset_reserved)
+        except exception.MemoryPageSizeNotSupported:
+            # This exception will been raised if instance cell's
+            # custom pagesize is not supported with host cell in
+            # _numa_cell_supports_pagesize_request function.
+            got_cell = None
+        last_fits[instance_index] = (host_index, got_cell)
+        return got_cell
+
+    def get_fitted_cell(host_index, instance_index):
+        # The instance cells returned by _numa_fit_instance_cell() are the
+        # instance cells themselves, whose IDs are set to the host cells
+        # they were last fitted onto, so fit them again unless that was
+        # onto the host cell of this permutation.
+        last_host_index, got_cell = last_fits[instance_index]
+        if last_host_index != host_index:
+            got_cell = fit_cell(host_index, instance_index)
+        return got_cell
+
     # TODO(ndipanov): We may want to sort permutations differently
     # depending on whether we want packing/spreading over NUMA nodes
-    for host_cell_perm in itertools.permutations(
-            host_cells, len(instance_topology)):
-        chosen_instance_cells = []
-        chosen_host_cells = []
-        for host_cell, instance_cell in zip(
-                host_cell_perm, instance_topology.cells):
-            try:
-                cpuset_reserved = 0
-                if (instance_topology.emulator_threads_isolated
-                    and len(chosen_instance_cells) == 0):
-                    # For the case of isolate emulator threads, to
-                    # make predictable where that CPU overhead is
-                    # located we always configure it to be on host
-                    # NUMA node associated to the guest NUMA node
-                    # 0.
-                    cpuset_reserved = 1
-                got_cell = _numa_fit_instance_cell(
-                    host_cell, instance_cell, limits, cpuset_reserved)
-            except exception.MemoryPageSizeNotSupported:
-                # This exception will been raised if instance cell's
-                # custom pagesize is not supported with host cell in
-                # _numa_cell_supports_pagesize_request function.
-                break
-            if got_cell is None:
-                break
-            chosen_host_cells.append(host_cell)
-            chosen_instance_cells.append(got_cell)
-
-        if len(chosen_instance_cells) != len(host_cell_perm):
+    for host_indexes in _numa_cell_permutations(
+            len(host_cells), len(instance_topology),
+            lambda host_index, instance_index: fit_cell(
+                host_index, instance_index) is not None):
+        chosen_host_cells = [host_cells[index] for index in host_indexes]
+        chosen_instance_cells = [
+            get_fitted_cell(host_index, instance_index)
+            for instance_index, host_index in enumerate(host_indexes)]
+        if None in chosen_instance_cells:
             continue
 
         if pci_requests and pci_stats and not pci_stats.support_requests(
@@ -1735,6 +1755,119 @@ def numa_fit_instance_to_host(
             emulator_threads_policy=emulator_threads_policy)
 
 
+def _numa_cell_permutations(num_host_cells, num_instance_cells, fits):
+    """Yield the permutations of host cell indexes onto which the instance
+    cells fit, in the order of itertools.permutations().
+
+    Whether each instance cell fits onto each host cell is only checked
+    once, by calling fits(host_index, instance_index). The permutations
+    starting with a host cell onto which the instance cell does not fit,
+    or leaving host cells onto which the remaining instance cells cannot
+    all be fitted, are skipped without being enumerated.
+    """
+    feasible = {}
+
+    def fit(host_index, instance_index):
+        if (host_index, instance_index) not in feasible:
+            feasible[host_index, instance_index] = fits(host_index,
+                                                        instance_index)
+        return feasible[host_index, instance_index]
+
+    def can_match(free_host_indexes, instance_indexes):
+        # Look for a bipartite matching of the remaining instance cells
+        # onto the free host cells, with augmenting paths
+        matched = {}
+
+        def augment(instance_index, seen):
+            for host_index in free_host_indexes:
+                if host_index in seen or not fit(host_index, instance_index):
+                    continue
+                seen.add(host_index)
+                if (host_index not in matched or
+                        augment(matched[host_index], seen)):
+                    matched[host_index] = instance_index
+                    return True
+            return False
+
+        return all(augment(instance_index, set())
+                   for instance_index in instance_indexes)
+
+    def search(chosen):
+        instance_index = len(chosen)
+        if instance_index == num_instance_cells:
+            yield tuple(chosen)
+            return
+        for host_index in range(num_host_cells):
+            if host_index in chosen or not fit(host_index, instance_index):
+                continue
+            chosen.append(host_index)
+            free_host_indexes = [index for index in range(num_host_cells)
+                                 if index not in chosen]
+            if can_match(free_host_indexes,
+                         range(instance_index + 1, num_instance_cells)):
+                for permutation in search(chosen):
+                    yield permutation
+            chosen.pop()
+
+    return search([])
+
+
+# Fields of the objects which do not change the result of
+# numa_fit_instance_to_host()
+_NUMA_FIT_IGNORED_FIELDS = {
+    'InstanceNUMATopology': {'id', 'instance_uuid'},
+}
+
+
+def _numa_fit_cache_key(value):
+    if isinstance(value, obj_base.NovaObject):
+        ignored = _NUMA_FIT_IGNORED_FIELDS.get(value.obj_name(), ())
+        return (value.obj_name(),) + tuple(
+            (name, _numa_fit_cache_key(getattr(value, name)))
+            for name in sorted(value.fields)
+            if name not in ignored and value.obj_attr_is_set(name))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_numa_fit_cache_key(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_numa_fit_cache_key(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _numa_fit_cache_key(item))
+                            for key, item in value.items()))
+    return value
+
+
+def numa_fit_cache_key(host_topology, instance_topology, limits=None,
+                       pci_requests=None, pci_stats=None):
+    """Return a hashable key of the arguments of numa_fit_instance_to_host()
+    determining whether the instance fits on the host.
+
+    Two calls with equal keys fit the instance onto the same host cells, so
+    that the result of the first one can be reused for hosts with the same
+    NUMA topology and usage. The key covers the usage of the host cells,
+    including their pinned CPUs and memory pages, the instance cells, the
+    limits and the NUMA nodes of the PCI devices of the host.
+
+    :param host_topology: objects.NUMATopology object to fit an
+                          instance on, or its JSON representation as stored
+                          in the ComputeNode, which is used as is
+    :param instance_topology: objects.InstanceNUMATopology to be fitted
+    :param limits: objects.NUMATopologyLimits that defines limits
+    :param pci_requests: instance pci_requests
+    :param pci_stats: pci_stats for the host
+
+    :returns: a hashable key, or None if the result of the call cannot be
+              reused since it depends on the PCI devices of the host
+    """
+    if pci_requests:
+        return None
+    pci_numa_nodes = frozenset(
+        pool['numa_node'] for pool in pci_stats.pools) if pci_stats else None
+    return (_numa_fit_cache_key(host_topology),
+            _numa_fit_cache_key(instance_topology),
+            _numa_fit_cache_key(limits),
+            pci_numa_nodes)
+
+
 def numa_get_reserved_huge_pages():
     """Returns reserved memory pages from host option.
 
@@ -19,10 +19,13 @@ Pluggable Weighing support
 
 import abc
 
+from oslo_utils import importutils
 import six
 
 from nova import loadables
 
+numpy = importutils.try_import('numpy')
+
 
 def normalize(weight_list, minval=None, maxval=None):
     """Normalize the values in a list between 0 and 1.0.
@@ -53,6 +56,51 @@ def normalize(weight_list, minval=None, maxval=None):
     return ((i - minval) / range_ for i in weight_list)
 
 
+def normalize_vector(weights, minval=None, maxval=None):
+    """Normalize the values of a numpy array between 0 and 1.0.
+
+    This is the array counterpart of normalize() and follows the same rules.
+    """
+    if not len(weights):
+        return weights
+
+    if maxval is None:
+        maxval = weights.max()
+
+    if minval is None:
+        minval = weights.min()
+
+    maxval = float(maxval)
+    minval = float(minval)
+
+    if minval == maxval:
+        return numpy.zeros(len(weights))
+
+    range_ = maxval - minval
+    return (weights - minval) / range_
+
+
+def rank(weights, top=None):
+    """Return the indices of a numpy array of weights by descending weight.
+
+    If top is set, only the indices of the top highest weights (and of any
+    other weight equal to the lowest of them) are sorted, the others follow
+    in no particular order. Equal weights keep their original order, like
+    with sorted().
+    """
+    count = len(weights)
+    if top is None or top >= count:
+        return numpy.argsort(-weights, kind='mergesort')
+
+    top = max(top, 1)
+    kth = weights[numpy.argpartition(-weights, top - 1)[top - 1]]
+    head = numpy.flatnonzero(weights >= kth)
+    head = head[numpy.argsort(-weights[head], kind='mergesort')]
+    # NOTE: Negating the comparison keeps the NaN weights in the tail.
+    tail = numpy.flatnonzero(~(weights >= kth))
+    return numpy.concatenate((head, tail))
+
+
 class WeighedObject(object):
     """Object with weight information."""
     def __init__(self, obj, weight):
@@ -76,6 +124,10 @@ class BaseWeigher(object):
     minval = None
     maxval = None
 
+    # Set to True in a subclass which implements _weigh_table(), so that the
+    # weigher can weigh a whole table of objects at once.
+    vectorized = False
+
     def weight_multiplier(self):
         """How weighted this weigher should be.
 
@@ -117,19 +169,82 @@ class BaseWeigher(object):
 
         return weights
 
+    def _weigh_table(self, table, weight_properties):
+        """Return a numpy array of the weights of the objects of a table.
+
+        Override this in a subclass which sets vectorized to True.
+        """
+        raise NotImplementedError()
+
+    def weigh_table(self, table, weight_properties):
+        """Weigh all the objects of a table at once.
+
+        Returns a numpy array of weights, recording the min and max values
+        the same way weigh_objects() does.
+        """
+        weights = self._weigh_table(table, weight_properties)
+        if len(weights):
+            minval = weights.min()
+            maxval = weights.max()
+            if self.minval is None or minval < self.minval:
+                self.minval = minval
+            if self.maxval is None or maxval > self.maxval:
+                self.maxval = maxval
+        return weights
+
 
 class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
+    # Set in a subclass to the class building a table from a list of objects
+    # in order to weigh them with numpy arrays.
+    table_class = None
+
+    def _weigh_objects(self, weigher, weighed_objs, weighing_properties):
+        """Return the weights of a weigher as a list."""
+        return weigher.weigh_objects(weighed_objs, weighing_properties)
+
+    def _weigh_vector(self, weigher, table, weighed_objs, weighing_properties):
+        """Return the weights of a weigher as a numpy array."""
+        if weigher.vectorized:
+            return weigher.weigh_table(table, weighing_properties)
+        return numpy.array(self._weigh_objects(weigher, weighed_objs,
+                                               weighing_properties),
+                           dtype=float)
+
+    def _get_weighed_objects_vectorized(self, weighers, weighed_objs,
+                                        weighing_properties, top=None):
+        table = self.table_class([w.obj for w in weighed_objs])
+        totals = numpy.zeros(len(weighed_objs))
+        for weigher in weighers:
+            weights = self._weigh_vector(weigher, table, weighed_objs,
+                                         weighing_properties)
+            totals += weigher.weight_multiplier() * normalize_vector(
+                weights, minval=weigher.minval, maxval=weigher.maxval)
+
+        for obj, weight in zip(weighed_objs, totals.tolist()):
+            obj.weight = weight
 
-    def get_weighed_objects(self, weighers, obj_list, weighing_properties):
-        """Return a sorted (descending), normalized list of WeighedObjects."""
+        return [weighed_objs[i] for i in rank(totals, top=top)]
+
+    def get_weighed_objects(self, weighers, obj_list, weighing_properties,
+                            top=None):
+        """Return a sorted (descending), normalized list of WeighedObjects.
+
+        If top is set and the objects are weighed with numpy arrays, only the
+        top first objects are guaranteed to be sorted.
+        """
         weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
 
         if len(weighed_objs) <= 1:
             return weighed_objs
 
+        if self.table_class is not None:
+            return self._get_weighed_objects_vectorized(
+                weighers, weighed_objs, weighing_properties, top=top)
+
         for weigher in weighers:
-            weights = weigher.weigh_objects(weighed_objs, weighing_properties)
+            weights = self._weigh_objects(weigher, weighed_objs,
+                                          weighing_properties)
 
             # Normalize the weights
             weights = normalize(weights,
@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Load test of the placement service against a synthetic provider topology.
+
+The topology is built through the placement object layer in the database
+given by a SQLAlchemy connection URL. Each compute node is a root provider
+with NUMA node child providers holding its VCPU and MEMORY_MB, each NUMA node
+having SR-IOV physical function child providers holding SRIOV_NET_VF on one
+of a few physical networks. The compute nodes are grouped in aggregates,
+each shared with a storage provider holding the DISK_GB.
+
+A mix of requests is then replayed against the placement service through
+PlacementDirect, in process and without HTTP:
+
+    plain       GET /allocation_candidates for VCPU, MEMORY_MB and DISK_GB
+    granular    GET /allocation_candidates with a NUMA and a SR-IOV group
+    traits      GET /allocation_candidates requiring a CPU trait
+    member_of   GET /allocation_candidates in one aggregate
+    put         PUT /allocations/{consumer_uuid} of a new consumer
+    post        POST /allocations of two new consumers
+
+The throughput and the latency percentiles of each kind of request are
+reported at the end.
+
+Run like:
+
+    ./tools/placement/load_test.py --connection sqlite:////tmp/placement.db \
+                                   --roots 20000 --requests 2000
+
+    ./tools/placement/load_test.py \
+        --connection mysql+pymysql://root@localhost/placement \
+        --skip-build --requests 2000 --concurrency 8 \
+        --mix plain=4,granular=2,traits=1,member_of=1,put=1,post=1
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import random
+import sys
+import threading
+import time
+
+from oslo_policy import opts as policy_opts
+from oslo_utils import uuidutils
+import prettytable
+from six.moves import queue
+
+from nova.api.openstack.placement import context as placement_context
+from nova.api.openstack.placement import db_api
+from nova.api.openstack.placement import deploy
+from nova.api.openstack.placement import direct
+from nova.api.openstack.placement.objects import resource_provider as rp_obj
+import nova.conf
+from nova.db import migration
+
+
+CONF = nova.conf.CONF
+
+CPU_TRAIT = 'HW_CPU_X86_AVX2'
+SHARES_TRAIT = 'MISC_SHARES_VIA_AGGREGATE'
+PHYSNET_TRAIT = 'CUSTOM_PHYSNET_%d'
+
+# The resources requested by each kind of request.
+INSTANCE = {'VCPU': 2, 'MEMORY_MB': 2048, 'DISK_GB': 20}
+PORT = {'SRIOV_NET_VF': 1}
+
+DEFAULT_MIX = 'plain=4,granular=2,traits=1,member_of=1,put=1,post=1'
+KINDS = ('plain', 'granular', 'traits', 'member_of', 'put', 'post')
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Load test the placement service.')
+    parser.add_argument('--connection', default='sqlite:////tmp/placement.db',
+                        help='SQLAlchemy connection URL of the placement '
+                             'database.')
+    parser.add_argument('--skip-build', action='store_true',
+                        help='Replay the requests against the topology '
+                             'already in the database.')
+    parser.add_argument('--roots', type=int, default=1000,
+                        help='Number of compute node root providers.')
+    parser.add_argument('--numa-nodes', type=int, default=2,
+                        help='Number of NUMA node providers per compute '
+                             'node.')
+    parser.add_argument('--pfs', type=int, default=2,
+                        help='Number of SR-IOV physical function providers '
+                             'per NUMA node.')
+    parser.add_argument('--physnets', type=int, default=2,
+                        help='Number of physical networks of the physical '
+                             'functions.')
+    parser.add_argument('--roots-per-aggregate', type=int, default=100,
+                        help='Number of compute nodes sharing a storage '
+                             'provider in an aggregate.')
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='Number of requests to replay.')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Number of threads replaying the requests.')
+    parser.add_argument('--limit', type=int, default=50,
+                        help='Limit of the allocation candidates requests, '
+                             '0 for none.')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='Comma separated kind=weight pairs of the '
+                             'requests to replay, among %s.' %
+                             ', '.join(KINDS))
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed of the random topology and requests.')
+    args = parser.parse_args(argv)
+
+    mix = {}
+    for pair in args.mix.split(','):
+        kind, _sep, weight = pair.partition('=')
+        if kind not in KINDS:
+            parser.error('Unknown kind of request: %s' % kind)
+        mix[kind] = int(weight or 1)
+    args.mix = mix
+    return args
+
+
+class Topology(object):
+    """The UUIDs of the synthetic providers, picked by the requests."""
+
+    def __init__(self):
+        self.numa_nodes = []
+        self.aggregates = []
+
+
+def _inventory(ctx, rp, **totals):
+    return rp_obj.InventoryList(ctx, objects=[
+        rp_obj.Inventory(ctx, resource_provider=rp, resource_class=rc,
+                         total=total, reserved=0, min_unit=1,
+                         max_unit=total, step_size=1, allocation_ratio=1.0)
+        for rc, total in totals.items()])
+
+
+def _create_provider(ctx, name, parent=None):
+    rp = rp_obj.ResourceProvider(
+        ctx, name=name, uuid=uuidutils.generate_uuid(),
+        parent_provider_uuid=parent.uuid if parent else None)
+    rp.create()
+    return rp
+
+
+def build_topology(ctx, args):
+    """Create the providers described by args in the placement database."""
+    traits = {}
+    for name in [PHYSNET_TRAIT % i for i in range(args.physnets)]:
+        trait = rp_obj.Trait(ctx, name=name)
+        trait.create()
+        traits[name] = trait
+    for name in (CPU_TRAIT, SHARES_TRAIT):
+        traits[name] = rp_obj.Trait.get_by_name(ctx, name)
+
+    topology = Topology()
+    started = time.time()
+    for index in range(args.roots):
+        if index % args.roots_per_aggregate == 0:
+            aggregate = uuidutils.generate_uuid()
+            topology.aggregates.append(aggregate)
+            storage = _create_provider(ctx, 'storage-%d' % index)
+            storage.set_inventory(_inventory(ctx, storage, DISK_GB=100000))
+            storage.set_traits(rp_obj.TraitList(
+                ctx, objects=[traits[SHARES_TRAIT]]))
+            storage.set_aggregates([aggregate])
+
+        root = _create_provider(ctx, 'compute-%d' % index)
+        root.set_aggregates([aggregate])
+        if index % 2:
+            root.set_traits(rp_obj.TraitList(
+                ctx, objects=[traits[CPU_TRAIT]]))
+        for numa in range(args.numa_nodes):
+            node = _create_provider(
+                ctx, 'compute-%d-numa-%d' % (index, numa), root)
+            node.set_inventory(_inventory(ctx, node, VCPU=32,
+                                          MEMORY_MB=131072))
+            topology.numa_nodes.append(node.uuid)
+            for pf in range(args.pfs):
+                provider = _create_provider(
+                    ctx, 'compute-%d-numa-%d-pf-%d' % (index, numa, pf), node)
+                provider.set_inventory(_inventory(ctx, provider,
+                                                  SRIOV_NET_VF=8))
+                physnet = traits[PHYSNET_TRAIT % (pf % args.physnets)]
+                provider.set_traits(rp_obj.TraitList(ctx, objects=[physnet]))
+        if (index + 1) % 1000 == 0:
+            print('Built %d compute nodes in %.1fs' % (
+                index + 1, time.time() - started))
+    return topology
+
+
+def load_topology(ctx):
+    """Find the providers of a topology built by a previous run."""
+    topology = Topology()
+    aggregates = set()
+    for rp in rp_obj.ResourceProviderList.get_all_by_filters(ctx, {}):
+        if '-numa-' in rp.name and '-pf-' not in rp.name:
+            topology.numa_nodes.append(rp.uuid)
+        elif rp.name.startswith('storage-'):
+            aggregates.update(rp.get_aggregates())
+    topology.aggregates = sorted(aggregates)
+    return topology
+
+
+def _resources(resources):
+    return ','.join('%s:%d' % (rc, amount)
+                    for rc, amount in sorted(resources.items()))
+
+
+def _allocation(numa_node):
+    return {numa_node: {'resources': {'VCPU': 1, 'MEMORY_MB': 256}}}
+
+
+def make_request(kind, topology, args, rand):
+    """Return the (label, method, url, body) of a request of the given kind.
+    """
+    limit = '&limit=%d' % args.limit if args.limit else ''
+    url = '/allocation_candidates?'
+    if kind == 'plain':
+        url += 'resources=%s' % _resources(INSTANCE)
+    elif kind == 'granular':
+        physnet = PHYSNET_TRAIT % rand.randrange(args.physnets)
+        url += ('resources=DISK_GB:%d&resources1=%s&resources2=%s'
+                '&required2=%s&group_policy=none' % (
+                    INSTANCE['DISK_GB'],
+                    _resources({'VCPU': INSTANCE['VCPU'],
+                                'MEMORY_MB': INSTANCE['MEMORY_MB']}),
+                    _resources(PORT), physnet))
+    elif kind == 'traits':
+        url += 'resources=%s&required=%s' % (_resources(INSTANCE), CPU_TRAIT)
+    elif kind == 'member_of':
+        url += 'resources=%s&member_of=%s' % (
+            _resources(INSTANCE), rand.choice(topology.aggregates))
+    elif kind == 'put':
+        consumer = uuidutils.generate_uuid()
+        body = {
+            'allocations': _allocation(rand.choice(topology.numa_nodes)),
+            'project_id': 'load-test',
+            'user_id': 'load-test',
+            'consumer_generation': None,
+        }
+        return ('PUT /allocations/{consumer_uuid}', 'PUT',
+                '/allocations/%s' % consumer, body)
+    elif kind == 'post':
+        body = {}
+        for _i in range(2):
+            body[uuidutils.generate_uuid()] = {
+                'allocations': _allocation(rand.choice(topology.numa_nodes)),
+                'project_id': 'load-test',
+                'user_id': 'load-test',
+                'consumer_generation': None,
+            }
+        return 'POST /allocations', 'POST', '/allocations', body
+    return 'GET /allocation_candidates (%s)' % kind, 'GET', url + limit, None
+
+
+class Results(object):
+    """The latencies and errors of the replayed requests, by label."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        # The first exception raised by the requests of each label
+        self.exceptions = {}
+
+    def add(self, label, latency, error, exc=None):
+        with self.lock:
+            self.latencies[label].append(latency)
+            if error:
+                self.errors[label] += 1
+            if exc is not None:
+                self.exceptions.setdefault(label, exc)
+
+    def succeeded(self):
+        return (sum(len(latencies) for latencies in self.latencies.values()) -
+                sum(self.errors.values()))
+
+
+def _worker(client, requests, results):
+    while True:
+        try:
+            label, method, url, body = requests.get_nowait()
+        except queue.Empty:
+            return
+        started = time.time()
+        try:
+            resp = client.request(url, method, json=body)
+        except Exception as exc:
+            # Count the request as failed rather than let the thread die and
+            # the following requests of the queue be silently skipped.
+            results.add(label, time.time() - started, True, exc=exc)
+            continue
+        results.add(label, time.time() - started, resp.status_code >= 400)
+
+
+def replay(topology, args, rand):
+    weighted = [kind for kind, weight in sorted(args.mix.items())
+                for _i in range(weight)]
+    requests = queue.Queue()
+    for _i in range(args.requests):
+        requests.put(make_request(rand.choice(weighted), topology, args,
+                                  rand))
+
+    results = Results()
+    with direct.PlacementDirect(CONF, latest_microversion=True) as client:
+        started = time.time()
+        threads = [threading.Thread(target=_worker,
+                                    args=(client, requests, results))
+                   for _i in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+    return results, elapsed
+
+
+def _percentile(latencies, percent):
+    index = int(round(percent / 100.0 * (len(latencies) - 1)))
+    return latencies[index] * 1000
+
+
+def report(results, elapsed):
+    table = prettytable.PrettyTable(
+        ['Request', 'Count', 'Errors', 'Req/s', 'p50 (ms)', 'p90 (ms)',
+         'p99 (ms)', 'Max (ms)'])
+    table.align = 'r'
+    table.align['Request'] = 'l'
+    for label, latencies in sorted(results.latencies.items()):
+        latencies.sort()
+        table.add_row([
+            label, len(latencies), results.errors[label],
+            '%.1f' % (len(latencies) / elapsed),
+            '%.1f' % _percentile(latencies, 50),
+            '%.1f' % _percentile(latencies, 90),
+            '%.1f' % _percentile(latencies, 99),
+            '%.1f' % (latencies[-1] * 1000)])
+    print(table)
+    total = sum(len(latencies) for latencies in results.latencies.values())
+    print('%d requests in %.1fs, %.1f req/s' % (
+        total, elapsed, total / elapsed if elapsed else 0.0))
+    for label, exc in sorted(results.exceptions.items()):
+        print('%s raised: %r' % (label, exc), file=sys.stderr)
+
+
+def main(argv=sys.argv[1:]):
+    args = _parse_args(argv)
+    rand = random.Random(args.seed)
+
+    CONF([], project='nova', default_config_files=[])
+    # Register the [oslo_policy] options the placement application reads,
+    # like nova.api.openstack.placement.wsgi does.
+    policy_opts.set_defaults(CONF)
+    CONF.set_override('connection', args.connection,
+                      group='placement_database')
+    # The placement transaction context has to be configured before the
+    # migrations start its engine, otherwise it is built from the
+    # [database]/connection default.
+    db_api.configure(CONF)
+    migration.db_sync(database='placement')
+    deploy.update_database()
+
+    ctx = placement_context.RequestContext(user_id='load-test',
+                                           project_id='load-test')
+    if args.skip_build:
+        topology = load_topology(ctx)
+    else:
+        started = time.time()
+        topology = build_topology(ctx, args)
+        print('Built %d compute nodes in %.1fs' % (
+            args.roots, time.time() - started))
+    if not topology.numa_nodes:
+        sys.exit('No compute nodes found in the database.')
+
+    results, elapsed = replay(topology, args, rand)
+    report(results, elapsed)
+    if not results.succeeded():
+        sys.exit('No request succeeded.')
+
+
+if __name__ == '__main__':
+    main()